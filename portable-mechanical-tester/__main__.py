@@ -1,5 +1,21 @@
 """Module containing code to start and control the portable mechanical tester.
 
+Usage: python portable-mechanical-tester SUBCOMMAND [OPTIONS]
+    run: Runs the tester: buttons, limit switches, the sensors and
+        the live data server, and optionally a test protocol.
+    calibrate: Calibrates the load cell with known weights and stores the
+        calibration profile.
+    tare: Re-tares the load cell and stores its offset.
+    jog: Moves the carriage by a distance.
+    record: Records the load cell and encoder readings to a recording file.
+    analyze: Computes the material properties of recordings (analysis.py).
+
+Each subcommand imports and constructs only the devices it needs, e.g.
+"tare" never sets up the motor and "analyze" never touches the pins. The
+GPIO backend itself is only selected and configured when it is first used
+(see gpio.py). The time spent in each startup phase is printed, and can be
+checked against a target with --startup-target.
+
 Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
 
 Prof Instruments - Portable Mechanical Tester
@@ -11,34 +27,508 @@ Ridwan Alaoudian
 Tyler Bursa
 """
 
-# Import classes
-from button import Button
-from linear_actuator import LinearActuator
-from load_cell_amplifier import LoadCellAmplifier
-from load_cell import LoadCell
-from motor import Motor
-from rotary_encoder import RotaryEncoder
-
-import multiprocessing
-
-# Initialize objects
-motor = Motor(20, 21)
-linear_actuator = LinearActuator(motor)
-rotary_encoder = RotaryEncoder(9, 11, 10)
-load_cell_amplifier = LoadCellAmplifier(5, 6)
-load_cell = LoadCell(load_cell_amplifier)
-
-# Initialize buttons
-up_button = Button(27, linear_actuator.move_up)
-down_button = Button(17, linear_actuator.move_down)
-stop_button = Button(2, linear_actuator.stop)
-inc_speed_button = Button(7, linear_actuator.increase_speed)
-dec_speed_button = Button(3, linear_actuator.decrease_speed)
-
-# Initialize limit switches
-bottom_limit_switch = Button(19, linear_actuator.stop)
-top_limit_switch = Button(26, linear_actuator.stop)
-
-# Run load cell and rotary encoder in separate processes
-multiprocessing.Process(target=load_cell.run).start()
-multiprocessing.Process(target=rotary_encoder.run).start()
+import time
+
+_START_TIME = time.perf_counter()
+
+import argparse
+import sys
+
+# BCM pin numbers of the devices
+MOTOR_PINS = (20, 21)                   # DIR, PUL
+ROTARY_ENCODER_PINS = (9, 11, 10)       # A, B, X
+LOAD_CELL_AMPLIFIER_PINS = (5, 6)       # DAT, CLK
+BOTTOM_LIMIT_SWITCH_PIN = 19
+TOP_LIMIT_SWITCH_PIN = 26
+
+
+class StartupTimer:
+    """Measures the time spent in each startup phase, from the start of the
+    program.
+
+    Attributes:
+        phases: A dictionary of the time spent in each phase, in order [s].
+        devices: A dictionary of the time each device took to initialize [s].
+            Devices initialized concurrently overlap.
+    """
+
+    def __init__(self, start=None):
+        """Initializes StartupTimer, by default from the start of the program."""
+        self._start = self._lap_start = _START_TIME if start is None else start
+        self.phases = {}
+        self.devices = {}
+
+    def lap(self, phase):
+        """Ends a phase, which started when the previous one ended. The time
+        is added to any earlier lap of the same phase.
+        """
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._lap_start
+        self._lap_start = now
+
+    @property
+    def total(self):
+        """The time until the end of the last phase [s]."""
+        return self._lap_start - self._start
+
+    def report(self, target=None):
+        """Prints the time spent in each phase, and an error if the total is
+        over the target [s].
+        """
+        phases = [phase + " " + "{0:.3f}".format(t) + " s" for phase, t in self.phases.items()]
+        print("Startup time: " + ", ".join(phases) + ", total " + "{0:.3f}".format(self.total) + " s")
+        if self.devices:
+            print("Device startup time: " + ", ".join(name + " " + "{0:.3f}".format(t) + " s"
+                                                      for name, t in self.devices.items()))
+        if target is not None and self.total > target:
+            print("ERROR: Startup took " + "{0:.3f}".format(self.total) + " s, over the target of "
+                  + str(target) + " s.")
+
+
+def initialize_devices(timer, factories, serial=None):
+    """Selects the GPIO backend and constructs devices concurrently, timing
+    both phases. See runtime.initialize().
+
+    Args:
+        timer: The StartupTimer.
+        factories: A dictionary mapping device names to functions taking no
+            arguments and returning the device, constructed concurrently.
+        serial: An optional dictionary of the same kind, for the devices
+            bit-banging timing-critical signals (the HX711), constructed on
+            the calling thread afterwards.
+
+    Returns:
+        A dictionary of the devices by name.
+    """
+    import gpio
+    from runtime import initialize
+    timer.lap("imports")
+    gpio.get_backend()
+    timer.lap("gpio")
+    devices, startup_times = initialize(factories, serial)
+    del startup_times["total"]
+    timer.devices.update(startup_times)
+    timer.lap("devices")
+    return devices
+
+
+def build_tester(arguments, timer):
+    """Constructs the devices of the tester and wires them to a Runtime,
+    ready to run.
+
+    Args:
+        arguments: The parsed arguments of the run subcommand.
+        timer: The StartupTimer.
+
+    Returns:
+        A dictionary of the Runtime ("runtime"), the devices, the shared ring
+        buffers ("force_buffer", "position_buffer",
+        "force_displacement_buffer") and the ProtocolRunner
+        ("protocol_runner", None without a protocol) by name.
+    """
+    from button import Button
+    from calibration import CalibrationStore
+    from force_displacement import ForceDisplacementAligner, ForceDisplacementPipeline
+    from linear_actuator import LinearActuator
+    from load_cell_amplifier import LoadCellAmplifier
+    from load_cell import LoadCell
+    from motion_planner import MotionPlanner
+    from motor import Motor
+    from rotary_encoder import RotaryEncoder
+    from runtime import Runtime
+    from safety import SafetyInterlock
+    from shared_ring_buffer import SharedRingBuffer
+    from streaming import StreamServer
+    from supervisor import Scheduling, Watchdog, apply_scheduling
+    protocol = None
+    if arguments.protocol is not None:
+        from controller import ClosedLoopController, latest_value
+        from protocol import ProtocolRunner, compile_protocol, load_protocol
+        protocol = load_protocol(arguments.protocol)
+    timer.lap("imports")
+
+    # Initialize objects concurrently, except the load cell, whose tare
+    # bit-bangs the HX711 clock and so runs alone on this thread afterwards.
+    # It starts from its stored calibration profile and only checks its
+    # offset with a quick tare; without a profile it is tared from scratch.
+    calibration_store = CalibrationStore()
+    devices = initialize_devices(timer, {
+        "motor": lambda: Motor(*MOTOR_PINS),
+        "rotary_encoder": lambda: RotaryEncoder(*ROTARY_ENCODER_PINS),
+    }, serial={
+        "load_cell_amplifier": lambda: LoadCellAmplifier(*LOAD_CELL_AMPLIFIER_PINS,
+                                                         calibration=calibration_store.load("load_cell"),
+                                                         quick_tare=True),
+    })
+    motor = devices["motor"]
+    rotary_encoder = devices["rotary_encoder"]
+    load_cell_amplifier = devices["load_cell_amplifier"]
+    linear_actuator = LinearActuator(motor)
+    load_cell = LoadCell(load_cell_amplifier)
+
+    runtime = Runtime()
+
+    # Buttons only post events; their handlers run one at a time on the
+    # runtime's event loop
+    buttons = [Button(27, runtime.callback("up")),
+               Button(17, runtime.callback("down")),
+               Button(2, runtime.callback("stop")),
+               Button(7, runtime.callback("increase_speed")),
+               Button(3, runtime.callback("decrease_speed"))]
+
+    # Limit switches halt the step pulses directly, without debouncing or
+    # going through the event loop. The fault is latched until the stop
+    # button is pressed, after which the carriage can move away from the
+    # switch.
+    safety_interlock = SafetyInterlock(motor, {BOTTOM_LIMIT_SWITCH_PIN: Motor.Direction.CCW,
+                                               TOP_LIMIT_SWITCH_PIN: Motor.Direction.CW})
+
+    runtime.on("up", linear_actuator.move_up)
+    runtime.on("down", linear_actuator.move_down)
+    runtime.on("stop", linear_actuator.stop)
+    runtime.on("stop", lambda channel: safety_interlock.reset())
+    runtime.on("increase_speed", linear_actuator.increase_speed)
+    runtime.on("decrease_speed", linear_actuator.decrease_speed)
+
+    # Shared ring buffers the sensor readings are published to. Any process
+    # can read them, e.g. force_buffer.latest()["force"].
+    force_buffer = SharedRingBuffer(LoadCell.RECORD_FIELDS, LoadCell.RECORD_FORMAT)
+    position_buffer = SharedRingBuffer(RotaryEncoder.RECORD_FIELDS, RotaryEncoder.RECORD_FORMAT)
+
+    # Aligned (time, force, displacement) records
+    force_displacement_buffer = SharedRingBuffer(ForceDisplacementAligner.RECORD_FIELDS,
+                                                 ForceDisplacementAligner.RECORD_FORMAT)
+    force_displacement = ForceDisplacementPipeline(force_buffer, position_buffer,
+                                                   ForceDisplacementAligner(linear_actuator.SCREW_LEAD))
+
+    def align_force_displacement():
+        for record in force_displacement.poll():
+            force_displacement_buffer.write(*record)
+
+    # Run the load cell in a separate process. The encoder edges are counted
+    # by GPIO callbacks in this process, which a forked process would not
+    # inherit, so its position is published from the event loop every
+    # millisecond to be interpolated onto the load cell readings, which are
+    # aligned on the event loop too.
+    # On a 4-core Pi the load cell process gets a core of its own with a
+    # real-time priority, away from the main process (buttons, encoder
+    # callbacks, motor step timing) on cores 0 and 1; without permission the
+    # default scheduling is kept. If its ring buffer stops advancing, the
+    # motor is stopped and the process restarted. The HX711 is read at
+    # 10 Hz, so the watchdog allows 2 s.
+    def stop_motor(process):
+        print("ERROR: Stopping the motor, process " + process + " stalled.")
+        motor.disable()
+
+    apply_scheduling(Scheduling(cpus={0, 1}))
+    runtime.add_process("load_cell", load_cell.run, force_buffer,
+                        scheduling=Scheduling(cpus={2}, policy="fifo", priority=50),
+                        watchdog=Watchdog(lambda: force_buffer.head, TIMEOUT=2.0, on_stall=stop_motor))
+    runtime.add_periodic("rotary_encoder", lambda: rotary_encoder.publish(position_buffer), 0.001)
+    runtime.add_periodic("force_displacement", align_force_displacement, 0.01)
+
+    # Carriage position from the step count, checked against the encoder so
+    # lost steps stop the motor. Home with motion_planner.home(safety_interlock)
+    # to make the position absolute. The carriage velocity and acceleration
+    # are estimated from the encoder edge times at 100 Hz.
+    motion_planner = MotionPlanner(linear_actuator, rotary_encoder)
+    runtime.add_periodic("position_check", motion_planner.check, 0.01)
+    runtime.add_periodic("velocity", motion_planner.update_velocity, 0.01)
+
+    # Live data for local viewers (TCP port 9109, JSON lines), which can also
+    # send the up/down/stop/speed commands
+    stream_server = StreamServer(force_buffer, position_buffer, linear_actuator)
+    runtime.add_task("stream_server", stream_server.serve)
+    runtime.add_periodic("stream", stream_server.publish, 0.02)
+
+    # A protocol runs on the closed-loop controller, fed with the aligned
+    # force and displacement, and stops the runtime once it is over. Records
+    # older than MAX_AGE count as missing, so a stalled load cell process
+    # stops the motor. The displacement is counted from the start of the
+    # run, so by default the travel is only bounded by the length of the
+    # travel envelope either way.
+    if protocol is not None:
+        plan = compile_protocol(protocol, linear_actuator)
+        travel_limits = arguments.travel_limits
+        if travel_limits is None:
+            travel = motion_planner.TRAVEL_LIMITS[1] - motion_planner.TRAVEL_LIMITS[0]
+            travel_limits = (-travel, travel)
+        controller = ClosedLoopController(linear_actuator,
+                                          latest_value(force_displacement_buffer, "displacement", MAX_AGE=0.5),
+                                          latest_value(force_displacement_buffer, "force", MAX_AGE=0.5),
+                                          FORCE_LIMIT=arguments.force_limit, TRAVEL_LIMITS=tuple(travel_limits))
+        protocol_runner = ProtocolRunner(plan, controller)
+        runtime.add_task("protocol", _run_protocol, runtime, protocol_runner, 1 / controller.CONTROL_RATE)
+    else:
+        protocol_runner = None
+    timer.lap("setup")
+    return {
+        "runtime": runtime,
+        "motor": motor,
+        "rotary_encoder": rotary_encoder,
+        "load_cell_amplifier": load_cell_amplifier,
+        "linear_actuator": linear_actuator,
+        "load_cell": load_cell,
+        "buttons": buttons,
+        "safety_interlock": safety_interlock,
+        "motion_planner": motion_planner,
+        "stream_server": stream_server,
+        "force_buffer": force_buffer,
+        "position_buffer": position_buffer,
+        "force_displacement_buffer": force_displacement_buffer,
+        "protocol_runner": protocol_runner,
+    }
+
+
+def run(arguments, timer):
+    """Runs the tester until it is interrupted or its protocol is over."""
+    tester = build_tester(arguments, timer)
+    runtime = tester["runtime"]
+
+    # The tasks start once the processes are started
+    async def report_startup():
+        timer.lap("processes")
+        timer.report(arguments.startup_target)
+
+    runtime.add_task("startup_report", report_startup)
+
+    try:
+        runtime.run()
+    finally:
+        tester["motor"].disable()
+        for name in ("force_buffer", "position_buffer", "force_displacement_buffer"):
+            tester[name].close()
+            tester[name].unlink()
+    protocol_runner = tester["protocol_runner"]
+    return 0 if protocol_runner is None or protocol_runner.fault is None else 1
+
+
+async def _run_protocol(runtime, protocol_runner, period):
+    """Runs a protocol, then prints its report and stops the runtime."""
+    import asyncio
+    import json
+    protocol_runner.start()
+    try:
+        while protocol_runner.running:
+            protocol_runner.update()
+            await asyncio.sleep(period)
+    finally:
+        protocol_runner.stop()
+        protocol_runner.controller.stop()
+    print(json.dumps(protocol_runner.report(), indent=4))
+    runtime.stop()
+
+
+def calibrate(arguments, timer):
+    """Calibrates the load cell with known weights and stores the profile."""
+    from calibration import CalibrationProfile, CalibrationStore
+    from load_cell_amplifier import LoadCellAmplifier
+    timer.lap("imports")
+
+    # Starting from an empty profile skips the tare on initialization, so it
+    # can be done once the load is removed
+    calibration_store = CalibrationStore(arguments.calibration)
+    load_cell_amplifier = initialize_devices(timer, {}, serial={
+        "load_cell_amplifier": lambda: LoadCellAmplifier(*LOAD_CELL_AMPLIFIER_PINS,
+                                                         calibration=CalibrationProfile(arguments.name,
+                                                                                        GAIN=arguments.gain)),
+    })["load_cell_amplifier"]
+    timer.report(arguments.startup_target)
+
+    input("Remove any load from the load cell and press Enter.")
+    load_cell_amplifier.reset()
+    load_cell_amplifier.tare()
+    for i, weight in enumerate(arguments.weight):
+        input("Place " + str(weight) + " on the load cell and press Enter.")
+        if i == 0:
+            load_cell_amplifier.calibrate_reference_unit(weight, arguments.times)
+        # A single weight only sets the reference unit; several are also
+        # linearization points
+        if len(arguments.weight) > 1:
+            load_cell_amplifier.add_calibration_point(weight, arguments.times)
+
+    profile = load_cell_amplifier.calibration_profile(arguments.name)
+    calibration_store.save(profile)
+    print("Saved calibration profile " + profile.name + " to " + calibration_store.path + ": OFFSET "
+          + str(profile.OFFSET) + ", REFERENCE_UNIT " + str(profile.REFERENCE_UNIT) + ", "
+          + str(len(profile.points)) + " linearization points")
+    return 0
+
+
+def tare(arguments, timer):
+    """Re-tares the load cell and stores the new offset in its profile."""
+    from calibration import CalibrationStore
+    from load_cell_amplifier import LoadCellAmplifier
+    timer.lap("imports")
+
+    calibration_store = CalibrationStore(arguments.calibration)
+    profile = calibration_store.load(arguments.name)
+    if profile is None:
+        print("ERROR: No calibration profile " + arguments.name + " in " + calibration_store.path
+              + ", run the calibrate subcommand first.")
+        return 1
+    load_cell_amplifier = initialize_devices(timer, {}, serial={
+        "load_cell_amplifier": lambda: LoadCellAmplifier(*LOAD_CELL_AMPLIFIER_PINS, calibration=profile),
+    })["load_cell_amplifier"]
+    timer.report(arguments.startup_target)
+
+    previous_offset = load_cell_amplifier.OFFSET
+    load_cell_amplifier.tare(arguments.times)
+    calibration_store.save(load_cell_amplifier.calibration_profile(arguments.name))
+    print("Load cell offset: " + str(load_cell_amplifier.OFFSET) + " (changed by "
+          + str(load_cell_amplifier.OFFSET - previous_offset) + ")")
+    return 0
+
+
+def jog(arguments, timer):
+    """Moves the carriage by a distance, stopping at the limit switches."""
+    from linear_actuator import LinearActuator
+    from motion_planner import MotionPlanner
+    from motor import Motor
+    from rotary_encoder import RotaryEncoder
+    from safety import SafetyInterlock
+    timer.lap("imports")
+
+    devices = initialize_devices(timer, {
+        "motor": lambda: Motor(*MOTOR_PINS),
+        "rotary_encoder": lambda: RotaryEncoder(*ROTARY_ENCODER_PINS),
+    })
+    motor = devices["motor"]
+    linear_actuator = LinearActuator(motor)
+    safety_interlock = SafetyInterlock(motor, {BOTTOM_LIMIT_SWITCH_PIN: Motor.Direction.CCW,
+                                               TOP_LIMIT_SWITCH_PIN: Motor.Direction.CW})
+    motion_planner = MotionPlanner(linear_actuator, devices["rotary_encoder"])
+    timer.lap("setup")
+    timer.report(arguments.startup_target)
+
+    try:
+        if arguments.home and not motion_planner.home(safety_interlock):
+            return 1
+        moved = motion_planner.move_by(arguments.distance, arguments.speed, wait=True)
+    finally:
+        motor.disable()
+    print("Carriage position: " + "{0:.3f}".format(motion_planner.position) + " mm")
+    return 0 if moved and not safety_interlock.tripped and motion_planner.fault is None else 1
+
+
+def record(arguments, timer):
+    """Records the raw and calibrated load cell readings and the encoder
+    position to a recording file.
+    """
+    import gpio
+    from calibration import CalibrationStore
+    from force_displacement import ForceDisplacementAligner
+    from load_cell import LoadCell
+    from load_cell_amplifier import LoadCellAmplifier
+    from recorder import Recorder, calibration_from
+    from rotary_encoder import RotaryEncoder
+    timer.lap("imports")
+
+    calibration_store = CalibrationStore(arguments.calibration)
+    devices = initialize_devices(timer, {
+        "rotary_encoder": lambda: RotaryEncoder(*ROTARY_ENCODER_PINS),
+    }, serial={
+        "load_cell_amplifier": lambda: LoadCellAmplifier(*LOAD_CELL_AMPLIFIER_PINS,
+                                                         calibration=calibration_store.load("load_cell"),
+                                                         quick_tare=True),
+    })
+    rotary_encoder = devices["rotary_encoder"]
+    load_cell_amplifier = devices["load_cell_amplifier"]
+    load_cell = LoadCell(load_cell_amplifier)
+    aligner = ForceDisplacementAligner(arguments.screw_lead)
+    aligner.zero(rotary_encoder.position)
+    calibration = calibration_from(load_cell_amplifier)
+    calibration["SCREW_LEAD"] = arguments.screw_lead
+    timer.lap("setup")
+    timer.report(arguments.startup_target)
+
+    profile = load_cell_amplifier.calibration
+    records = 0
+    with Recorder(arguments.output, calibration) as recorder:
+        end_time = gpio.monotonic() + arguments.duration
+        try:
+            while gpio.monotonic() < end_time:
+                raw = load_cell_amplifier.read()
+                weight = (raw - load_cell_amplifier.OFFSET) / load_cell_amplifier.REFERENCE_UNIT
+                if profile is not None:
+                    weight = profile.linearize(weight)
+                position = rotary_encoder.position
+                recorder.write(load_cell_amplifier.statistics.last_sample_time, raw,
+                               load_cell.filter.update(weight), position, aligner.to_displacement(position))
+                records += 1
+        except KeyboardInterrupt:
+            pass
+    print("Recorded " + str(records) + " readings to " + arguments.output)
+    return 0
+
+
+def analyze(arguments, timer):
+    """Analyzes recordings with analysis.py."""
+    import analysis
+    return analysis.main(arguments.arguments)
+
+
+def main(argv=None):
+    """Runs the subcommand given on the command line.
+
+    Returns:
+        The exit status.
+    """
+    parser = argparse.ArgumentParser(prog="portable-mechanical-tester",
+                                     description="Runs and controls the portable mechanical tester.")
+    parser.add_argument("--startup-target", type=float, default=None,
+                        help="startup time reported as an error when exceeded [s]")
+    subparsers = parser.add_subparsers(dest="subcommand", metavar="SUBCOMMAND")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser("run", help="run the tester")
+    run_parser.add_argument("--protocol", default=None, help="YAML or JSON test protocol to run")
+    run_parser.add_argument("--force-limit", type=float, default=None,
+                            help="largest force allowed during the protocol")
+    run_parser.add_argument("--travel-limits", type=float, nargs=2, default=None, metavar=("MIN", "MAX"),
+                            help="displacement range allowed during the protocol, from the start of the "
+                            "run [mm] (default: the length of the travel envelope either way)")
+    run_parser.set_defaults(function=run)
+
+    calibrate_parser = subparsers.add_parser("calibrate", help="calibrate the load cell with known weights")
+    calibrate_parser.add_argument("--weight", type=float, action="append", required=True,
+                                  help="known weight, in force units; repeat for linearization points")
+    calibrate_parser.add_argument("--gain", type=int, choices=(128, 64, 32), default=128, help="amplifier gain")
+    calibrate_parser.set_defaults(function=calibrate)
+
+    tare_parser = subparsers.add_parser("tare", help="re-tare the load cell and store its offset")
+    tare_parser.set_defaults(function=tare)
+
+    for subparser, times in ((calibrate_parser, 10), (tare_parser, 25)):
+        subparser.add_argument("--name", default="load_cell", help="name of the calibration profile")
+        subparser.add_argument("--calibration", default=None, help="calibration profiles file")
+        subparser.add_argument("--times", type=int, default=times, help="conversions averaged per measurement")
+
+    jog_parser = subparsers.add_parser("jog", help="move the carriage by a distance")
+    jog_parser.add_argument("distance", type=float, help="distance [mm], positive upwards")
+    jog_parser.add_argument("--speed", type=float, default=5, help="speed [mm/s]")
+    jog_parser.add_argument("--home", action="store_true", help="home against the bottom limit switch first")
+    jog_parser.set_defaults(function=jog)
+
+    record_parser = subparsers.add_parser("record", help="record the load cell and encoder readings")
+    record_parser.add_argument("output", help="recording file to write")
+    record_parser.add_argument("--duration", type=float, default=60, help="recording duration [s]")
+    record_parser.add_argument("--calibration", default=None, help="calibration profiles file")
+    record_parser.add_argument("--screw-lead", type=float, default=5, help="lead of the lead screw [mm]")
+    record_parser.set_defaults(function=record)
+
+    # The arguments of analysis.py are passed through, including --help
+    analyze_parser = subparsers.add_parser("analyze", help="compute the material properties of recordings",
+                                           add_help=False)
+    analyze_parser.set_defaults(function=analyze)
+
+    arguments, unknown_arguments = parser.parse_known_args(argv)
+    if arguments.subcommand == "analyze":
+        arguments.arguments = unknown_arguments
+    elif unknown_arguments:
+        parser.error("unrecognized arguments: " + " ".join(unknown_arguments))
+    return arguments.function(arguments, StartupTimer())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+"""Module defining Specimen class and the material property analysis.
+
+Computes the results of a completed tensile test from its force and
+displacement samples:
+    Stress and strain: engineering values from the specimen's cross-section
+        area and gauge length.
+    Elastic modulus: a robust least squares fit of the stress-strain curve
+        between LOWER_FIT and UPPER_FIT of the ultimate strength, before the
+        ultimate. Points further than OUTLIER_SCALE residual standard
+        deviations from the line are rejected and the line refitted.
+    Yield strength: the 0.2% offset yield, where the curve crosses the
+        elastic line shifted by OFFSET_STRAIN.
+    Ultimate strength, elongation at break and toughness: the largest
+        stress, the strain of the last point before the stress drops below
+        BREAK_FRACTION of the ultimate strength, and the area under the curve
+        up to that point.
+
+Samples are processed in chunks of CHUNK_SIZE with vectorized NumPy
+operations, in a few passes over the data, so the memory used does not
+depend on the length of the test. Inputs can be NumPy arrays, memory-mapped
+arrays (numpy.load(..., mmap_mode="r")) or recording files.
+
+The ultimate strength is the largest sample, so forces should be filtered
+(as LoadCell records them) rather than raw readings.
+
+Forces are in N and lengths in mm, so stresses are in MPa and toughness in
+MJ/m^3.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import json
+import math
+import sys
+
+CHUNK_SIZE = 1 << 20         # Samples processed at once
+LOWER_FIT = 0.1              # Fit range of the elastic modulus, as fractions of the ultimate strength
+UPPER_FIT = 0.4
+OUTLIER_SCALE = 3            # Residual standard deviations beyond which a point is rejected from the fit
+ROBUST_ITERATIONS = 5        # Maximum number of refits after rejecting outliers
+OFFSET_STRAIN = 0.002        # Offset of the yield line
+BREAK_FRACTION = 0.5         # Fraction of the ultimate strength below which the specimen is broken
+
+MaterialProperties = namedtuple("MaterialProperties", (
+    "elastic_modulus", "yield_strength", "yield_strain", "ultimate_strength", "ultimate_strain",
+    "elongation_at_break", "toughness", "samples"))
+MaterialProperties.__doc__ = """The results of a test. Stresses and the elastic
+modulus are in MPa, strains are dimensionless and toughness is in MJ/m^3.
+yield_strength and yield_strain are NaN if the curve never crosses the
+offset line before the break."""
+
+
+class Specimen:
+    """Represents the geometry of a test specimen.
+
+    Attributes:
+        AREA: A float indicating the cross-section area of the gauge section
+            [mm^2].
+        GAUGE_LENGTH: A float indicating the initial gauge length [mm].
+        name: A string identifying the specimen.
+    """
+
+    def __init__(self, AREA, GAUGE_LENGTH, name="specimen"):
+        """Initializes Specimen."""
+        if AREA <= 0 or GAUGE_LENGTH <= 0:
+            raise ValueError("Specimen area and gauge length must be positive.")
+        self.AREA = AREA
+        self.GAUGE_LENGTH = GAUGE_LENGTH
+        self.name = name
+
+    @classmethod
+    def rectangular(cls, width, thickness, GAUGE_LENGTH, name="specimen"):
+        """Creates a specimen with a rectangular cross-section [mm]."""
+        return cls(width * thickness, GAUGE_LENGTH, name)
+
+    @classmethod
+    def round(cls, diameter, GAUGE_LENGTH, name="specimen"):
+        """Creates a specimen with a circular cross-section [mm]."""
+        return cls(math.pi * diameter ** 2 / 4, GAUGE_LENGTH, name)
+
+    def stress_strain(self, force, displacement):
+        """Converts force [N] and displacement [mm] arrays to engineering
+        stress [MPa] and strain arrays.
+        """
+        import numpy as np
+        return (np.asarray(force, dtype=np.float64) / self.AREA,
+                np.asarray(displacement, dtype=np.float64) / self.GAUGE_LENGTH)
+
+
+class ArraySource:
+    """Reads force and displacement samples from two array-likes, e.g. NumPy
+    arrays or memory-mapped arrays.
+    """
+
+    def __init__(self, force, displacement):
+        """Initializes ArraySource."""
+        if len(force) != len(displacement):
+            raise ValueError("Force and displacement arrays differ in length.")
+        self.force = force
+        self.displacement = displacement
+
+    def __len__(self):
+        return len(self.force)
+
+    def read(self, start, stop):
+        """Returns the (force, displacement) arrays of a range of samples."""
+        return self.force[start:stop], self.displacement[start:stop]
+
+
+class RecordingSource:
+    """Reads force and displacement samples from a recording file."""
+
+    def __init__(self, recording):
+        """Initializes RecordingSource from an open recorder.Recording."""
+        self.recording = recording
+
+    def __len__(self):
+        return len(self.recording)
+
+    def read(self, start, stop):
+        """Returns the (force, displacement) arrays of a range of samples."""
+        return self.recording.column("force", start, stop), self.recording.column("displacement", start, stop)
+
+
+def analyze(source, specimen, chunk_size=CHUNK_SIZE):
+    """Computes the material properties of a test.
+
+    Args:
+        source: An ArraySource, a RecordingSource or any object with
+            __len__() and read(start, stop).
+        specimen: The Specimen tested.
+        chunk_size: The number of samples processed at once.
+
+    Returns:
+        MaterialProperties.
+
+    Raises:
+        ValueError: The test holds no samples or no load.
+    """
+    import numpy as np
+
+    length = len(source)
+    if length == 0:
+        raise ValueError("The test holds no samples.")
+
+    def chunks(start, stop, overlap=False):
+        """Yields (index of the first sample, stress, strain) for each chunk.
+        With overlap, every chunk after the first starts with the last sample
+        of the previous one.
+        """
+        for chunk_start in range(start, stop, chunk_size):
+            first = chunk_start - 1 if overlap and chunk_start > start else chunk_start
+            stress, strain = specimen.stress_strain(*source.read(first, min(chunk_start + chunk_size, stop)))
+            yield first, stress, strain
+
+    # Ultimate strength
+    ultimate_strength = -np.inf
+    ultimate_index = 0
+    for first, stress, strain in chunks(0, length):
+        i = int(np.argmax(stress))
+        if stress[i] > ultimate_strength:
+            ultimate_strength = float(stress[i])
+            ultimate_index = first + i
+            ultimate_strain = float(strain[i])
+    if ultimate_strength <= 0:
+        raise ValueError("The test holds no tensile load.")
+
+    # Break: the last point before the stress drops below BREAK_FRACTION of
+    # the ultimate strength
+    break_index = length - 1
+    for first, stress, strain in chunks(ultimate_index, length):
+        broken = np.flatnonzero(stress < BREAK_FRACTION * ultimate_strength)
+        if len(broken):
+            break_index = first + int(broken[0]) - 1
+            break
+
+    # Toughness and elongation at break
+    toughness = 0.0
+    for first, stress, strain in chunks(0, break_index + 1, overlap=True):
+        toughness += float(np.sum((stress[1:] + stress[:-1]) * np.diff(strain))) / 2
+        elongation_at_break = float(strain[-1])
+
+    # Elastic modulus
+    fit = _robust_fit(chunks, ultimate_index, ultimate_strength)
+    if fit is None:
+        elastic_modulus = yield_strength = yield_strain = math.nan
+    else:
+        elastic_modulus, intercept, fit_start = fit
+        yield_strength, yield_strain = _offset_yield(chunks, fit_start, break_index, elastic_modulus, intercept)
+
+    return MaterialProperties(elastic_modulus, yield_strength, yield_strain, ultimate_strength, ultimate_strain,
+                              elongation_at_break, toughness, length)
+
+
+def analyze_recording(path, specimen, chunk_size=CHUNK_SIZE):
+    """Computes the material properties of a recorded test. See analyze()."""
+    from recorder import Recording
+    with Recording(path) as recording:
+        return analyze(RecordingSource(recording), specimen, chunk_size)
+
+
+def analyze_many(paths, specimens, jobs=None, chunk_size=CHUNK_SIZE):
+    """Analyzes recorded tests in parallel, one process per CPU core by
+    default.
+
+    Args:
+        paths: The paths of the recordings.
+        specimens: The Specimen of each recording, or a single Specimen
+            shared by all of them.
+        jobs: The number of worker processes, or None for one per core.
+        chunk_size: The number of samples processed at once.
+
+    Returns:
+        A list of MaterialProperties, in the order of paths.
+    """
+    if isinstance(specimens, Specimen):
+        specimens = [specimens] * len(paths)
+    if len(specimens) != len(paths):
+        raise ValueError("Expected one specimen per recording.")
+    if jobs == 1:
+        return [analyze_recording(path, specimen, chunk_size) for path, specimen in zip(paths, specimens)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(analyze_recording, paths, specimens, [chunk_size] * len(paths)))
+
+
+def _robust_fit(chunks, ultimate_index, ultimate_strength):
+    """Fits stress = elastic_modulus * strain + intercept over the elastic
+    range, rejecting outliers. Each iteration is one pass accumulating the
+    sums of the least squares fit, so no samples are kept.
+
+    Returns:
+        An (elastic_modulus, intercept, index of the first fitted sample)
+        tuple, or None if fewer than two distinct strains lie in the range.
+    """
+    import numpy as np
+
+    lower = LOWER_FIT * ultimate_strength
+    upper = UPPER_FIT * ultimate_strength
+    line = None
+    inliers = None
+    for _ in range(ROBUST_ITERATIONS + 1):
+        n = sx = sy = sxx = sxy = syy = 0.0
+        fit_start = None
+        for first, stress, strain in chunks(0, ultimate_index + 1):
+            selected = (stress >= lower) & (stress <= upper)
+            if line is not None:
+                slope, intercept, limit, _ = line
+                selected &= np.abs(stress - (slope * strain + intercept)) <= limit
+            x = strain[selected]
+            y = stress[selected]
+            if fit_start is None and len(x):
+                fit_start = first + int(np.argmax(selected))
+            n += len(x)
+            sx += float(np.sum(x))
+            sy += float(np.sum(y))
+            sxx += float(np.dot(x, x))
+            sxy += float(np.dot(x, y))
+            syy += float(np.dot(y, y))
+        denominator = n * sxx - sx * sx
+        if n < 2 or denominator <= 0:
+            return None if line is None else (line[0], line[1], line[3])
+        slope = (n * sxy - sx * sy) / denominator
+        intercept = (sy - slope * sx) / n
+        # Sum of the squared residuals, from the same sums
+        residuals = (syy - 2 * slope * sxy - 2 * intercept * sy + slope * slope * sxx
+                     + 2 * slope * intercept * sx + n * intercept * intercept)
+        limit = OUTLIER_SCALE * math.sqrt(max(residuals, 0.0) / n)
+        if n == inliers or limit == 0:
+            break
+        line = (slope, intercept, limit, fit_start)
+        inliers = n
+    return slope, intercept, fit_start
+
+
+def _offset_yield(chunks, fit_start, break_index, elastic_modulus, intercept):
+    """Finds where the curve first drops below the elastic line shifted by
+    OFFSET_STRAIN, interpolating between the two samples around it.
+
+    Returns:
+        A (yield_strength, yield_strain) tuple, NaN if there is no crossing.
+    """
+    import numpy as np
+
+    for first, stress, strain in chunks(fit_start, break_index + 1, overlap=True):
+        distance = stress - (elastic_modulus * (strain - OFFSET_STRAIN) + intercept)
+        below = np.flatnonzero(distance <= 0)
+        if len(below) == 0:
+            continue
+        i = int(below[0])
+        if i == 0:
+            return float(stress[0]), float(strain[0])
+        fraction = distance[i - 1] / (distance[i - 1] - distance[i])
+        return (float(stress[i - 1] + fraction * (stress[i] - stress[i - 1])),
+                float(strain[i - 1] + fraction * (strain[i] - strain[i - 1])))
+    return math.nan, math.nan
+
+
+def main(arguments=None):
+    """Analyzes the recordings given on the command line and prints their
+    material properties as JSON lines.
+    """
+    parser = argparse.ArgumentParser(description="Computes the material properties of recorded tests.")
+    parser.add_argument("recordings", nargs="+", help="recording files to analyze")
+    parser.add_argument("--area", type=float, required=True, help="specimen cross-section area [mm^2]")
+    parser.add_argument("--gauge-length", type=float, required=True, help="specimen gauge length [mm]")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, one per core by default")
+    arguments = parser.parse_args(arguments)
+
+    specimen = Specimen(arguments.area, arguments.gauge_length)
+    for path, properties in zip(arguments.recordings, analyze_many(arguments.recordings, specimen, arguments.jobs)):
+        print(json.dumps(dict(properties._asdict(), recording=path)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,649 @@
+"""Module containing benchmarks of the acquisition and motion code.
+
+The benchmarks run against the simulated GPIO backend, so they need no
+hardware and can be run on any machine:
+    python benchmarks.py [BENCHMARK ...] [--save] [--check]
+
+Results are appended to a history file (benchmark_results.json next to this
+module by default) with --save. --check compares the results with the last
+saved ones and exits with status 1 if any metric got worse by more than the
+tolerance, so the suite can gate changes automatically. CPU-time metrics
+include the simulator's own cost and vary between machines, so results are
+only comparable with history saved on the same machine.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import argparse
+from filters import SpikeRejectionFilter, MedianFilter, TrimmedMeanFilter, MovingAverageFilter
+import gpio
+from metrics import MetricsRegistry
+from simulator import SimulatedGPIO, SimulatedAMT102, SimulatedHX711, SimulatedSwitch
+
+# Device modules configure the GPIO backend on import, so the simulator must
+# be selected first.
+gpio.set_backend(SimulatedGPIO())
+
+from button import Button
+from linear_actuator import LinearActuator
+from load_cell import LoadCell
+from load_cell_amplifier import LoadCellAmplifier, MultiChannelLoadCellAmplifier
+from motor import Motor
+from step_generator import StepGenerator
+from rotary_encoder import RotaryEncoder, VelocityEstimator
+from safety import SafetyInterlock
+
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results.json")
+
+# Metric name endings for which a larger value is better. For every other
+# metric (times, latencies, jitter, overheads, counts of late events) a
+# smaller value is better.
+HIGHER_IS_BETTER = ("_per_s", "_rpm", "_rate")
+
+
+def simulated_backend():
+    """Selects and returns a fresh simulated GPIO backend."""
+    backend = SimulatedGPIO()
+    gpio.set_backend(backend)
+    return backend
+
+
+def synthetic_quadrature_edges(counts):
+    """Generates the (A, B) states of an encoder turning by a number of
+    quadrature counts, one state per edge.
+
+    Args:
+        counts: The signed number of quadrature counts to generate.
+    """
+    increment = 1 if counts >= 0 else -1
+    count = 0
+    for _ in range(abs(counts)):
+        count += increment
+        yield SimulatedAMT102.STATES[count % 4]
+
+
+def benchmark_encoder_decoder(edges=200000):
+    """Measures how many encoder edges per second RotaryEncoder can decode.
+
+    Args:
+        edges: The number of quadrature edges to decode.
+
+    Returns:
+        A dictionary with the rate of the decoding state machine alone, the
+        rate through the edge callbacks of the simulated backend (a lower
+        bound, as it includes the simulator's own cost) and the shaft speed
+        the decoder alone can follow.
+    """
+    backend = simulated_backend()
+    encoder = SimulatedAMT102(backend, 9, 11, 10)
+    rotary_encoder = RotaryEncoder(9, 11, 10)
+
+    states = list(synthetic_quadrature_edges(edges))
+    t_initial = time.perf_counter()
+    for pin_A_state, pin_B_state in states:
+        rotary_encoder.update(pin_A_state, pin_B_state)
+    decoder_time = time.perf_counter() - t_initial
+    assert rotary_encoder.position == edges, "Decoder lost counts"
+
+    rotary_encoder.reset()
+    rotary_encoder.update(*SimulatedAMT102.STATES[0])
+    t_initial = time.perf_counter()
+    encoder.rotate(edges)
+    callback_time = time.perf_counter() - t_initial
+    assert rotary_encoder.position == edges, "Decoder lost counts"
+
+    decoder_rate = edges / decoder_time
+    return {
+        "decoder_counts_per_s": decoder_rate,
+        "callback_counts_per_s": edges / callback_time,
+        "max_shaft_speed_rpm": decoder_rate / RotaryEncoder.COUNTS_PER_REVOLUTION * 60,
+    }
+
+
+def benchmark_velocity_estimator(speeds=(0.01, 0.1, 1, 10, 100, 500), update_rate=100, duration=1.0,
+                                 SCREW_LEAD=5, TOLERANCE=0.02, TIMESTAMP_RESOLUTION=1e-6):
+    """Measures the accuracy and latency of VelocityEstimator against a
+    synthetic edge stream, compared with counting edges between updates.
+
+    For each carriage speed, the carriage starts from rest, moves at the
+    speed for duration (stretched to at least 50 edges) and stops. Edges are
+    timestamped with TIMESTAMP_RESOLUTION, as by the monotonic clock.
+
+    Args:
+        speeds: The carriage speeds measured [mm/s].
+        update_rate: The rate of the estimator updates [Hz].
+        duration: The time spent at each speed [s].
+        SCREW_LEAD: The lead of the lead screw [mm].
+        TOLERANCE: The relative error within which the estimate counts as
+            settled.
+        TIMESTAMP_RESOLUTION: The resolution of the edge timestamps [s].
+
+    Returns:
+        A dictionary with, over all speeds, the largest RMS relative error
+        over the second half of the motion for the estimator and for edge
+        counting, the largest time to settle within TOLERANCE after the
+        start and to fall within TOLERANCE of 0 after the stop, and the CPU
+        time per update.
+    """
+    counts_per_mm = RotaryEncoder.COUNTS_PER_REVOLUTION / SCREW_LEAD
+    period = 1 / update_rate
+    results = {"rms_error": 0.0, "counting_rms_error": 0.0, "start_latency_s": 0.0, "stop_latency_s": 0.0}
+    updates = 0
+    update_time = 0.0
+    for speed in speeds:
+        estimator = VelocityEstimator(SCALE=1 / counts_per_mm)
+        count_rate = speed * counts_per_mm
+        stop_time = max(duration, 50 / count_rate)
+        end_time = stop_time + 1
+        steps = int(round(end_time * update_rate))
+
+        def last_edge(t):
+            count = int(min(t, stop_time) * count_rate)
+            if count == 0:
+                return (-1.0, 0)    # The carriage has been at rest since t = -1
+            return (round(count / count_rate / TIMESTAMP_RESOLUTION) * TIMESTAMP_RESOLUTION, count)
+
+        edges = [last_edge(i * period) for i in range(steps + 1)]
+        estimates = []
+        t_initial = time.process_time()
+        for i in range(steps + 1):
+            estimates.append(estimator.update(i * period, edges[i]))
+        update_time += time.process_time() - t_initial
+        updates += steps + 1
+
+        errors = []
+        counting_errors = []
+        start = None
+        stop = None
+        for i in range(1, steps + 1):
+            t = i * period
+            if t <= stop_time:
+                error = abs(estimates[i] - speed) / speed
+                if start is None and error <= TOLERANCE:
+                    start = t
+                if t >= stop_time / 2:
+                    counted = (edges[i][1] - edges[i - 1][1]) / counts_per_mm / period
+                    errors.append(error ** 2)
+                    counting_errors.append(((counted - speed) / speed) ** 2)
+            elif stop is None and abs(estimates[i]) <= TOLERANCE * speed:
+                stop = t - stop_time
+        results["rms_error"] = max(results["rms_error"], math.sqrt(statistics.mean(errors)))
+        results["counting_rms_error"] = max(results["counting_rms_error"],
+                                            math.sqrt(statistics.mean(counting_errors)))
+        results["start_latency_s"] = max(results["start_latency_s"], stop_time if start is None else start)
+        results["stop_latency_s"] = max(results["stop_latency_s"], end_time - stop_time if stop is None else stop)
+    results["update_cpu_s"] = update_time / updates
+    return results
+
+
+def legacy_spike_rejection(history, samples, spikes):
+    """The original LoadCell.getMeasure() filter, kept as a reference.
+
+    Args:
+        history: A list of readings, the newest last.
+        samples: The window size.
+        spikes: The rank of the largest permitted distance from the mean.
+    """
+    history = history[-samples:]
+    avg = statistics.mean(history)
+    deltas = sorted([abs(i-avg) for i in history])
+    if len(deltas) < spikes:
+        max_permitted_delta = deltas[-1]
+    else:
+        max_permitted_delta = deltas[-spikes]
+    valid_values = list(filter(lambda val: abs(val - avg) <= max_permitted_delta, history))
+    return statistics.mean(valid_values)
+
+
+def benchmark_filter(window_sizes=(20, 100, 1000, 10000), readings=20000):
+    """Measures the per-sample cost of the load cell filters.
+
+    Args:
+        window_sizes: The window sizes (LoadCell samples) to measure.
+        readings: The number of readings filtered per measurement.
+
+    Returns:
+        A dictionary with the cost per sample of each filter for each window
+        size [s], including the original getMeasure() algorithm for windows
+        small enough to measure it in reasonable time.
+    """
+    generator = random.Random(0)
+    values = [generator.gauss(1000, 5) + (500 if generator.random() < 0.01 else 0) for _ in range(readings)]
+    results = {}
+    for samples in window_sizes:
+        filters = {
+            "spike_rejection": SpikeRejectionFilter(samples, 4),
+            "median": MedianFilter(samples),
+            "trimmed_mean": TrimmedMeanFilter(samples, max(1, samples // 10)),
+            "moving_average": MovingAverageFilter(samples),
+        }
+        for name, stream_filter in filters.items():
+            t_initial = time.perf_counter()
+            for value in values:
+                stream_filter.update(value)
+            results[name + "_" + str(samples) + "_s_per_sample"] = (time.perf_counter() - t_initial) / readings
+
+        if samples <= 1000:
+            legacy_readings = min(readings, 2000)
+            t_initial = time.perf_counter()
+            for i in range(legacy_readings):
+                legacy_spike_rejection(values[max(0, i + 1 - samples):i + 1], samples, 4)
+            results["legacy_spike_rejection_" + str(samples) + "_s_per_sample"] = (
+                (time.perf_counter() - t_initial) / legacy_readings)
+    return results
+
+
+def benchmark_hx711(samples=400, rate=80):
+    """Measures the load cell acquisition against a simulated HX711.
+
+    Args:
+        samples: The number of samples read per measurement.
+        rate: The output data rate of the simulated HX711 [Hz].
+
+    Returns:
+        A dictionary with the achieved sample rate, the CPU time per sample
+        of read() and read_samples(), and the readings per CPU second of
+        LoadCell.getMeasure() (read plus filter). CPU times include the
+        simulated HX711 reacting to every clock edge, so they are upper
+        bounds of the cost on the Pi's CPU at the same speed.
+    """
+    backend = simulated_backend()
+    SimulatedHX711(backend, 5, 6, value=lambda t: 1000 + 10 * math.sin(t), RATE=rate, noise=2)
+    amplifier = LoadCellAmplifier(5, 6, RATE=rate)
+    load_cell = LoadCell(amplifier)
+
+    amplifier.statistics.reset()
+    t_initial = time.process_time()
+    for _ in range(samples):
+        amplifier.read()
+    read_time = (time.process_time() - t_initial) / samples
+    sample_rate = amplifier.statistics.sample_rate
+
+    out = amplifier.read_samples(samples)
+    t_initial = time.process_time()
+    amplifier.read_samples(samples, out)
+    read_samples_time = (time.process_time() - t_initial) / samples
+
+    t_initial = time.process_time()
+    for _ in range(samples):
+        load_cell.getMeasure()
+    get_measure_time = time.process_time() - t_initial
+    return {
+        "sample_rate": sample_rate,
+        "read_cpu_s_per_sample": read_time,
+        "read_samples_cpu_s_per_sample": read_samples_time,
+        "get_measure_readings_per_s": samples / get_measure_time,
+    }
+
+
+def benchmark_multi_channel_hx711(channels=(1, 2, 4), samples=100, rate=80):
+    """Measures reading several HX711 sharing one clock line, against
+    reading as many HX711 with their own clock lines one after the other.
+
+    Read times are measured on the simulator's clock, which advances by
+    ACCESS_TIME on every pin access, so they count the pin accesses a read
+    makes rather than the simulator's own cost.
+
+    Args:
+        channels: The numbers of channels measured.
+        samples: The number of conversions read per measurement.
+        rate: The output data rate of the simulated HX711s [Hz].
+
+    Returns:
+        A dictionary with, for each number of channels, the time to read one
+        conversion of every channel and the channel samples that time
+        allows per second, and the time to read the largest number of
+        channels from separate amplifiers.
+    """
+    PINS_DAT = (5, 12, 13, 16, 23, 24, 25, 8)
+    PINS_CLK = (6, 14, 15, 18, 4, 22, 10, 9)
+    results = {}
+    for count in channels:
+        backend = simulated_backend()
+        for pin in PINS_DAT[:count]:
+            SimulatedHX711(backend, pin, 6, value=lambda t: 1000 + 10 * math.sin(t), RATE=rate, noise=2)
+        amplifier = MultiChannelLoadCellAmplifier(PINS_DAT[:count], 6, RATE=rate)
+        registry = MetricsRegistry()
+        amplifier.enable_metrics(registry)
+        for _ in range(samples):
+            amplifier.read()
+        read_time = registry.histogram("hx711_read_seconds")
+        read_time = read_time.sum / read_time.count
+        results["read_s_" + str(count) + "_channels"] = read_time
+        results["channel_samples_" + str(count) + "_channels_per_s"] = count / read_time
+
+    count = max(channels)
+    backend = simulated_backend()
+    amplifiers = []
+    for PIN_DAT, PIN_CLK in zip(PINS_DAT[:count], PINS_CLK[:count]):
+        SimulatedHX711(backend, PIN_DAT, PIN_CLK, value=lambda t: 1000 + 10 * math.sin(t), RATE=rate, noise=2)
+        amplifiers.append(LoadCellAmplifier(PIN_DAT, PIN_CLK, RATE=rate))
+    registry = MetricsRegistry()
+    for index, amplifier in enumerate(amplifiers):
+        amplifier.enable_metrics(registry, "hx711_" + str(index))
+    for _ in range(samples):
+        for amplifier in amplifiers:
+            amplifier.read()
+    results["separate_read_s_" + str(count) + "_channels"] = sum(
+        registry.histogram("hx711_" + str(index) + "_read_seconds").sum for index in range(count)) / samples
+    return results
+
+
+def benchmark_step_generator(rate=5000, steps=20000):
+    """Measures the step timing of Motor moves.
+
+    Args:
+        rate: The step rate of the timing measurement [steps/s].
+        steps: The number of steps per measurement.
+
+    Returns:
+        A dictionary with the jitter and maximum lateness of steps at rate
+        (on the simulator's clock, so they reflect the scheduling logic, not
+        the OS), and the highest step rate the generator's CPU time allows,
+        measured by emitting steps with no interval between them.
+    """
+    simulated_backend()
+    with _quiet():
+        motor = Motor(20, 21)
+    step_generator = motor.step_generator
+    step_generator.run_schedule([1 / rate] * steps, lambda: True)
+    timing = step_generator.statistics.report()
+
+    t_initial = time.process_time()
+    step_generator.run_schedule([0.0] * steps, lambda: True)
+    step_time = (time.process_time() - t_initial) / steps
+    return {
+        "achieved_rate": timing["achieved_rate"],
+        "jitter_s": timing["jitter"],
+        "max_lateness_s": timing["max_lateness"],
+        "max_sustainable_rate": 1 / step_time,
+    }
+
+
+def benchmark_button_latency(presses=50):
+    """Measures the latency from a button press to the first step pulse,
+    through Button, LinearActuator.move_up() and Motor.
+
+    Args:
+        presses: The number of presses measured.
+
+    Returns:
+        A dictionary with the mean, 99th percentile and maximum latency in
+        real time [s].
+    """
+    backend = simulated_backend()
+    first_pulse = threading.Event()
+    pulse_times = []
+
+    def on_pulse(level):
+        if level and not first_pulse.is_set():
+            pulse_times.append(time.perf_counter())
+            first_pulse.set()
+
+    latencies = []
+    with _quiet():
+        motor = Motor(20, 21)
+        linear_actuator = LinearActuator(motor)
+        motor.disable()
+        switch = SimulatedSwitch(backend, 27)
+        Button(27, linear_actuator.move_up)
+        backend.watch(21, on_pulse)
+        for _ in range(presses):
+            first_pulse.clear()
+            t_initial = time.perf_counter()
+            switch.press()
+            if not first_pulse.wait(1):
+                raise RuntimeError("The motor did not start after a button press.")
+            latencies.append(pulse_times[-1] - t_initial)
+            motor.disable()
+            while motor.moving:
+                time.sleep(0.0001)
+            switch.release()
+            backend.advance(0.5)    # Past the button's bounce time
+    latencies.sort()
+    return {
+        "mean_latency_s": sum(latencies) / len(latencies),
+        "p99_latency_s": latencies[int(0.99 * (len(latencies) - 1))],
+        "max_latency_s": latencies[-1],
+    }
+
+
+def benchmark_limit_switch(trips=200, max_latency=0.0002, seed=0):
+    """Measures the edge-to-halt latency of the limit switch interlock.
+
+    Runs the step generator at random rates between a crawl and its maximum
+    rate and presses a simulated limit switch at a random time during each
+    run, once with the edge callbacks and once relying on polling alone (as
+    if the callback thread never got to run).
+
+    Args:
+        trips: The number of trips per mode.
+        max_latency: The MAX_LATENCY of the interlock [s].
+        seed: The seed of the random rates and press times.
+
+    Returns:
+        A dictionary with the mean, 99th percentile and maximum latency [s]
+        and the number of trips slower than max_latency, for each mode.
+    """
+    results = {}
+    for mode in ("callback", "polling"):
+        backend = simulated_backend()
+        generator = random.Random(seed)
+        with _quiet():
+            motor = Motor(20, 21, 22)
+        switch = SimulatedSwitch(backend, 26)
+        interlock = SafetyInterlock(motor, {26: Motor.Direction.CW}, MAX_LATENCY=max_latency)
+        if mode == "polling":
+            backend.remove_event_detect(26)
+        step_generator = motor.step_generator
+        for _ in range(trips):
+            switch.release()
+            interlock.reset()
+            rate = math.exp(generator.uniform(math.log(1), math.log(step_generator.MAX_RATE)))
+            switch.press_at(backend.monotonic() + generator.uniform(0, 0.1))
+            step_generator.run(lambda: rate, lambda: True)
+            # Measure from the simulated edge rather than the interlock's own
+            # conservative estimate
+            trip = interlock.trips[-1]
+            interlock.trips[-1] = trip._replace(latency=trip.halt_time - switch.edge_time)
+        interlock.late_trips = sum(trip.latency > max_latency for trip in interlock.trips)
+        for metric, value in interlock.report().items():
+            results[mode + "_" + metric] = value
+    return results
+
+
+def benchmark_metrics_overhead(events=200000):
+    """Measures the cost of the metrics recorded on the hot paths.
+
+    Timing whole simulated runs with and without metrics is dominated by
+    the simulator and by timer noise, so the cost of each kind of record is
+    measured on its own and related to how often the instrumented code
+    runs on the tester.
+
+    Args:
+        events: The number of records timed per metric type.
+
+    Returns:
+        A dictionary with the cost per record of each metric type [s] and the
+        fraction of time spent recording metrics on each instrumented path.
+    """
+    registry = MetricsRegistry()
+    histogram = registry.histogram("histogram")
+    rate_meter = registry.rate_meter("rate_meter")
+    values = [random.Random(0).expovariate(1e5) for _ in range(1000)] * (events // 1000)
+
+    t_initial = time.perf_counter()
+    for value in values:
+        pass
+    loop_time = time.perf_counter() - t_initial
+    t_initial = time.perf_counter()
+    for value in values:
+        histogram.record(value)
+    histogram_cost = (time.perf_counter() - t_initial - loop_time) / len(values)
+    t_initial = time.perf_counter()
+    for value in values:
+        rate_meter.mark()
+    mark_cost = (time.perf_counter() - t_initial - loop_time) / len(values)
+    t_initial = time.perf_counter()
+    for value in values:
+        gpio.monotonic()
+    clock_cost = (time.perf_counter() - t_initial - loop_time) / len(values)
+
+    # Cost per event and event period of every instrumented path
+    paths = {
+        "step_generator": ((histogram_cost + mark_cost) / StepGenerator.METRICS_SAMPLING,
+                           1 / StepGenerator(0).MAX_RATE),
+        "load_cell_amplifier": (2 * histogram_cost + mark_cost + 3 * clock_cost, 1 / 80),
+        "load_cell_filter": (histogram_cost + 2 * clock_cost, 1 / 80),
+        "encoder_loop": (histogram_cost + mark_cost, 0.001),
+    }
+    results = {
+        "histogram_record_s": histogram_cost,
+        "rate_meter_mark_s": mark_cost,
+    }
+    for name, (cost, period) in paths.items():
+        results[name + "_overhead"] = cost / period
+    return results
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silences the device classes' console output."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+BENCHMARKS = {
+    "hx711": benchmark_hx711,
+    "multi_channel_hx711": benchmark_multi_channel_hx711,
+    "encoder_decoder": benchmark_encoder_decoder,
+    "velocity_estimator": benchmark_velocity_estimator,
+    "filter": benchmark_filter,
+    "step_generator": benchmark_step_generator,
+    "button_latency": benchmark_button_latency,
+    "limit_switch": benchmark_limit_switch,
+    "metrics_overhead": benchmark_metrics_overhead,
+}
+
+
+def run(names=None):
+    """Runs benchmarks and returns their results.
+
+    Args:
+        names: The names of the BENCHMARKS to run, or None for all of them.
+
+    Returns:
+        A dictionary mapping "benchmark.metric" to its value.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        for metric, value in BENCHMARKS[name]().items():
+            results[name + "." + metric] = value
+    return results
+
+
+def load_history(path=RESULTS_PATH):
+    """Returns the saved results, oldest first."""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return []
+
+
+def save_results(results, label=None, path=RESULTS_PATH):
+    """Appends results to the history file.
+
+    Args:
+        results: A dictionary returned by run().
+        label: A string identifying the version measured. Defaults to the
+            current git commit.
+        path: The path of the history file.
+    """
+    history = load_history(path)
+    history.append({"label": label or _version(), "time": time.time(), "results": results})
+    with open(path, "w") as file:
+        json.dump(history, file, indent=4)
+
+
+def find_regressions(results, baseline, tolerance=0.25):
+    """Compares results with a baseline.
+
+    Args:
+        results: A dictionary returned by run().
+        baseline: A dictionary returned by run() for an earlier version.
+        tolerance: The relative change of a metric, in its worse direction,
+            accepted as noise.
+
+    Returns:
+        A list of (metric, baseline value, value) tuples of the metrics that
+        got worse by more than tolerance.
+    """
+    regressions = []
+    for metric, value in results.items():
+        reference = baseline.get(metric)
+        if reference is None:
+            continue
+        if metric.endswith(HIGHER_IS_BETTER):
+            worse = value < reference * (1 - tolerance)
+        else:
+            # Allow a small absolute margin so metrics near 0 do not flag
+            worse = value > reference * (1 + tolerance) + 1e-9
+        if worse:
+            regressions.append((metric, reference, value))
+    return regressions
+
+
+def _version():
+    """Returns the current git commit, or "unknown"."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the acquisition and motion benchmarks.")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK",
+                        help="benchmarks to run (default: all of " + ", ".join(BENCHMARKS) + ")")
+    parser.add_argument("--results", default=RESULTS_PATH, help="history file of saved results")
+    parser.add_argument("--save", action="store_true", help="append the results to the history file")
+    parser.add_argument("--label", help="label of the saved results (default: git commit)")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if the results regressed "
+                        "compared with the last saved results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="accepted relative change (default 0.25)")
+    arguments = parser.parse_args()
+    for name in arguments.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark " + name)
+
+    history = load_history(arguments.results)
+    results = run(arguments.benchmarks)
+    for metric, value in results.items():
+        print(metric + ": " + "{0:.6g}".format(value))
+
+    regressions = []
+    if arguments.check:
+        if history:
+            regressions = find_regressions(results, history[-1]["results"], arguments.tolerance)
+            for metric, reference, value in regressions:
+                print("REGRESSION: " + metric + " " + "{0:.6g}".format(reference) + " -> "
+                      + "{0:.6g}".format(value) + " (" + history[-1]["label"] + ")")
+        else:
+            print("No saved results to check against.")
+    if arguments.save:
+        save_results(results, arguments.label, arguments.results)
+    sys.exit(1 if regressions else 0)
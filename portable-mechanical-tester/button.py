@@ -3,10 +3,7 @@
 Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
 """
 
-import RPi.GPIO as GPIO
-
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BCM)
+from gpio import GPIO
 
 class Button:
     """Represents a button connected to a specified GPIO pin on the Raspberry Pi.
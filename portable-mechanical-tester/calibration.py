@@ -0,0 +1,144 @@
+"""Module defining CalibrationProfile and CalibrationStore classes.
+
+A CalibrationProfile holds everything needed to turn raw HX711 readings of
+one load cell into forces: the offset (tare), the reference unit, the gain
+and optional multi-point linearization. Profiles are stored in a JSON file,
+one per load cell, so a LoadCellAmplifier can start from its stored
+calibration instead of taring and using a hard-coded reference unit.
+
+The file is chosen, in order, by the path given to CalibrationStore, the
+PMT_CALIBRATION environment variable, or
+~/.portable-mechanical-tester/calibration.json.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from bisect import bisect_right
+import json
+import os
+import time
+
+CALIBRATION_ENVIRONMENT_VARIABLE = "PMT_CALIBRATION"
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".portable-mechanical-tester", "calibration.json")
+
+
+class CalibrationProfile:
+    """Represents the calibration of one load cell.
+
+    Attributes:
+        name: A string identifying the load cell.
+        OFFSET: A float holding the raw reading at zero force.
+        REFERENCE_UNIT: A float holding the raw reading change per unit of
+            force.
+        GAIN: An integer indicating the amplifier gain the profile was made
+            with, 128, 64 or 32.
+        points: A sorted list of (reading, force) pairs for multi-point
+            linearization, where reading is the value calibrated with OFFSET
+            and REFERENCE_UNIT only. Readings between points are linearly
+            interpolated; beyond the outer points the outer segments are
+            extended. Fewer than two points means no linearization.
+        MAX_DRIFT: A float indicating the largest offset change a quick tare
+            accepts [raw counts].
+        updated: A float holding the time the profile was last changed, in
+            seconds since the epoch.
+    """
+
+    def __init__(self, name, OFFSET=0.0, REFERENCE_UNIT=1.0, GAIN=128, points=(), MAX_DRIFT=2000, updated=None):
+        """Initializes CalibrationProfile."""
+        self.name = name
+        self.OFFSET = OFFSET
+        self.REFERENCE_UNIT = REFERENCE_UNIT
+        self.GAIN = GAIN
+        self.points = sorted((float(reading), float(force)) for reading, force in points)
+        self.MAX_DRIFT = MAX_DRIFT
+        self.updated = time.time() if updated is None else updated
+
+    def add_point(self, reading, force):
+        """Adds a linearization point.
+
+        Args:
+            reading: The reading calibrated with OFFSET and REFERENCE_UNIT.
+            force: The known force applied when the reading was taken.
+        """
+        self.points = sorted(self.points + [(float(reading), float(force))])
+        self.updated = time.time()
+
+    def linearize(self, reading):
+        """Returns the force corresponding to a reading."""
+        points = self.points
+        if len(points) < 2:
+            return reading
+        i = min(max(bisect_right(points, (reading, float("inf"))), 1), len(points) - 1)
+        (reading_0, force_0), (reading_1, force_1) = points[i - 1], points[i]
+        return force_0 + (reading - reading_0) * (force_1 - force_0) / (reading_1 - reading_0)
+
+    def linearize_array(self, readings):
+        """Returns the forces corresponding to a NumPy array of readings."""
+        import numpy as np
+        points = self.points
+        if len(points) < 2:
+            return readings
+        point_readings = np.array([reading for reading, _ in points])
+        point_forces = np.array([force for _, force in points])
+        i = np.clip(np.searchsorted(point_readings, readings, side="right"), 1, len(points) - 1)
+        slopes = (point_forces[i] - point_forces[i - 1]) / (point_readings[i] - point_readings[i - 1])
+        return point_forces[i - 1] + (readings - point_readings[i - 1]) * slopes
+
+    def to_dict(self):
+        """Returns the profile as a JSON-serializable dictionary."""
+        return {
+            "OFFSET": self.OFFSET,
+            "REFERENCE_UNIT": self.REFERENCE_UNIT,
+            "GAIN": self.GAIN,
+            "points": [list(point) for point in self.points],
+            "MAX_DRIFT": self.MAX_DRIFT,
+            "updated": self.updated,
+        }
+
+    @classmethod
+    def from_dict(cls, name, values):
+        """Creates a profile from a dictionary returned by to_dict()."""
+        return cls(name, **values)
+
+
+class CalibrationStore:
+    """Reads and writes the calibration profiles file.
+
+    Attributes:
+        path: The path of the JSON file.
+    """
+
+    def __init__(self, path=None):
+        """Initializes CalibrationStore for a file, which need not exist yet."""
+        self.path = path or os.environ.get(CALIBRATION_ENVIRONMENT_VARIABLE) or DEFAULT_PATH
+
+    def load(self, name):
+        """Returns the profile called name, or None if it is not stored."""
+        values = self.__read().get(name)
+        return None if values is None else CalibrationProfile.from_dict(name, values)
+
+    def names(self):
+        """Returns the names of the stored profiles."""
+        return sorted(self.__read())
+
+    def save(self, profile):
+        """Stores a profile, replacing any profile of the same name. The file
+        is replaced atomically so a crash cannot leave it half written.
+        """
+        profiles = self.__read()
+        profiles[profile.name] = profile.to_dict()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(profiles, file, indent=4, sort_keys=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+
+    def __read(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
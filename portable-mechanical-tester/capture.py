@@ -0,0 +1,274 @@
+"""Module defining TriggeredCapture class and its triggers.
+
+Captures the moments around an event, typically specimen fracture, at full
+resolution. TriggeredCapture runs the load cell acquisition loop in place
+of LoadCell.run():
+
+    Pre-trigger: every raw reading is kept in a ring of PRE_SAMPLES readings
+        held in preallocated arrays, so keeping them costs two array stores
+        per reading.
+    Trigger: the triggers are checked on every reading. When one fires, the
+        HX711 is switched to 80 Hz (if its "RATE" pin is wired) and the next
+        POST_SAMPLES readings are kept as well.
+    Dump: the pre- and post-trigger readings are copied and written to a
+        recording file by a background thread, so the acquisition loop never
+        waits for the SD card. The rate is then restored and the capture
+        re-armed.
+
+The filtered force is still published as by LoadCell.run(), so a
+TriggeredCapture can replace it in the load cell process:
+    runtime.add_process("load_cell", capture.run, force_buffer)
+
+Available triggers:
+    ForceDropTrigger: the force falls by a fraction from its peak.
+    SlopeChangeTrigger: the force slope drops by more than a threshold.
+    LimitSwitchTrigger: a limit switch pin changes to its active level.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from array import array
+from collections import deque
+from gpio import GPIO
+import os
+from recorder import Recorder, calibration_from
+import threading
+
+CAPTURE_FIELDS = ("time", "raw", "force")
+CAPTURE_FORMAT = "did"
+
+
+class ForceDropTrigger:
+    """Fires when the force falls DROP_FRACTION below its peak, once the peak
+    has reached MIN_PEAK.
+    """
+
+    def __init__(self, DROP_FRACTION=0.3, MIN_PEAK=1.0):
+        """Initializes ForceDropTrigger."""
+        self.DROP_FRACTION = DROP_FRACTION
+        self.MIN_PEAK = MIN_PEAK
+        self.reset()
+
+    def reset(self):
+        """Forgets the peak."""
+        self._peak = 0.0
+
+    def check(self, t, force):
+        """Returns a description of the event if the trigger fires, else None."""
+        if force > self._peak:
+            self._peak = force
+        elif self._peak >= self.MIN_PEAK and force < self._peak * (1 - self.DROP_FRACTION):
+            return "Force dropped from " + "{0:.3f}".format(self._peak) + " to " + "{0:.3f}".format(force)
+        return None
+
+
+class SlopeChangeTrigger:
+    """Fires when the force slope over the last WINDOW readings is more than
+    CHANGE below the slope over the WINDOW readings before them.
+    """
+
+    def __init__(self, CHANGE, WINDOW=4):
+        """Initializes SlopeChangeTrigger.
+
+        Args:
+            CHANGE: The slope drop that fires the trigger [force units/s].
+            WINDOW: The number of readings each slope is measured over.
+        """
+        self.CHANGE = CHANGE
+        self.WINDOW = WINDOW
+        self.reset()
+
+    def reset(self):
+        """Forgets the readings."""
+        self._readings = deque(maxlen=2 * self.WINDOW + 1)
+
+    def check(self, t, force):
+        """Returns a description of the event if the trigger fires, else None."""
+        readings = self._readings
+        readings.append((t, force))
+        if len(readings) < readings.maxlen:
+            return None
+        (t_0, force_0), (t_1, force_1), (t_2, force_2) = readings[0], readings[self.WINDOW], readings[-1]
+        if t_1 <= t_0 or t_2 <= t_1:
+            return None
+        previous_slope = (force_1 - force_0) / (t_1 - t_0)
+        slope = (force_2 - force_1) / (t_2 - t_1)
+        if previous_slope - slope > self.CHANGE:
+            return "Force slope changed from " + "{0:.3f}".format(previous_slope) + " to " + "{0:.3f}".format(slope)
+        return None
+
+
+class LimitSwitchTrigger:
+    """Fires when a limit switch pin changes to ACTIVE_LEVEL. The pins are
+    read on every reading rather than through edge callbacks, so the trigger
+    works in whichever process runs the capture.
+    """
+
+    def __init__(self, PINS, ACTIVE_LEVEL=1):
+        """Initializes LimitSwitchTrigger. The pins must already be set up as
+        inputs, e.g. by a SafetyInterlock.
+        """
+        self.PINS = tuple(PINS)
+        self.ACTIVE_LEVEL = ACTIVE_LEVEL
+        self.reset()
+
+    def reset(self):
+        """Takes the current pin levels as the reference."""
+        self._levels = {pin: GPIO.input(pin) for pin in self.PINS}
+
+    def check(self, t, force):
+        """Returns a description of the event if the trigger fires, else None."""
+        levels = self._levels
+        for pin in self.PINS:
+            level = GPIO.input(pin)
+            if level != levels[pin]:
+                levels[pin] = level
+                if level == self.ACTIVE_LEVEL:
+                    return "Limit switch on pin " + str(pin) + " reached"
+        return None
+
+
+class TriggeredCapture:
+    """Runs the load cell acquisition, capturing the readings around trigger
+    events to recording files.
+
+    Attributes:
+        load_cell: The LoadCell whose amplifier is read and whose filter
+            produces the published force.
+        triggers: A list of triggers, each with check(t, force) and reset().
+        directory: The directory the capture files are written to.
+        PRE_SAMPLES: An integer indicating the readings kept before a trigger.
+        POST_SAMPLES: An integer indicating the readings kept after a trigger.
+        CAPTURE_RATE: An integer indicating the HX711 rate after a trigger
+            [Hz].
+        captures: A list of the paths of the capture files written.
+        enabled: A boolean indicating whether run() keeps running.
+    """
+
+    def __init__(self, load_cell, triggers, directory=".", PRE_SAMPLES=200, POST_SAMPLES=400, CAPTURE_RATE=80):
+        """Initializes TriggeredCapture and preallocates its buffers."""
+        self.load_cell = load_cell
+        self.triggers = list(triggers)
+        self.directory = directory
+        self.PRE_SAMPLES = PRE_SAMPLES
+        self.POST_SAMPLES = POST_SAMPLES
+        self.CAPTURE_RATE = CAPTURE_RATE
+        self.captures = []
+        self.enabled = True
+        self._times = array("d", bytes(8 * (PRE_SAMPLES + POST_SAMPLES)))
+        self._raw = array("i", bytes(4 * (PRE_SAMPLES + POST_SAMPLES)))
+        self._count = 0                 # Readings written to the ring since it was armed
+        self._event = None              # (time, description) of the pending trigger
+        self._post_count = 0
+        self._writers = []
+
+    def run(self, buffer=None):
+        """Reads the load cell until stop() is called, publishing the filtered
+        force like LoadCell.run() and capturing trigger events.
+
+        Args:
+            buffer: An optional SharedRingBuffer with LoadCell.RECORD_FIELDS
+                and LoadCell.RECORD_FORMAT.
+        """
+        self.enabled = True
+        amplifier = self.load_cell.source
+        while (self.enabled):
+            raw = amplifier.read()
+            t = amplifier.statistics.last_sample_time
+            force = self.add(t, raw)
+            if buffer is None:
+                print("Load Cell Reading: " + "{0: 4.4f}".format(force))
+            else:
+                buffer.write(t, force)
+        self.wait()
+
+    def add(self, t, raw):
+        """Processes one raw reading.
+
+        Returns:
+            The filtered force.
+        """
+        amplifier = self.load_cell.source
+        weight = (raw - amplifier.OFFSET) / amplifier.REFERENCE_UNIT
+        if amplifier.calibration is not None:
+            weight = amplifier.calibration.linearize(weight)
+        force = self.load_cell.filter.update(weight)
+
+        if self._event is None:
+            slot = self._count % self.PRE_SAMPLES
+            self._times[slot] = t
+            self._raw[slot] = raw
+            self._count += 1
+            for trigger in self.triggers:
+                description = trigger.check(t, force)
+                if description is not None:
+                    self.trigger(t, description)
+                    break
+        else:
+            slot = self.PRE_SAMPLES + self._post_count
+            self._times[slot] = t
+            self._raw[slot] = raw
+            self._post_count += 1
+            if self._post_count == self.POST_SAMPLES:
+                self.__dump()
+        return force
+
+    def trigger(self, t, description):
+        """Starts capturing the post-trigger readings, unless a capture is
+        already in progress.
+        """
+        if self._event is not None:
+            return
+        self._event = (t, description)
+        self._post_count = 0
+        amplifier = self.load_cell.source
+        self._rate = amplifier.RATE
+        if amplifier.PIN_RATE is not None and amplifier.RATE != self.CAPTURE_RATE:
+            amplifier.set_rate(self.CAPTURE_RATE)
+
+    def stop(self):
+        """Stops run() once the current reading is processed."""
+        self.enabled = False
+
+    def wait(self):
+        """Waits for the capture files being written."""
+        for writer in self._writers:
+            writer.join()
+        self._writers = []
+
+    def __dump(self):
+        """Hands the captured readings to a background writer and re-arms."""
+        PRE_SAMPLES = self.PRE_SAMPLES
+        count = min(self._count, PRE_SAMPLES)
+        start = self._count % PRE_SAMPLES if self._count > PRE_SAMPLES else 0
+        order = list(range(start, count)) + list(range(0, start))
+        times = [self._times[i] for i in order] + self._times[PRE_SAMPLES:PRE_SAMPLES + self.POST_SAMPLES].tolist()
+        raw = [self._raw[i] for i in order] + self._raw[PRE_SAMPLES:PRE_SAMPLES + self.POST_SAMPLES].tolist()
+
+        event_time, description = self._event
+        amplifier = self.load_cell.source
+        path = os.path.join(self.directory, "capture-" + str(len(self.captures) + 1) + ".pmt")
+        self.captures.append(path)
+        metadata = {"trigger": description, "trigger_time": event_time, "pre_samples": count}
+        writer = threading.Thread(target=_write_capture,
+                                  args=(path, calibration_from(amplifier), metadata, times, raw,
+                                        amplifier.OFFSET, amplifier.REFERENCE_UNIT, amplifier.calibration))
+        writer.start()
+        self._writers = [thread for thread in self._writers if thread.is_alive()] + [writer]
+
+        if amplifier.PIN_RATE is not None and amplifier.RATE != self._rate:
+            amplifier.set_rate(self._rate)
+        self._event = None
+        self._count = 0
+        for trigger in self.triggers:
+            trigger.reset()
+
+
+def _write_capture(path, calibration, metadata, times, raw, OFFSET, REFERENCE_UNIT, profile):
+    """Writes captured readings, with their calibrated force, to a recording."""
+    with Recorder(path, calibration, CAPTURE_FIELDS, CAPTURE_FORMAT, metadata=metadata) as recorder:
+        for t, value in zip(times, raw):
+            weight = (value - OFFSET) / REFERENCE_UNIT
+            if profile is not None:
+                weight = profile.linearize(weight)
+            recorder.write(t, value, weight)
@@ -0,0 +1,396 @@
+"""Module defining ClosedLoopController class and related functions.
+
+Runs a test under closed-loop control at a fixed control rate. Each control
+period the controller reads the carriage displacement and the force,
+checks the safety limits and commands a new signed velocity to the
+LinearActuator. The step generator then ramps the motor to that velocity.
+
+Supported setpoints:
+    Constant crosshead rate: the carriage follows a position reference
+        moving at the commanded rate. The rate is fed forward and a PI loop
+        corrects the position error, so missed or extra steps do not
+        accumulate.
+    Constant strain rate: the same, with the crosshead rate given by the
+        engineering strain rate times the gauge length.
+    Force hold: a PI loop on the force error commands the velocity.
+
+The loop runs on absolute deadlines with gpio.monotonic() and gpio.sleep(),
+so it also runs against the simulated backend. Its timing is measured
+every period and exposed through ClosedLoopController.statistics.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from enum import Enum
+import gpio
+import math
+import threading
+
+
+class ControlMode(Enum):
+    """Stores the setpoint types of the controller."""
+    IDLE = "Idle"
+    CROSSHEAD_RATE = "Constant crosshead rate"
+    STRAIN_RATE = "Constant strain rate"
+    FORCE_HOLD = "Force hold"
+
+
+class PIController:
+    """Represents a proportional-integral controller with a clamped output.
+
+    Anti-windup uses conditional integration: the error is only integrated
+    while the output is not saturated, or while it drives the output back
+    out of saturation.
+
+    Attributes:
+        KP: A float indicating the proportional gain.
+        KI: A float indicating the integral gain [1/s].
+        OUTPUT_LIMIT: A float indicating the largest output magnitude.
+        integral: A float holding the integrated error.
+    """
+
+    def __init__(self, KP, KI, OUTPUT_LIMIT):
+        """Initializes PIController with its gains and output limit."""
+        self.KP = KP
+        self.KI = KI
+        self.OUTPUT_LIMIT = OUTPUT_LIMIT
+        self.reset()
+
+    def reset(self):
+        """Clears the integrated error."""
+        self.integral = 0.0
+
+    def update(self, error, dt, feedforward=0.0):
+        """Returns the controller output for a new error.
+
+        Args:
+            error: The setpoint minus the measurement.
+            dt: The time since the previous update [s].
+            feedforward: A value added to the output before clamping.
+        """
+        integral = self.integral + error * dt
+        output = feedforward + self.KP * error + self.KI * integral
+        if abs(output) <= self.OUTPUT_LIMIT or output * error < 0:
+            self.integral = integral
+        else:
+            output = feedforward + self.KP * error + self.KI * self.integral
+        return max(-self.OUTPUT_LIMIT, min(self.OUTPUT_LIMIT, output))
+
+
+class ControlLoopStatistics:
+    """Keeps statistics on the timing of a fixed-rate control loop.
+
+    Attributes:
+        PERIOD: A float indicating the control period [s].
+        iterations: An integer counting the control periods run.
+        overruns: An integer counting periods whose update finished after the
+            next deadline.
+        max_lateness: A float indicating the largest delay between a deadline
+            and the start of its update [s].
+        max_latency: A float indicating the longest update, from reading the
+            sensors to commanding the actuator [s].
+    """
+
+    def __init__(self, PERIOD):
+        """Initializes ControlLoopStatistics for a control period."""
+        self.PERIOD = PERIOD
+        self.reset()
+
+    def reset(self):
+        """Clears all recorded periods."""
+        self.iterations = 0
+        self.overruns = 0
+        self.max_lateness = 0.0
+        self.max_latency = 0.0
+        self._first_time = None
+        self._last_time = None
+        self._mean_lateness = 0.0
+        self._lateness_m2 = 0.0
+        self._total_latency = 0.0
+
+    def record(self, lateness, latency, now):
+        """Records one control period.
+
+        Args:
+            lateness: The time between the period's deadline and the start of
+                its update [s].
+            latency: The duration of the update [s].
+            now: The time the update started [s].
+        """
+        if self._first_time is None:
+            self._first_time = now
+        self._last_time = now
+        self.iterations += 1
+        # Welford's online mean and variance
+        delta = lateness - self._mean_lateness
+        self._mean_lateness += delta / self.iterations
+        self._lateness_m2 += delta * (lateness - self._mean_lateness)
+        self._total_latency += latency
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        if latency > self.max_latency:
+            self.max_latency = latency
+        if lateness + latency > self.PERIOD:
+            self.overruns += 1
+
+    @property
+    def achieved_rate(self):
+        """The average rate the loop actually ran at [Hz]."""
+        if self._first_time is None or self._last_time <= self._first_time:
+            return 0.0
+        return (self.iterations - 1) / (self._last_time - self._first_time)
+
+    @property
+    def jitter(self):
+        """The standard deviation of the period lateness [s]."""
+        if self.iterations < 2:
+            return 0.0
+        return math.sqrt(self._lateness_m2 / (self.iterations - 1))
+
+    def report(self):
+        """Returns the statistics as a dictionary."""
+        return {
+            "iterations": self.iterations,
+            "commanded_rate": 1 / self.PERIOD,
+            "achieved_rate": self.achieved_rate,
+            "mean_lateness": self._mean_lateness,
+            "jitter": self.jitter,
+            "max_lateness": self.max_lateness,
+            "mean_latency": self._total_latency / self.iterations if self.iterations else 0.0,
+            "max_latency": self.max_latency,
+            "overruns": self.overruns,
+        }
+
+
+class ClosedLoopController:
+    """Controls a LinearActuator from displacement and force feedback.
+
+    The motor is stopped (disabled) and the controller returns to IDLE as
+    soon as the force or the displacement leaves its limits, or a sensor
+    stops providing data. The reason is kept in fault until the next
+    setpoint is given. Past a limit, a new setpoint runs only while it
+    moves the crosshead back toward the permitted range, so the specimen
+    can be unloaded or the carriage backed off without a manual jog.
+
+    Attributes:
+        linear_actuator: The LinearActuator being controlled.
+        position: A function returning the carriage displacement [mm], or
+            None if no recent reading is available.
+        force: A function returning the force, or None if no recent reading
+            is available. Positive velocities must increase the force.
+        CONTROL_RATE: A float indicating the control loop rate [Hz].
+        FORCE_LIMIT: A float indicating the largest permitted force magnitude,
+            or None.
+        TRAVEL_LIMITS: A (minimum, maximum) tuple of the permitted
+            displacement [mm], or None.
+        GAUGE_LENGTH: A float indicating the specimen gauge length used for
+            strain-rate control [mm].
+        position_controller: The PIController of the rate modes [mm -> mm/s].
+        force_controller: The PIController of the force hold mode
+            [force -> mm/s].
+        mode: The current ControlMode.
+        fault: A string describing why the last test was stopped, or None.
+        statistics: The ControlLoopStatistics of the current or last run.
+    """
+
+    def __init__(self, linear_actuator, position, force, CONTROL_RATE=100, FORCE_LIMIT=None,
+                 TRAVEL_LIMITS=None, GAUGE_LENGTH=None, POSITION_GAINS=(5.0, 1.0), FORCE_GAINS=(0.05, 0.2)):
+        """Initializes ClosedLoopController.
+
+        Args:
+            linear_actuator: The LinearActuator to control.
+            position: A function returning the displacement [mm] or None.
+            force: A function returning the force or None.
+            CONTROL_RATE: The control loop rate [Hz].
+            FORCE_LIMIT: The largest permitted force magnitude, or None.
+            TRAVEL_LIMITS: The (minimum, maximum) displacement [mm], or None.
+            GAUGE_LENGTH: The specimen gauge length [mm], or None.
+            POSITION_GAINS: The (KP [1/s], KI [1/s^2]) of the rate modes.
+            FORCE_GAINS: The (KP, KI) of the force hold mode, in
+                [mm/s per force unit] and [mm/s^2 per force unit].
+        """
+        self.linear_actuator = linear_actuator
+        self.position = position
+        self.force = force
+        self.CONTROL_RATE = CONTROL_RATE
+        self.FORCE_LIMIT = FORCE_LIMIT
+        self.TRAVEL_LIMITS = TRAVEL_LIMITS
+        self.GAUGE_LENGTH = GAUGE_LENGTH
+        self.position_controller = PIController(*POSITION_GAINS, linear_actuator.MAX_SPEED)
+        self.force_controller = PIController(*FORCE_GAINS, linear_actuator.MAX_SPEED)
+        self.mode = ControlMode.IDLE
+        self.fault = None
+        self.velocity = 0.0
+        self.statistics = ControlLoopStatistics(1 / CONTROL_RATE)
+        self.running = False
+        self._thread = None
+        self._setpoint = 0.0
+        self._reference_time = None
+        self._reference_position = None
+
+    def set_crosshead_rate(self, rate):
+        """Moves the crosshead at a constant rate.
+
+        Args:
+            rate: The crosshead rate [mm/s], positive upwards.
+        """
+        self.__set_mode(ControlMode.CROSSHEAD_RATE, rate)
+
+    def set_strain_rate(self, strain_rate):
+        """Strains the specimen at a constant engineering strain rate.
+
+        Args:
+            strain_rate: The engineering strain rate [1/s].
+        """
+        if not self.GAUGE_LENGTH:
+            raise ValueError("A gauge length is required for strain-rate control.")
+        self.__set_mode(ControlMode.STRAIN_RATE, strain_rate)
+
+    def hold_force(self, force):
+        """Holds a constant force.
+
+        Args:
+            force: The force to hold, in the units of the force function.
+        """
+        self.__set_mode(ControlMode.FORCE_HOLD, force)
+
+    def idle(self):
+        """Decelerates the actuator to a stop and stops controlling it. The
+        limits are still monitored.
+        """
+        self.mode = ControlMode.IDLE
+        self.velocity = 0.0
+        self.linear_actuator.set_velocity(0)
+
+    def __set_mode(self, mode, setpoint):
+        """Switches to a setpoint. Rate references start from the current
+        displacement at the next control period.
+        """
+        self.fault = None
+        self.position_controller.reset()
+        self.force_controller.reset()
+        self._setpoint = setpoint
+        self._reference_time = None
+        self.mode = mode
+
+    def start(self):
+        """Runs the control loop in a background thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self.running = True
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the control loop and decelerates the actuator to a stop."""
+        self.running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.idle()
+
+    def run(self):
+        """Runs the control loop until stop() is called."""
+        period = 1 / self.CONTROL_RATE
+        statistics = self.statistics
+        statistics.reset()
+        self.running = True
+        deadline = gpio.monotonic()
+        last_time = deadline
+        while self.running:
+            now = gpio.monotonic()
+            self.update(now, now - last_time)
+            last_time = now
+            statistics.record(now - deadline, gpio.monotonic() - now, now)
+
+            # Re-anchor instead of running late periods back to back
+            deadline += period
+            remaining = deadline - gpio.monotonic()
+            if remaining < -period:
+                deadline -= remaining
+            elif remaining > 0:
+                gpio.sleep(remaining)
+
+    def update(self, now, dt):
+        """Runs one control period: checks the limits and commands the
+        actuator's velocity.
+
+        Args:
+            now: The current time [s].
+            dt: The time since the previous period [s].
+        """
+        position = self.position()
+        force = self.force()
+        if position is None or force is None:
+            if self.mode != ControlMode.IDLE:
+                self.__stop_on_fault("Sensor data missing.")
+            return
+        limit = self.__check_limits(position, force)
+        if self.mode == ControlMode.IDLE:
+            if limit is not None:
+                self.__stop_on_fault(limit[0])
+            return
+        if self.mode == ControlMode.FORCE_HOLD:
+            velocity = self.force_controller.update(self._setpoint - force, dt)
+        else:
+            rate = self._setpoint
+            if self.mode == ControlMode.STRAIN_RATE:
+                rate *= self.GAUGE_LENGTH
+            if self._reference_time is None:
+                self._reference_time = now
+                self._reference_position = position
+            reference = self._reference_position + rate * (now - self._reference_time)
+            velocity = self.position_controller.update(reference - position, dt, feedforward=rate)
+        if limit is not None and velocity * limit[1] <= 0:
+            # Past a limit, only a setpoint backing off it may run
+            self.__stop_on_fault(limit[0])
+            return
+        self.velocity = velocity
+        self.linear_actuator.set_velocity(velocity)
+
+    def __check_limits(self, position, force):
+        """Returns None within the force and travel limits, else a (reason,
+        direction) tuple, direction being the sign of the velocities moving
+        back toward the permitted range, or 0 if no velocity does.
+        """
+        exceeded = []
+        if self.FORCE_LIMIT is not None and abs(force) > self.FORCE_LIMIT:
+            exceeded.append(("Force limit exceeded: " + str(force), -1 if force > 0 else 1))
+        if self.TRAVEL_LIMITS is not None and not self.TRAVEL_LIMITS[0] <= position <= self.TRAVEL_LIMITS[1]:
+            exceeded.append(("Travel limit exceeded: " + str(position) + " mm",
+                             -1 if position > self.TRAVEL_LIMITS[1] else 1))
+        if not exceeded:
+            return None
+        directions = set(direction for _, direction in exceeded)
+        return exceeded[0][0], directions.pop() if len(directions) == 1 else 0
+
+    def __stop_on_fault(self, reason):
+        """Stops the motor immediately and records why."""
+        if self.linear_actuator.MOTOR.enabled:
+            self.linear_actuator.MOTOR.disable()
+        self.mode = ControlMode.IDLE
+        self.velocity = 0.0
+        if self.fault is None:
+            self.fault = reason
+            print("ERROR: " + reason)
+
+
+def latest_value(ring_buffer, field, transform=None, MAX_AGE=0.5):
+    """Returns a function reading the newest value of a field from a
+    SharedRingBuffer, suitable as a ClosedLoopController position or force.
+
+    Args:
+        ring_buffer: A SharedRingBuffer whose first field is a timestamp from
+            gpio.monotonic().
+        field: The name of the field to read.
+        transform: An optional function applied to the value, e.g.
+            ForceDisplacementAligner.to_displacement for encoder positions.
+        MAX_AGE: The age beyond which a record is treated as missing [s].
+    """
+    time_field = ring_buffer.FIELDS[0]
+
+    def read():
+        record = ring_buffer.latest()
+        if record is None or gpio.monotonic() - record[time_field] > MAX_AGE:
+            return None
+        value = record[field]
+        return transform(value) if transform is not None else value
+    return read
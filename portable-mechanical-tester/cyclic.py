@@ -0,0 +1,375 @@
+"""Module defining CyclicTest, CycleSummarizer and RainflowCounter classes.
+
+Long cyclic (fatigue) tests run for millions of cycles, far too many to
+record every sample. A CyclicTest drives a ClosedLoopController at a
+constant crosshead rate, reversing it at a lower and an upper limit on
+displacement or force. A CycleSummarizer reduces the aligned
+(time, force, displacement) records to one summary per cycle as they
+arrive:
+
+    Peak and valley force and displacement.
+    Hysteresis loop area: the work done on the specimen over the cycle,
+        the closed integral of force over displacement.
+    Stiffness: (peak force - valley force) / (peak displacement - valley
+        displacement), and its ratio to the stiffness of the first
+        REFERENCE_CYCLES cycles, which tracks stiffness degradation.
+    Rainflow counting: the force reversals are counted into a histogram of
+        ranges and means by a streaming RainflowCounter.
+
+The samples of the current cycle are kept in preallocated arrays. Once the
+cycle is complete they are written at full resolution only for every
+CAPTURE_INTERVAL-th cycle and for anomalous cycles, whose stiffness differs
+from the previous cycle's by more than ANOMALY_THRESHOLD. Memory and disk
+use per cycle are therefore constant.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from array import array
+from enum import Enum
+import math
+
+SUMMARY_FIELDS = ("time", "cycle", "peak_force", "valley_force", "peak_displacement", "valley_displacement",
+                  "area", "stiffness", "stiffness_ratio", "captured")
+SUMMARY_FORMAT = "dqdddddddB"
+CAPTURE_FIELDS = ("time", "cycle", "force", "displacement")
+CAPTURE_FORMAT = "dqdd"
+
+
+class CycleLimit(Enum):
+    """Stores the quantities a cyclic test can reverse on."""
+    DISPLACEMENT = "Displacement"
+    FORCE = "Force"
+
+
+class ReversalDetector:
+    """Finds the peaks and valleys of a signal as it streams in.
+
+    A peak is confirmed once the signal has fallen HYSTERESIS below it, and
+    a valley once it has risen HYSTERESIS above it, so noise smaller than
+    HYSTERESIS creates no reversals.
+
+    Attributes:
+        HYSTERESIS: A float indicating the smallest reversal detected.
+        rising: A boolean indicating whether the signal is rising, or None
+            before the first reversal.
+    """
+
+    def __init__(self, HYSTERESIS):
+        """Initializes ReversalDetector."""
+        self.HYSTERESIS = HYSTERESIS
+        self.rising = None
+        self._extreme = None
+        self._start = None
+
+    def add(self, value):
+        """Adds a value.
+
+        Returns:
+            The value of the peak or valley confirmed by this value, or None.
+        """
+        extreme = self._extreme
+        if extreme is None:
+            self._extreme = value
+            self._start = value
+            return None
+        if self.rising is None:
+            if abs(value - self._start) >= self.HYSTERESIS:
+                self.rising = value > self._start
+                self._extreme = value
+                # The starting value is the first reversal
+                return self._start
+            return None
+        if self.rising:
+            if value > extreme:
+                self._extreme = value
+            elif extreme - value >= self.HYSTERESIS:
+                self.rising = False
+                self._extreme = value
+                return extreme
+        else:
+            if value < extreme:
+                self._extreme = value
+            elif value - extreme >= self.HYSTERESIS:
+                self.rising = True
+                self._extreme = value
+                return extreme
+        return None
+
+
+class RainflowCounter:
+    """Counts cycles with the four-point rainflow method as reversals stream
+    in, into a histogram of ranges and means.
+
+    Attributes:
+        BIN_WIDTH: A float indicating the width of the range and mean bins.
+        histogram: A dictionary mapping (range bin, mean bin) to the number
+            of full cycles counted. Bin i holds values from i * BIN_WIDTH to
+            (i + 1) * BIN_WIDTH.
+        cycles: An integer counting the full cycles.
+    """
+
+    def __init__(self, BIN_WIDTH):
+        """Initializes RainflowCounter with an empty histogram."""
+        self.BIN_WIDTH = BIN_WIDTH
+        self.histogram = {}
+        self.cycles = 0
+        self._stack = []    # Reversals not closed into a cycle yet
+
+    @property
+    def residue(self):
+        """The reversals not closed into a full cycle yet."""
+        return list(self._stack)
+
+    def add(self, reversal):
+        """Adds a reversal and counts the cycles it closes."""
+        stack = self._stack
+        stack.append(reversal)
+        while len(stack) >= 4:
+            inner = abs(stack[-2] - stack[-3])
+            if inner <= abs(stack[-1] - stack[-2]) and inner <= abs(stack[-3] - stack[-4]):
+                self.__count(inner, (stack[-2] + stack[-3]) / 2)
+                del stack[-3:-1]
+            else:
+                break
+
+    def half_cycles(self):
+        """Returns the (range, mean) of the half cycles left in the residue."""
+        stack = self._stack
+        return [(abs(b - a), (a + b) / 2) for a, b in zip(stack, stack[1:])]
+
+    def __count(self, range_, mean):
+        key = (int(range_ // self.BIN_WIDTH), int(mean // self.BIN_WIDTH))
+        self.histogram[key] = self.histogram.get(key, 0) + 1
+        self.cycles += 1
+
+
+class CycleSummarizer:
+    """Reduces aligned (time, force, displacement) records to per-cycle
+    summaries. A cycle runs from one valley of the limited quantity to the
+    next.
+
+    Attributes:
+        LIMIT: The CycleLimit whose valleys delimit the cycles.
+        HYSTERESIS: A float indicating the smallest reversal of the limited
+            quantity.
+        FORCE_HYSTERESIS: A float indicating the smallest force reversal
+            counted by the rainflow counter.
+        CAPTURE_INTERVAL: An integer indicating how many cycles pass between
+            cycles captured at full resolution, or 0 to only capture
+            anomalous cycles.
+        ANOMALY_THRESHOLD: A float indicating the relative stiffness change
+            from the previous cycle beyond which a cycle is anomalous.
+        REFERENCE_CYCLES: An integer indicating the number of initial cycles
+            whose mean stiffness is the reference of stiffness_ratio.
+        MAX_CYCLE_SAMPLES: An integer indicating the number of samples kept
+            per cycle. Longer cycles are captured truncated.
+        summaries: A Recorder (or any object with write()) receiving one
+            SUMMARY_FIELDS record per cycle, or None.
+        captures: A Recorder receiving the CAPTURE_FIELDS records of the
+            captured cycles, or None.
+        rainflow: The RainflowCounter of the force reversals.
+        cycles: An integer counting the completed cycles.
+        last_summary: A dictionary holding the summary of the last cycle, or
+            None.
+    """
+
+    def __init__(self, LIMIT=CycleLimit.DISPLACEMENT, HYSTERESIS=0.05, FORCE_HYSTERESIS=1.0, summaries=None,
+                 captures=None, CAPTURE_INTERVAL=1000, ANOMALY_THRESHOLD=0.05, REFERENCE_CYCLES=10,
+                 MAX_CYCLE_SAMPLES=65536, BIN_WIDTH=None):
+        """Initializes CycleSummarizer.
+
+        Args:
+            BIN_WIDTH: The bin width of the rainflow histogram, FORCE_HYSTERESIS
+                by default.
+        """
+        self.LIMIT = LIMIT
+        self.HYSTERESIS = HYSTERESIS
+        self.FORCE_HYSTERESIS = FORCE_HYSTERESIS
+        self.summaries = summaries
+        self.captures = captures
+        self.CAPTURE_INTERVAL = CAPTURE_INTERVAL
+        self.ANOMALY_THRESHOLD = ANOMALY_THRESHOLD
+        self.REFERENCE_CYCLES = REFERENCE_CYCLES
+        self.MAX_CYCLE_SAMPLES = MAX_CYCLE_SAMPLES
+        self.rainflow = RainflowCounter(BIN_WIDTH or FORCE_HYSTERESIS)
+        self.cycles = 0
+        self.last_summary = None
+        self._reversals = ReversalDetector(HYSTERESIS)
+        self._force_reversals = ReversalDetector(FORCE_HYSTERESIS)
+        self._key = 2 if LIMIT == CycleLimit.DISPLACEMENT else 1
+        self._times = array("d", bytes(8 * MAX_CYCLE_SAMPLES))
+        self._forces = array("d", bytes(8 * MAX_CYCLE_SAMPLES))
+        self._displacements = array("d", bytes(8 * MAX_CYCLE_SAMPLES))
+        self._reference_stiffness = 0.0
+        self._previous_stiffness = None
+        self._started = False
+        self._previous = None       # (force, displacement) of the previous sample
+        self.__start_cycle()
+
+    def add(self, records):
+        """Adds aligned (time, force, displacement) records, oldest first."""
+        for record in records:
+            t, force, displacement = record
+            reversal = self._force_reversals.add(force)
+            if reversal is not None:
+                self.rainflow.add(reversal)
+            if self._reversals.add(record[self._key]) is not None and self._reversals.rising:
+                # A valley was confirmed: the cycle in progress is complete
+                if self._started:
+                    self.__end_cycle(t)
+                self.__start_cycle()
+                self._started = True
+            self.__add_sample(t, force, displacement)
+
+    def __add_sample(self, t, force, displacement):
+        previous = self._previous
+        if previous is not None:
+            self._area += (force + previous[0]) * (displacement - previous[1]) / 2
+        self._previous = (force, displacement)
+        if force > self._peak_force:
+            self._peak_force = force
+        if force < self._valley_force:
+            self._valley_force = force
+        if displacement > self._peak_displacement:
+            self._peak_displacement = displacement
+        if displacement < self._valley_displacement:
+            self._valley_displacement = displacement
+        n = self._samples
+        if n < self.MAX_CYCLE_SAMPLES:
+            self._times[n] = t
+            self._forces[n] = force
+            self._displacements[n] = displacement
+        self._samples = n + 1
+
+    def __start_cycle(self):
+        """Clears the accumulators. The previous sample is kept, so the
+        area between the last sample of a cycle and the first of the next is
+        not lost.
+        """
+        self._area = 0.0
+        self._peak_force = self._peak_displacement = -math.inf
+        self._valley_force = self._valley_displacement = math.inf
+        self._samples = 0
+
+    def __end_cycle(self, t):
+        """Summarizes the completed cycle and captures it if needed.
+
+        Args:
+            t: The time of the sample that confirmed the cycle's closing
+                valley, which is the time of the summary [s].
+        """
+        if self._samples == 0:
+            return  # Nothing to summarize, so not counted as a cycle
+        self.cycles += 1
+        cycle = self.cycles
+        displacement_range = self._peak_displacement - self._valley_displacement
+        stiffness = (self._peak_force - self._valley_force) / displacement_range if displacement_range > 0 else 0.0
+        if cycle <= self.REFERENCE_CYCLES:
+            self._reference_stiffness += (stiffness - self._reference_stiffness) / cycle
+        stiffness_ratio = stiffness / self._reference_stiffness if self._reference_stiffness else 1.0
+        previous = self._previous_stiffness
+        anomalous = previous is not None and previous != 0 and abs(stiffness / previous - 1) > self.ANOMALY_THRESHOLD
+        self._previous_stiffness = stiffness
+        captured = self.captures is not None and (anomalous or (self.CAPTURE_INTERVAL > 0
+                                                               and cycle % self.CAPTURE_INTERVAL == 0))
+        samples = min(self._samples, self.MAX_CYCLE_SAMPLES)
+        if captured:
+            write = self.captures.write
+            for i in range(samples):
+                write(self._times[i], cycle, self._forces[i], self._displacements[i])
+
+        summary = (t, cycle, self._peak_force, self._valley_force, self._peak_displacement,
+                   self._valley_displacement, abs(self._area), stiffness, stiffness_ratio, captured)
+        self.last_summary = dict(zip(SUMMARY_FIELDS, summary))
+        if self.summaries is not None:
+            self.summaries.write(*summary)
+
+
+class CyclicTest:
+    """Cycles a ClosedLoopController's crosshead between two limits.
+
+    The controller's force and travel limits stay active throughout, and a
+    controller fault ends the test.
+
+    Attributes:
+        controller: The ClosedLoopController moving the crosshead.
+        LIMIT: The CycleLimit the reversals are based on.
+        LOWER: A float indicating the value at which the crosshead reverses
+            upwards [mm or force].
+        UPPER: A float indicating the value at which the crosshead reverses
+            downwards [mm or force].
+        RATE: A float indicating the crosshead rate [mm/s].
+        CYCLES: An integer indicating the number of cycles to run, or None
+            to run until stop() is called.
+        summarizer: An optional CycleSummarizer fed through add().
+        half_cycles: An integer counting the reversals commanded.
+        running: A boolean indicating whether the test is cycling.
+    """
+
+    def __init__(self, controller, LOWER, UPPER, RATE, LIMIT=CycleLimit.DISPLACEMENT, CYCLES=None,
+                 summarizer=None):
+        """Initializes CyclicTest."""
+        if not LOWER < UPPER:
+            raise ValueError("The lower limit must be below the upper limit.")
+        self.controller = controller
+        self.LOWER = LOWER
+        self.UPPER = UPPER
+        self.RATE = abs(RATE)
+        self.LIMIT = LIMIT
+        self.CYCLES = CYCLES
+        self.summarizer = summarizer
+        self.half_cycles = 0
+        self.running = False
+        self._rising = True
+
+    def start(self):
+        """Starts cycling upwards from the current position."""
+        self.half_cycles = 0
+        self._rising = True
+        self.running = True
+        self.controller.set_crosshead_rate(self.RATE)
+        self.controller.start()
+
+    def stop(self):
+        """Stops cycling and decelerates the crosshead to a stop."""
+        self.running = False
+        self.controller.idle()
+
+    def add(self, records):
+        """Passes aligned (time, force, displacement) records to the
+        summarizer.
+        """
+        if self.summarizer is not None:
+            self.summarizer.add(records)
+
+    def update(self):
+        """Reverses the crosshead at the limits. Call it periodically, e.g.
+        with Runtime.add_periodic() at the controller's rate.
+        """
+        if not self.running:
+            return
+        controller = self.controller
+        if controller.fault is not None:
+            self.running = False
+            return
+        if self.LIMIT == CycleLimit.DISPLACEMENT:
+            value = controller.position()
+        else:
+            value = controller.force()
+        if value is None:
+            return
+        if self._rising and value >= self.UPPER:
+            self._rising = False
+            self.__reverse(-self.RATE)
+        elif not self._rising and value <= self.LOWER:
+            self._rising = True
+            self.__reverse(self.RATE)
+
+    def __reverse(self, rate):
+        """Reverses the crosshead, or stops the test after CYCLES cycles."""
+        self.half_cycles += 1
+        if self.CYCLES is not None and self.half_cycles >= 2 * self.CYCLES:
+            self.stop()
+        else:
+            self.controller.set_crosshead_rate(rate)
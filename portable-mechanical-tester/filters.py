@@ -0,0 +1,328 @@
+"""Module defining streaming filters for load cell readings.
+
+Every filter keeps its window in a SlidingWindow, which maintains the
+window's insertion order (a ring buffer), its sorted order and its sum
+incrementally. Adding a sample therefore costs O(log n) comparisons plus
+one memmove of the sorted list, instead of re-sorting the whole window.
+
+Each filter also has a filter_array() batch mode that filters a whole
+recorded array at once with NumPy. NumPy is only imported when the batch
+mode is used.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from array import array
+from bisect import bisect_left, insort
+
+
+class SlidingWindow:
+    """Represents the most recent values of a stream.
+
+    Attributes:
+        SIZE: An integer indicating the maximum number of values kept.
+        sorted: A list of the values in the window in ascending order.
+        sum: A float indicating the sum of the values in the window.
+    """
+
+    def __init__(self, SIZE):
+        """Initializes an empty SlidingWindow of the given size."""
+        if SIZE < 1:
+            raise ValueError("Window size must be at least 1.")
+        self.SIZE = SIZE
+        self.reset()
+
+    def reset(self):
+        """Removes all values from the window."""
+        self._values = array("d", bytes(8 * self.SIZE))
+        self._head = 0      # Index the next value is written to
+        self._length = 0
+        self._updates = 0   # Updates since the sum was last recomputed
+        self.sorted = []
+        self.sum = 0.0
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        """Iterates over the values from oldest to newest."""
+        start = (self._head - self._length) % self.SIZE
+        for i in range(self._length):
+            yield self._values[(start + i) % self.SIZE]
+
+    def append(self, value):
+        """Adds a value, evicting the oldest one if the window is full.
+
+        Returns:
+            The evicted value, or None.
+        """
+        evicted = None
+        if self._length == self.SIZE:
+            evicted = self._values[self._head]
+            del self.sorted[bisect_left(self.sorted, evicted)]
+            self.sum -= evicted
+        else:
+            self._length += 1
+        self._values[self._head] = value
+        self._head = (self._head + 1) % self.SIZE
+        insort(self.sorted, value)
+        self.sum += value
+
+        # Recompute the sum once per window length so rounding errors from
+        # the running additions and subtractions cannot accumulate.
+        self._updates += 1
+        if self._updates >= self.SIZE:
+            self._updates = 0
+            self.sum = sum(self.sorted)
+        return evicted
+
+    @property
+    def mean(self):
+        """The mean of the values in the window."""
+        return self.sum / self._length
+
+
+class SpikeRejectionFilter:
+    """Averages the last samples values after discarding spikes.
+
+    Matches the original LoadCell.getMeasure() behavior: the values whose
+    distance from the window mean exceeds the spikes-th largest distance are
+    discarded and the remaining values are averaged. Since the values
+    farthest from the mean are always at the ends of the sorted window, they
+    are found by walking inwards from both ends in O(spikes).
+
+    Attributes:
+        samples: An integer indicating the window size.
+        spikes: An integer indicating the rank of the largest permitted
+            distance from the mean, i.e. up to spikes - 1 values are discarded.
+        value: A float indicating the last filtered value.
+    """
+
+    def __init__(self, samples=20, spikes=4):
+        """Initializes SpikeRejectionFilter with a window size and spike count."""
+        self.samples = samples
+        self.spikes = spikes
+        self.window = SlidingWindow(samples)
+        self.value = None
+
+    def reset(self):
+        """Clears the window."""
+        self.window.reset()
+        self.value = None
+
+    def update(self, value):
+        """Adds a sample and returns the filtered value."""
+        window = self.window
+        window.append(value)
+        ordered = window.sorted
+        length = len(ordered)
+        mean = window.sum / length
+
+        # Find the spikes-th largest distance from the mean (the largest one
+        # while the window holds fewer than spikes values, the smallest one
+        # for spikes=0 like the original deltas[-spikes])
+        if self.spikes == 0:
+            rank = length
+        elif length >= self.spikes:
+            rank = self.spikes
+        else:
+            rank = 1
+        low, high = 0, length - 1
+        for _ in range(rank):
+            low_delta = mean - ordered[low]
+            high_delta = ordered[high] - mean
+            if low_delta > high_delta:
+                max_permitted_delta = low_delta
+                low += 1
+            else:
+                max_permitted_delta = high_delta
+                high -= 1
+
+        # Discard the values beyond it at both ends
+        total = window.sum
+        low, high = 0, length - 1
+        while mean - ordered[low] > max_permitted_delta:
+            total -= ordered[low]
+            low += 1
+        while ordered[high] - mean > max_permitted_delta:
+            total -= ordered[high]
+            high -= 1
+
+        self.value = total / (high - low + 1)
+        return self.value
+
+    def filter_array(self, values):
+        """Filters a whole array as if each value was passed to update() on a
+        fresh filter.
+
+        Args:
+            values: A sequence or NumPy array of samples.
+
+        Returns:
+            A NumPy array of filtered values.
+        """
+        import numpy as np
+
+        def spike_rejected_means(windows):
+            means = windows.mean(axis=1, keepdims=True)
+            deltas = np.abs(windows - means)
+            rank = self.spikes if windows.shape[1] >= self.spikes else 1
+            max_permitted_deltas = np.partition(deltas, -rank, axis=1)[:, [-rank]]
+            valid = deltas <= max_permitted_deltas
+            return (windows * valid).sum(axis=1) / valid.sum(axis=1)
+
+        return _filter_windows(np.asarray(values, dtype=float), self.samples, spike_rejected_means,
+                               SpikeRejectionFilter(self.samples, self.spikes))
+
+
+class MedianFilter:
+    """Returns the median of the last samples values.
+
+    Attributes:
+        samples: An integer indicating the window size.
+        value: A float indicating the last filtered value.
+    """
+
+    def __init__(self, samples=20):
+        """Initializes MedianFilter with a window size."""
+        self.samples = samples
+        self.window = SlidingWindow(samples)
+        self.value = None
+
+    def reset(self):
+        """Clears the window."""
+        self.window.reset()
+        self.value = None
+
+    def update(self, value):
+        """Adds a sample and returns the filtered value."""
+        self.window.append(value)
+        ordered = self.window.sorted
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            self.value = ordered[middle]
+        else:
+            self.value = (ordered[middle - 1] + ordered[middle]) / 2
+        return self.value
+
+    def filter_array(self, values):
+        """Filters a whole array at once. See SpikeRejectionFilter.filter_array()."""
+        import numpy as np
+        return _filter_windows(np.asarray(values, dtype=float), self.samples,
+                               lambda windows: np.median(windows, axis=1), MedianFilter(self.samples))
+
+
+class TrimmedMeanFilter:
+    """Averages the last samples values after discarding the trim smallest
+    and trim largest ones.
+
+    Attributes:
+        samples: An integer indicating the window size.
+        trim: An integer indicating how many values are discarded at each end.
+        value: A float indicating the last filtered value.
+    """
+
+    def __init__(self, samples=20, trim=2):
+        """Initializes TrimmedMeanFilter with a window size and trim count."""
+        self.samples = samples
+        self.trim = trim
+        self.window = SlidingWindow(samples)
+        self.value = None
+
+    def reset(self):
+        """Clears the window."""
+        self.window.reset()
+        self.value = None
+
+    def update(self, value):
+        """Adds a sample and returns the filtered value."""
+        self.window.append(value)
+        ordered = self.window.sorted
+        trim = min(self.trim, (len(ordered) - 1) // 2)
+        if trim:
+            total = self.window.sum - sum(ordered[:trim]) - sum(ordered[-trim:])
+        else:
+            total = self.window.sum
+        self.value = total / (len(ordered) - 2 * trim)
+        return self.value
+
+    def filter_array(self, values):
+        """Filters a whole array at once. See SpikeRejectionFilter.filter_array()."""
+        import numpy as np
+        trim = min(self.trim, (self.samples - 1) // 2)
+
+        def trimmed_means(windows):
+            ordered = np.sort(windows, axis=1)
+            return ordered[:, trim:windows.shape[1] - trim].mean(axis=1)
+
+        return _filter_windows(np.asarray(values, dtype=float), self.samples, trimmed_means,
+                               TrimmedMeanFilter(self.samples, self.trim))
+
+
+class MovingAverageFilter:
+    """Averages the last samples values.
+
+    Attributes:
+        samples: An integer indicating the window size.
+        value: A float indicating the last filtered value.
+    """
+
+    def __init__(self, samples=20):
+        """Initializes MovingAverageFilter with a window size."""
+        self.samples = samples
+        self.window = SlidingWindow(samples)
+        self.value = None
+
+    def reset(self):
+        """Clears the window."""
+        self.window.reset()
+        self.value = None
+
+    def update(self, value):
+        """Adds a sample and returns the filtered value."""
+        self.window.append(value)
+        self.value = self.window.mean
+        return self.value
+
+    def filter_array(self, values):
+        """Filters a whole array at once. See SpikeRejectionFilter.filter_array()."""
+        import numpy as np
+        values = np.asarray(values, dtype=float)
+        cumulative = np.concatenate(([0.0], np.cumsum(values)))
+        lengths = np.minimum(np.arange(1, len(values) + 1), self.samples)
+        ends = np.arange(1, len(values) + 1)
+        return (cumulative[ends] - cumulative[ends - lengths]) / lengths
+
+
+def _filter_windows(values, samples, reduce_windows, warm_up_filter, chunk_size=65536):
+    """Applies a function to every full window of an array, in chunks so the
+    window views never need more than chunk_size rows at once.
+
+    Args:
+        values: A NumPy array of samples.
+        samples: An integer indicating the window size.
+        reduce_windows: A function taking a 2D array of windows (one per row)
+            and returning one filtered value per window.
+        warm_up_filter: A fresh filter used for the first samples - 1 values,
+            whose windows are not full yet.
+        chunk_size: The maximum number of windows processed at once.
+
+    Returns:
+        A NumPy array of filtered values.
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    result = np.empty(len(values))
+    warm_up = min(samples - 1, len(values))
+    for i in range(warm_up):
+        result[i] = warm_up_filter.update(values[i])
+    if len(values) < samples:
+        return result
+
+    windows = sliding_window_view(values, samples)
+    rows_per_chunk = max(1, chunk_size // samples)
+    for start in range(0, len(windows), rows_per_chunk):
+        chunk = windows[start:start + rows_per_chunk]
+        result[warm_up + start:warm_up + start + len(chunk)] = reduce_windows(chunk)
+    return result
@@ -0,0 +1,181 @@
+"""Module defining ForceDisplacementAligner class and related functions.
+
+Pairs every load cell reading with the carriage displacement at the same
+instant. The load cell is read at 10 or 80 Hz while the encoder position is
+sampled at kHz rates, so the displacement at each force timestamp is
+linearly interpolated between the two encoder samples around it. Both
+streams are timestamped with gpio.monotonic(), which on the Raspberry Pi is
+the system-wide CLOCK_MONOTONIC and therefore shared by all processes.
+
+Memory use is bounded: only the encoder samples still needed to interpolate
+pending force readings are kept, up to MAX_POSITIONS of them even when no
+force reading arrives (e.g. the load cell stalled or started late), and at
+most MAX_PENDING force readings wait for encoder data before being emitted
+with the last known position, or dropped if there is none.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from collections import deque
+import gpio
+from rotary_encoder import RotaryEncoder
+
+
+class ForceDisplacementAligner:
+    """Aligns a force stream with an encoder position stream.
+
+    Attributes:
+        SCREW_LEAD: A number indicating the carriage travel per revolution of
+            the lead screw, which the encoder measures [mm].
+        COUNTS_PER_REVOLUTION: An integer indicating the encoder counts per
+            revolution of the lead screw.
+        MAX_PENDING: An integer indicating the maximum number of force
+            readings waiting for encoder data.
+        MAX_POSITIONS: An integer indicating the maximum number of encoder
+            samples kept; the oldest are discarded first.
+        zero_position: An integer indicating the encoder position at zero
+            displacement [counts], or None to use the first position received.
+        held_samples: An integer counting force readings emitted with the last
+            known position because newer encoder data never arrived in time.
+        dropped_samples: An integer counting force readings discarded because
+            no encoder data arrived at all.
+    """
+    RECORD_FIELDS = ("time", "force", "displacement")   # Fields of the aligned records
+    RECORD_FORMAT = "ddd"
+
+    def __init__(self, SCREW_LEAD=5, COUNTS_PER_REVOLUTION=RotaryEncoder.COUNTS_PER_REVOLUTION,
+                 MAX_PENDING=1024, MAX_POSITIONS=4096):
+        """Initializes ForceDisplacementAligner with the lead screw geometry."""
+        self.SCREW_LEAD = SCREW_LEAD
+        self.COUNTS_PER_REVOLUTION = COUNTS_PER_REVOLUTION
+        self.MAX_PENDING = MAX_PENDING
+        self.MAX_POSITIONS = MAX_POSITIONS
+        self.zero_position = None
+        self.held_samples = 0
+        self.dropped_samples = 0
+        self._positions = deque(maxlen=MAX_POSITIONS)   # (time, position) pairs, oldest first
+        self._forces = deque()      # (time, force) pairs waiting for encoder data
+
+    def zero(self, position=None):
+        """Sets the displacement to zero at the given encoder position, or at
+        the most recent one.
+        """
+        if position is None and self._positions:
+            position = self._positions[-1][1]
+        self.zero_position = position
+
+    def add_position(self, t, position):
+        """Adds an encoder sample.
+
+        Args:
+            t: The time the position was sampled [s].
+            position: The encoder position [counts].
+        """
+        if self.zero_position is None:
+            self.zero_position = position
+        self._positions.append((t, position))
+
+    def add_force(self, t, force):
+        """Adds a load cell reading.
+
+        Args:
+            t: The time the reading was taken [s].
+            force: The force reading.
+        """
+        self._forces.append((t, force))
+
+    def pop_aligned(self):
+        """Returns every force reading that can be aligned so far.
+
+        Returns:
+            A list of (time, force, displacement) tuples, displacement in [mm].
+        """
+        aligned = []
+        forces = self._forces
+        positions = self._positions
+        while forces and positions:
+            t, force = forces[0]
+            # Drop encoder samples no longer needed, keeping the last one
+            # at or before t
+            while len(positions) > 1 and positions[1][0] <= t:
+                positions.popleft()
+            t_before, position_before = positions[0]
+            if t <= t_before:
+                position = position_before
+            elif len(positions) > 1:
+                t_after, position_after = positions[1]
+                position = position_before + (position_after - position_before) * (t - t_before) / (t_after - t_before)
+            elif len(forces) > self.MAX_PENDING:
+                position = position_before
+                self.held_samples += 1
+            else:
+                break   # Wait for an encoder sample after t
+            forces.popleft()
+            aligned.append((t, force, self.to_displacement(position)))
+        if not positions:
+            while len(forces) > self.MAX_PENDING:
+                forces.popleft()
+                self.dropped_samples += 1
+        return aligned
+
+    def to_displacement(self, position):
+        """Converts an encoder position to carriage displacement [mm]."""
+        return (position - self.zero_position) / self.COUNTS_PER_REVOLUTION * self.SCREW_LEAD
+
+
+class ForceDisplacementPipeline:
+    """Reads the load cell and encoder ring buffers published by the sensor
+    processes and produces aligned force-displacement records.
+
+    Attributes:
+        aligner: The ForceDisplacementAligner doing the interpolation.
+        enabled: A boolean indicating whether run() keeps running.
+    """
+
+    def __init__(self, force_buffer, position_buffer, aligner=None):
+        """Initializes ForceDisplacementPipeline.
+
+        Args:
+            force_buffer: The SharedRingBuffer written by LoadCell.run().
+            position_buffer: The SharedRingBuffer written by RotaryEncoder.publish().
+            aligner: An optional ForceDisplacementAligner.
+        """
+        self.force_reader = force_buffer.reader(from_start=True)
+        self.position_reader = position_buffer.reader(from_start=True)
+        self.aligner = aligner or ForceDisplacementAligner()
+        self.enabled = True
+
+    def poll(self):
+        """Reads the new records of both streams.
+
+        Returns:
+            A list of aligned (time, force, displacement) tuples.
+        """
+        for record in self.position_reader.read():
+            self.aligner.add_position(record[0], record[1])
+        for record in self.force_reader.read():
+            self.aligner.add_force(record[0], record[1])
+        return self.aligner.pop_aligned()
+
+    def records(self, period=0.01):
+        """Yields aligned records as they become available, until stop() is
+        called.
+
+        Args:
+            period: The time between polls of the input buffers [s].
+        """
+        self.enabled = True
+        while (self.enabled):
+            yield from self.poll()
+            gpio.sleep(period)
+
+    def run(self, output, period=0.01):
+        """Writes aligned records to a SharedRingBuffer with RECORD_FIELDS and
+        RECORD_FORMAT until stop() is called.
+        """
+        for record in self.records(period):
+            output.write(*record)
+
+    def stop(self):
+        """Stops run() and records()."""
+        self.enabled = False
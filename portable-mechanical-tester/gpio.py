@@ -0,0 +1,131 @@
+"""Module defining the pluggable GPIO backend used by every device class.
+
+Device modules import ``GPIO`` from this module instead of importing
+``RPi.GPIO`` directly. ``GPIO`` is a proxy that forwards every attribute
+lookup to the currently selected backend, so the same device code runs
+against the real Raspberry Pi pins or against the in-process simulator in
+simulator.py.
+
+The backend is chosen the first time ``GPIO`` is used:
+    1. A backend passed to set_backend() always wins.
+    2. Otherwise the PMT_GPIO_BACKEND environment variable is consulted
+       ("rpi" or "sim").
+    3. Otherwise RPi.GPIO is used. If it cannot be loaded the error is
+       raised rather than silently falling back to the simulator, which
+       would drive no pins and read simulated load cells.
+
+Selecting the backend also configures it (BCM pin numbering, warnings off),
+so importing a device module touches no hardware: nothing happens until a
+device is constructed or the clock is read.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import os
+import time
+
+BACKEND_ENVIRONMENT_VARIABLE = "PMT_GPIO_BACKEND"
+
+_backend = None
+
+
+def _load_rpi_backend():
+    """Imports and returns the RPi.GPIO module."""
+    import RPi.GPIO
+    return RPi.GPIO
+
+
+def _load_simulated_backend():
+    """Creates and returns a new SimulatedGPIO instance."""
+    from simulator import SimulatedGPIO
+    return SimulatedGPIO()
+
+
+def _select_default_backend():
+    """Determines which backend to use when none has been set explicitly.
+
+    Returns:
+        The RPi.GPIO module or a SimulatedGPIO instance.
+
+    Raises:
+        ValueError: The PMT_GPIO_BACKEND environment variable holds an unknown
+            backend name.
+        ImportError, RuntimeError: No backend is named and RPi.GPIO cannot
+            be loaded.
+    """
+    name = os.environ.get(BACKEND_ENVIRONMENT_VARIABLE, "").strip().lower()
+    if (name == "rpi"):
+        return _load_rpi_backend()
+    elif (name == "sim"):
+        return _load_simulated_backend()
+    elif (name != ""):
+        raise ValueError("Unknown GPIO backend '" + name + "' in " + BACKEND_ENVIRONMENT_VARIABLE
+                         + ", expected 'rpi' or 'sim'.")
+
+    try:
+        return _load_rpi_backend()
+    except (ImportError, RuntimeError) as error:
+        raise type(error)("RPi.GPIO is unavailable (" + str(error) + "). Set " + BACKEND_ENVIRONMENT_VARIABLE
+                          + "=sim to run on the simulated hardware.") from error
+
+
+def get_backend():
+    """Returns the active GPIO backend, selecting and configuring a default
+    one if needed.
+    """
+    global _backend
+    if _backend is None:
+        _backend = _configure(_select_default_backend())
+    return _backend
+
+
+def _configure(backend):
+    """Sets the BCM pin numbering used by every device class and turns off
+    the channel-in-use warnings, then returns the backend.
+    """
+    backend.setwarnings(False)
+    backend.setmode(backend.BCM)
+    return backend
+
+
+def set_backend(backend):
+    """Sets the GPIO backend used by every device class.
+
+    Must be called before the devices are constructed, since devices configure
+    their pins on initialization.
+
+    Args:
+        backend: An object implementing the RPi.GPIO interface (setup, input,
+            output, add_event_detect, ...), e.g. a SimulatedGPIO instance.
+            Passing None resets the selection so the default backend is chosen
+            again on next use.
+    """
+    global _backend
+    _backend = None if backend is None else _configure(backend)
+
+
+def monotonic():
+    """Returns the time of the backend's clock [s].
+
+    Hardware backends use time.monotonic(). Simulated backends provide their
+    own virtual clock so timing-dependent code stays deterministic.
+    """
+    return getattr(get_backend(), "monotonic", time.monotonic)()
+
+
+def sleep(seconds):
+    """Sleeps on the backend's clock. See monotonic()."""
+    getattr(get_backend(), "sleep", time.sleep)(seconds)
+
+
+class _BackendProxy:
+    """Forwards attribute access to the active GPIO backend."""
+
+    def __getattr__(self, name):
+        return getattr(get_backend(), name)
+
+    def __repr__(self):
+        return "<GPIO proxy for " + repr(get_backend()) + ">"
+
+
+GPIO = _BackendProxy()
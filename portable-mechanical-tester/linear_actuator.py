@@ -3,11 +3,6 @@
 Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
 """
 
-import RPi.GPIO as GPIO
-
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BCM)
-
 class LinearActuator:
     """Represents a linear actuator actuated by a stepper motor.
 
@@ -18,6 +13,8 @@ class LinearActuator:
             actuator carriage travels per revolution of the lead screw.
             Lead for the SFU1605 ball screw is 5mm:
             (Page 4) https://www.linearmodul.dk/Filer/PDF-Kataloger/PDF-Katalog%20Ballscrews.pdf
+        pending_direction: The motor Direction set_velocity() reverses to once
+            the motor has decelerated to a stop, or None.
     """
     MAX_SPEED = 500   # The maximum speed of the linear actuator [mm/s]
     MIN_SPEED = 0    # The minimum speed of the linear actuator [mm/s]
@@ -25,8 +22,9 @@ class LinearActuator:
     def __init__(self, MOTOR, speed = 500, SCREW_LEAD = 5):
         """Initializes LinearActuator with a motor and and an initial speed."""
         self.MOTOR = MOTOR
-        self.set_speed(speed)
         self.SCREW_LEAD = SCREW_LEAD
+        self.pending_direction = None
+        self.set_speed(speed)
 
     def move_down(self, test):
         """Moves the linear actuator downwards."""
@@ -40,6 +38,35 @@ class LinearActuator:
         """Stops the linear actuator."""
         self.MOTOR.disable()
 
+    def set_velocity(self, velocity):
+        """Sets the signed velocity of the linear actuator, starting the motor
+        if it is stopped. A velocity of 0 decelerates the motor to a stop.
+
+        A velocity of the opposite sign while the motor is moving first
+        decelerates it to a stop, since switching the direction pin at speed
+        would lose steps: the new direction is kept in pending_direction and
+        applied by the first call once the motor has stopped. Call it
+        periodically, e.g. from a controller, until the reversal is done.
+
+        Args:
+            velocity: The velocity of the linear actuator [mm/s], positive
+                upwards (motor turning CW).
+        """
+        if (velocity > 0):
+            direction = self.MOTOR.Direction.CW
+        elif (velocity < 0):
+            direction = self.MOTOR.Direction.CCW
+        else:
+            direction = None
+        if (direction is not None and self.MOTOR.moving and direction != self.MOTOR.direction):
+            self.pending_direction = direction
+            self.set_speed(0)
+            return
+        self.pending_direction = None
+        self.set_speed(abs(velocity))
+        if (direction is not None):
+            self.MOTOR.start(direction)
+
     def increase_speed(self, test):
         """Increases the speed of the linear actuator by a specified increment."""
         INCREMENT = 25  # How much the speed of the MOTOR should be increased by [mm/s]
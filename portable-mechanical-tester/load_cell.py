@@ -1,53 +1,77 @@
-"""Module defining LoadCell class and related functions.
+"""Module defining LoadCell and MultiChannelLoadCell classes and related
+functions.
 
 Original Source Code: https://github.com/dcrystalj/HX711py3, comes with Apache 2.0 license
 
 Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
 """
 
+from filters import SpikeRejectionFilter
 from load_cell_amplifier import LoadCellAmplifier
-import statistics
+import metrics
+import time
 
 class LoadCell:
-    def __init__(self, source=None, samples=20, spikes=4, sleep=0.1):
+    """Represents a load cell read through a LoadCellAmplifier.
+
+    Attributes:
+        source: The LoadCellAmplifier the load cell is connected to.
+        samples: An integer indicating the number of recent readings filtered.
+        spikes: An integer indicating the rank of the largest permitted
+            distance from the mean reading (see SpikeRejectionFilter).
+        filter: The streaming filter applied to the readings. Defaults to a
+            SpikeRejectionFilter, but any filter from filters.py can be used.
+    """
+    RECORD_FIELDS = ("time", "force")   # Fields of the records published by run()
+    RECORD_FORMAT = "dd"
+
+    def __init__(self, source=None, samples=20, spikes=4, sleep=0.1, filter=None):
 
         self.source = source or LoadCellAmplifier()
         self.samples = samples
         self.spikes = spikes
         self.sleep = sleep
-        self.history = []
+        self.filter = filter or SpikeRejectionFilter(samples, spikes)
 
         self.enabled = True
+        self._filter_time = None    # Recorded once enable_metrics() is called
 
-    def newMeasure(self):
-        value = self.source.getWeight()
-        self.history.append(value)
-
-    def getMeasure(self):
-        """Useful for continuous measurements."""
-        self.newMeasure()
-        # cut to old values
-        self.history = self.history[-self.samples:]
-
-        avg = statistics.mean(self.history)
-        deltas = sorted([abs(i-avg) for i in self.history])
+    def enable_metrics(self, registry=None, name="load_cell"):
+        """Records the CPU time of every filter update, and enables the
+        amplifier's metrics.
 
-        if len(deltas) < self.spikes:
-            max_permitted_delta = deltas[-1]
-        else:
-            max_permitted_delta = deltas[-self.spikes]
+        Args:
+            registry: The MetricsRegistry to record into, metrics.REGISTRY
+                by default.
+            name: The prefix of the metric names.
+        """
+        registry = registry or metrics.REGISTRY
+        self._filter_time = registry.histogram(name + "_filter_seconds")
+        if not self.source.metrics_enabled:
+            self.source.enable_metrics(registry)
 
-        valid_values = list(filter(
-            lambda val: abs(val - avg) <= max_permitted_delta, self.history
-        ))
+    @property
+    def history(self):
+        """A list of the readings in the filter window, oldest first."""
+        return list(self.filter.window)
 
-        avg = statistics.mean(valid_values)
+    def newMeasure(self):
+        value = self.source.get_weight()
+        filter_time = self._filter_time
+        if filter_time is None:
+            return self.filter.update(value)
+        t_initial = time.perf_counter()
+        value = self.filter.update(value)
+        filter_time.record(time.perf_counter() - t_initial)
+        return value
 
-        return avg
+    def getMeasure(self):
+        """Useful for continuous measurements."""
+        return self.newMeasure()
 
     def getWeight(self, samples=None):
         """Get weight for once in a while. It clears history first."""
-        self.history = []
+        self.filter.reset()
 
         [self.newMeasure() for i in range(samples or self.samples)]
 
@@ -56,31 +80,117 @@ class LoadCell:
     def tare(self, times=25):
         self.source.tare(times)
 
+    def quickTare(self, times=5):
+        return self.source.quick_tare(times)
+
     def setOffset(self, offset):
-        self.source.setOffset(offset)
+        self.source.set_offset(offset)
 
     def setReferenceUnit(self, reference_unit):
-        self.source.setReferenceUnit(reference_unit)
+        self.source.set_reference_unit(reference_unit)
 
     def powerDown(self):
-        self.source.powerDown()
+        self.source.power_down()
 
     def powerUp(self):
-        self.source.powerUp()
+        self.source.power_up()
 
     def reset(self):
         self.source.reset()
 
-    def run(self):
+    def run(self, buffer=None):
         """Determines the force applied onto the load cell and outputs
-        it the console.
+        it the console, or publishes it to a shared ring buffer.
+
+        Args:
+            buffer: An optional SharedRingBuffer with RECORD_FIELDS and
+                RECORD_FORMAT. If given, every reading is written to it
+                instead of being printed.
         """
         self.enabled = True
         while (self.enabled):
             # TODO: Set load cell amplifier reference unit using instructions in LoadCellAmplifier _init__
-            weight = self.get_weight()
-            print("Load Cell Reading: " + "{0: 4.4f}".format(weight))
+            weight = self.getMeasure()
+            if buffer is None:
+                print("Load Cell Reading: " + "{0: 4.4f}".format(weight))
+            else:
+                # Timestamp the reading with the time its conversion completed
+                buffer.write(self.source.statistics.last_sample_time, weight)
 
     def stop(self):
         """Stops the load cell from outputting values to the console."""
         self.enabled = False
+
+
+class MultiChannelLoadCell:
+    """Represents the load cells read through a MultiChannelLoadCellAmplifier,
+    each filtered by its own LoadCell.
+
+    Attributes:
+        source: The MultiChannelLoadCellAmplifier the load cells are
+            connected to.
+        load_cells: A list of LoadCell, one per channel of the amplifier.
+    """
+    RECORD_FIELDS = LoadCell.RECORD_FIELDS  # Fields of the records published by run() for each channel
+    RECORD_FORMAT = LoadCell.RECORD_FORMAT
+
+    def __init__(self, source, samples=20, spikes=4, filters=None):
+        """Initializes MultiChannelLoadCell.
+
+        Args:
+            source: The MultiChannelLoadCellAmplifier.
+            samples: See LoadCell.
+            spikes: See LoadCell.
+            filters: An optional list of streaming filters, one per channel.
+                Defaults to a SpikeRejectionFilter per channel.
+        """
+        self.source = source
+        filters = filters or [None] * len(source.channels)
+        self.load_cells = [LoadCell(channel, samples, spikes, filter=filter)
+                           for channel, filter in zip(source.channels, filters)]
+        self.enabled = True
+
+    def enable_metrics(self, registry=None, name="load_cell"):
+        """Enables the metrics of every LoadCell, named name + "_" + channel
+        index, and of the amplifier.
+        """
+        for index, load_cell in enumerate(self.load_cells):
+            load_cell.enable_metrics(registry, name + "_" + str(index))
+
+    def getMeasures(self):
+        """Reads one conversion of every channel.
+
+        Returns:
+            A list of the filtered readings, one per channel.
+        """
+        # Each channel consumes the conversion the first one triggered
+        return [load_cell.getMeasure() for load_cell in self.load_cells]
+
+    def tare(self, times=25):
+        self.source.tare(times)
+
+    def quickTare(self, times=5):
+        return self.source.quick_tare(times)
+
+    def run(self, buffers=None):
+        """Determines the forces applied onto the load cells and outputs them
+        to the console, or publishes them to shared ring buffers.
+
+        Args:
+            buffers: An optional list of SharedRingBuffer with RECORD_FIELDS
+                and RECORD_FORMAT, one per channel. If given, every reading
+                is written to its channel's buffer instead of being printed.
+        """
+        self.enabled = True
+        while (self.enabled):
+            weights = self.getMeasures()
+            if buffers is None:
+                print("Load Cell Readings: " + ", ".join("{0: 4.4f}".format(weight) for weight in weights))
+            else:
+                t = self.source.statistics.last_sample_time
+                for buffer, weight in zip(buffers, weights):
+                    buffer.write(t, weight)
+
+    def stop(self):
+        """Stops the load cells from outputting values to the console."""
+        self.enabled = False
@@ -1,16 +1,17 @@
-"""Module defining LoadCellAmplifier class and related functions.
+"""Module defining LoadCellAmplifier and MultiChannelLoadCellAmplifier
+classes and related functions.
 
 Source Code: https://github.com/dcrystalj/HX711py3, comes with Apache 2.0 license
 
 Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
 """
 
-import RPi.GPIO as GPIO
+from array import array
+from calibration import CalibrationProfile
+from gpio import GPIO
+import gpio
+import metrics
 import statistics
-import time
-
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BCM)
 
 class LoadCellAmplifier:
     """Represents a HX711 load cell amplifier.
@@ -23,17 +24,42 @@ class LoadCellAmplifier:
         GAIN: An integer indicating the gain of the load cell amplifier.
         BITS_TO_READ: An integer indicating the number of bits to read before
             calculating a force value.
+        RATE: An integer indicating the output data rate set by the "RATE"
+            pin of the load cell amplifier, 10 or 80 [Hz].
+        PIN_RATE: An integer indicating the GPIO pin connected to "RATE", or
+            None if the rate is fixed by wiring.
+        statistics: The AcquisitionStatistics of the samples read so far.
+        calibration: The CalibrationProfile applied, or None.
+        metrics_enabled: A boolean indicating whether enable_metrics() was
+            called.
     """
 
-    def __init__(self, PIN_DAT, PIN_CLK, GAIN = 128, BITS_TO_READ = 24):
+    GAIN_PULSES = {128: 1, 64: 3, 32: 2}   # Extra clock pulses selecting each gain
+
+    def __init__(self, PIN_DAT, PIN_CLK, GAIN = 128, BITS_TO_READ = 24, RATE = 10, calibration = None,
+                 quick_tare = False, PIN_RATE = None):
         """Initializes LoadCellAmplifier with a "DAT" pin, a "CLK" pin, gain,
-        and the number of bits to read. Tares load cell and begins reading values.
+        the number of bits to read and the output data rate.
+
+        If a CalibrationProfile is given, it is applied (including its gain)
+        and, if quick_tare is True, checked with quick_tare(). Otherwise the
+        load cell is reset and tared, which takes 25 conversions.
         """
         self.PIN_CLK = PIN_CLK
         self.PIN_DAT = PIN_DAT
+        self.PIN_RATE = PIN_RATE
+        self.RATE = RATE
+        self.statistics = AcquisitionStatistics(RATE)
+        self.metrics_enabled = False
+        self._ready_wait_time = None    # Metrics recorded once enable_metrics() is called
+        self._read_time = None
+        self._samples = None
 
         GPIO.setup(self.PIN_CLK, GPIO.OUT)
         GPIO.setup(self.PIN_DAT, GPIO.IN)
+        if PIN_RATE is not None:
+            GPIO.setup(self.PIN_RATE, GPIO.OUT)
+            GPIO.output(self.PIN_RATE, RATE == 80)
 
         # The value returned by the hx711 that corresponds to your
         # reference unit AFTER dividing by the SCALE.
@@ -45,37 +71,163 @@ class LoadCellAmplifier:
         self.last_val = 0
         self.twos_complement_threshold = 1 << (BITS_TO_READ-1)
         self.twos_complement_offset = -(1 << (BITS_TO_READ))
-        self.set_gain(GAIN)
-        self.read()
-
-        # HOW TO CALCULATE THE REFFERENCE UNIT
-        #########################################
-        # To set the reference unit to 1.
-        # Call get_weight before and after putting 1000g weight on your sensor.
-        # Divide difference with grams (1000g) and use it as reference unit.
-        self.set_reference_unit(21)
-        self.reset()
-        self.tare()
+        self.calibration = None
+
+        if calibration is None:
+            self.set_gain(GAIN)
+
+            # HOW TO CALCULATE THE REFFERENCE UNIT
+            #########################################
+            # To set the reference unit to 1.
+            # Call get_weight before and after putting 1000g weight on your sensor.
+            # Divide difference with grams (1000g) and use it as reference unit.
+            # Or use calibrate_reference_unit() and save calibration_profile().
+            self.set_reference_unit(21)
+            self.reset()
+            self.tare()
+        else:
+            self.apply_calibration(calibration)
+            if quick_tare:
+                self.quick_tare()
 
         self.enabled = True
 
+    def enable_metrics(self, registry=None, name="hx711"):
+        """Records the time spent waiting for DRDY and shifting out each
+        sample, the sample rate and the dropped conversions.
+
+        Args:
+            registry: The MetricsRegistry to record into, metrics.REGISTRY
+                by default.
+            name: The prefix of the metric names.
+        """
+        registry = registry or metrics.REGISTRY
+        self._ready_wait_time = registry.histogram(name + "_ready_wait_seconds")
+        self._read_time = registry.histogram(name + "_read_seconds")
+        self._samples = registry.rate_meter(name + "_samples")
+        registry.gauge(name + "_dropped_conversions", self.statistics, "dropped_conversions")
+        self.metrics_enabled = True
+
+    @property
+    def gain(self):
+        """The gain of the amplifier, 128, 64 or 32."""
+        for gain, pulses in self.GAIN_PULSES.items():
+            if pulses == self.GAIN:
+                return gain
+
+    def apply_calibration(self, profile):
+        """Applies a CalibrationProfile, switching to its gain if needed."""
+        if self.GAIN != self.GAIN_PULSES[profile.GAIN]:
+            self.set_gain(profile.GAIN)
+        self.set_offset(profile.OFFSET)
+        self.set_reference_unit(profile.REFERENCE_UNIT)
+        self.calibration = profile
+
+    def calibration_profile(self, name):
+        """Returns a CalibrationProfile holding the current calibration, with
+        the linearization points of the applied profile if any.
+        """
+        profile = CalibrationProfile(name, self.OFFSET, self.REFERENCE_UNIT, self.gain)
+        if self.calibration is not None:
+            profile.points = list(self.calibration.points)
+            profile.MAX_DRIFT = self.calibration.MAX_DRIFT
+        return profile
+
+    def quick_tare(self, times=5):
+        """Re-tares from a few conversions, checking the drift against the
+        applied calibration. If the offset moved by more than the profile's
+        MAX_DRIFT (e.g. because a load is applied), the stored offset is kept.
+
+        Args:
+            times: The number of conversions, whose median is the new offset.
+
+        Returns:
+            The change of the offset [raw counts].
+        """
+        values = sorted(self.read() for i in range(times))
+        return self.update_offset(values[times // 2])
+
+    def update_offset(self, offset):
+        """Sets an offset measured by a quick tare, unless it drifted by more
+        than the applied profile's MAX_DRIFT from the current one.
+
+        Returns:
+            The change of the offset [raw counts].
+        """
+        drift = offset - self.OFFSET
+        if self.calibration is not None and abs(drift) > self.calibration.MAX_DRIFT:
+            print("ERROR: Load cell offset drifted by " + str(drift) + ", keeping the stored offset.")
+        else:
+            self.set_offset(offset)
+        return drift
+
+    def calibrate_reference_unit(self, known_weight, times=10):
+        """Sets the reference unit from readings of a known weight placed on
+        the tared load cell.
+        """
+        values = sorted(self.read() for i in range(times))
+        self.set_reference_unit((values[times // 2] - self.OFFSET) / known_weight)
+
+    def add_calibration_point(self, known_weight, times=10):
+        """Adds a linearization point from readings of a known weight placed
+        on the load cell, creating a profile called "load_cell" if none is
+        applied.
+        """
+        if self.calibration is None:
+            self.calibration = self.calibration_profile("load_cell")
+        values = sorted(self.read() for i in range(times))
+        self.calibration.add_point((values[times // 2] - self.OFFSET) / self.REFERENCE_UNIT, known_weight)
+
     def isReady(self):
         return GPIO.input(self.PIN_DAT) == 0
 
     def set_gain(self, gain):
-        if gain is 128:
+        if gain == 128:
             self.GAIN = 1
-        elif gain is 64:
+        elif gain == 64:
             self.GAIN = 3
-        elif gain is 32:
+        elif gain == 32:
             self.GAIN = 2
 
         GPIO.output(self.PIN_CLK, False)
         self.read()
 
+    def set_rate(self, rate):
+        """Switches the output data rate with the "RATE" pin. The first
+        conversions at the new rate are still settling.
+
+        Args:
+            rate: The output data rate, 10 or 80 [Hz].
+        """
+        if self.PIN_RATE is None:
+            print("ERROR: The load cell amplifier rate is fixed by wiring.")
+            return
+        if rate not in (10, 80):
+            print("ERROR: Invalid load cell amplifier rate: " + str(rate))
+            return
+        GPIO.output(self.PIN_RATE, rate == 80)
+        self.RATE = rate
+        self.statistics.RATE = rate
+
     def wait_for_ready(self):
+        """Sleeps until the load cell amplifier pulls "DAT" low to signal that
+        a conversion is ready, instead of polling the pin.
+
+        The edge wait times out after two conversion periods, so a falling
+        edge that occurs between checking the pin and starting the wait only
+        costs one conversion rather than blocking forever.
+        """
+        ready_wait_time = self._ready_wait_time
+        if ready_wait_time is not None:
+            t_initial = gpio.monotonic()
+        timeout = max(1, int(2000 / self.RATE))     # [ms]
         while not self.isReady():
-            pass
+            GPIO.wait_for_edge(self.PIN_DAT, GPIO.FALLING, timeout=timeout)
+        now = gpio.monotonic()
+        self.statistics.record(now)
+        if ready_wait_time is not None:
+            ready_wait_time.record(now - t_initial)
+            self._samples.mark()
 
     def correct_twos_complement(self, unsignedValue):
         if unsignedValue >= self.twos_complement_threshold:
@@ -85,6 +237,9 @@ class LoadCellAmplifier:
 
     def read(self):
         self.wait_for_ready()
+        read_time = self._read_time
+        if read_time is not None:
+            t_initial = gpio.monotonic()
 
         unsignedValue = 0
         for i in range(0, self.BITS_TO_READ):
@@ -99,14 +254,83 @@ class LoadCellAmplifier:
             GPIO.output(self.PIN_CLK, True)
             GPIO.output(self.PIN_CLK, False)
 
+        if read_time is not None:
+            read_time.record(gpio.monotonic() - t_initial)
         return self.correct_twos_complement(unsignedValue)
 
+    def read_samples(self, count, out=None):
+        """Reads count consecutive conversions, sleeping on DRDY between them.
+
+        Args:
+            count: The number of samples to read.
+            out: An optional preallocated array("i") of at least count
+                elements that receives the samples.
+
+        Returns:
+            An array("i") holding the raw 24-bit values as they were shifted
+            out of the load cell amplifier, before two's complement
+            correction. Use convert() to calibrate them.
+        """
+        if out is None:
+            out = array("i", bytes(4 * count))
+        elif len(out) < count:
+            raise ValueError("Output array holds fewer than " + str(count) + " samples.")
+
+        # Bind the pin functions once, not once per bit
+        write_pin = GPIO.output
+        read_pin = GPIO.input
+        PIN_CLK = self.PIN_CLK
+        PIN_DAT = self.PIN_DAT
+        bits = range(self.BITS_TO_READ)
+        gain_pulses = range(self.GAIN)
+        read_time = self._read_time
+
+        for n in range(count):
+            self.wait_for_ready()
+            if read_time is not None:
+                t_initial = gpio.monotonic()
+            unsignedValue = 0
+            for i in bits:
+                write_pin(PIN_CLK, True)
+                bitValue = read_pin(PIN_DAT)
+                write_pin(PIN_CLK, False)
+                unsignedValue = (unsignedValue << 1) | bitValue
+            for i in gain_pulses:
+                write_pin(PIN_CLK, True)
+                write_pin(PIN_CLK, False)
+            out[n] = unsignedValue
+            if read_time is not None:
+                read_time.record(gpio.monotonic() - t_initial)
+        return out
+
+    def convert(self, raw):
+        """Converts raw values from read_samples() to calibrated values in a
+        single vectorized pass: two's complement correction, offset removal
+        and division by the reference unit.
+
+        Args:
+            raw: An array("i"), NumPy array or sequence of raw 24-bit values.
+
+        Returns:
+            A NumPy array of calibrated (and linearized) values.
+        """
+        import numpy as np
+        values = np.asarray(raw, dtype=np.int64)
+        values = np.where(values >= self.twos_complement_threshold,
+                          values + self.twos_complement_offset, values)
+        values = (values - self.OFFSET) / self.REFERENCE_UNIT
+        if self.calibration is not None:
+            values = self.calibration.linearize_array(values)
+        return values
+
     def get_value(self):
         return self.read() - self.OFFSET
 
     def get_weight(self):
         value = self.get_value()
         value /= self.REFERENCE_UNIT
+        if self.calibration is not None:
+            value = self.calibration.linearize(value)
         return value
 
     def tare(self, times=25):
@@ -115,7 +339,7 @@ class LoadCellAmplifier:
 
         # remove spikes
         cut = times//5
-        values = sorted([self.read() for i in range(times)])[cut:-cut]
+        values = sorted([self.read() for i in range(times)])[cut:times - cut]
         offset = statistics.mean(values)
 
         self.set_offset(offset)
@@ -125,7 +349,7 @@ class LoadCellAmplifier:
     def set_offset(self, offset):
         self.OFFSET = offset
 
-    def set_reference_uni(self, reference_unit):
+    def set_reference_unit(self, reference_unit):
         self.REFERENCE_UNIT = reference_unit
 
     # HX711 datasheet states that setting the PDA_CLOCK pin on high
@@ -136,12 +360,421 @@ class LoadCellAmplifier:
     def power_down(self):
         GPIO.output(self.PIN_CLK, False)
         GPIO.output(self.PIN_CLK, True)
-        time.sleep(0.0001)
+        gpio.sleep(0.0001)
+
+    def power_up(self):
+        GPIO.output(self.PIN_CLK, False)
+        gpio.sleep(0.0001)
+
+    def reset(self):
+        self.power_down()
+        self.power_up()
+
+
+class MultiChannelLoadCellAmplifier:
+    """Represents several HX711 load cell amplifiers sharing one "CLK" line.
+
+    Every clock pulse shifts one bit out of all the amplifiers at once, and
+    the "DAT" pins are all sampled after it, each bit being shifted into its
+    channel's value as it is read. A read therefore costs one set of clock
+    pulses plus one pin read per channel and bit, instead of a full read per
+    amplifier. The pins are read after the falling clock edge, so "CLK"
+    stays high for one pin write whatever the number of channels, well
+    below the 60 us that powers the amplifiers down.
+
+    The amplifiers use the same gain and output data rate. A conversion is
+    read once every amplifier has one ready, so the channels are sampled
+    together.
+
+    Attributes:
+        PINS_DAT: A tuple of the GPIO pins connected to "DAT" on each load
+            cell amplifier.
+        PIN_CLK: An integer indicating the GPIO pin connected to "CLK" on all
+            the load cell amplifiers.
+        GAIN: An integer indicating the extra clock pulses selecting the gain.
+        BITS_TO_READ: An integer indicating the number of bits to read before
+            calculating a force value.
+        RATE: An integer indicating the output data rate, 10 or 80 [Hz].
+        PIN_RATE: An integer indicating the GPIO pin connected to "RATE" on
+            all the load cell amplifiers, or None if the rate is fixed by
+            wiring.
+        channels: A list of LoadCellAmplifierChannel, one per "DAT" pin, each
+            with its own offset and reference unit and usable as the source
+            of a LoadCell.
+        statistics: The AcquisitionStatistics of the samples read so far.
+        metrics_enabled: A boolean indicating whether enable_metrics() was
+            called.
+    """
+
+    GAIN_PULSES = LoadCellAmplifier.GAIN_PULSES
+
+    def __init__(self, PINS_DAT, PIN_CLK, GAIN = 128, BITS_TO_READ = 24, RATE = 10, calibrations = None,
+                 quick_tare = False, PIN_RATE = None):
+        """Initializes MultiChannelLoadCellAmplifier with the "DAT" pins, the
+        shared "CLK" pin, gain, the number of bits to read and the output
+        data rate.
+
+        If a list of CalibrationProfile is given, one per channel, they are
+        applied and, if quick_tare is True, checked with quick_tare().
+        Otherwise the load cells are reset and tared together, which takes
+        25 conversions.
+        """
+        self.PINS_DAT = tuple(PINS_DAT)
+        self.PIN_CLK = PIN_CLK
+        self.PIN_RATE = PIN_RATE
+        self.RATE = RATE
+        self.BITS_TO_READ = BITS_TO_READ
+        self.GAIN = 0
+        self.statistics = AcquisitionStatistics(RATE)
+        self.metrics_enabled = False
+        self._ready_wait_time = None    # Metrics recorded once enable_metrics() is called
+        self._read_time = None
+        self._samples = None
+        self._values = [0] * len(self.PINS_DAT)     # Last conversion of each channel
+        self._unread = [False] * len(self.PINS_DAT)  # Channels that have not consumed it yet
+
+        GPIO.setup(self.PIN_CLK, GPIO.OUT)
+        for pin in self.PINS_DAT:
+            GPIO.setup(pin, GPIO.IN)
+        if PIN_RATE is not None:
+            GPIO.setup(self.PIN_RATE, GPIO.OUT)
+            GPIO.output(self.PIN_RATE, RATE == 80)
+
+        self.channels = [LoadCellAmplifierChannel(self, index) for index in range(len(self.PINS_DAT))]
+
+        if calibrations is None:
+            self.set_gain(GAIN)
+            for channel in self.channels:
+                channel.set_reference_unit(21)
+            self.reset()
+            self.tare()
+        else:
+            for channel, profile in zip(self.channels, calibrations):
+                channel.apply_calibration(profile)
+            if quick_tare:
+                self.quick_tare()
+
+        self.enabled = True
+
+    def enable_metrics(self, registry=None, name="hx711"):
+        """Records the time spent waiting for DRDY and shifting out each
+        sample, the sample rate and the dropped conversions.
+
+        Args:
+            registry: The MetricsRegistry to record into, metrics.REGISTRY
+                by default.
+            name: The prefix of the metric names.
+        """
+        registry = registry or metrics.REGISTRY
+        self._ready_wait_time = registry.histogram(name + "_ready_wait_seconds")
+        self._read_time = registry.histogram(name + "_read_seconds")
+        self._samples = registry.rate_meter(name + "_samples")
+        registry.gauge(name + "_dropped_conversions", self.statistics, "dropped_conversions")
+        self.metrics_enabled = True
+
+    @property
+    def gain(self):
+        """The gain of the amplifiers, 128, 64 or 32."""
+        for gain, pulses in self.GAIN_PULSES.items():
+            if pulses == self.GAIN:
+                return gain
+
+    def isReady(self):
+        return all(GPIO.input(pin) == 0 for pin in self.PINS_DAT)
+
+    def set_gain(self, gain):
+        self.GAIN = self.GAIN_PULSES[gain]
+        GPIO.output(self.PIN_CLK, False)
+        self.read()
+
+    def set_rate(self, rate):
+        """Switches the output data rate with the "RATE" pin. See
+        LoadCellAmplifier.set_rate().
+        """
+        if self.PIN_RATE is None:
+            print("ERROR: The load cell amplifier rate is fixed by wiring.")
+            return
+        if rate not in (10, 80):
+            print("ERROR: Invalid load cell amplifier rate: " + str(rate))
+            return
+        GPIO.output(self.PIN_RATE, rate == 80)
+        self.RATE = rate
+        self.statistics.RATE = rate
+
+    def wait_for_ready(self):
+        """Sleeps until every load cell amplifier pulls "DAT" low. See
+        LoadCellAmplifier.wait_for_ready().
+        """
+        ready_wait_time = self._ready_wait_time
+        if ready_wait_time is not None:
+            t_initial = gpio.monotonic()
+        timeout = max(1, int(2000 / self.RATE))     # [ms]
+        for pin in self.PINS_DAT:
+            # An amplifier holds "DAT" low until it is read, so the pins
+            # already checked stay ready
+            while GPIO.input(pin) != 0:
+                GPIO.wait_for_edge(pin, GPIO.FALLING, timeout=timeout)
+        now = gpio.monotonic()
+        self.statistics.record(now)
+        if ready_wait_time is not None:
+            ready_wait_time.record(now - t_initial)
+            self._samples.mark()
+
+    def read(self):
+        """Reads one conversion of every channel.
+
+        Returns:
+            A list of the signed raw values, one per channel.
+        """
+        self.wait_for_ready()
+        read_time = self._read_time
+        if read_time is not None:
+            t_initial = gpio.monotonic()
+        values = self.__shift()
+        threshold = 1 << (self.BITS_TO_READ - 1)
+        offset = -(1 << self.BITS_TO_READ)
+        values = [value + offset if value >= threshold else value for value in values]
+        self._values = values
+        self._unread = [True] * len(values)
+        if read_time is not None:
+            read_time.record(gpio.monotonic() - t_initial)
+        return values
+
+    def read_channel(self, index):
+        """Returns the signed raw value of a channel from the last conversion
+        if that channel has not consumed it yet, and otherwise reads a new
+        conversion of every channel. Reading each channel in turn therefore
+        reads the amplifiers once per round.
+        """
+        if not self._unread[index]:
+            self.read()
+        self._unread[index] = False
+        return self._values[index]
+
+    def read_samples(self, count, out=None):
+        """Reads count consecutive conversions of every channel, sleeping on
+        DRDY between them.
+
+        Args:
+            count: The number of samples to read per channel.
+            out: An optional list of preallocated array("i"), one per
+                channel, of at least count elements that receive the samples.
+
+        Returns:
+            A list of array("i"), one per channel, holding the raw 24-bit
+            values as they were shifted out, before two's complement
+            correction. Use each channel's convert() to calibrate them.
+        """
+        if out is None:
+            out = [array("i", bytes(4 * count)) for pin in self.PINS_DAT]
+        elif any(len(samples) < count for samples in out):
+            raise ValueError("Output array holds fewer than " + str(count) + " samples.")
+        read_time = self._read_time
+        for n in range(count):
+            self.wait_for_ready()
+            if read_time is not None:
+                t_initial = gpio.monotonic()
+            for samples, value in zip(out, self.__shift()):
+                samples[n] = value
+            if read_time is not None:
+                read_time.record(gpio.monotonic() - t_initial)
+        return out
+
+    def tare(self, times=25):
+        """Sets the offset of every channel from the same conversions, after
+        removing spikes.
+        """
+        cut = times//5
+        for channel, samples in zip(self.channels, self.read_samples(times)):
+            values = sorted(channel.correct_twos_complement(value) for value in samples)[cut:times - cut]
+            channel.set_offset(statistics.mean(values))
+
+    def quick_tare(self, times=5):
+        """Re-tares every channel from a few conversions. See
+        LoadCellAmplifier.quick_tare().
+
+        Returns:
+            A list of the changes of the offsets [raw counts].
+        """
+        drifts = []
+        for channel, samples in zip(self.channels, self.read_samples(times)):
+            values = sorted(channel.correct_twos_complement(value) for value in samples)
+            drifts.append(channel.update_offset(values[times // 2]))
+        return drifts
+
+    def power_down(self):
+        GPIO.output(self.PIN_CLK, False)
+        GPIO.output(self.PIN_CLK, True)
+        gpio.sleep(0.0001)
 
     def power_up(self):
         GPIO.output(self.PIN_CLK, False)
-        time.sleep(0.0001)
+        gpio.sleep(0.0001)
 
     def reset(self):
         self.power_down()
         self.power_up()
+
+    def __shift(self):
+        """Shifts one conversion out of every amplifier and selects the gain
+        of the next one.
+
+        Returns:
+            A list of the unsigned raw values, one per channel.
+        """
+        # Bind the pin functions once, not once per bit
+        write_pin = GPIO.output
+        read_pin = GPIO.input
+        PIN_CLK = self.PIN_CLK
+        PINS_DAT = self.PINS_DAT
+        values = [0] * len(PINS_DAT)
+        for i in range(self.BITS_TO_READ):
+            write_pin(PIN_CLK, True)
+            write_pin(PIN_CLK, False)
+            values = [(value << 1) | read_pin(pin) for value, pin in zip(values, PINS_DAT)]
+        for i in range(self.GAIN):
+            write_pin(PIN_CLK, True)
+            write_pin(PIN_CLK, False)
+        return values
+
+
+class LoadCellAmplifierChannel(LoadCellAmplifier):
+    """Represents one channel of a MultiChannelLoadCellAmplifier, with its own
+    offset, reference unit and calibration. It can be used wherever a
+    LoadCellAmplifier is, e.g. as the source of a LoadCell; the gain, rate
+    and power are shared with the other channels.
+
+    Attributes:
+        amplifier: The MultiChannelLoadCellAmplifier of the channel.
+        index: An integer indicating the position of the channel in
+            amplifier.channels.
+    """
+
+    def __init__(self, amplifier, index):
+        """Initializes LoadCellAmplifierChannel, uncalibrated."""
+        self.amplifier = amplifier
+        self.index = index
+        self.PIN_CLK = amplifier.PIN_CLK
+        self.PIN_DAT = amplifier.PINS_DAT[index]
+        self.REFERENCE_UNIT = 1
+        self.OFFSET = 1
+        self.BITS_TO_READ = amplifier.BITS_TO_READ
+        self.last_val = 0
+        self.twos_complement_threshold = 1 << (self.BITS_TO_READ-1)
+        self.twos_complement_offset = -(1 << (self.BITS_TO_READ))
+        self.calibration = None
+        self.enabled = True
+
+    @property
+    def GAIN(self):
+        return self.amplifier.GAIN
+
+    @property
+    def RATE(self):
+        return self.amplifier.RATE
+
+    @property
+    def PIN_RATE(self):
+        return self.amplifier.PIN_RATE
+
+    @property
+    def statistics(self):
+        return self.amplifier.statistics
+
+    @property
+    def metrics_enabled(self):
+        return self.amplifier.metrics_enabled
+
+    def enable_metrics(self, registry=None, name="hx711"):
+        self.amplifier.enable_metrics(registry, name)
+
+    def isReady(self):
+        return self.amplifier.isReady()
+
+    def set_gain(self, gain):
+        self.amplifier.set_gain(gain)
+
+    def set_rate(self, rate):
+        self.amplifier.set_rate(rate)
+
+    def wait_for_ready(self):
+        self.amplifier.wait_for_ready()
+
+    def read(self):
+        return self.amplifier.read_channel(self.index)
+
+    def read_samples(self, count, out=None):
+        """Reads count conversions of this channel. See
+        LoadCellAmplifier.read_samples().
+        """
+        if out is None:
+            out = array("i", bytes(4 * count))
+        elif len(out) < count:
+            raise ValueError("Output array holds fewer than " + str(count) + " samples.")
+        for n in range(count):
+            out[n] = self.read()
+        return out
+
+    def power_down(self):
+        self.amplifier.power_down()
+
+    def power_up(self):
+        self.amplifier.power_up()
+
+
+class AcquisitionStatistics:
+    """Keeps track of the achieved sample rate of a load cell amplifier and
+    of conversions that were dropped because they were not read in time.
+
+    Attributes:
+        RATE: An integer indicating the output data rate of the load cell
+            amplifier [Hz].
+        samples: An integer counting the samples read.
+        dropped_conversions: An integer counting the conversions that
+            completed but were never read.
+    """
+
+    def __init__(self, RATE):
+        """Initializes AcquisitionStatistics for an output data rate."""
+        self.RATE = RATE
+        self.reset()
+
+    def reset(self):
+        """Clears all recorded samples."""
+        self.samples = 0
+        self.dropped_conversions = 0
+        self._first_time = None
+        self._last_time = None
+
+    def record(self, now):
+        """Records a sample that became ready at the given time [s]."""
+        if self._last_time is None:
+            self._first_time = now
+        else:
+            # Each extra conversion period since the last sample is a
+            # conversion that was overwritten before it was read.
+            periods = round((now - self._last_time) * self.RATE)
+            if periods > 1:
+                self.dropped_conversions += periods - 1
+        self._last_time = now
+        self.samples += 1
+
+    @property
+    def last_sample_time(self):
+        """The time the last sample became ready [s], or None."""
+        return self._last_time
+
+    @property
+    def sample_rate(self):
+        """The average rate at which samples were read [Hz]."""
+        if self._first_time is None or self._last_time <= self._first_time:
+            return 0.0
+        return (self.samples - 1) / (self._last_time - self._first_time)
+
+    def report(self):
+        """Returns the statistics as a dictionary."""
+        return {
+            "samples": self.samples,
+            "sample_rate": self.sample_rate,
+            "dropped_conversions": self.dropped_conversions,
+        }
@@ -0,0 +1,386 @@
+"""Module defining the metrics instrumentation of the device classes.
+
+Devices record into metrics only after enable_metrics() is called on them;
+until then each instrumented code path costs a single "is None" check.
+Recording is designed to stay well under 1% of the cost of the code being
+measured:
+
+    Counter: an integer increment.
+    Histogram: an HDR-style log-linear histogram. A value is mapped to its
+        bucket with math.frexp() and one multiplication, so recording is O(1)
+        with a relative error below 1 / SUB_BUCKETS across the whole range.
+        Percentiles are only computed when a snapshot is taken.
+    RateMeter: an integer increment; rates are computed at snapshot time.
+    Gauge: an attribute read at snapshot time, e.g. to expose existing
+        statistics such as AcquisitionStatistics.dropped_conversions.
+
+Snapshots are exported as JSON lines (JsonLinesExporter) or as Prometheus
+text from a local HTTP endpoint (PrometheusServer). Each process has its own
+REGISTRY; processes started by a Runtime export their own JSON lines file
+once export_json_lines() has been called in the parent, and the Prometheus
+endpoint also serves the latest snapshot of every such file.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gpio
+import json
+import math
+import os
+import threading
+import time
+
+
+class Counter:
+    """Counts events.
+
+    Attributes:
+        name: A string identifying the metric.
+        value: An integer holding the count.
+    """
+
+    def __init__(self, name):
+        """Initializes Counter at 0."""
+        self.name = name
+        self.value = 0
+
+    def inc(self, amount=1):
+        """Increments the count."""
+        self.value += amount
+
+    def snapshot(self):
+        return {"type": "counter", "value": self.value}
+
+
+class Gauge:
+    """Reports the current value of an attribute or property of an object.
+    Holding the object rather than a function keeps the gauge picklable, so
+    it can be passed to a child process.
+
+    Attributes:
+        name: A string identifying the metric.
+        source: The object holding the value.
+        attribute: A string naming the attribute of source to report.
+    """
+
+    def __init__(self, name, source, attribute):
+        """Initializes Gauge with the attribute it reports."""
+        self.name = name
+        self.source = source
+        self.attribute = attribute
+
+    def snapshot(self):
+        return {"type": "gauge", "value": getattr(self.source, self.attribute)}
+
+
+class RateMeter:
+    """Measures the rate of events.
+
+    Attributes:
+        name: A string identifying the metric.
+        WINDOW: A float indicating the length of the window the recent rate
+            is computed over [s].
+        count: An integer counting the events.
+    """
+
+    def __init__(self, name, WINDOW=1.0):
+        """Initializes RateMeter with no events."""
+        self.name = name
+        self.WINDOW = WINDOW
+        self.count = 0
+        self._start_time = gpio.monotonic()
+        self._window_time = self._start_time
+        self._window_count = 0
+        self._rate = 0.0
+
+    def mark(self, events=1):
+        """Records events."""
+        self.count += events
+
+    def snapshot(self):
+        now = gpio.monotonic()
+        if now - self._window_time >= self.WINDOW:
+            self._rate = (self.count - self._window_count) / (now - self._window_time)
+            self._window_time = now
+            self._window_count = self.count
+        elapsed = now - self._start_time
+        return {"type": "rate", "count": self.count, "rate": self._rate,
+                "mean_rate": self.count / elapsed if elapsed > 0 else 0.0}
+
+
+class Histogram:
+    """Records the distribution of positive values, e.g. latencies [s].
+
+    Attributes:
+        name: A string identifying the metric.
+        LOWEST: A float indicating the smallest distinguishable value. Smaller
+            values are recorded as LOWEST.
+        HIGHEST: A float indicating the largest distinguishable value. Larger
+            values are counted in the top bucket but still update max.
+        count: An integer counting the recorded values.
+        sum: A float holding the sum of the recorded values.
+        min: A float indicating the smallest recorded value, or None.
+        max: A float indicating the largest recorded value, or None.
+    """
+    SUB_BUCKETS = 128   # Buckets per power of two, i.e. < 1% relative error
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, name, LOWEST=1e-9, HIGHEST=1e3):
+        """Initializes an empty Histogram covering LOWEST to HIGHEST."""
+        self.name = name
+        self.LOWEST = LOWEST
+        self.HIGHEST = HIGHEST
+        self._min_exponent = math.frexp(LOWEST)[1]
+        self._last_index = (math.frexp(HIGHEST)[1] - self._min_exponent + 1) * self.SUB_BUCKETS - 1
+        self.counts = array("Q", bytes(8 * (self._last_index + 1)))
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        """Records a value."""
+        if value < self.LOWEST:
+            value = self.LOWEST
+        mantissa, exponent = math.frexp(value)
+        # mantissa is in [0.5, 1), so this is the sub-bucket of SUB_BUCKETS
+        SUB_BUCKETS = self.SUB_BUCKETS
+        index = (exponent - self._min_exponent) * SUB_BUCKETS + int((mantissa - 0.5) * (2 * SUB_BUCKETS))
+        if index > self._last_index:
+            index = self._last_index
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, percentile):
+        """Returns the value below which percentile percent of the recorded
+        values fall, or None if nothing was recorded.
+        """
+        if self.count == 0:
+            return None
+        target = max(1, math.ceil(self.count * percentile / 100))
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= target:
+                return min(self.__bucket_value(index), self.max)
+        return self.max
+
+    def __bucket_value(self, index):
+        """Returns the middle of a bucket."""
+        exponent, sub_bucket = divmod(index, self.SUB_BUCKETS)
+        mantissa = 0.5 + (sub_bucket + 0.5) / (2 * self.SUB_BUCKETS)
+        return math.ldexp(mantissa, exponent + self._min_exponent)
+
+    def snapshot(self):
+        return {"type": "histogram", "count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+                "percentiles": {str(percentile): self.percentile(percentile) for percentile in self.PERCENTILES}}
+
+
+class MetricsRegistry:
+    """Holds the metrics of a process.
+
+    Attributes:
+        process: A string identifying the process in snapshots.
+        json_lines_directory: The directory processes export their JSON lines
+            files to, or None.
+    """
+
+    def __init__(self, process="main"):
+        """Initializes an empty MetricsRegistry."""
+        self.process = process
+        self.json_lines_directory = None
+        self._metrics = {}
+        self._exporter = None
+
+    def counter(self, name):
+        """Returns the Counter called name, creating it if needed."""
+        return self.__get(name, Counter)
+
+    def gauge(self, name, source, attribute):
+        """Registers a Gauge reporting source.attribute and returns it."""
+        self._metrics[name] = Gauge(name, source, attribute)
+        return self._metrics[name]
+
+    def rate_meter(self, name):
+        """Returns the RateMeter called name, creating it if needed."""
+        return self.__get(name, RateMeter)
+
+    def histogram(self, name):
+        """Returns the Histogram called name, creating it if needed."""
+        return self.__get(name, Histogram)
+
+    def __get(self, name, metric_type):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = metric_type(name)
+        elif not isinstance(metric, metric_type):
+            raise ValueError("Metric " + name + " is a " + type(metric).__name__)
+        return metric
+
+    def snapshot(self):
+        """Returns the current value of every metric as a dictionary."""
+        return {"time": time.time(), "process": self.process,
+                "metrics": {name: metric.snapshot() for name, metric in list(self._metrics.items())}}
+
+    def export_json_lines(self, directory, PERIOD=1.0):
+        """Appends a snapshot of this process to <directory>/<process>.jsonl
+        every PERIOD seconds, and makes processes started by a Runtime do the
+        same.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.json_lines_directory = directory
+        self._exporter = JsonLinesExporter(self, os.path.join(directory, self.process + ".jsonl"), PERIOD)
+        self._exporter.start()
+        return self._exporter
+
+    def start_process(self, process):
+        """Renames the registry for a newly started child process and starts
+        its JSON lines exporter if the parent was exporting. Called by Runtime.
+        """
+        self.process = process
+        if self.json_lines_directory is not None:
+            period = self._exporter.PERIOD if self._exporter is not None else 1.0
+            self.export_json_lines(self.json_lines_directory, period)
+
+
+class JsonLinesExporter:
+    """Appends registry snapshots to a file, one JSON object per line.
+
+    Attributes:
+        path: The path of the file.
+        PERIOD: The time between snapshots [s].
+    """
+
+    def __init__(self, registry, path, PERIOD=1.0):
+        """Initializes JsonLinesExporter for a registry and file."""
+        self.registry = registry
+        self.path = path
+        self.PERIOD = PERIOD
+        self.enabled = False
+
+    def write(self):
+        """Appends one snapshot."""
+        with open(self.path, "a") as file:
+            file.write(json.dumps(self.registry.snapshot()) + "\n")
+
+    def run(self):
+        """Appends a snapshot every PERIOD until stop() is called."""
+        self.enabled = True
+        while self.enabled:
+            time.sleep(self.PERIOD)
+            self.write()
+
+    def start(self):
+        """Runs the exporter in a background thread."""
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.enabled = False
+
+
+class PrometheusServer:
+    """Serves the metrics as Prometheus text on a local HTTP endpoint.
+
+    The response holds the registry's own metrics plus the latest snapshot
+    of every other process exporting to the registry's JSON lines directory.
+    """
+
+    def __init__(self, registry, port=9108, host="127.0.0.1"):
+        """Initializes PrometheusServer for a registry and address."""
+        self.registry = registry
+        self.address = (host, port)
+        self._server = None
+
+    def render(self):
+        """Returns the Prometheus text of all snapshots."""
+        snapshots = [self.registry.snapshot()]
+        directory = self.registry.json_lines_directory
+        if directory is not None:
+            for file_name in sorted(os.listdir(directory)):
+                if file_name.endswith(".jsonl") and file_name != self.registry.process + ".jsonl":
+                    line = _last_line(os.path.join(directory, file_name))
+                    if line:
+                        snapshots.append(json.loads(line))
+        return to_prometheus(snapshots)
+
+    def start(self):
+        """Serves requests in a background thread."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(self.address, Handler)
+        self.address = self._server.server_address
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def to_prometheus(snapshots):
+    """Formats registry snapshots as Prometheus text.
+
+    Args:
+        snapshots: A list of dictionaries returned by MetricsRegistry.snapshot().
+    """
+    lines = []
+    for snapshot in snapshots:
+        labels = '{process="' + snapshot["process"] + '"}'
+        for name, metric in snapshot["metrics"].items():
+            name = "pmt_" + "".join(c if c.isalnum() else "_" for c in name)
+            if metric["type"] == "counter":
+                lines.append(name + "_total" + labels + " " + _number(metric["value"]))
+            elif metric["type"] == "gauge":
+                lines.append(name + labels + " " + _number(metric["value"]))
+            elif metric["type"] == "rate":
+                lines.append(name + "_total" + labels + " " + _number(metric["count"]))
+                lines.append(name + "_rate" + labels + " " + _number(metric["rate"]))
+            else:
+                for percentile, value in metric["percentiles"].items():
+                    lines.append(name + '{process="' + snapshot["process"] + '",quantile="'
+                                 + "{0:g}".format(float(percentile) / 100) + '"} ' + _number(value))
+                lines.append(name + "_sum" + labels + " " + _number(metric["sum"]))
+                lines.append(name + "_count" + labels + " " + _number(metric["count"]))
+                if metric["max"] is not None:
+                    lines.append(name + "_max" + labels + " " + _number(metric["max"]))
+    return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _last_line(path):
+    """Returns the last complete line of a file, reading only its end."""
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        end = file.tell()
+        size = min(end, 65536)
+        file.seek(end - size)
+        lines = file.read(size).split(b"\n")
+    complete = [line for line in lines[:-1] if line]
+    return complete[-1].decode() if complete else None
+
+
+REGISTRY = MetricsRegistry()   # The registry of the current process
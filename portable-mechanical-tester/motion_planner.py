@@ -0,0 +1,270 @@
+"""Module defining MotionPlanner class and related functions.
+
+Gives the LinearActuator a notion of absolute carriage position:
+
+    Position: counted from the step pulses the StepGenerator emits, so it
+        covers every move (buttons, controller, planned moves). Once the
+        carriage has been homed against a limit switch, the position is
+        absolute.
+    Moves: move_by() and move_to() move the carriage by an exact number of
+        steps along a trapezoidal (or S-curve) schedule computed by
+        plan_move() and cached, so repeated moves are not re-planned. Targets
+        outside the soft travel envelope are refused once homed.
+    Lost steps: the commanded position is compared with the encoder
+        position every CHECK_STEPS steps of a planned move, and by check()
+        at any other time. An error larger than MAX_POSITION_ERROR stops the
+        move and latches a fault.
+    Velocity: update_velocity(), called at a fixed rate, estimates the
+        carriage velocity and acceleration from the encoder edge times.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from functools import lru_cache
+import gpio
+from motor import Motor
+from rotary_encoder import RotaryEncoder, VelocityEstimator
+from step_generator import plan_move
+
+
+@lru_cache(maxsize=64)
+def move_schedule(steps, max_rate, acceleration, start_rate, profile):
+    """Returns the cached step intervals of a move. See plan_move()."""
+    return tuple(plan_move(steps, max_rate, acceleration, start_rate, profile))
+
+
+class MotionPlanner:
+    """Tracks the carriage position of a LinearActuator and moves it to
+    given positions.
+
+    The carriage moves up (positive positions) when the motor turns CW, and
+    the encoder count increases with it.
+
+    Attributes:
+        LINEAR_ACTUATOR: The LinearActuator moved.
+        ROTARY_ENCODER: The RotaryEncoder on the lead screw, or None to skip
+            the lost step detection.
+        TRAVEL_LIMITS: A (minimum, maximum) tuple of the soft travel envelope
+            [mm], enforced once homed.
+        MAX_POSITION_ERROR: A float indicating the largest permitted
+            difference between the commanded and encoder positions [mm].
+        CHECK_STEPS: An integer indicating how many steps of a planned move
+            are emitted per position check.
+        COUNTS_PER_REVOLUTION: An integer indicating the encoder counts per
+            revolution of the lead screw.
+        homed: A boolean indicating whether the position is absolute.
+        fault: A string describing the latched lost step fault, or None.
+        max_position_error: A float holding the largest position error
+            measured [mm].
+        velocity_estimator: The VelocityEstimator of the carriage in mm, or
+            None without an encoder.
+    """
+
+    def __init__(self, LINEAR_ACTUATOR, ROTARY_ENCODER=None, TRAVEL_LIMITS=(0, 250), MAX_POSITION_ERROR=0.1,
+                 CHECK_STEPS=16, COUNTS_PER_REVOLUTION=RotaryEncoder.COUNTS_PER_REVOLUTION):
+        """Initializes MotionPlanner with the current position as 0."""
+        self.LINEAR_ACTUATOR = LINEAR_ACTUATOR
+        self.ROTARY_ENCODER = ROTARY_ENCODER
+        self.TRAVEL_LIMITS = TRAVEL_LIMITS
+        self.MAX_POSITION_ERROR = MAX_POSITION_ERROR
+        self.CHECK_STEPS = CHECK_STEPS
+        self.COUNTS_PER_REVOLUTION = COUNTS_PER_REVOLUTION
+        self.homed = False
+        self.fault = None
+        self.max_position_error = 0.0
+        self._steps_per_mm = LINEAR_ACTUATOR.MOTOR.STEPS_PER_REVOLUTION / LINEAR_ACTUATOR.SCREW_LEAD
+        self._counts_per_mm = COUNTS_PER_REVOLUTION / LINEAR_ACTUATOR.SCREW_LEAD
+        self._zero_steps = 0
+        self._zero_counts = 0
+        self.velocity_estimator = None
+        if ROTARY_ENCODER is not None:
+            self.velocity_estimator = VelocityEstimator(SCALE=1 / self._counts_per_mm)
+        self.set_position(0)
+
+    @property
+    def step_generator(self):
+        """The StepGenerator counting the steps of the motor."""
+        return self.LINEAR_ACTUATOR.MOTOR.step_generator
+
+    @property
+    def position(self):
+        """The commanded carriage position [mm]."""
+        return (self.step_generator.position - self._zero_steps) / self._steps_per_mm
+
+    @property
+    def encoder_position(self):
+        """The carriage position measured by the encoder [mm], or None."""
+        if self.ROTARY_ENCODER is None:
+            return None
+        return (self.ROTARY_ENCODER.position - self._zero_counts) / self._counts_per_mm
+
+    @property
+    def position_error(self):
+        """The encoder position minus the commanded position [mm], or 0 without
+        an encoder.
+        """
+        encoder_position = self.encoder_position
+        return 0.0 if encoder_position is None else encoder_position - self.position
+
+    @property
+    def velocity(self):
+        """The smoothed carriage velocity measured by the encoder [mm/s],
+        positive upwards, or None.
+        """
+        return None if self.velocity_estimator is None else self.velocity_estimator.velocity
+
+    @property
+    def acceleration(self):
+        """The smoothed carriage acceleration measured by the encoder
+        [mm/s^2], or None.
+        """
+        return None if self.velocity_estimator is None else self.velocity_estimator.acceleration
+
+    def update_velocity(self):
+        """Updates the velocity and acceleration from the encoder edges. Call
+        at a fixed rate of 100 Hz or more.
+        """
+        if self.velocity_estimator is not None:
+            self.velocity_estimator.update(gpio.monotonic(), self.ROTARY_ENCODER.last_edge)
+
+    def set_position(self, position):
+        """Declares the current carriage position [mm], for both the step
+        count and the encoder.
+        """
+        self._zero_steps = self.step_generator.position - round(position * self._steps_per_mm)
+        if self.ROTARY_ENCODER is not None:
+            self._zero_counts = self.ROTARY_ENCODER.position - round(position * self._counts_per_mm)
+
+    def check(self):
+        """Compares the commanded and encoder positions, latching a fault and
+        disabling the motor if they differ by more than MAX_POSITION_ERROR.
+
+        Returns:
+            False if a fault is latched.
+        """
+        error = abs(self.position_error)
+        if error > self.max_position_error:
+            self.max_position_error = error
+        if error > self.MAX_POSITION_ERROR and self.fault is None:
+            self.fault = "Lost steps: position error " + "{0:.3f}".format(error) + " mm"
+            print("ERROR: " + self.fault)
+            motor = self.LINEAR_ACTUATOR.MOTOR
+            if motor.enabled:
+                motor.disable()
+        return self.fault is None
+
+    def reset(self):
+        """Clears a latched fault, taking the encoder position as the true
+        position.
+        """
+        encoder_position = self.encoder_position
+        if encoder_position is not None:
+            self.set_position(encoder_position)
+        self.fault = None
+
+    def move_to(self, position, speed=None, wait=False):
+        """Moves the carriage to a position. See move_by()."""
+        return self.move_by(position - self.position, speed, wait)
+
+    def move_by(self, distance, speed=None, wait=False):
+        """Moves the carriage by a distance along a precomputed schedule.
+
+        Args:
+            distance: The signed distance to move [mm], positive upwards.
+            speed: The cruise speed [mm/s], the LinearActuator's speed by
+                default.
+            wait: True to return only once the move is over.
+
+        Returns:
+            False if the move was refused: a fault is latched, the motor is
+            moving or the target lies outside TRAVEL_LIMITS.
+        """
+        if self.fault is not None:
+            print("ERROR: " + self.fault)
+            return False
+        target = self.position + distance
+        if self.homed and not self.TRAVEL_LIMITS[0] <= target <= self.TRAVEL_LIMITS[1]:
+            print("ERROR: Target position " + "{0:.3f}".format(target) + " mm is outside the travel limits.")
+            return False
+        steps = round(target * self._steps_per_mm) - (self.step_generator.position - self._zero_steps)
+        if steps == 0:
+            return True
+
+        linear_actuator = self.LINEAR_ACTUATOR
+        step_generator = self.step_generator
+        max_rate = linear_actuator.convert_to_steps_per_s(linear_actuator.speed if speed is None else speed)
+        intervals = move_schedule(abs(steps), max(max_rate, step_generator.START_RATE),
+                                  step_generator.ACCELERATION, step_generator.START_RATE, step_generator.PROFILE)
+        direction = Motor.Direction.CW if steps > 0 else Motor.Direction.CCW
+        if not linear_actuator.MOTOR.move(direction, intervals, self.__running()):
+            return False
+        if wait:
+            self.wait()
+        return True
+
+    def home(self, interlock, direction=Motor.Direction.CCW, speed=5, BACKOFF=1):
+        """Moves towards a limit switch until the interlock trips, sets the
+        position there to the matching end of TRAVEL_LIMITS and backs off.
+        Blocks until done.
+
+        Args:
+            interlock: The SafetyInterlock of the limit switches.
+            direction: The direction of the limit switch to home against,
+                CCW (down) for the lower end of the travel.
+            speed: The homing speed [mm/s].
+            BACKOFF: The distance to move away from the switch [mm].
+
+        Returns:
+            False if the carriage stopped before reaching a limit switch.
+        """
+        linear_actuator = self.LINEAR_ACTUATOR
+        motor = linear_actuator.MOTOR
+        interlock.reset()
+        self.homed = False
+        self.fault = None
+        previous_speed = linear_actuator.speed
+        linear_actuator.set_speed(speed)
+        motor.start(direction)
+        self.wait()
+        linear_actuator.set_speed(previous_speed)
+        if not interlock.tripped:
+            print("ERROR: Homing stopped before reaching a limit switch.")
+            return False
+
+        interlock.reset()
+        lower = direction == Motor.Direction.CCW
+        self.set_position(self.TRAVEL_LIMITS[0] if lower else self.TRAVEL_LIMITS[1])
+        self.homed = True
+        return self.move_by(BACKOFF if lower else -BACKOFF, speed, wait=True)
+
+    def wait(self, POLL_TIME=0.01):
+        """Blocks until the motor has stopped moving."""
+        motor = self.LINEAR_ACTUATOR.MOTOR
+        while motor.moving:
+            gpio.sleep(POLL_TIME)
+
+    def report(self):
+        """Returns the position tracking state as a dictionary."""
+        return {
+            "position": self.position,
+            "encoder_position": self.encoder_position,
+            "position_error": self.position_error,
+            "velocity": self.velocity,
+            "acceleration": self.acceleration,
+            "max_position_error": self.max_position_error,
+            "homed": self.homed,
+            "fault": self.fault,
+        }
+
+    def __running(self):
+        """Returns the running function of a planned move, checking the
+        position every CHECK_STEPS steps.
+        """
+        if self.ROTARY_ENCODER is None:
+            return None
+        CHECK_STEPS = self.CHECK_STEPS
+        calls = [0]
+        def running():
+            calls[0] += 1
+            return calls[0] % CHECK_STEPS or self.check()
+        return running
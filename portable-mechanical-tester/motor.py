@@ -4,12 +4,9 @@ Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
 """
 
 from enum import Enum
-import RPi.GPIO as GPIO
+from gpio import GPIO
+from step_generator import StepGenerator
 import threading
-import time
-
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BCM)
 
 class Motor:
     """Represents a stepper motor.
@@ -21,6 +18,9 @@ class Motor:
             Connected to "PUL-" on the microstep driver.
         PIN_ENA: An integer indicating the GPIO pin number of the enable pin.
             Connected to "ENA-" on the microstep driver.
+        step_generator: The StepGenerator emitting the motor's step pulses.
+            Its statistics attribute reports the achieved step rate and
+            jitter of the current or last move.
     """
     STEPS_PER_REVOLUTION = 200  # The amount of steps that the motor needs to take to turn 1 revolution
 
@@ -50,8 +50,13 @@ class Motor:
         if PIN_ENA is not None:
             GPIO.output(self.PIN_ENA, self.enabled)
 
+        self.step_generator = StepGenerator(self.PIN_PUL)
         self.set_direction(self.Direction.CW)  # Sets the initial motor direction as clockwise
         self.speed = 100          # Default speed of the motor [steps/s]
+        self.moving = False     # Whether the step generator is running
+        self._schedule = None   # Step intervals of the requested move, or None to follow speed
+        self._move_requested = threading.Event()
+        self._move_thread = None
 
     def move_CW(self):
         """Turns the motor a single step clockwise (when looking at the motor's top face)."""
@@ -64,7 +69,7 @@ class Motor:
         else:
             self.enable()
             self.set_direction(self.Direction.CW)
-            threading.Thread(target=self.__move).start()
+            self.__start_thread()
             print("Motor CW")
 
     def move_CCW(self):
@@ -80,18 +85,96 @@ class Motor:
         else:
             self.enable()
             self.set_direction(self.Direction.CCW)
-            threading.Thread(target=self.__move).start()
+            self.__start_thread()
             print("Motor CCW")
 
+    def enable_metrics(self, registry=None, name="motor"):
+        """Records the step timing of the motor's moves. See
+        StepGenerator.enable_metrics().
+        """
+        self.step_generator.enable_metrics(registry, name)
+
+    def start(self, direction):
+        """Keeps the motor turning in a direction at its current speed,
+        starting it if it is stopped. Unlike move_CW() and move_CCW() it never
+        toggles the motor off, so it can be called repeatedly by a controller.
+
+        The direction pin is switched immediately, so the speed should have
+        been ramped down to 0 before reversing.
+
+        Args:
+            direction: An Enum value indicating the direction the motor should
+            turn.
+        """
+        if (self.direction != direction):
+            self.set_direction(direction)
+        if (not self.moving):
+            self.enable()
+            self.__start_thread()
+
+    def move(self, direction, intervals, running=None):
+        """Moves the motor by a fixed number of steps following a schedule,
+        e.g. from plan_move(), on the motor's worker thread. Returns
+        immediately; the move is over once 'moving' is False.
+
+        Args:
+            direction: An Enum value indicating the direction the motor should
+            turn.
+            intervals: The step intervals of the move [s]. One more step than
+                there are intervals is emitted.
+            running: An optional function called before every step. The move
+                ends early, and the motor is disabled, once it returns False.
+
+        Returns:
+            False if the motor is already moving, so the move was not started.
+        """
+        if (self.moving):
+            print("ERROR: Motor is already moving")
+            return False
+        self.set_direction(direction)
+        self._schedule = (intervals, running)
+        self.enable()
+        self.__start_thread()
+        return True
+
+    def __start_thread(self):
+        """Starts stepping the motor on the motor's worker thread, which is
+        created once and then reused by every move.
+        """
+        self.moving = True
+        if self._move_thread is None:
+            self._move_thread = threading.Thread(target=self.__work, daemon=True)
+            self._move_thread.start()
+        self._move_requested.set()
+
+    def __work(self):
+        """Runs a move every time one is requested."""
+        while True:
+            self._move_requested.wait()
+            self._move_requested.clear()
+            try:
+                self.__move()
+            finally:
+                self.moving = False
+
     def __move(self):
-        """Moves the motor a single step in whichever direction the direction
-        is set.
+        """Steps the motor in whichever direction is set until it is disabled.
+        Changes of speed follow the step generator's acceleration ramp, and
+        a speed of 0 decelerates the motor to a stop. A move started by
+        move() follows its schedule instead.
         """
-        while (self.enabled):
-            GPIO.output(self.PIN_PUL, 1)
-            time.sleep(2/self.speed)
-            GPIO.output(self.PIN_PUL, 0)
-            time.sleep(2/self.speed)
+        schedule = self._schedule
+        if schedule is None:
+            self.step_generator.run(lambda: self.speed, lambda: self.enabled)
+        else:
+            self._schedule = None
+            intervals, running = schedule
+            if running is None:
+                self.step_generator.run_schedule(intervals, lambda: self.enabled)
+            else:
+                self.step_generator.run_schedule(intervals, lambda: self.enabled and running())
+        if (self.enabled):
+            self.disable()
 
     def disable(self):
         """Disables the motor and updates its 'enabled' state."""
@@ -117,8 +200,10 @@ class Motor:
         if (direction == self.Direction.CW):
             self.direction = self.Direction.CW
             GPIO.output(self.PIN_DIR, 1)
+            self.step_generator.direction = 1
         elif (direction == self.Direction.CCW):
             self.direction = self.Direction.CCW
             GPIO.output(self.PIN_DIR, 0)
+            self.step_generator.direction = -1
         else:
             print ("ERROR: Invalid direction specified.")
@@ -0,0 +1,480 @@
+"""Module defining test protocols, their compilation into execution plans
+and the ProtocolRunner executing them.
+
+A protocol describes a standard test procedure as a list of stages, in YAML
+or JSON:
+
+    name: Tensile test
+    gauge_length: 50            # [mm], only needed for strain rates
+    stages:
+      - name: preload
+        type: ramp
+        rate: 0.5               # Crosshead rate [mm/s], positive upwards
+        until: force >= 10
+      - name: pull
+        type: ramp
+        strain_rate: 0.001      # [1/s], instead of rate
+        until:                  # The first condition met ends the stage
+          - force <= 50% peak   # Fraction of the stage's peak force
+          - displacement >= 40
+      - name: hold
+        type: hold
+        force: 5                # Holds a force, or the position without it
+        duration: 30            # Shorthand for "time >= 30"
+      - name: unload
+        type: move
+        to: 0                   # Absolute displacement [mm], or distance
+        speed: 5                # [mm/s], the actuator speed by default
+
+Ramp and hold stages run on a ClosedLoopController and need an end
+condition. Conditions compare force, displacement (absolute [mm]) or time
+(since the stage started [s]) to a number. Move stages drive the Motor
+along a step schedule and end when the move is over, or earlier if one of
+their conditions is met.
+
+compile_protocol() validates a protocol and compiles it once, before the
+test, into an ExecutionPlan: controller setpoints, parsed conditions and,
+for relative moves, the step schedule. ProtocolRunner.update() then only
+compares the live force and displacement with the conditions of the current
+stage, so a transition is at most one update period behind the data. Every
+transition is logged with its gpio.monotonic() timestamp.
+
+Validating a protocol without running it:
+    python protocol.py PROTOCOL
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import argparse
+from collections import namedtuple
+from controller import ControlMode
+import gpio
+import json
+import math
+from motion_planner import move_schedule
+import operator
+import os
+import re
+
+STAGE_TYPES = ("ramp", "hold", "move")
+QUANTITIES = ("force", "displacement", "time")
+OPERATORS = {">=": operator.ge, "<=": operator.le, ">": operator.gt, "<": operator.lt}
+
+_PROTOCOL_KEYS = ("name", "gauge_length", "stages")
+_STAGE_KEYS = {
+    "ramp": ("name", "type", "rate", "strain_rate", "until", "duration"),
+    "hold": ("name", "type", "force", "until", "duration"),
+    "move": ("name", "type", "distance", "to", "speed", "until", "duration"),
+}
+_CONDITION = re.compile(r"^\s*(" + "|".join(QUANTITIES) + r")\s*(>=|<=|>|<)\s*"
+                        r"([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(%\s*peak)?\s*$")
+
+Condition = namedtuple("Condition", ("quantity", "compare", "threshold", "of_peak", "text"))
+Move = namedtuple("Move", ("distance", "target", "speed", "direction", "intervals"))
+Stage = namedtuple("Stage", ("name", "mode", "setpoint", "conditions", "move"))
+ExecutionPlan = namedtuple("ExecutionPlan", ("name", "gauge_length", "stages"))
+Transition = namedtuple("Transition", ("time", "stage", "reason", "force", "displacement"))
+
+
+def load_protocol(path):
+    """Reads a protocol from a YAML (.yaml, .yml) or JSON file.
+
+    Returns:
+        The protocol as a dictionary, not validated yet.
+
+    Raises:
+        ValueError: The file is not valid YAML or JSON.
+    """
+    with open(path) as file:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            import yaml
+            try:
+                return yaml.safe_load(file)
+            except yaml.YAMLError as error:
+                raise ValueError("invalid YAML: " + str(error))
+        return json.load(file)
+
+
+def parse_condition(text):
+    """Parses an end condition such as "force >= 10" or "force <= 50% peak".
+
+    Raises:
+        ValueError: The condition is malformed.
+    """
+    match = _CONDITION.match(str(text))
+    if match is None:
+        raise ValueError("invalid condition '" + str(text) + "', expected e.g. 'force >= 10', "
+                         "'displacement > 5', 'time >= 30' or 'force <= 50% peak'")
+    quantity, symbol, threshold, of_peak = match.groups()
+    if of_peak and quantity != "force":
+        raise ValueError("only force conditions can refer to the peak: '" + str(text) + "'")
+    return Condition(quantity, OPERATORS[symbol], float(threshold), bool(of_peak), " ".join(str(text).split()))
+
+
+def compile_protocol(protocol, linear_actuator):
+    """Validates a protocol and compiles it into an ExecutionPlan.
+
+    Args:
+        protocol: The protocol dictionary, e.g. from load_protocol().
+        linear_actuator: The LinearActuator the plan is for, whose limits and
+            step generator settings the plan is checked and scheduled with.
+
+    Raises:
+        ValueError: The protocol is invalid. The message locates the problem,
+            e.g. "stages[2].rate: ...".
+    """
+    if not isinstance(protocol, dict):
+        raise ValueError("protocol: expected a mapping with 'stages'")
+    _check_keys(protocol, _PROTOCOL_KEYS, "protocol")
+    gauge_length = protocol.get("gauge_length")
+    if gauge_length is not None:
+        gauge_length = _number(gauge_length, "gauge_length", positive=True)
+    stages = protocol.get("stages")
+    if not isinstance(stages, list) or not stages:
+        raise ValueError("stages: expected a non-empty list of stages")
+    compiled = tuple(_compile_stage(stage, "stages[" + str(index) + "]", index, gauge_length, linear_actuator)
+                     for index, stage in enumerate(stages))
+    return ExecutionPlan(str(protocol.get("name", "protocol")), gauge_length, compiled)
+
+
+def _compile_stage(stage, location, index, gauge_length, linear_actuator):
+    """Validates and compiles one stage. See compile_protocol()."""
+    if not isinstance(stage, dict):
+        raise ValueError(location + ": expected a mapping")
+    kind = stage.get("type")
+    if kind not in STAGE_TYPES:
+        raise ValueError(location + ".type: expected one of " + ", ".join(STAGE_TYPES))
+    _check_keys(stage, _STAGE_KEYS[kind], location)
+    name = str(stage.get("name", "stage " + str(index + 1)))
+
+    until = stage.get("until", [])
+    if not isinstance(until, list):
+        until = [until]
+    conditions = []
+    for number, text in enumerate(until):
+        try:
+            conditions.append(parse_condition(text))
+        except ValueError as error:
+            raise ValueError(location + ".until[" + str(number) + "]: " + str(error))
+    if "duration" in stage:
+        duration = _number(stage["duration"], location + ".duration", positive=True)
+        conditions.append(Condition("time", operator.ge, duration, False, "time >= " + str(duration)))
+    conditions = tuple(conditions)
+
+    MAX_SPEED = linear_actuator.MAX_SPEED
+    move = None
+    if kind == "ramp":
+        if ("rate" in stage) == ("strain_rate" in stage):
+            raise ValueError(location + ": expected either 'rate' or 'strain_rate'")
+        if "rate" in stage:
+            mode = ControlMode.CROSSHEAD_RATE
+            setpoint = _number(stage["rate"], location + ".rate")
+            speed = abs(setpoint)
+        else:
+            if gauge_length is None:
+                raise ValueError(location + ".strain_rate: 'gauge_length' is required for strain rates")
+            mode = ControlMode.STRAIN_RATE
+            setpoint = _number(stage["strain_rate"], location + ".strain_rate")
+            speed = abs(setpoint) * gauge_length
+        if speed > MAX_SPEED:
+            raise ValueError(location + ": the crosshead rate " + str(speed) + " mm/s exceeds "
+                             + str(MAX_SPEED) + " mm/s")
+    elif kind == "hold":
+        if "force" in stage:
+            mode = ControlMode.FORCE_HOLD
+            setpoint = _number(stage["force"], location + ".force")
+        else:
+            mode = ControlMode.CROSSHEAD_RATE
+            setpoint = 0.0
+    else:
+        mode = None
+        setpoint = None
+        move = _compile_move(stage, location, linear_actuator)
+
+    if move is None and not conditions:
+        raise ValueError(location + ": a " + kind + " stage needs 'until' or 'duration'")
+    return Stage(name, mode, setpoint, conditions, move)
+
+
+def _compile_move(stage, location, linear_actuator):
+    """Compiles a move stage, scheduling its steps if the distance is known."""
+    if ("distance" in stage) == ("to" in stage):
+        raise ValueError(location + ": expected either 'distance' or 'to'")
+    speed = linear_actuator.speed
+    if "speed" in stage:
+        speed = _number(stage["speed"], location + ".speed", positive=True)
+    if speed > linear_actuator.MAX_SPEED:
+        raise ValueError(location + ".speed: " + str(speed) + " mm/s exceeds "
+                         + str(linear_actuator.MAX_SPEED) + " mm/s")
+    if "to" in stage:
+        return Move(None, _number(stage["to"], location + ".to"), speed, None, None)
+    distance = _number(stage["distance"], location + ".distance")
+    direction, intervals = step_schedule(linear_actuator, distance, speed)
+    return Move(distance, None, speed, direction, intervals)
+
+
+def step_schedule(linear_actuator, distance, speed):
+    """Returns the (direction, intervals) of a move of the carriage by a
+    distance [mm] at a cruise speed [mm/s], from the cached schedules of
+    motion_planner.move_schedule(). A move of less than a step has no
+    intervals.
+    """
+    motor = linear_actuator.MOTOR
+    step_generator = motor.step_generator
+    steps = round(distance * motor.STEPS_PER_REVOLUTION / linear_actuator.SCREW_LEAD)
+    direction = motor.Direction.CW if steps > 0 else motor.Direction.CCW
+    if steps == 0:
+        return direction, None
+    max_rate = max(linear_actuator.convert_to_steps_per_s(speed), step_generator.START_RATE)
+    return direction, move_schedule(abs(steps), max_rate, step_generator.ACCELERATION,
+                                    step_generator.START_RATE, step_generator.PROFILE)
+
+
+def _check_keys(mapping, keys, location):
+    """Raises ValueError naming the first key of mapping not in keys."""
+    for key in mapping:
+        if key not in keys:
+            raise ValueError(location + "." + str(key) + ": unknown key, expected one of " + ", ".join(keys))
+
+
+def _number(value, location, positive=False):
+    """Returns value as a float, raising ValueError if it is not a finite
+    (and, if required, positive) number.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(location + ": expected a number")
+    if positive and value <= 0:
+        raise ValueError(location + ": expected a positive number")
+    return float(value)
+
+
+class ProtocolRunner:
+    """Runs an ExecutionPlan on a ClosedLoopController.
+
+    The controller's force and displacement functions provide the live data
+    the conditions are evaluated against, and its force and travel limits
+    stay active throughout. A controller fault ends the protocol.
+
+    Attributes:
+        plan: The ExecutionPlan run.
+        controller: The ClosedLoopController running the ramp and hold
+            stages.
+        stage_index: An integer indicating the current stage.
+        transitions: A list of Transition, one per stage entered, plus one
+            when the protocol ends (with stage None).
+        running: A boolean indicating whether the protocol is running.
+        fault: A string describing why the protocol was aborted, or None.
+        max_update_interval: A float holding the longest time between two
+            update() calls [s], which bounds the transition latency.
+    """
+
+    def __init__(self, plan, controller):
+        """Initializes ProtocolRunner."""
+        self.plan = plan
+        self.controller = controller
+        self.stage_index = None
+        self.transitions = []
+        self.running = False
+        self.fault = None
+        self.max_update_interval = 0.0
+        self._start_time = None
+        self._stage_time = None
+        self._last_update = None
+        self._peak = 0.0
+        self._move_pending = False
+        self._moving = False
+
+    @property
+    def stage(self):
+        """The current Stage, or None."""
+        if self.stage_index is None or self.stage_index >= len(self.plan.stages):
+            return None
+        return self.plan.stages[self.stage_index]
+
+    def start(self):
+        """Starts the controller and the first stage."""
+        if self.plan.gauge_length is not None:
+            self.controller.GAUGE_LENGTH = self.plan.gauge_length
+        self.transitions = []
+        self.fault = None
+        self.max_update_interval = 0.0
+        self.running = True
+        now = gpio.monotonic()
+        self._start_time = now
+        self._last_update = None
+        self.controller.start()
+        self.__enter(0, now, "Start", self.controller.force(), self.controller.position())
+
+    def stop(self, reason="Stopped"):
+        """Aborts the protocol and decelerates the crosshead to a stop."""
+        if not self.running:
+            return
+        self._moving = False
+        self.controller.idle()
+        self.__finish(gpio.monotonic(), reason, self.controller.force(), self.controller.position())
+
+    def update(self):
+        """Evaluates the end conditions of the current stage against the live
+        data and moves on to the next stage when one is met. Call it
+        periodically, e.g. with Runtime.add_periodic() at the controller's
+        rate.
+        """
+        if not self.running:
+            return
+        now = gpio.monotonic()
+        if self._last_update is not None:
+            self.max_update_interval = max(self.max_update_interval, now - self._last_update)
+        self._last_update = now
+
+        controller = self.controller
+        force = controller.force()
+        displacement = controller.position()
+        if controller.fault is not None:
+            self.fault = controller.fault
+            self._moving = False
+            self.__finish(now, "Fault: " + controller.fault, force, displacement)
+            return
+
+        stage = self.stage
+        motor = controller.linear_actuator.MOTOR
+        if stage.move is not None:
+            if self._move_pending:
+                # Waits for the previous stage's motion to stop
+                if not motor.moving and displacement is not None:
+                    self.__start_move(stage.move, displacement)
+                return
+            if not motor.moving:
+                self.__enter(self.stage_index + 1, now, "Move complete", force, displacement)
+                return
+
+        if force is None or displacement is None:
+            return
+        if force > self._peak:
+            self._peak = force
+        values = {"force": force, "displacement": displacement, "time": now - self._stage_time}
+        for condition in stage.conditions:
+            threshold = condition.threshold
+            if condition.of_peak:
+                if self._peak <= 0:
+                    continue
+                threshold *= self._peak / 100
+            if condition.compare(values[condition.quantity], threshold):
+                if stage.move is not None:
+                    self._moving = False
+                    controller.idle()
+                self.__enter(self.stage_index + 1, now, condition.text, force, displacement)
+                return
+
+    def report(self):
+        """Returns the state of the protocol as a dictionary, with the
+        transition times relative to the start [s].
+        """
+        stage = self.stage
+        return {
+            "protocol": self.plan.name,
+            "stage": None if stage is None else stage.name,
+            "running": self.running,
+            "fault": self.fault,
+            "max_update_interval": self.max_update_interval,
+            "transitions": [transition._replace(time=transition.time - self._start_time)._asdict()
+                            for transition in self.transitions],
+        }
+
+    def __enter(self, index, now, reason, force, displacement):
+        """Logs the transition and starts stage index."""
+        if index >= len(self.plan.stages):
+            self.controller.idle()
+            self.__finish(now, reason, force, displacement)
+            return
+        stage = self.plan.stages[index]
+        self.stage_index = index
+        self.__log(Transition(now, stage.name, reason, force, displacement))
+        self._stage_time = now
+        self._peak = 0.0
+        controller = self.controller
+        if stage.mode == ControlMode.CROSSHEAD_RATE:
+            controller.set_crosshead_rate(stage.setpoint)
+        elif stage.mode == ControlMode.STRAIN_RATE:
+            controller.set_strain_rate(stage.setpoint)
+        elif stage.mode == ControlMode.FORCE_HOLD:
+            controller.hold_force(stage.setpoint)
+        else:
+            controller.idle()
+            self._move_pending = True
+
+    def __start_move(self, move, displacement):
+        """Starts the move of a move stage along its precomputed schedule, or
+        one planned from the current displacement.
+        """
+        self._move_pending = False
+        direction, intervals = move.direction, move.intervals
+        if move.target is not None:
+            direction, intervals = step_schedule(self.controller.linear_actuator,
+                                                 move.target - displacement, move.speed)
+        if intervals is None:
+            return
+        self._moving = True
+        self.controller.linear_actuator.MOTOR.move(direction, intervals, lambda: self._moving)
+
+    def __finish(self, now, reason, force, displacement):
+        """Logs the end of the protocol."""
+        self.running = False
+        self.stage_index = len(self.plan.stages)
+        self.__log(Transition(now, None, reason, force, displacement))
+
+    def __log(self, transition):
+        """Records and prints a transition."""
+        self.transitions.append(transition)
+        elapsed = transition.time - self._start_time
+        print("Protocol " + "{0:9.3f}".format(elapsed) + " s: "
+              + ("end" if transition.stage is None else "stage '" + transition.stage + "'")
+              + " (" + transition.reason + ")")
+
+
+def describe(plan):
+    """Returns a human-readable description of an ExecutionPlan."""
+    lines = ["Protocol '" + plan.name + "'"
+             + ("" if plan.gauge_length is None else ", gauge length " + str(plan.gauge_length) + " mm")]
+    for number, stage in enumerate(plan.stages, 1):
+        if stage.move is None:
+            action = stage.mode.value + " " + str(stage.setpoint)
+        elif stage.move.target is not None:
+            action = "Move to " + str(stage.move.target) + " mm at " + str(stage.move.speed) + " mm/s"
+        else:
+            steps = 0 if stage.move.intervals is None else len(stage.move.intervals) + 1
+            action = ("Move by " + str(stage.move.distance) + " mm at " + str(stage.move.speed) + " mm/s ("
+                      + str(steps) + " steps scheduled)")
+        until = ", ".join(condition.text for condition in stage.conditions)
+        lines.append("  " + str(number) + ". " + stage.name + ": " + action + ("" if not until else ", until " + until))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Validates protocol files and prints their execution plans."""
+    parser = argparse.ArgumentParser(description="Validate test protocols and print their execution plans.")
+    parser.add_argument("protocols", nargs="+", help="YAML or JSON protocol files")
+    parser.add_argument("--screw-lead", type=float, default=5, help="lead of the lead screw [mm]")
+    args = parser.parse_args(argv)
+
+    # Only the actuator's settings are needed, so no pin is driven
+    from simulator import SimulatedGPIO
+    gpio.set_backend(SimulatedGPIO())
+    from linear_actuator import LinearActuator
+    from motor import Motor
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        linear_actuator = LinearActuator(Motor(20, 21), SCREW_LEAD=args.screw_lead)
+
+    status = 0
+    for path in args.protocols:
+        try:
+            print(describe(compile_protocol(load_protocol(path), linear_actuator)))
+        except (OSError, ValueError) as error:
+            print("ERROR: " + path + ": " + str(error))
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,439 @@
+"""Module defining Recorder and Recording classes and related functions.
+
+A recording is an append-only binary file made of fixed-size blocks:
+    File header (HEADER_SIZE bytes): magic followed by JSON metadata holding
+        the record fields and format, the block geometry and the calibration
+        (OFFSET, REFERENCE_UNIT, GAIN, SCREW_LEAD, STEPS_PER_REVOLUTION) and
+        any other metadata given by the writer.
+    Data blocks: a block header (kind, record count, first and last
+        timestamp) followed by BLOCK_RECORDS fixed-width records stored
+        column by column.
+    Index blocks: written after every INDEX_INTERVAL data blocks (and when
+        the recording is closed), listing the block number and time range
+        of each of those data blocks, so a reader can seek by time without
+        touching the data pages.
+
+The Recorder packs records into column arrays and hands complete blocks to
+a background thread, so the acquisition loop never waits on the SD card.
+The Recording reader memory-maps the file and exposes the blocks as
+zero-copy NumPy arrays.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from array import array
+import json
+import os
+import queue
+import struct
+import threading
+
+_MAGIC = b"PMTREC01"
+_BLOCK_MAGIC = b"PMTB"
+_BLOCK_HEADER = struct.Struct("<4sIIIdd")   # magic, kind, count, padding, t_first, t_last
+_INDEX_ENTRY = struct.Struct("<Qddq")        # block number, t_first, t_last, count
+DATA_BLOCK = 0
+INDEX_BLOCK = 1
+
+# NumPy type of each supported record type code. "l" and "L" are not
+# supported since their array size differs between platforms.
+_NUMPY_CODES = {"b": "i1", "B": "u1", "h": "i2", "H": "u2", "i": "i4", "I": "u4",
+                "q": "i8", "Q": "u8", "f": "f4", "d": "f8"}
+
+# Gain of the load cell amplifier for each value of LoadCellAmplifier.GAIN
+# (the number of extra clock pulses)
+_GAINS_BY_PULSES = {1: 128, 2: 32, 3: 64}
+
+
+def calibration_from(load_cell_amplifier=None, linear_actuator=None):
+    """Collects the calibration of the devices used in a test.
+
+    Args:
+        load_cell_amplifier: An optional LoadCellAmplifier.
+        linear_actuator: An optional LinearActuator.
+
+    Returns:
+        A dictionary suitable for Recorder's calibration argument.
+    """
+    calibration = {}
+    if load_cell_amplifier is not None:
+        calibration["OFFSET"] = load_cell_amplifier.OFFSET
+        calibration["REFERENCE_UNIT"] = load_cell_amplifier.REFERENCE_UNIT
+        calibration["GAIN"] = _GAINS_BY_PULSES.get(load_cell_amplifier.GAIN, load_cell_amplifier.GAIN)
+        if load_cell_amplifier.calibration is not None:
+            calibration["PROFILE"] = load_cell_amplifier.calibration.name
+            calibration["LINEARIZATION"] = [list(point) for point in load_cell_amplifier.calibration.points]
+    if linear_actuator is not None:
+        calibration["SCREW_LEAD"] = linear_actuator.SCREW_LEAD
+        calibration["STEPS_PER_REVOLUTION"] = linear_actuator.MOTOR.STEPS_PER_REVOLUTION
+    return calibration
+
+
+class _Layout:
+    """Computes the byte layout of the blocks of a recording."""
+
+    def __init__(self, FIELDS, FORMAT, BLOCK_RECORDS, INDEX_INTERVAL):
+        if len(FIELDS) != len(FORMAT):
+            raise ValueError("Record format " + FORMAT + " does not match fields " + str(FIELDS))
+        for code in FORMAT:
+            if code not in _NUMPY_CODES:
+                raise ValueError("Unsupported record type code " + code)
+        self.FIELDS = tuple(FIELDS)
+        self.FORMAT = FORMAT
+        self.BLOCK_RECORDS = BLOCK_RECORDS
+        self.INDEX_INTERVAL = INDEX_INTERVAL
+        self.column_offsets = []
+        offset = _BLOCK_HEADER.size
+        for code in FORMAT:
+            self.column_offsets.append(offset)
+            offset += (BLOCK_RECORDS * struct.calcsize("<" + code) + 7) // 8 * 8
+        index_size = _BLOCK_HEADER.size + INDEX_INTERVAL * _INDEX_ENTRY.size
+        self.block_size = max(offset, (index_size + 7) // 8 * 8)
+
+
+class Recorder:
+    """Writes records to a recording file without blocking the caller.
+
+    Attributes:
+        path: The path of the recording file.
+        FIELDS: A tuple of the record field names.
+        FORMAT: A string of struct type codes, one per field.
+        BLOCK_RECORDS: An integer indicating the number of records per block.
+        INDEX_INTERVAL: An integer indicating the number of data blocks
+            between index blocks.
+        records: An integer counting the records written.
+        dropped_blocks: An integer counting blocks discarded because the
+            background writer fell more than MAX_QUEUED_BLOCKS behind.
+    """
+    HEADER_SIZE = 4096
+    MAX_QUEUED_BLOCKS = 256
+    RECORD_FIELDS = ("time", "raw", "force", "position", "displacement")   # Default record layout
+    RECORD_FORMAT = "didqd"
+
+    def __init__(self, path, calibration=None, FIELDS=RECORD_FIELDS, FORMAT=RECORD_FORMAT,
+                 BLOCK_RECORDS=1024, INDEX_INTERVAL=64, metadata=None):
+        """Creates the recording file and starts the background writer.
+
+        Args:
+            path: The path of the recording file. An existing file is replaced.
+            calibration: A dictionary of calibration values stored in the
+                header, e.g. from calibration_from().
+            FIELDS: The record field names. The first field must be the
+                timestamp.
+            FORMAT: The struct type code of each field.
+            BLOCK_RECORDS: The number of records per block.
+            INDEX_INTERVAL: The number of data blocks between index blocks.
+            metadata: An optional JSON-serializable dictionary stored in the
+                header, e.g. what triggered a capture.
+        """
+        self.path = path
+        self._layout = _Layout(FIELDS, FORMAT, BLOCK_RECORDS, INDEX_INTERVAL)
+        self.FIELDS = self._layout.FIELDS
+        self.FORMAT = FORMAT
+        self.BLOCK_RECORDS = BLOCK_RECORDS
+        self.INDEX_INTERVAL = INDEX_INTERVAL
+        self.records = 0
+        self.dropped_blocks = 0
+
+        header_metadata = {
+            "fields": list(self.FIELDS),
+            "format": FORMAT,
+            "block_records": BLOCK_RECORDS,
+            "index_interval": INDEX_INTERVAL,
+            "block_size": self._layout.block_size,
+            "calibration": calibration or {},
+            "metadata": metadata or {},
+        }
+        encoded = json.dumps(header_metadata).encode()
+        if len(_MAGIC) + 4 + len(encoded) > self.HEADER_SIZE:
+            raise ValueError("Recording metadata does not fit in the file header.")
+        header = _MAGIC + struct.pack("<I", len(encoded)) + encoded
+        self._file = open(path, "wb")
+        self._file.write(header.ljust(self.HEADER_SIZE, b"\0"))
+
+        self._columns = [array(code) for code in FORMAT]
+        self._data_blocks = 0
+        self._index_entries = []
+        self._queue = queue.Queue(self.MAX_QUEUED_BLOCKS)
+        self._writer = threading.Thread(target=self.__write_blocks, daemon=True)
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def write(self, *values):
+        """Appends a record.
+
+        Args:
+            values: The record's field values, in FIELDS order.
+        """
+        columns = self._columns
+        for column, value in zip(columns, values):
+            column.append(value)
+        self.records += 1
+        if len(columns[0]) == self.BLOCK_RECORDS:
+            self.__submit_block()
+
+    def close(self):
+        """Writes the remaining records and the last index block, and closes
+        the file.
+        """
+        if self._file is None:
+            return
+        if len(self._columns[0]):
+            self.__submit_block()
+        if self._index_entries:
+            self.__submit_index()
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        self._file = None
+
+    def __submit_block(self):
+        """Packs the buffered records into a data block and queues it."""
+        layout = self._layout
+        columns = self._columns
+        count = len(columns[0])
+        t_first = columns[0][0]
+        t_last = columns[0][-1]
+        block = bytearray(layout.block_size)
+        _BLOCK_HEADER.pack_into(block, 0, _BLOCK_MAGIC, DATA_BLOCK, count, 0, t_first, t_last)
+        for offset, column in zip(layout.column_offsets, columns):
+            data = column.tobytes()
+            block[offset:offset + len(data)] = data
+        self._columns = [array(code) for code in self.FORMAT]
+        if not self.__queue(block):
+            return
+
+        self._index_entries.append((self._data_blocks, t_first, t_last, count))
+        self._data_blocks += 1
+        if len(self._index_entries) == self.INDEX_INTERVAL:
+            self.__submit_index()
+
+    def __submit_index(self):
+        """Packs the pending index entries into an index block and queues it."""
+        block = bytearray(self._layout.block_size)
+        entries = self._index_entries
+        _BLOCK_HEADER.pack_into(block, 0, _BLOCK_MAGIC, INDEX_BLOCK, len(entries), 0, entries[0][1], entries[-1][2])
+        for i, entry in enumerate(entries):
+            _INDEX_ENTRY.pack_into(block, _BLOCK_HEADER.size + i * _INDEX_ENTRY.size, *entry)
+        self._index_entries = []
+        self.__queue(block)
+
+    def __queue(self, block):
+        """Hands a block to the background writer.
+
+        Returns:
+            False if the block was dropped because the writer is too far behind.
+        """
+        try:
+            self._queue.put_nowait(block)
+        except queue.Full:
+            self.dropped_blocks += 1
+            return False
+        return True
+
+    def __write_blocks(self):
+        """Writes queued blocks to the file. Runs in the background thread."""
+        while True:
+            block = self._queue.get()
+            if block is None:
+                self._file.flush()
+                return
+            self._file.write(block)
+
+
+class Recording:
+    """Reads a recording file through a memory map.
+
+    Attributes:
+        path: The path of the recording file.
+        FIELDS: A tuple of the record field names.
+        calibration: A dictionary of the calibration stored in the header.
+        metadata: A dictionary of the other metadata stored in the header.
+        segments: A list of zero-copy NumPy structured arrays, one per run of
+            consecutive data blocks, with one element per data block. Each
+            field holds BLOCK_RECORDS values, of which the first "count" are
+            valid.
+    """
+
+    def __init__(self, path):
+        """Opens and memory-maps a recording file."""
+        import mmap
+        import numpy as np
+
+        self.path = path
+        self.segments = []
+        self._map = None
+        self._file = open(path, "rb")
+        # An empty file cannot be memory-mapped
+        if os.fstat(self._file.fileno()).st_size < len(_MAGIC) + 4:
+            self.close()
+            raise ValueError(path + " is not a recording.")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise ValueError(path + " is not a recording.")
+        length = struct.unpack_from("<I", self._map, len(_MAGIC))[0]
+        metadata = json.loads(self._map[len(_MAGIC) + 4:len(_MAGIC) + 4 + length])
+        self.FIELDS = tuple(metadata["fields"])
+        self.FORMAT = metadata["format"]
+        self.BLOCK_RECORDS = metadata["block_records"]
+        self.calibration = metadata["calibration"]
+        self.metadata = metadata.get("metadata", {})
+        layout = _Layout(self.FIELDS, self.FORMAT, self.BLOCK_RECORDS, metadata["index_interval"])
+        block_size = layout.block_size
+
+        header_names = ["magic", "kind", "count", "t_first", "t_last"]
+        header_formats = ["S4", "<u4", "<u4", "<f8", "<f8"]
+        header_offsets = [0, 4, 8, 16, 24]
+        data_type = np.dtype({
+            "names": header_names + list(self.FIELDS),
+            "formats": header_formats + [("<" + _numpy_code(code), (self.BLOCK_RECORDS,)) for code in self.FORMAT],
+            "offsets": header_offsets + layout.column_offsets,
+            "itemsize": block_size})
+        index_type = np.dtype({
+            "names": header_names + ["entries"],
+            "formats": header_formats + [(np.dtype([("block", "<u8"), ("t_first", "<f8"), ("t_last", "<f8"),
+                                                    ("count", "<i8")]), (layout.INDEX_INTERVAL,))],
+            "offsets": header_offsets + [_BLOCK_HEADER.size],
+            "itemsize": block_size})
+
+        HEADER_SIZE = Recorder.HEADER_SIZE
+        block_count = (len(self._map) - HEADER_SIZE) // block_size
+        all_blocks = np.frombuffer(self._map, dtype=data_type, count=block_count, offset=HEADER_SIZE)
+        kinds = all_blocks["kind"]
+        index_numbers = np.flatnonzero(kinds == INDEX_BLOCK)
+
+        # The data blocks between two index blocks are contiguous, so each
+        # run of them is exposed as one zero-copy array
+        self.segments = []
+        start = 0
+        for number in list(index_numbers) + [block_count]:
+            if number > start:
+                self.segments.append(all_blocks[start:number])
+            start = number + 1
+        self._segment_starts = np.cumsum([0] + [len(segment) for segment in self.segments])
+        self._counts = np.concatenate([segment["count"] for segment in self.segments] or [[]]).astype(np.int64)
+        self._record_starts = np.concatenate(([0], np.cumsum(self._counts)))
+
+        # Time index from the index blocks, falling back to the block headers
+        # for a recording that was not closed properly
+        index_blocks = np.frombuffer(self._map, dtype=index_type, count=block_count, offset=HEADER_SIZE)[index_numbers]
+        entries = [block["entries"][:block["count"]] for block in index_blocks]
+        if sum(len(block_entries) for block_entries in entries) == len(self._counts):
+            self._block_times = np.concatenate([e["t_first"] for e in entries] or [[]])
+        else:
+            self._block_times = np.concatenate([segment["t_first"] for segment in self.segments] or [[]])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return int(self._record_starts[-1])
+
+    @property
+    def block_count(self):
+        """The number of data blocks."""
+        return len(self._counts)
+
+    def block(self, number):
+        """Returns a zero-copy structured array element for a data block."""
+        import numpy as np
+        segment = int(np.searchsorted(self._segment_starts, number, side="right")) - 1
+        return self.segments[segment][number - self._segment_starts[segment]]
+
+    def close(self):
+        """Releases the memory map. Arrays still referenced from earlier
+        calls, e.g. column() views, keep the pages mapped until they are
+        released themselves.
+        """
+        self.segments = []
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass    # Unmapped once the exported arrays are garbage collected
+            self._map = None
+        self._file.close()
+
+    def index_at(self, t):
+        """Returns the index of the first record at or after time t [s]."""
+        import numpy as np
+        number = max(0, int(np.searchsorted(self._block_times, t, side="right")) - 1)
+        if number >= self.block_count:
+            return len(self)
+        count = self._counts[number]
+        times = self.block(number)[self.FIELDS[0]][:count]
+        position = int(np.searchsorted(times, t))
+        return int(self._record_starts[number]) + position
+
+    def column(self, field, start=0, stop=None):
+        """Returns the values of one field for a range of records.
+
+        Args:
+            field: The field name.
+            start: The index of the first record.
+            stop: The index after the last record, or None for the end.
+
+        Returns:
+            A NumPy array. It is a zero-copy view when the range lies in a
+            single block.
+        """
+        import numpy as np
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return np.empty(0, dtype="<" + _numpy_code(self.FORMAT[self.FIELDS.index(field)]))
+        first = int(np.searchsorted(self._record_starts, start, side="right")) - 1
+        last = int(np.searchsorted(self._record_starts, stop - 1, side="right")) - 1
+        parts = []
+        for number in range(first, last + 1):
+            block_start = self._record_starts[number]
+            low = max(start - block_start, 0)
+            high = min(stop - block_start, self._counts[number])
+            parts.append(self.block(number)[field][low:high])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def between(self, start_time, end_time):
+        """Returns every field for the records between two times [s].
+
+        Returns:
+            A dictionary mapping field names to NumPy arrays.
+        """
+        start = self.index_at(start_time)
+        stop = self.index_at(end_time)
+        return {field: self.column(field, start, stop) for field in self.FIELDS}
+
+    def iter_blocks(self):
+        """Yields a dictionary of zero-copy column views for each data block."""
+        for segment in self.segments:
+            for block in segment:
+                count = block["count"]
+                yield {field: block[field][:count] for field in self.FIELDS}
+
+
+def export_csv(recording_path, csv_path):
+    """Streams a recording to a CSV file one block at a time, so memory use
+    does not grow with the length of the recording.
+
+    Args:
+        recording_path: The path of the recording file.
+        csv_path: The path of the CSV file to write.
+    """
+    import csv
+    with Recording(recording_path) as recording, open(csv_path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(recording.FIELDS)
+        for block in recording.iter_blocks():
+            writer.writerows(zip(*(block[field].tolist() for field in recording.FIELDS)))
+
+
+def _numpy_code(code):
+    """Returns the NumPy type code of a struct type code."""
+    return _NUMPY_CODES[code]
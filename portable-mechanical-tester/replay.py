@@ -0,0 +1,222 @@
+"""Module defining the replay engine for recorded tests.
+
+A replay feeds the raw HX711 readings and the encoder positions of a
+recording back through the same LoadCell and RotaryEncoder code used during
+the test, so changes to the filtering or the velocity calculation can be
+evaluated on real data without repeating the test:
+
+    Load cell: a ReplayLoadCellAmplifier returns the recorded raw readings
+        from read(), so calibration, linearization and the LoadCell filter
+        run unchanged.
+    Encoder: the quadrature states between consecutive recorded positions
+        are decoded by RotaryEncoder.update(), and the velocity is sampled
+        with RotaryEncoder.sample() at the recorded times.
+
+Replays run on the simulated GPIO backend without sleeping, so they are
+deterministic and run as fast as the CPU allows. The output is a CSV file
+whose floats are written exactly (repr), so two replays can be compared
+with diff. Many recordings can be replayed in parallel:
+    python replay.py RECORDING [RECORDING ...] --output DIRECTORY [--jobs N]
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import argparse
+from calibration import CalibrationProfile
+from filters import SpikeRejectionFilter, MedianFilter, TrimmedMeanFilter, MovingAverageFilter
+import gpio
+from simulator import SimulatedGPIO, SimulatedAMT102
+
+# Device modules configure the GPIO backend on import, so the simulator must
+# be selected first.
+gpio.set_backend(SimulatedGPIO())
+
+from concurrent.futures import ProcessPoolExecutor
+from force_displacement import ForceDisplacementAligner
+from load_cell import LoadCell
+from load_cell_amplifier import LoadCellAmplifier
+from recorder import Recording
+from rotary_encoder import RotaryEncoder
+import csv
+import os
+import sys
+
+OUTPUT_FIELDS = ("time", "raw", "force", "position", "angular_velocity", "displacement")
+
+# Filters selectable for a replay, created from the samples and spikes options
+FILTERS = {
+    "spike": lambda samples, spikes: SpikeRejectionFilter(samples, spikes),
+    "median": lambda samples, spikes: MedianFilter(samples),
+    "trimmed": lambda samples, spikes: TrimmedMeanFilter(samples, spikes),
+    "average": lambda samples, spikes: MovingAverageFilter(samples),
+}
+
+# Pins of the replayed devices. They are never driven, since the recorded
+# values are injected above the pin level.
+_PIN_DAT, _PIN_CLK = 5, 6
+_PIN_A, _PIN_B, _PIN_X = 9, 11, 10
+
+
+class ReplayLoadCellAmplifier(LoadCellAmplifier):
+    """A LoadCellAmplifier whose conversions are recorded raw readings.
+
+    Attributes:
+        readings: An iterator of (time, raw) pairs, raw being the signed
+            value read() returned during the test.
+    """
+
+    def __init__(self, calibration, RATE=10):
+        """Initializes ReplayLoadCellAmplifier with the calibration of the
+        recording.
+        """
+        self.readings = iter(())
+        super().__init__(_PIN_DAT, _PIN_CLK, RATE=RATE, calibration=calibration)
+
+    def feed(self, t, raw):
+        """Sets the reading returned by the next read()."""
+        self.readings = iter(((t, raw),))
+
+    def set_gain(self, gain):
+        # The recorded readings were converted at the recorded gain, so no
+        # conversion has to be read to select it
+        self.GAIN = self.GAIN_PULSES[gain]
+
+    def read(self):
+        t, raw = next(self.readings)
+        self.statistics.record(t)
+        return raw
+
+
+def calibration_profile(calibration):
+    """Returns the CalibrationProfile described by the calibration dictionary
+    of a recording header.
+    """
+    return CalibrationProfile(calibration.get("PROFILE", "replay"),
+                              calibration.get("OFFSET", 0.0),
+                              calibration.get("REFERENCE_UNIT", 1.0),
+                              calibration.get("GAIN", 128),
+                              calibration.get("LINEARIZATION", ()),
+                              updated=0.0)
+
+
+def quadrature_states(position, target):
+    """Generates the (A, B) states of an encoder moving from one position to
+    another, one state per edge.
+
+    Args:
+        position: The starting position [quadrature counts].
+        target: The final position [quadrature counts].
+    """
+    STATES = SimulatedAMT102.STATES
+    increment = 1 if target >= position else -1
+    for count in range(position + increment, target + increment, increment):
+        yield STATES[count % 4]
+
+
+def replay(recording_path, output_path, samples=20, spikes=4, filter="spike", calibration=None):
+    """Replays a recording through LoadCell and RotaryEncoder.
+
+    Args:
+        recording_path: The path of the recording, with "time", "raw" and
+            "position" fields.
+        output_path: The path of the CSV file to write, with OUTPUT_FIELDS.
+        samples: The number of readings filtered by the LoadCell.
+        spikes: The spikes option of the filter (the trim of a "trimmed"
+            filter).
+        filter: The name of the filter in FILTERS.
+        calibration: An optional CalibrationProfile replacing the
+            calibration stored in the recording.
+
+    Returns:
+        A dictionary summarizing the replay: the number of records, the
+        encoder's invalid transitions and the load cell's dropped
+        conversions.
+    """
+    # A fresh backend per replay keeps every replay independent of the ones
+    # run before it in the same process
+    gpio.set_backend(SimulatedGPIO())
+    with Recording(recording_path) as recording:
+        header = recording.calibration
+        amplifier = ReplayLoadCellAmplifier(calibration or calibration_profile(header))
+        load_cell = LoadCell(amplifier, samples, spikes, filter=FILTERS[filter](samples, spikes))
+        rotary_encoder = RotaryEncoder(_PIN_A, _PIN_B, _PIN_X)
+        aligner = ForceDisplacementAligner(header.get("SCREW_LEAD", 5))
+
+        records = 0
+        with open(output_path, "w", newline="") as output:
+            writer = csv.writer(output, lineterminator="\n")
+            writer.writerow(OUTPUT_FIELDS)
+            for block in recording.iter_blocks():
+                for t, raw, position in zip(block["time"].tolist(), block["raw"].tolist(),
+                                            block["position"].tolist()):
+                    if records == 0:
+                        for pin_A_state, pin_B_state in quadrature_states(0, position % 4):
+                            rotary_encoder.update(pin_A_state, pin_B_state)
+                        rotary_encoder.reset(position)
+                        aligner.zero(position)
+                    else:
+                        for pin_A_state, pin_B_state in quadrature_states(rotary_encoder.position, position):
+                            rotary_encoder.update(pin_A_state, pin_B_state, t)
+                    rotary_encoder.sample(t)
+                    amplifier.feed(t, raw)
+                    force = load_cell.getMeasure()
+                    writer.writerow((repr(t), raw, repr(force), position,
+                                     repr(float(rotary_encoder.angular_velocity)),
+                                     repr(aligner.to_displacement(position))))
+                    records += 1
+    return {
+        "recording": recording_path,
+        "records": records,
+        "invalid_transitions": rotary_encoder.invalid_transitions,
+        "dropped_conversions": amplifier.statistics.dropped_conversions,
+    }
+
+
+def replay_many(recording_paths, output_directory, jobs=None, **options):
+    """Replays recordings in parallel, one process per CPU core by default.
+    Each output is named after its recording, with a .csv extension.
+
+    Args:
+        recording_paths: The paths of the recordings.
+        output_directory: The directory the CSV files are written to.
+        jobs: The number of worker processes, or None for one per core.
+        options: The options of replay().
+
+    Returns:
+        A list of the summaries returned by replay(), in the order of
+        recording_paths.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    output_paths = [os.path.join(output_directory, os.path.splitext(os.path.basename(path))[0] + ".csv")
+                    for path in recording_paths]
+    if len(set(output_paths)) != len(output_paths):
+        raise ValueError("Recordings with the same file name would overwrite each other's output.")
+    if jobs == 1:
+        return [replay(path, output_path, **options) for path, output_path in zip(recording_paths, output_paths)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(replay, path, output_path, **options)
+                   for path, output_path in zip(recording_paths, output_paths)]
+        return [future.result() for future in futures]
+
+
+def main(arguments=None):
+    """Replays the recordings given on the command line."""
+    parser = argparse.ArgumentParser(description="Replays recorded tests through the load cell and encoder code.")
+    parser.add_argument("recordings", nargs="+", help="recording files to replay")
+    parser.add_argument("--output", default=".", help="directory of the CSV outputs")
+    parser.add_argument("--samples", type=int, default=20, help="readings filtered by the load cell")
+    parser.add_argument("--spikes", type=int, default=4, help="spikes option of the filter")
+    parser.add_argument("--filter", choices=sorted(FILTERS), default="spike", help="load cell filter")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, one per core by default")
+    arguments = parser.parse_args(arguments)
+
+    summaries = replay_many(arguments.recordings, arguments.output, arguments.jobs, samples=arguments.samples,
+                            spikes=arguments.spikes, filter=arguments.filter)
+    for summary in summaries:
+        print(summary["recording"] + ": " + str(summary["records"]) + " records, "
+              + str(summary["invalid_transitions"]) + " invalid encoder transitions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
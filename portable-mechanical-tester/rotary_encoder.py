@@ -1,16 +1,28 @@
-"""Module defining RotaryEncoder class and related functions.
+"""Module defining RotaryEncoder and VelocityEstimator classes and related
+functions.
 
 Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
 """
 
 from enum import Enum
-import RPi.GPIO as GPIO
-import time
+from gpio import GPIO
+import gpio
+import math
+import metrics
 
 class RotaryEncoder:
     """Represents a AMT102 rotary encoder from CUI Inc. used to keep track of
     the position of a stepper motor.
 
+    The encoder is decoded in 4x mode: every edge on "A" or "B" triggers a
+    callback that looks the transition up in TRANSITIONS and updates a
+    signed position counter, so no edge is missed between polls and no core
+    is spent busy-waiting. Each rising edge on "X" (once per revolution)
+    checks the counter against the previous index position to detect lost
+    counts, and can re-zero the counter. Every counted edge is timestamped,
+    so the velocity is estimated from edge times (see VelocityEstimator)
+    rather than by counting edges over a fixed window.
+
     Attributes:
         PIN_A: An integer indicating the GPIO pin number connected to "A" on the
             rotary encoder.
@@ -18,8 +30,30 @@ class RotaryEncoder:
             rotary encoder.
         PIN_X: An integer indicating the GPIO pin number connected to "X" on the
             rotary encoder.
+        position: An integer indicating the position of the encoder
+            [quadrature counts, 4 per pulse]. Safe to read from any thread.
+        invalid_transitions: An integer counting transitions in which both "A"
+            and "B" changed, i.e. an edge was missed.
+        lost_counts: An integer counting the position error found at index
+            pulses [quadrature counts].
+        correct_on_index: A boolean indicating whether the position is
+            corrected to the expected index position at each index pulse.
+        last_edge: A (time, position) tuple of the last timestamped edge, or
+            None. Safe to read from any thread.
+        velocity_estimator: The VelocityEstimator updated by sample(), in
+            quadrature counts.
     """
     PULSES_PER_REVOLUTION = 2048    # The number of pulses sent by the encoder per revolution.
+    RECORD_FIELDS = ("time", "position", "angular_velocity")   # Fields of the records published by run()
+    RECORD_FORMAT = "dqd"
+    COUNTS_PER_REVOLUTION = 4 * PULSES_PER_REVOLUTION  # The number of edges on "A" and "B" per revolution.
+
+    # Position change indexed by (previous state << 2) | state, where a state
+    # is (A << 1) | B. Transitions changing both A and B are invalid (0).
+    TRANSITIONS = (0, -1, 1, 0,
+                   1, 0, 0, -1,
+                   -1, 0, 0, 1,
+                   0, 1, -1, 0)
 
     class Direction(Enum):
         """Stores the states of the encoder's direction."""
@@ -27,8 +61,8 @@ class RotaryEncoder:
         CCW = "Counterclockwise"
 
     def __init__(self, PIN_A, PIN_B, PIN_X):
-        """Initializes RotaryEncoder with the "A", "B", and "X" pins and sets
-        all pins as inputs.
+        """Initializes RotaryEncoder with the "A", "B", and "X" pins, sets
+        all pins as inputs and starts decoding edges.
         """
 
         """Initialize GPIO pin numbers"""
@@ -45,51 +79,164 @@ class RotaryEncoder:
         self.angular_velocity = 0
         self.direction = self.Direction.CW
         self.enabled = True
+        self.position = 0
+        self.invalid_transitions = 0
+        self.lost_counts = 0
+        self.correct_on_index = False
+        self._index_position = None
+        self._zero_on_index = False
+        self.last_edge = None
+        self.velocity_estimator = VelocityEstimator()
+        self._state = (GPIO.input(self.PIN_A) << 1) | GPIO.input(self.PIN_B)
+        self._sample_time = None    # Time of the previous sample()
+        self._loop_error = None     # Metrics recorded once enable_metrics() is called
+        self._loops = None
 
-    def run(self):
-        """Runs the rotary encoder and outputs its angular velocity to the console."""
-        SAMPLING_RATE = 1    # Amount of time elapsed before the angular velocity of the encoder is calculated [s]
+        """Start edge detection"""
+        GPIO.add_event_detect(self.PIN_A, GPIO.BOTH, callback=self.__on_edge)
+        GPIO.add_event_detect(self.PIN_B, GPIO.BOTH, callback=self.__on_edge)
+        GPIO.add_event_detect(self.PIN_X, GPIO.RISING, callback=self.__on_index)
 
-        while (self.enabled):
-            pulses_counted = 0
-            time_elapsed = 0
-            t_initial = time.perf_counter()
-            previous_pin_A_state = GPIO.input(self.PIN_A)
-            while (time_elapsed < SAMPLING_RATE):
-                pin_A_state = GPIO.input(self.PIN_A)
-                pin_B_state = GPIO.input(self.PIN_B)
-                print (pin_A_state)
-                print(pin_B_state)
+    def update(self, pin_A_state, pin_B_state, t=None):
+        """Decodes a new state of the "A" and "B" pins.
 
-                self.direction = self.__get_direction(pin_A_state, pin_B_state, previous_pin_A_state)
-                last_state = GPIO.input(self.PIN_A)
+        Args:
+            pin_A_state: An integer corresponding to the current state (high, 1 or low, 0) of pin A.
+            pin_B_state: An integer corresponding to the current state (high, 1 or low, 0) of pin B.
+            t: The time of the edge [s]. If given, a counted edge is stored
+                in last_edge for the velocity estimation.
+        """
+        state = (pin_A_state << 1) | pin_B_state
+        change = self.TRANSITIONS[(self._state << 2) | state]
+        if change:
+            self.position += change
+            if t is not None:
+                self.last_edge = (t, self.position)
+        elif state != self._state:
+            self.invalid_transitions += 1
+        self._state = state
+
+    def enable_metrics(self, registry=None, name="encoder"):
+        """Records the rate of the run() loop and how far each iteration is
+        from SAMPLING_RATE, and exposes the position and error counters.
+        Edges themselves are not instrumented, to keep the callbacks short.
+
+        Args:
+            registry: The MetricsRegistry to record into, metrics.REGISTRY
+                by default.
+            name: The prefix of the metric names.
+        """
+        registry = registry or metrics.REGISTRY
+        self._loop_error = registry.histogram(name + "_loop_period_error_seconds")
+        self._loops = registry.rate_meter(name + "_loops")
+        registry.gauge(name + "_position", self, "position")
+        registry.gauge(name + "_invalid_transitions", self, "invalid_transitions")
+        registry.gauge(name + "_lost_counts", self, "lost_counts")
 
-                if (pin_B_state == 1):
-                    pulses_counted += 1
-                if (pin_B_state == 1):
-                    pulses_counted += 1
+    def zero_on_index(self):
+        """Sets the position to 0 at the next index pulse."""
+        self._zero_on_index = True
 
-                time_elapsed = time.perf_counter() - t_initial
+    def reset(self, position=0):
+        """Sets the position and forgets the previous index position and the
+        edges the velocity was estimated from.
+        """
+        self.position = position
+        self._index_position = None
+        self.last_edge = None
+        self.velocity_estimator.reset()
 
-            self.angular_velocity = self.__calculate_angular_velocity(pulses_counted, time_elapsed)
-            print("Encoder angular velocity: " + str(self.angular_velocity))
+    def run(self, buffer=None, SAMPLING_RATE=0.01):
+        """Runs the rotary encoder and outputs its angular velocity to the
+        console, or publishes its position and angular velocity to a shared
+        ring buffer.
 
-    def __get_direction(self, pin_A_state, pin_B_state, previous_pin_A_state):
-        """Determines the direction in which the encoder is rotating.
+        The edges are counted by GPIO callbacks of the process that
+        constructed the encoder, which do not survive a fork: run() must run
+        in that process. To publish from the runtime's main process, call
+        publish() periodically instead.
 
         Args:
-            pin_A_state: An integer corresponding to the current state (high, 1 or low, 0) of pin A.
-            pin_B_state: An integer corresponding to the current state (high, 1 or low, 0) of pin B.
-            previous_pin_A_state: An integer corresponding to the previous state (high, 1 or low, 0) of pin A.
+            buffer: An optional SharedRingBuffer with RECORD_FIELDS and
+                RECORD_FORMAT. If given, every sample is written to it instead
+                of being printed.
+            SAMPLING_RATE: Amount of time elapsed between samples of the
+                position and angular velocity [s].
+        """
+        self.enabled = True
+        self.sample(gpio.monotonic())
+        while (self.enabled):
+            gpio.sleep(SAMPLING_RATE)
+            t_previous = self._sample_time
+            if buffer is None:
+                self.sample(gpio.monotonic())
+                print("Encoder angular velocity: " + str(self.angular_velocity))
+            else:
+                self.publish(buffer)
+            t = self._sample_time
+            if self._loop_error is not None:
+                self._loop_error.record(abs(t - t_previous - SAMPLING_RATE))
+                self._loops.mark()
+
+    def publish(self, buffer):
+        """Samples the encoder and writes the sample to a SharedRingBuffer
+        with RECORD_FIELDS and RECORD_FORMAT, e.g. with
+        Runtime.add_periodic() in the process that constructed the encoder.
+        """
+        t = gpio.monotonic()
+        position = self.sample(t)
+        buffer.write(t, position, self.angular_velocity)
+
+    def sample(self, t):
+        """Updates the direction and angular velocity from the edges
+        timestamped since the previous sample.
+
+        Args:
+            t: The time of the sample [s].
 
         Returns:
-            The direction in which the encoder is rotating.
+            The position [quadrature counts].
+        """
+        position = self.position
+        velocity = self.velocity_estimator.update(t, self.last_edge)
+        self.direction = self.Direction.CW if velocity >= 0 else self.Direction.CCW
+        self.angular_velocity = self.__calculate_angular_velocity(abs(velocity) / 4, 1)
+        self._sample_time = t
+        return position
+
+    def stop(self):
+        """Stops the rotary encoder from outputting values to the console."""
+        self.enabled = False
+
+    def __on_edge(self, channel):
+        """Timestamps the edge, reads both channels and decodes the new
+        state. Called on every edge of "A" and "B".
+        """
+        t = gpio.monotonic()
+        self.update(GPIO.input(self.PIN_A), GPIO.input(self.PIN_B), t)
+
+    def __on_index(self, channel):
+        """Checks the position against the previous index pulse and re-zeroes
+        it if requested. Called on every rising edge of "X".
         """
-        if (pin_A_state != previous_pin_A_state):
-            if (pin_B_state != pin_A_state):
-                return self.Direction.CW
+        if self._zero_on_index:
+            self.position = 0
+            self._index_position = 0
+            self._zero_on_index = False
+            return
+        if self._index_position is None:
+            self._index_position = self.position
+            return
+        # Position error relative to the nearest expected index position
+        error = (self.position - self._index_position) % self.COUNTS_PER_REVOLUTION
+        if error > self.COUNTS_PER_REVOLUTION // 2:
+            error -= self.COUNTS_PER_REVOLUTION
+        if error:
+            self.lost_counts += abs(error)
+            if self.correct_on_index:
+                self.position -= error
             else:
-                return self.Direction.CCW
+                self._index_position += error
 
     def __calculate_angular_velocity(self, pulses_counted, time_interval):
         """Calculates the angular velocity of the encoder.
@@ -106,3 +253,88 @@ class RotaryEncoder:
         if (self.direction == self.Direction.CW):
             angular_velocity *= -1
         return angular_velocity
+
+
+class VelocityEstimator:
+    """Estimates velocity and acceleration from timestamped encoder edges
+    with the M/T method.
+
+    Each update() measures the position change between the last edge seen by
+    the previous update and the newest edge, over the time between those two
+    edges rather than between the updates. The estimate is therefore exact
+    for a constant velocity at any update rate: at high speeds many counts
+    fall in each update, at low speeds the interval stretches over several
+    updates. While no edge arrives the velocity is bounded by one count over
+    the time since the last edge, so a stop is seen without waiting for an
+    edge that never comes. The estimate is then smoothed by a first order
+    low-pass filter, and the acceleration is the smoothed derivative of the
+    smoothed velocity. Each update costs the same whatever the speed.
+
+    Attributes:
+        SCALE: A float indicating the distance of one quadrature count, e.g.
+            SCREW_LEAD / COUNTS_PER_REVOLUTION for mm. Defaults to 1, i.e.
+            velocities in quadrature counts/s.
+        TIME_CONSTANT: A float indicating the time constant of the smoothing
+            [s], or 0 to disable it.
+        MAX_EDGE_INTERVAL: A float indicating the time without edges after
+            which the velocity is 0 [s].
+        raw_velocity: A float holding the last unsmoothed estimate
+            [SCALE/s].
+        velocity: A float holding the smoothed velocity [SCALE/s].
+        acceleration: A float holding the smoothed acceleration [SCALE/s^2].
+    """
+
+    def __init__(self, SCALE=1, TIME_CONSTANT=0.01, MAX_EDGE_INTERVAL=0.5):
+        """Initializes VelocityEstimator at rest."""
+        self.SCALE = SCALE
+        self.TIME_CONSTANT = TIME_CONSTANT
+        self.MAX_EDGE_INTERVAL = MAX_EDGE_INTERVAL
+        self.reset()
+
+    def reset(self):
+        """Forgets the edges and sets the estimates to 0."""
+        self.raw_velocity = 0.0
+        self.velocity = 0.0
+        self.acceleration = 0.0
+        self._edge = None   # Edge the previous estimate ended at
+        self._time = None   # Time of the previous update()
+
+    def update(self, t, edge):
+        """Updates the estimates. Call at a fixed rate, 100 Hz or more.
+
+        Args:
+            t: The time of the update [s].
+            edge: A (time, position) tuple of the last edge, as
+                RotaryEncoder.last_edge, or None if no edge was seen yet.
+
+        Returns:
+            The smoothed velocity [SCALE/s].
+        """
+        previous_edge = self._edge
+        raw_velocity = self.raw_velocity
+        if edge is None:
+            raw_velocity = 0.0
+        elif previous_edge is None:
+            self._edge = edge
+        elif edge[0] > previous_edge[0]:
+            raw_velocity = (edge[1] - previous_edge[1]) * self.SCALE / (edge[0] - previous_edge[0])
+            self._edge = edge
+        else:
+            elapsed = t - previous_edge[0]
+            if elapsed > self.MAX_EDGE_INTERVAL:
+                raw_velocity = 0.0
+            elif abs(raw_velocity) * elapsed > self.SCALE:
+                # The next edge is overdue, so the velocity has dropped
+                raw_velocity = math.copysign(self.SCALE / elapsed, raw_velocity)
+        self.raw_velocity = raw_velocity
+
+        previous_time = self._time
+        self._time = t
+        if previous_time is None or t <= previous_time:
+            return self.velocity
+        dt = t - previous_time
+        weight = 1 - math.exp(-dt / self.TIME_CONSTANT) if self.TIME_CONSTANT > 0 else 1
+        velocity = self.velocity + weight * (raw_velocity - self.velocity)
+        self.acceleration += weight * ((velocity - self.velocity) / dt - self.acceleration)
+        self.velocity = velocity
+        return velocity
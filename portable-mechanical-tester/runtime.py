@@ -0,0 +1,436 @@
+"""Module defining Runtime class and related functions.
+
+A Runtime runs the tester on a single asyncio event loop. It owns the
+tasks of the application and routes events to their handlers:
+
+    Events: GPIO callbacks (buttons, limit switches) only post an event to
+        the loop, which is safe from any thread. Handlers run one at a time
+        on the loop, so they never race with each other or with the tasks.
+    Tasks: coroutines and periodic functions run on the loop.
+    Processes: sensor acquisition runs in child processes, each given a
+        multiprocessing.Event so stopping the Runtime also stops the child.
+        Setting an attribute such as LoadCell.enabled in the parent does
+        not reach a child process. A process can be given a Scheduling (CPU
+        affinity, policy and priority) and a Watchdog, which restarts it
+        when its heartbeat stalls or it dies (see supervisor.py).
+
+Stopping the Runtime cancels every task, stops every process and waits for
+them to exit. The time spent in every task step and event handler is
+recorded in TaskStatistics, and the CPU usage and scheduling latency of
+every process in WorkerStatistics.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import multiprocessing
+from supervisor import WorkerStatistics, apply_scheduling
+import threading
+import time
+
+
+class TaskStatistics:
+    """Keeps statistics on the time spent in a task or event handler.
+
+    Attributes:
+        runs: An integer counting the task steps or handled events.
+        total_time: A float indicating the total time spent running [s].
+        max_time: A float indicating the longest single run [s].
+        max_lateness: A float indicating the largest delay between a periodic
+            task's deadline and its start [s].
+        errors: An integer counting runs that raised an exception.
+    """
+
+    def __init__(self):
+        """Initializes TaskStatistics with no recorded runs."""
+        self.runs = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.max_lateness = 0.0
+        self.errors = 0
+
+    def record(self, duration, lateness=0.0):
+        """Records one run.
+
+        Args:
+            duration: The time the run took [s].
+            lateness: The time between the run's deadline and its start [s].
+        """
+        self.runs += 1
+        self.total_time += duration
+        if duration > self.max_time:
+            self.max_time = duration
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+
+    def report(self):
+        """Returns the statistics as a dictionary."""
+        return {
+            "runs": self.runs,
+            "mean_time": self.total_time / self.runs if self.runs else 0.0,
+            "max_time": self.max_time,
+            "max_lateness": self.max_lateness,
+            "errors": self.errors,
+        }
+
+
+class Runtime:
+    """Runs the tester's tasks, processes and event handlers on one event loop.
+
+    Attributes:
+        statistics: A dictionary of TaskStatistics by task name. Event
+            handlers are recorded as "event:<event name>".
+        processes: A dictionary of the started multiprocessing.Process objects
+            by name.
+        worker_statistics: A dictionary of WorkerStatistics by process name,
+            also exposed as "process.<name>.*" gauges in metrics.REGISTRY.
+    """
+
+    def __init__(self, PROCESS_JOIN_TIMEOUT=5, SUPERVISION_PERIOD=0.1):
+        """Initializes an empty Runtime.
+
+        Args:
+            PROCESS_JOIN_TIMEOUT: How long stop waits for each child process
+                to exit before terminating it [s].
+            SUPERVISION_PERIOD: How often the processes' heartbeats and
+                statistics are checked [s].
+        """
+        self.PROCESS_JOIN_TIMEOUT = PROCESS_JOIN_TIMEOUT
+        self.SUPERVISION_PERIOD = SUPERVISION_PERIOD
+        self.statistics = defaultdict(TaskStatistics)
+        self.processes = {}
+        self.worker_statistics = {}
+        self._loop = None
+        self._events = None
+        self._stopped = None
+        self._handlers = defaultdict(list)
+        self._task_factories = {}
+        self._tasks = {}
+        self._process_targets = {}
+        self._stop_events = {}
+        self._watchdogs = {}
+
+    def on(self, event, handler):
+        """Registers a handler for an event.
+
+        Args:
+            event: The name of the event.
+            handler: A function or coroutine function called with the
+                event's arguments.
+        """
+        self._handlers[event].append(handler)
+
+    def post(self, event, *args):
+        """Posts an event to the loop. Safe to call from any thread, e.g. a
+        GPIO callback.
+
+        Args:
+            event: The name of the event.
+            args: The arguments passed to the event's handlers.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        if _running_loop() is loop:
+            self._events.put_nowait((event, args))
+        else:
+            loop.call_soon_threadsafe(self._events.put_nowait, (event, args))
+
+    def callback(self, event):
+        """Returns a function posting an event with its arguments, to be used
+        as a Button CALLBACK.
+        """
+        return lambda *args: self.post(event, *args)
+
+    def add_task(self, name, coroutine_function, *args):
+        """Adds a coroutine to run on the loop. Started immediately if the
+        Runtime is running.
+
+        Args:
+            name: A unique name for the task.
+            coroutine_function: A coroutine function, called with args.
+        """
+        self._task_factories[name] = lambda: coroutine_function(*args)
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self.__start_task, name)
+
+    def add_periodic(self, name, function, period):
+        """Adds a function called every period on absolute deadlines. A late
+        call re-anchors the schedule instead of running back to back.
+
+        Args:
+            name: A unique name for the task.
+            function: A function taking no arguments.
+            period: The time between calls [s].
+        """
+        self.add_task(name, self.__periodic, name, function, period)
+
+    def add_process(self, name, target, *args, scheduling=None, watchdog=None):
+        """Adds a function to run in a child process. target must be a bound
+        method of an object with a stop() method, e.g. LoadCell.run, which is
+        called in the child when the Runtime stops.
+
+        Args:
+            name: A unique name for the process.
+            target: The bound method to run.
+            args: The arguments of target.
+            scheduling: An optional supervisor.Scheduling applied in the child
+                before target runs.
+            watchdog: An optional supervisor.Watchdog restarting the process
+                when its heartbeat stalls or it dies.
+        """
+        self._process_targets[name] = (target, args, scheduling)
+        if watchdog is not None:
+            self._watchdogs[name] = watchdog
+        statistics = self.worker_statistics[name] = WorkerStatistics()
+        for attribute in ("cpu_usage", "scheduling_latency", "max_scheduling_latency", "restarts"):
+            metrics.REGISTRY.gauge("process." + name + "." + attribute, statistics, attribute)
+
+    def process_report(self):
+        """Returns the WorkerStatistics reports as a dictionary by process
+        name.
+        """
+        return {name: statistics.report() for name, statistics in self.worker_statistics.items()}
+
+    def cancel(self, name):
+        """Cancels a task or stops a process by name."""
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+        stop_event = self._stop_events.get(name)
+        if stop_event is not None:
+            stop_event.set()
+
+    def run(self):
+        """Runs the Runtime until stop() is called or the process is
+        interrupted.
+        """
+        try:
+            asyncio.run(self.main())
+        except KeyboardInterrupt:
+            pass
+
+    def stop(self):
+        """Stops the Runtime. Safe to call from any thread."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._stopped.set)
+
+    async def main(self):
+        """Starts the processes and tasks, dispatches events until stop() is
+        called, then cancels and stops everything.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
+        self._stopped = asyncio.Event()
+        for name in self._process_targets:
+            self.__start_process(name)
+        for name in self._task_factories:
+            self.__start_task(name)
+        dispatcher = asyncio.ensure_future(self.__dispatch())
+        supervisor = asyncio.ensure_future(self.__supervise_processes())
+        try:
+            await self._stopped.wait()
+        finally:
+            dispatcher.cancel()
+            supervisor.cancel()
+            await asyncio.gather(supervisor, return_exceptions=True)
+            tasks = list(self._tasks.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(dispatcher, *tasks, return_exceptions=True)
+            self._tasks.clear()
+            await self._loop.run_in_executor(None, self.__stop_processes)
+
+    def __start_process(self, name):
+        """Starts the process called name with a new stop event."""
+        target, args, scheduling = self._process_targets[name]
+        stop_event = multiprocessing.Event()
+        process = multiprocessing.Process(target=_run_process, name=name,
+                                          args=(name, target, args, stop_event, metrics.REGISTRY, scheduling))
+        process.start()
+        self._stop_events[name] = stop_event
+        self.processes[name] = process
+        self.worker_statistics[name].start(process.pid)
+        watchdog = self._watchdogs.get(name)
+        if watchdog is not None:
+            watchdog.reset(time.monotonic())
+
+    async def __supervise_processes(self):
+        """Updates the processes' statistics and restarts the processes whose
+        watchdog detects a stall or that died.
+        """
+        while True:
+            await asyncio.sleep(self.SUPERVISION_PERIOD)
+            now = time.monotonic()
+            for name, process in list(self.processes.items()):
+                self.worker_statistics[name].update(now)
+                watchdog = self._watchdogs.get(name)
+                if watchdog is None or self._stop_events[name].is_set():
+                    continue
+                if not process.is_alive():
+                    problem = "exited with code " + str(process.exitcode)
+                elif watchdog.check(now):
+                    problem = "sent no heartbeat for " + str(watchdog.TIMEOUT) + " s"
+                else:
+                    continue
+                await self.__restart_process(name, watchdog, problem)
+
+    async def __restart_process(self, name, watchdog, problem):
+        """Stops the motor through the watchdog's on_stall and restarts a
+        process, unless it has been restarted MAX_RESTARTS times.
+        """
+        watchdog.stalls += 1
+        print("ERROR: Process " + name + " " + problem + ".")
+        if watchdog.on_stall is not None:
+            try:
+                watchdog.on_stall(name)
+            except Exception as error:
+                print("ERROR: Stall handler for process " + name + " failed: " + repr(error))
+        statistics = self.worker_statistics[name]
+        self._stop_events[name].set()
+        await self._loop.run_in_executor(None, self.__stop_process, name)
+        if statistics.restarts >= watchdog.MAX_RESTARTS:
+            print("ERROR: Process " + name + " was restarted " + str(statistics.restarts)
+                  + " times, leaving it stopped.")
+            return
+        statistics.restarts += 1
+        print("Restarting process " + name + ".")
+        self.__start_process(name)
+
+    def __start_task(self, name):
+        """Creates the task called name from its factory."""
+        self._tasks[name] = asyncio.ensure_future(self.__supervise(name, self._task_factories[name]()))
+
+    async def __supervise(self, name, coroutine):
+        """Runs a task, reporting an exception instead of losing it."""
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self.statistics[name].errors += 1
+            print("ERROR: Task " + name + " failed: " + repr(error))
+        finally:
+            if self._tasks.get(name) is asyncio.current_task():
+                del self._tasks[name]
+
+    async def __periodic(self, name, function, period):
+        """Calls a function every period, recording its timing."""
+        statistics = self.statistics[name]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            start = loop.time()
+            t_initial = time.perf_counter()
+            function()
+            statistics.record(time.perf_counter() - t_initial, start - deadline)
+            deadline += period
+            remaining = deadline - loop.time()
+            if remaining < -period:
+                deadline -= remaining
+                remaining = 0
+            await asyncio.sleep(max(0, remaining))
+
+    async def __dispatch(self):
+        """Runs the handlers of every posted event, one at a time."""
+        while True:
+            event, args = await self._events.get()
+            statistics = self.statistics["event:" + event]
+            t_initial = time.perf_counter()
+            for handler in self._handlers.get(event, ()):
+                try:
+                    result = handler(*args)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as error:
+                    statistics.errors += 1
+                    print("ERROR: Handler for event " + event + " failed: " + repr(error))
+            statistics.record(time.perf_counter() - t_initial)
+
+    def __stop_processes(self):
+        """Signals every process to stop and waits for it to exit."""
+        for stop_event in self._stop_events.values():
+            stop_event.set()
+        for name in self.processes:
+            self.__stop_process(name)
+
+    def __stop_process(self, name):
+        """Waits for a signalled process to exit, terminating it after
+        PROCESS_JOIN_TIMEOUT.
+        """
+        process = self.processes[name]
+        process.join(self.PROCESS_JOIN_TIMEOUT)
+        if process.is_alive():
+            print("ERROR: Process " + name + " did not stop, terminating it.")
+            process.terminate()
+            process.join()
+
+
+def initialize(factories, serial=None):
+    """Constructs devices concurrently, so slow initializations overlap
+    instead of adding up.
+
+    Devices bit-banging timing-critical signals, such as an HX711 whose tare
+    must never leave its clock high while another thread holds the GIL, are
+    given in serial instead. They are constructed one after the other on the
+    calling thread, once every concurrent construction is over.
+
+    Args:
+        factories: A dictionary mapping device names to functions taking no
+            arguments and returning the device, constructed concurrently.
+        serial: An optional dictionary of the same kind, constructed on the
+            calling thread afterwards.
+
+    Returns:
+        A (devices, startup_times) tuple of dictionaries by device name.
+        startup_times holds the time each device took to initialize and, as
+        "total", the time until all of them were ready [s].
+    """
+    def timed(factory):
+        t_initial = time.perf_counter()
+        device = factory()
+        return device, time.perf_counter() - t_initial
+
+    t_initial = time.perf_counter()
+    results = {}
+    if factories:
+        with ThreadPoolExecutor(max_workers=len(factories)) as executor:
+            futures = {name: executor.submit(timed, factory) for name, factory in factories.items()}
+            results = {name: future.result() for name, future in futures.items()}
+    for name, factory in (serial or {}).items():
+        results[name] = timed(factory)
+    devices = {name: device for name, (device, _) in results.items()}
+    startup_times = {name: startup_time for name, (_, startup_time) in results.items()}
+    startup_times["total"] = time.perf_counter() - t_initial
+    return devices, startup_times
+
+
+def _running_loop():
+    """Returns the running event loop of the current thread, or None."""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _run_process(name, target, args, stop_event, registry, scheduling=None):
+    """Runs a bound method in a child process, calling its object's stop()
+    once stop_event is set.
+
+    The parent's metrics registry is passed along so that, with the spawn
+    start method too, it is unpickled together with the metrics the
+    devices hold and becomes the child's REGISTRY.
+    """
+    if scheduling is not None:
+        apply_scheduling(scheduling)
+    metrics.REGISTRY = registry
+    registry.start_process(name)
+    def wait_for_stop():
+        stop_event.wait()
+        target.__self__.stop()
+    threading.Thread(target=wait_for_stop, daemon=True).start()
+    target(*args)
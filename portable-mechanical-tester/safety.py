@@ -0,0 +1,159 @@
+"""Module defining SafetyInterlock class and related functions.
+
+The limit switches stop the motor through a dedicated path instead of a
+debounced Button callback. Pulse generation is inhibited by two
+independent mechanisms, whichever reacts first:
+
+    Polling: the StepGenerator asks the interlock before every pulse and at
+        least every CHECK_INTERVAL while waiting between pulses, and the
+        interlock reads the limit pins itself. This bounds the reaction time
+        by CHECK_INTERVAL plus one pin read, even when the GPIO callback
+        thread is delayed by the interpreter.
+    Edge callbacks: an edge on a limit pin trips the interlock straight from
+        the GPIO callback, without a bounce time (the first edge latches the
+        fault, so bounces cannot matter) and without going through the
+        Runtime's event queue.
+
+Once tripped, the interlock stays latched until reset(), and every trip is
+recorded with its measured edge-to-halt latency.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from collections import namedtuple
+from gpio import GPIO
+import gpio
+import threading
+
+LimitTrip = namedtuple("LimitTrip", ("pin", "edge_time", "halt_time", "latency"))
+LimitTrip.__doc__ = """A recorded trip of the interlock. edge_time is the
+earliest time the limit edge can have occurred: the callback time for an
+edge callback, the previous pin check for a trip found by polling, or the
+check that found the motor reversed towards a pressed switch."""
+
+
+class SafetyInterlock:
+    """Halts a motor's pulse generation when a limit switch is reached.
+
+    Attributes:
+        MOTOR: The Motor whose StepGenerator is inhibited.
+        LIMITS: A dictionary mapping each limit switch pin to the
+            Motor.Direction it blocks, or to None to block both directions.
+            The motor can always move away from a pressed limit switch.
+        ACTIVE_LEVEL: An integer indicating the pin level of a pressed switch.
+        MAX_LATENCY: A float indicating the edge-to-halt latency the interlock
+            must achieve [s]. Trips slower than this are counted in late_trips.
+        CHECK_INTERVAL: A float indicating the longest time between two pin
+            checks while the motor is running [s].
+        tripped: A boolean indicating whether pulses are inhibited.
+        fault: A string describing the latched fault, or None.
+        trips: A list of every LimitTrip recorded.
+        late_trips: An integer counting trips slower than MAX_LATENCY.
+    """
+
+    def __init__(self, MOTOR, LIMITS, ACTIVE_LEVEL=1, MAX_LATENCY=0.0002, CHECK_INTERVAL=None):
+        """Initializes SafetyInterlock, configures the limit switch pins and
+        attaches the interlock to the motor's StepGenerator.
+        """
+        self.MOTOR = MOTOR
+        self.LIMITS = dict(LIMITS)
+        self.ACTIVE_LEVEL = ACTIVE_LEVEL
+        self.MAX_LATENCY = MAX_LATENCY
+        self.CHECK_INTERVAL = MAX_LATENCY / 2 if CHECK_INTERVAL is None else CHECK_INTERVAL
+        self.tripped = False
+        self.fault = None
+        self.trips = []
+        self.late_trips = 0
+        self._lock = threading.Lock()
+        self._last_check = gpio.monotonic() - self.CHECK_INTERVAL
+        self._checked_direction = None  # Motor direction at the last read
+
+        pull = GPIO.PUD_DOWN if ACTIVE_LEVEL else GPIO.PUD_UP
+        edge = GPIO.RISING if ACTIVE_LEVEL else GPIO.FALLING
+        for pin in self.LIMITS:
+            GPIO.setup(pin, GPIO.IN, pull_up_down=pull)
+            GPIO.add_event_detect(pin, edge, callback=self.__on_edge)
+        MOTOR.step_generator.interlock = self
+
+    def check(self):
+        """Reads the limit pins if CHECK_INTERVAL has passed since the last
+        read or the motor direction has changed, tripping the interlock if a
+        blocking switch is pressed.
+
+        Returns:
+            True if pulses are inhibited.
+        """
+        if self.tripped:
+            return True
+        now = gpio.monotonic()
+        direction = self.MOTOR.direction
+        # A switch pressed while the motor moved away from it must block the
+        # very first pulse after a reversal
+        if now - self._last_check < self.CHECK_INTERVAL and direction == self._checked_direction:
+            return False
+        for pin in self.LIMITS:
+            if GPIO.input(pin) == self.ACTIVE_LEVEL and self.__blocks(pin):
+                # After a reversal the switch blocks from now on, however
+                # long ago it was pressed
+                self.trip(pin, self._last_check if direction == self._checked_direction else now)
+                return True
+        self._last_check = now
+        self._checked_direction = direction
+        return False
+
+    def trip(self, pin, edge_time):
+        """Inhibits pulses and disables the motor driver, latching a fault.
+
+        Args:
+            pin: The limit switch pin that was reached.
+            edge_time: The time of the limit edge [s].
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self.tripped:
+                return
+            self.tripped = True
+            motor = self.MOTOR
+            if motor.PIN_ENA is not None:
+                GPIO.output(motor.PIN_ENA, 0)
+            motor.enabled = False
+            halt_time = gpio.monotonic()
+            trip = LimitTrip(pin, edge_time, halt_time, halt_time - edge_time)
+            self.trips.append(trip)
+            if trip.latency > self.MAX_LATENCY:
+                self.late_trips += 1
+            self.fault = "Limit switch on pin " + str(pin) + " reached."
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        """Clears the latched fault so the motor can move again. A pressed
+        limit switch trips the interlock again as soon as the motor moves
+        towards it.
+        """
+        self.tripped = False
+        self.fault = None
+        self._last_check = gpio.monotonic() - self.CHECK_INTERVAL
+
+    def report(self):
+        """Returns the trip latency statistics as a dictionary."""
+        latencies = sorted(trip.latency for trip in self.trips)
+        return {
+            "trips": len(latencies),
+            "mean_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p99_latency": latencies[int(0.99 * (len(latencies) - 1))] if latencies else 0.0,
+            "max_latency": latencies[-1] if latencies else 0.0,
+            "late_trips": self.late_trips,
+        }
+
+    def __blocks(self, pin):
+        """Returns whether the switch on pin blocks the current direction."""
+        direction = self.LIMITS[pin]
+        return direction is None or direction == self.MOTOR.direction
+
+    def __on_edge(self, channel):
+        """Trips the interlock from the GPIO callback thread."""
+        edge_time = gpio.monotonic()
+        if not self.tripped and self.__blocks(channel):
+            self.trip(channel, edge_time)
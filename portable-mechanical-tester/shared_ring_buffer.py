@@ -0,0 +1,298 @@
+"""Module defining SharedRingBuffer class and related functions.
+
+A SharedRingBuffer holds fixed-width records in multiprocessing.shared_memory
+so an acquisition process can publish its readings to any number of other
+processes without pipes, pickling or locks. Exactly one process writes;
+every reader keeps its own cursor and never blocks the writer.
+
+Each slot starts with the sequence number of the record it holds. The head
+and sequence numbers are accessed through native uint64 memoryviews so every
+update is a single aligned 8-byte store (struct.pack_into clears its target
+before packing, so readers could see a torn value). The writer
+marks a slot as being written, writes the record, then stores the record's
+sequence number and finally advances the shared head. A reader accepts a
+record only if the slot holds the expected sequence number both before and
+after reading it, so records overwritten by a writer that has lapped the
+reader are detected and counted as overruns instead of being returned torn.
+
+The writer caches the head. A forked child reloads it from the shared
+memory, so a writer process restarted by the Runtime carries on from the
+sequence its predecessor reached rather than from the one its parent saw.
+
+Memory layout:
+    Header (HEADER_SIZE bytes): magic, slot size, capacity, head (number of
+        records written so far), record format and field names.
+    Slots (capacity * slot size bytes): sequence number (uint64) followed by
+        the record packed with the record format, padded to 8 bytes.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from multiprocessing import shared_memory
+import os
+import struct
+import weakref
+
+_HEADER = struct.Struct("<4sII4xQ32s160s")
+_MAX_FORMAT_SIZE = 32   # Sizes of the format and field name strings in the header
+_MAX_FIELDS_SIZE = 160
+_SEQUENCE_SIZE = 8
+_MAGIC = b"PMTR"
+_HEAD_INDEX = 2     # Index of the head in the header, in uint64 words
+_WRITING = (1 << 64) - 1    # Sequence number of a slot being written
+_BUFFERS = weakref.WeakSet()    # Open buffers, whose cached head a forked child reloads
+
+
+class SharedRingBuffer:
+    """Represents a single-producer, multi-consumer ring buffer of
+    timestamped records in shared memory.
+
+    A SharedRingBuffer can be passed to a multiprocessing.Process. It is
+    pickled by name only, so the child attaches to the same memory. The
+    creating process should unlink() it once every process is done.
+
+    Attributes:
+        name: A string identifying the shared memory block.
+        FIELDS: A tuple of the record field names.
+        FORMAT: A string holding the struct format of a record, one type code
+            per field and without byte order, e.g. "dd" for a timestamp and
+            one float.
+        CAPACITY: An integer indicating the number of records kept.
+    """
+    HEADER_SIZE = _HEADER.size
+
+    def __init__(self, FIELDS=("time", "value"), FORMAT="dd", CAPACITY=4096, name=None, create=True):
+        """Creates a new ring buffer, or attaches to an existing one.
+
+        Args:
+            FIELDS: The record field names, at most 160 bytes once joined
+                with commas. Ignored when attaching.
+            FORMAT: The struct format of a record, at most 32 bytes once
+                encoded. Ignored when attaching.
+            CAPACITY: The number of records kept. Ignored when attaching.
+            name: The name of the shared memory block. A unique name is chosen
+                if None.
+            create: True to create the block, False to attach to the existing
+                block called name.
+        """
+        if create:
+            record = struct.Struct("<" + FORMAT)
+            if len(FIELDS) != len(FORMAT) or len(record.unpack(bytes(record.size))) != len(FIELDS):
+                raise ValueError("Record format " + FORMAT + " does not match fields " + str(FIELDS))
+            # The header stores them in fixed-size strings, which struct
+            # would silently truncate
+            encoded_format = FORMAT.encode()
+            encoded_fields = ",".join(FIELDS).encode()
+            if len(encoded_format) > _MAX_FORMAT_SIZE:
+                raise ValueError("Record format " + FORMAT + " is longer than " + str(_MAX_FORMAT_SIZE) + " bytes")
+            if len(encoded_fields) > _MAX_FIELDS_SIZE:
+                raise ValueError("Field names " + str(FIELDS) + " are longer than " + str(_MAX_FIELDS_SIZE)
+                                 + " bytes once joined")
+            slot_size = (_SEQUENCE_SIZE + record.size + 7) // 8 * 8
+            self._memory = shared_memory.SharedMemory(name=name, create=True,
+                                                      size=self.HEADER_SIZE + CAPACITY * slot_size)
+            _HEADER.pack_into(self._memory.buf, 0, _MAGIC, slot_size, CAPACITY, 0, encoded_format, encoded_fields)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+            magic, slot_size, CAPACITY, _, FORMAT, FIELDS = _HEADER.unpack_from(self._memory.buf, 0)
+            if magic != _MAGIC:
+                raise ValueError("Shared memory block " + name + " is not a SharedRingBuffer")
+            FORMAT = FORMAT.rstrip(b"\0").decode()
+            FIELDS = tuple(FIELDS.rstrip(b"\0").decode().split(","))
+
+        self.name = self._memory.name
+        self.FIELDS = tuple(FIELDS)
+        self.FORMAT = FORMAT
+        self.CAPACITY = CAPACITY
+        self._record = struct.Struct("<" + FORMAT)
+        self._slot_size = slot_size
+        self._slot_words = slot_size // 8
+        self._buffer = self._memory.buf
+        self._header_words = self._buffer[:self.HEADER_SIZE].cast("Q")
+        self._slot_words_view = self._buffer[self.HEADER_SIZE:self.HEADER_SIZE + CAPACITY * slot_size].cast("Q")
+        self._head = self.head
+        _BUFFERS.add(self)
+
+    @classmethod
+    def attach(cls, name):
+        """Attaches to an existing ring buffer by name."""
+        return cls(name=name, create=False)
+
+    def __getstate__(self):
+        return {"name": self.name}
+
+    def __setstate__(self, state):
+        self.__init__(name=state["name"], create=False)
+
+    @property
+    def head(self):
+        """The number of records written so far."""
+        return self._header_words[_HEAD_INDEX]
+
+    def write(self, *values):
+        """Appends a record, overwriting the oldest one if the buffer is full.
+        Must only be called from a single process.
+
+        Args:
+            values: The record's field values, in FIELDS order.
+        """
+        sequence = self._head
+        slot = sequence % self.CAPACITY
+        sequence_index = slot * self._slot_words
+        self._slot_words_view[sequence_index] = _WRITING
+        self._record.pack_into(self._buffer, self.HEADER_SIZE + slot * self._slot_size + _SEQUENCE_SIZE, *values)
+        self._slot_words_view[sequence_index] = sequence
+        self._head = sequence + 1
+        self._header_words[_HEAD_INDEX] = self._head
+
+    def read_record(self, sequence):
+        """Reads the record with the given sequence number.
+
+        Returns:
+            The record as a tuple, or None if it has been overwritten (or is
+            not written yet).
+        """
+        slot = sequence % self.CAPACITY
+        sequence_index = slot * self._slot_words
+        if self._slot_words_view[sequence_index] != sequence:
+            return None
+        record = self._record.unpack_from(self._buffer, self.HEADER_SIZE + slot * self._slot_size + _SEQUENCE_SIZE)
+        if self._slot_words_view[sequence_index] != sequence:
+            return None
+        return record
+
+    def latest(self):
+        """Returns the most recent record as a dictionary, or None if no
+        record has been written yet.
+        """
+        for _ in range(3):
+            head = self.head
+            if head == 0:
+                return None
+            record = self.read_record(head - 1)
+            if record is not None:
+                return dict(zip(self.FIELDS, record))
+        return None
+
+    def reader(self, from_start=False):
+        """Returns a new RingBufferReader.
+
+        Args:
+            from_start: True to start at the oldest record still in the
+                buffer, False to only read records written from now on.
+        """
+        return RingBufferReader(self, from_start)
+
+    def as_array(self):
+        """Returns a zero-copy NumPy structured array over all slots. The
+        "sequence" field tells which record each slot holds.
+        """
+        import numpy as np
+        fields = [("sequence", "<u8")]
+        fields += [(field, "<" + code) for field, code in zip(self.FIELDS, _format_codes(self.FORMAT))]
+        dtype = np.dtype({"names": [name for name, _ in fields],
+                          "formats": [code for _, code in fields],
+                          "offsets": _field_offsets(self.FORMAT),
+                          "itemsize": self._slot_size})
+        return np.ndarray((self.CAPACITY,), dtype=dtype, buffer=self._buffer, offset=self.HEADER_SIZE)
+
+    def close(self):
+        """Detaches from the shared memory block. Arrays returned by
+        as_array() must be deleted first.
+        """
+        self.__release_views()
+        self._memory.close()
+
+    def __del__(self):
+        # SharedMemory cannot close its mapping while our views exist
+        self.__release_views()
+
+    def __release_views(self):
+        if getattr(self, "_buffer", None) is not None:
+            self._header_words.release()
+            self._slot_words_view.release()
+            self._buffer = None
+
+    def unlink(self):
+        """Frees the shared memory block. Call from the creating process once
+        every process has closed it.
+        """
+        self._memory.unlink()
+
+
+def _reload_heads():
+    """Reloads the cached head of every open buffer in a forked child."""
+    for ring_buffer in list(_BUFFERS):
+        if ring_buffer._buffer is not None:
+            ring_buffer._head = ring_buffer.head
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reload_heads)
+
+
+class RingBufferReader:
+    """Reads the records of a SharedRingBuffer in order.
+
+    Attributes:
+        cursor: An integer indicating the sequence number of the next record
+            to read.
+        overruns: An integer counting the records that were overwritten
+            before this reader could read them.
+    """
+
+    def __init__(self, ring_buffer, from_start=False):
+        """Initializes RingBufferReader at the start or end of a buffer."""
+        self.ring_buffer = ring_buffer
+        head = ring_buffer.head
+        self.cursor = max(0, head - ring_buffer.CAPACITY) if from_start else head
+        self.overruns = 0
+
+    def available(self):
+        """Returns the number of records written but not yet read."""
+        return self.ring_buffer.head - self.cursor
+
+    def read(self, max_records=None):
+        """Reads the records written since the last call.
+
+        Args:
+            max_records: The maximum number of records to return, or None.
+
+        Returns:
+            A list of record tuples, oldest first.
+        """
+        ring_buffer = self.ring_buffer
+        head = ring_buffer.head
+        if head - self.cursor > ring_buffer.CAPACITY:
+            self.overruns += head - ring_buffer.CAPACITY - self.cursor
+            self.cursor = head - ring_buffer.CAPACITY
+        if max_records is not None:
+            head = min(head, self.cursor + max_records)
+
+        records = []
+        read_record = ring_buffer.read_record
+        for sequence in range(self.cursor, head):
+            record = read_record(sequence)
+            if record is None:
+                self.overruns += 1
+            else:
+                records.append(record)
+        self.cursor = head
+        return records
+
+
+def _format_codes(format):
+    """Returns the NumPy type code of every field of a struct format."""
+    codes = {"b": "i1", "B": "u1", "h": "i2", "H": "u2", "i": "i4", "I": "u4",
+             "l": "i4", "L": "u4", "q": "i8", "Q": "u8", "f": "f4", "d": "f8", "?": "?"}
+    return [codes[code] for code in format]
+
+
+def _field_offsets(format):
+    """Returns the byte offset of every field of a slot, including the
+    sequence number.
+    """
+    offsets = [0]
+    for i in range(len(format)):
+        offsets.append(_SEQUENCE_SIZE + struct.calcsize("<" + format[:i]))
+    return offsets
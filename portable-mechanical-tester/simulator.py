@@ -0,0 +1,572 @@
+"""Module defining a deterministic, in-process simulation of the tester's hardware.
+
+SimulatedGPIO implements the subset of the RPi.GPIO interface used by the
+device classes and keeps its own virtual clock, so acquisition and
+step-generation code can be run, profiled and regression-tested on any
+machine. Every GPIO access advances the virtual clock by ACCESS_TIME, which
+both models the cost of a pin access and guarantees that busy-wait loops
+(e.g. LoadCellAmplifier.wait_for_ready) make progress.
+
+The simulated devices attach to a SimulatedGPIO instance and drive its input
+pins:
+    SimulatedHX711: HX711 load cell amplifier with DRDY timing, 24-bit two's
+        complement output and gain selection pulses.
+    SimulatedAMT102: AMT102 quadrature encoder, optionally driven by the
+        stepper motor's pulse and direction pins.
+    SimulatedSwitch: Button or limit switch with optional contact bounce.
+
+Example:
+    gpio = SimulatedGPIO()
+    set_backend(gpio)
+    SimulatedHX711(gpio, PIN_DAT=5, PIN_CLK=6, value=lambda t: 10000)
+    load_cell_amplifier = LoadCellAmplifier(5, 6)
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import random
+import threading
+
+
+class SimulatedGPIO:
+    """Simulated replacement for the RPi.GPIO module.
+
+    Attributes:
+        ACCESS_TIME: A float indicating how far the virtual clock advances on
+            every input()/output() call [s].
+        mode: The pin numbering mode set with setmode(), or None.
+    """
+    # Constants use the same values as RPi.GPIO
+    LOW = 0
+    HIGH = 1
+    OUT = 0
+    IN = 1
+    BOARD = 10
+    BCM = 11
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, ACCESS_TIME=1e-6, start_time=0.0):
+        """Initializes SimulatedGPIO with a pin access time and the initial
+        value of the virtual clock.
+        """
+        self.ACCESS_TIME = ACCESS_TIME
+        self.mode = None
+        self._time = start_time
+        self._directions = {}       # Pin -> IN/OUT for pins set up by the Pi
+        self._pulls = {}            # Pin -> PUD_* for input pins
+        self._output_levels = {}    # Pin -> level driven by the Pi
+        self._driven_levels = {}    # Pin -> level driven by a simulated device
+        self._events = {}           # Pin -> _EdgeDetector
+        self._watchers = {}         # Pin -> functions called when the Pi drives the pin
+        self._devices = []
+        self._updating = False
+        self._lock = threading.RLock()     # Serializes the clock and the device updates between threads
+
+    # Clock
+    def monotonic(self):
+        """Returns the current value of the virtual clock [s]."""
+        return self._time
+
+    def sleep(self, seconds):
+        """Advances the virtual clock instead of blocking. Like a real sleep
+        system call, even sleep(0) takes at least ACCESS_TIME.
+        """
+        self.advance(max(seconds, self.ACCESS_TIME))
+
+    def advance(self, seconds):
+        """Advances the virtual clock and lets every attached device react.
+
+        Args:
+            seconds: The amount of virtual time to advance by [s].
+        """
+        with self._lock:
+            self._time += seconds
+            if self._updating:
+                return
+            self._updating = True
+            try:
+                for device in self._devices:
+                    device.update(self._time)
+            finally:
+                self._updating = False
+
+    # RPi.GPIO interface
+    def setwarnings(self, enabled):
+        pass
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def getmode(self):
+        return self.mode
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=-1):
+        """Configures one or several pins as inputs or outputs."""
+        for pin in self.__channels(channel):
+            self._directions[pin] = direction
+            if direction == self.OUT:
+                self._output_levels[pin] = initial if initial in (self.LOW, self.HIGH) else self.LOW
+            else:
+                self._pulls[pin] = pull_up_down
+
+    def output(self, channel, value):
+        """Drives one or several output pins and notifies the devices watching them."""
+        for pin in self.__channels(channel):
+            if self._directions.get(pin) != self.OUT:
+                raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+            self.advance(self.ACCESS_TIME)
+            level = int(bool(value))
+            previous_level = self._output_levels.get(pin, self.LOW)
+            self._output_levels[pin] = level
+            if level != previous_level:
+                for watcher in self._watchers.get(pin, ()):
+                    watcher(level)
+
+    def input(self, channel):
+        """Returns the level of a pin."""
+        if channel not in self._directions:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        self.advance(self.ACCESS_TIME)
+        return self.level(channel)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        if self._directions.get(channel) != self.IN:
+            raise RuntimeError("You must setup() the GPIO channel as an input first")
+        if channel in self._events:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self._events[channel] = _EdgeDetector(edge, bouncetime)
+        if callback is not None:
+            self._events[channel].callbacks.append(callback)
+
+    def wait_for_edge(self, channel, edge, bouncetime=None, timeout=None):
+        """Advances the virtual clock until an edge occurs on an input pin.
+
+        The clock jumps straight to the next time an attached device reports
+        through next_event_time(), so waiting costs no real time.
+
+        Args:
+            channel: The pin to wait on.
+            edge: RISING, FALLING or BOTH.
+            bouncetime: Ignored.
+            timeout: The maximum time to wait [ms], or None to wait forever.
+
+        Returns:
+            The channel, or None if the timeout expired.
+        """
+        if self._directions.get(channel) != self.IN:
+            raise RuntimeError("You must setup() the GPIO channel as an input first")
+        if channel in self._events:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        detector = _EdgeDetector(edge, None)
+        self._events[channel] = detector
+        deadline = None if timeout is None else self._time + timeout / 1000
+        try:
+            while not detector.detected:
+                event_times = [device.next_event_time() for device in self._devices
+                               if hasattr(device, "next_event_time")]
+                next_time = min((t for t in event_times if t is not None), default=None)
+                if deadline is not None and (next_time is None or next_time >= deadline):
+                    self.advance(max(deadline - self._time, 0))
+                    return channel if detector.detected else None
+                if next_time is None:
+                    raise RuntimeError("No simulated device can produce an edge on channel " + str(channel))
+                self.advance(max(next_time - self._time, self.ACCESS_TIME))
+        finally:
+            del self._events[channel]
+        return channel
+
+    def add_event_callback(self, channel, callback):
+        if channel not in self._events:
+            raise RuntimeError("Add event detection using add_event_detect first before adding a callback")
+        self._events[channel].callbacks.append(callback)
+
+    def remove_event_detect(self, channel):
+        self._events.pop(channel, None)
+
+    def event_detected(self, channel):
+        detector = self._events.get(channel)
+        if detector is None:
+            return False
+        detected = detector.detected
+        detector.detected = False
+        return detected
+
+    def cleanup(self, channel=None):
+        pins = list(self._directions) if channel is None else self.__channels(channel)
+        for pin in pins:
+            self._directions.pop(pin, None)
+            self._pulls.pop(pin, None)
+            self._output_levels.pop(pin, None)
+            self._events.pop(pin, None)
+
+    # Interface used by simulated devices
+    def attach(self, device):
+        """Registers a simulated device so it is updated as the clock advances."""
+        self._devices.append(device)
+        device.update(self._time)
+
+    def watch(self, pin, function):
+        """Calls function(level) whenever the Pi changes the level of an output pin."""
+        self._watchers.setdefault(pin, []).append(function)
+
+    def drive(self, pin, level):
+        """Sets the level a simulated device applies to a pin and fires any
+        matching edge events.
+        """
+        previous_level = self.level(pin)
+        self._driven_levels[pin] = level
+        if level != previous_level and pin in self._events:
+            self._events[pin].fire(pin, level, self._time)
+
+    def level(self, pin):
+        """Returns the level of a pin without advancing the clock."""
+        if self._directions.get(pin) == self.OUT:
+            return self._output_levels.get(pin, self.LOW)
+        if pin in self._driven_levels:
+            return self._driven_levels[pin]
+        return self.HIGH if self._pulls.get(pin) == self.PUD_UP else self.LOW
+
+    def __channels(self, channel):
+        if isinstance(channel, (list, tuple)):
+            return channel
+        return (channel,)
+
+
+class _EdgeDetector:
+    """Edge detection state of a single input pin of SimulatedGPIO."""
+
+    def __init__(self, edge, bouncetime):
+        self.edge = edge
+        self.bouncetime = None if bouncetime is None else bouncetime / 1000
+        self.callbacks = []
+        self.detected = False
+        self.last_time = None
+
+    def fire(self, pin, level, now):
+        if self.edge == SimulatedGPIO.RISING and level != 1:
+            return
+        if self.edge == SimulatedGPIO.FALLING and level != 0:
+            return
+        if (self.bouncetime is not None and self.last_time is not None
+                and now - self.last_time < self.bouncetime):
+            return
+        self.last_time = now
+        self.detected = True
+        for callback in list(self.callbacks):
+            callback(pin)
+
+
+class SimulatedHX711:
+    """Represents a simulated HX711 load cell amplifier.
+
+    The amplifier converts continuously at RATE. When a conversion completes
+    DAT is pulled low (DRDY). Each rising edge on CLK shifts out the next bit
+    of the 24-bit two's complement result, MSB first. The 25th to 27th pulses
+    select the channel and gain of the next conversion. Holding CLK high for
+    longer than 60 microseconds powers the chip down.
+
+    Attributes:
+        PIN_DAT: An integer indicating the pin connected to "DAT".
+        PIN_CLK: An integer indicating the pin connected to "CLK".
+        RATE: An integer indicating the output data rate, 10 or 80 [Hz].
+        gain: An integer indicating the gain used for the current conversion.
+        conversions: An integer counting the completed conversions.
+        samples_read: An integer counting the conversions that were fully read.
+        overwritten_conversions: An integer counting conversions that were
+            replaced by the next one before being read.
+    """
+    BITS = 24
+    MAX_VALUE = (1 << 23) - 1
+    MIN_VALUE = -(1 << 23)
+    POWER_DOWN_TIME = 60e-6     # Time CLK must stay high to power down the chip [s]
+    SETTLING_CONVERSIONS = 4    # Conversions needed to settle after power up or a gain change
+    GAINS_BY_PULSES = {25: 128, 26: 32, 27: 64}
+
+    def __init__(self, gpio, PIN_DAT, PIN_CLK, value=0, RATE=10, noise=0, seed=0, PIN_RATE=None):
+        """Initializes SimulatedHX711.
+
+        Args:
+            gpio: The SimulatedGPIO instance the amplifier is wired to.
+            PIN_DAT: The pin connected to "DAT".
+            PIN_CLK: The pin connected to "CLK".
+            value: The bridge signal in counts at gain 128. Either a number, a
+                function of the virtual time or an iterable of numbers (the
+                last value is held once the iterable is exhausted).
+            RATE: The output data rate, 10 or 80 [Hz].
+            noise: Standard deviation of Gaussian noise added to each
+                conversion [counts].
+            seed: Seed of the noise generator.
+            PIN_RATE: An optional pin connected to "RATE". Driving it high
+                selects 80 Hz and low 10 Hz.
+        """
+        self.gpio = gpio
+        self.PIN_DAT = PIN_DAT
+        self.PIN_CLK = PIN_CLK
+        self.RATE = RATE
+        self.noise = noise
+        self._random = random.Random(seed)
+        self._value = value
+        self._iterator = None if callable(value) or isinstance(value, (int, float)) else iter(value)
+        self._last_iterated_value = 0
+
+        self.gain = 128
+        self._next_gain = 128
+        self.powered_down = False
+        self._clk_high_since = None
+        self._data = 0
+        self._ready = False
+        self._bits_clocked = 0
+        self._next_conversion = gpio.monotonic() + self.SETTLING_CONVERSIONS / self.RATE
+
+        self.conversions = 0
+        self.samples_read = 0
+        self.overwritten_conversions = 0
+
+        gpio.drive(self.PIN_DAT, 1)
+        gpio.watch(self.PIN_CLK, self.__on_clock)
+        if PIN_RATE is not None:
+            gpio.watch(PIN_RATE, lambda level: self.set_rate(80 if level else 10))
+        gpio.attach(self)
+
+    def set_rate(self, rate):
+        """Changes the output data rate (models the RATE pin)."""
+        self.RATE = rate
+        self._next_conversion = self.gpio.monotonic() + self.SETTLING_CONVERSIONS / self.RATE
+
+    def next_event_time(self):
+        """Returns the time the next conversion completes, or None."""
+        return None if self.powered_down else self._next_conversion
+
+    def signal(self, now):
+        """Returns the bridge signal at the given time [counts at gain 128]."""
+        if self._iterator is not None:
+            self._last_iterated_value = next(self._iterator, self._last_iterated_value)
+            return self._last_iterated_value
+        if callable(self._value):
+            return self._value(now)
+        return self._value
+
+    def update(self, now):
+        """Completes every conversion due by the given time."""
+        if self.powered_down:
+            return
+        if self._clk_high_since is not None and now - self._clk_high_since >= self.POWER_DOWN_TIME:
+            self.__power_down()
+            return
+        while now >= self._next_conversion:
+            self.__convert(self._next_conversion)
+            self._next_conversion += 1 / self.RATE
+
+    def __convert(self, now):
+        if self._bits_clocked > self.BITS:
+            # The previous read has finished, its gain pulses apply from now on
+            self.gain = self._next_gain
+            self._bits_clocked = 0
+        elif self._bits_clocked != 0:
+            # A read is in progress, the shift register is not updated
+            self.overwritten_conversions += 1
+            return
+        if self._ready:
+            self.overwritten_conversions += 1
+        value = self.signal(now) * self.gain / 128
+        if self.noise:
+            value += self._random.gauss(0, self.noise)
+        value = max(self.MIN_VALUE, min(self.MAX_VALUE, int(round(value))))
+        self._data = value & ((1 << self.BITS) - 1)
+        self._ready = True
+        self.conversions += 1
+        self.gpio.drive(self.PIN_DAT, 0)
+
+    def __power_down(self):
+        self.powered_down = True
+        self._ready = False
+        self._bits_clocked = 0
+        self.gpio.drive(self.PIN_DAT, 1)
+
+    def __on_clock(self, level):
+        now = self.gpio.monotonic()
+        if level == 1:
+            self._clk_high_since = now
+            if self.powered_down or not (self._ready or self._bits_clocked):
+                return
+            self._bits_clocked += 1
+            if self._bits_clocked <= self.BITS:
+                bit = (self._data >> (self.BITS - self._bits_clocked)) & 1
+                self.gpio.drive(self.PIN_DAT, bit)
+            else:
+                self.gpio.drive(self.PIN_DAT, 1)
+                self._next_gain = self.GAINS_BY_PULSES.get(self._bits_clocked, self._next_gain)
+        else:
+            if self.powered_down:
+                # Powering back up resets the chip to channel A, gain 128
+                self.powered_down = False
+                self._clk_high_since = None
+                self.gain = self._next_gain = 128
+                self._next_conversion = now + self.SETTLING_CONVERSIONS / self.RATE
+                return
+            self._clk_high_since = None
+            if self._bits_clocked == self.BITS + 1:
+                self._ready = False
+                self.samples_read += 1
+
+
+class SimulatedAMT102:
+    """Represents a simulated AMT102 quadrature encoder.
+
+    The encoder position is kept in quadrature counts (four per pulse). A and B
+    follow the Gray code sequence 00, 10, 11, 01 as the count increases, so A
+    leads B when the count increases. X is high while the count is a multiple
+    of one revolution.
+
+    If PIN_PUL is given, the encoder is coupled to the stepper motor: every
+    rising edge the Pi drives on PIN_PUL turns the shaft by one step, in the
+    direction given by PIN_DIR (high, i.e. Motor.Direction.CW, increases the
+    count).
+
+    Attributes:
+        PIN_A: An integer indicating the pin connected to "A".
+        PIN_B: An integer indicating the pin connected to "B".
+        PIN_X: An integer indicating the pin connected to "X".
+        PULSES_PER_REVOLUTION: An integer indicating the encoder resolution.
+        STEPS_PER_REVOLUTION: An integer indicating the steps per revolution
+            of the motor driving the encoder.
+        count: An integer indicating the absolute position [quadrature counts].
+        edges: An integer counting the A/B edges generated.
+    """
+    STATES = ((0, 0), (1, 0), (1, 1), (0, 1))   # (A, B) levels indexed by count % 4
+
+    def __init__(self, gpio, PIN_A, PIN_B, PIN_X, PULSES_PER_REVOLUTION=2048,
+                 PIN_PUL=None, PIN_DIR=None, STEPS_PER_REVOLUTION=200):
+        """Initializes SimulatedAMT102 and optionally couples it to a motor."""
+        self.gpio = gpio
+        self.PIN_A = PIN_A
+        self.PIN_B = PIN_B
+        self.PIN_X = PIN_X
+        self.PULSES_PER_REVOLUTION = PULSES_PER_REVOLUTION
+        self.PIN_DIR = PIN_DIR
+        self.STEPS_PER_REVOLUTION = STEPS_PER_REVOLUTION
+        self.count = 0
+        self.edges = 0
+        self._fraction = 0.0
+        self.__output()
+        if PIN_PUL is not None:
+            gpio.watch(PIN_PUL, self.__on_pulse)
+        gpio.attach(self)
+
+    @property
+    def counts_per_revolution(self):
+        """The number of quadrature counts per revolution."""
+        return 4 * self.PULSES_PER_REVOLUTION
+
+    def update(self, now):
+        pass
+
+    def rotate(self, counts):
+        """Turns the shaft by a number of quadrature counts, one edge at a time.
+
+        Args:
+            counts: The signed number of quadrature counts to turn by.
+        """
+        increment = 1 if counts > 0 else -1
+        for _ in range(abs(int(counts))):
+            self.count += increment
+            self.edges += 1
+            self.__output()
+
+    def rotate_revolutions(self, revolutions):
+        """Turns the shaft by a (fractional) number of revolutions."""
+        self._fraction += revolutions * self.counts_per_revolution
+        whole_counts = int(self._fraction)
+        self._fraction -= whole_counts
+        self.rotate(whole_counts)
+
+    def step(self, direction=1):
+        """Turns the shaft by one motor step.
+
+        Args:
+            direction: 1 for a clockwise step, -1 for a counterclockwise step.
+        """
+        self.rotate_revolutions(direction / self.STEPS_PER_REVOLUTION)
+
+    def __on_pulse(self, level):
+        if level == 1:
+            clockwise = self.PIN_DIR is None or self.gpio.level(self.PIN_DIR) == 1
+            self.step(1 if clockwise else -1)
+
+    def __output(self):
+        pin_A_state, pin_B_state = self.STATES[self.count % 4]
+        self.gpio.drive(self.PIN_A, pin_A_state)
+        self.gpio.drive(self.PIN_B, pin_B_state)
+        self.gpio.drive(self.PIN_X, 1 if self.count % self.counts_per_revolution == 0 else 0)
+
+
+class SimulatedSwitch:
+    """Represents a simulated button or limit switch.
+
+    Attributes:
+        PIN: An integer indicating the pin the switch is connected to.
+        ACTIVE_LEVEL: An integer indicating the level of the pin while the
+            switch is pressed.
+        pressed: A boolean indicating whether the switch is pressed.
+        edge_time: A float indicating the virtual time of the last press or
+            release [s].
+    """
+
+    def __init__(self, gpio, PIN, ACTIVE_LEVEL=1):
+        """Initializes SimulatedSwitch in the released state."""
+        self.gpio = gpio
+        self.PIN = PIN
+        self.ACTIVE_LEVEL = ACTIVE_LEVEL
+        self.pressed = False
+        self.edge_time = None
+        self._press_time = None
+        gpio.drive(self.PIN, 1 - ACTIVE_LEVEL)
+        gpio.attach(self)
+
+    def update(self, now):
+        if self._press_time is not None and now >= self._press_time:
+            self._press_time = None
+            self.press()
+
+    def next_event_time(self):
+        return self._press_time
+
+    def press_at(self, time):
+        """Presses the switch once the virtual clock reaches time [s]."""
+        self._press_time = time
+
+    def press(self, bounces=0, bounce_interval=0.0002):
+        """Presses the switch.
+
+        Args:
+            bounces: The number of contact bounces (extra release/press pairs)
+                to generate after the first contact.
+            bounce_interval: The virtual time between bounce edges [s].
+        """
+        self.__set(True, bounces, bounce_interval)
+
+    def release(self, bounces=0, bounce_interval=0.0002):
+        """Releases the switch. See press() for the arguments."""
+        self.__set(False, bounces, bounce_interval)
+
+    def click(self, hold_time=0.05):
+        """Presses the switch, holds it for hold_time [s] and releases it."""
+        self.press()
+        self.gpio.advance(hold_time)
+        self.release()
+
+    def __set(self, pressed, bounces, bounce_interval):
+        active = self.ACTIVE_LEVEL if pressed else 1 - self.ACTIVE_LEVEL
+        self.edge_time = self.gpio.monotonic()
+        self.gpio.drive(self.PIN, active)
+        for _ in range(bounces):
+            self.gpio.advance(bounce_interval)
+            self.gpio.drive(self.PIN, 1 - active)
+            self.gpio.advance(bounce_interval)
+            self.gpio.drive(self.PIN, active)
+        self.pressed = pressed
@@ -0,0 +1,411 @@
+"""Module defining StreamServer class and related functions.
+
+Streams live data to any number of local clients over TCP, as JSON lines:
+
+    {"type": "data", "channel": "force", "records": [[time, force], ...]}
+    {"type": "data", "channel": "position", "records": [[time, position, angular_velocity], ...]}
+    {"type": "state", "time": ..., "enabled": ..., "moving": ..., "direction": "CW", "speed": ...}
+
+The server runs on the Runtime's event loop. publish() reads the new records
+of the sensor ring buffers once and hands them to every client, so
+acquisition never waits for a client:
+
+    Decimation: each client chooses how its records are reduced, "minmax"
+        (the smallest and largest value of every bucket, so peaks are never
+        hidden), "lttb" (Largest-Triangle-Three-Buckets, which keeps the
+        shape of the curve) or "none", and how many points per second it
+        wants.
+    Backpressure: each client has its own bounded queue of messages, sent by
+        its own writer task. If a client reads too slowly, its oldest
+        messages are dropped and counted; other clients are not affected.
+
+Clients send commands as JSON lines, answered with a "reply" message:
+
+    {"command": "subscribe", "decimation": "lttb", "points_per_second": 100, "channels": ["force"]}
+    {"command": "move_up"}, {"command": "move_down"}, {"command": "stop"}
+    {"command": "set_speed", "speed": 10}
+
+The motion commands call the LinearActuator on the event loop, like the
+button handlers.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import asyncio
+from collections import deque
+import gpio
+import json
+import math
+
+CHANNELS = ("force", "position")
+
+
+class MinMaxDecimator:
+    """Reduces records to the records holding the smallest and largest value
+    of every time bucket.
+
+    Attributes:
+        BUCKET: A float indicating the duration of a bucket [s].
+        KEY: An integer indicating the index of the value in the records.
+    """
+
+    def __init__(self, POINTS_PER_SECOND, KEY=1):
+        """Initializes MinMaxDecimator for a number of output points per
+        second, two per bucket.
+        """
+        self.BUCKET = 2 / POINTS_PER_SECOND
+        self.KEY = KEY
+        self._bucket_end = None
+        self._minimum = None
+        self._maximum = None
+
+    def add(self, records):
+        """Adds records, oldest first.
+
+        Returns:
+            A list of the records of the buckets completed, oldest first.
+        """
+        KEY = self.KEY
+        output = []
+        for record in records:
+            t = record[0]
+            if self._bucket_end is None:
+                self._bucket_end = t + self.BUCKET
+            elif t >= self._bucket_end:
+                output.extend(self.flush())
+                self._bucket_end += self.BUCKET * (math.floor((t - self._bucket_end) / self.BUCKET) + 1)
+            if self._minimum is None or record[KEY] < self._minimum[KEY]:
+                self._minimum = record
+            if self._maximum is None or record[KEY] > self._maximum[KEY]:
+                self._maximum = record
+        return output
+
+    def flush(self):
+        """Returns the records of the current bucket and starts a new one."""
+        minimum, maximum = self._minimum, self._maximum
+        self._minimum = self._maximum = None
+        if minimum is None:
+            return []
+        if minimum is maximum:
+            return [minimum]
+        return [minimum, maximum] if minimum[0] <= maximum[0] else [maximum, minimum]
+
+
+class LTTBDecimator:
+    """Reduces records with Largest-Triangle-Three-Buckets over consecutive
+    windows.
+
+    Attributes:
+        POINTS_PER_SECOND: A number indicating the output rate [points/s].
+        WINDOW: A float indicating the duration of records reduced at once [s].
+        KEY: An integer indicating the index of the value in the records.
+    """
+
+    def __init__(self, POINTS_PER_SECOND, WINDOW=0.5, KEY=1):
+        """Initializes LTTBDecimator."""
+        self.POINTS_PER_SECOND = POINTS_PER_SECOND
+        self.WINDOW = WINDOW
+        self.KEY = KEY
+        self._records = []
+        self._anchor = None     # Last record output, the first point of the next window
+
+    def add(self, records):
+        """Adds records, oldest first.
+
+        Returns:
+            A list of the records selected from the windows completed, oldest
+            first.
+        """
+        buffered = self._records
+        buffered.extend(records)
+        if not buffered or buffered[-1][0] - buffered[0][0] < self.WINDOW:
+            return []
+        return self.flush()
+
+    def flush(self):
+        """Returns the records selected from the buffered records."""
+        records = self._records
+        self._records = []
+        if not records:
+            return []
+        count = max(2, round(self.POINTS_PER_SECOND * (records[-1][0] - records[0][0])))
+        if self._anchor is None:
+            selected = lttb(records, count, self.KEY)
+        else:
+            selected = lttb([self._anchor] + records, count + 1, self.KEY)[1:]
+        self._anchor = selected[-1]
+        return selected
+
+
+class PassThroughDecimator:
+    """Keeps every record."""
+
+    def add(self, records):
+        return list(records)
+
+    def flush(self):
+        return []
+
+
+DECIMATORS = {
+    "minmax": MinMaxDecimator,
+    "lttb": LTTBDecimator,
+    "none": lambda POINTS_PER_SECOND, KEY=1: PassThroughDecimator(),
+}
+
+
+def lttb(records, count, key=1):
+    """Selects count records keeping the visual shape of a curve, with the
+    Largest-Triangle-Three-Buckets algorithm. The first and last records are
+    always kept.
+
+    Args:
+        records: A list of records whose first element is the time.
+        count: The number of records to select.
+        key: The index of the value in the records.
+
+    Returns:
+        A list of the selected records, oldest first.
+    """
+    length = len(records)
+    if count >= length:
+        return list(records)
+    if count < 3:
+        return [records[0], records[-1]]
+    selected = [records[0]]
+    bucket_size = (length - 2) / (count - 2)
+    a = records[0]
+    for bucket in range(count - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        # Average of the next bucket, the third point of the triangles
+        next_end = min(int((bucket + 2) * bucket_size) + 1, length)
+        next_records = records[end:next_end] or records[-1:]
+        average_t = sum(record[0] for record in next_records) / len(next_records)
+        average_value = sum(record[key] for record in next_records) / len(next_records)
+
+        a_t, a_value = a[0], a[key]
+        largest_area = -1.0
+        for record in records[start:end]:
+            area = abs((a_t - average_t) * (record[key] - a_value) - (a_t - record[0]) * (average_value - a_value))
+            if area > largest_area:
+                largest_area = area
+                a_next = record
+        selected.append(a_next)
+        a = a_next
+    selected.append(records[-1])
+    return selected
+
+
+class StreamClient:
+    """Represents a connected client.
+
+    Attributes:
+        MAX_QUEUED: An integer indicating the largest number of messages
+            waiting to be sent before the oldest are dropped.
+        channels: A set of the channels subscribed to.
+        decimators: A dictionary of the decimator of each channel.
+        sent: An integer counting the messages sent.
+        dropped: An integer counting the messages dropped because the client
+            was too slow.
+    """
+
+    def __init__(self, writer, MAX_QUEUED=256):
+        """Initializes StreamClient, subscribed to every channel without
+        decimation.
+        """
+        self.writer = writer
+        self.MAX_QUEUED = MAX_QUEUED
+        self.sent = 0
+        self.dropped = 0
+        self._messages = deque()
+        self._ready = asyncio.Event()
+        self.subscribe()
+
+    def subscribe(self, decimation="none", points_per_second=100, channels=CHANNELS):
+        """Sets the channels sent to the client and their decimation.
+
+        Raises:
+            ValueError: The decimation or a channel is unknown.
+        """
+        if decimation not in DECIMATORS:
+            raise ValueError("Unknown decimation " + str(decimation))
+        if points_per_second <= 0:
+            raise ValueError("points_per_second must be positive.")
+        for channel in channels:
+            if channel not in CHANNELS:
+                raise ValueError("Unknown channel " + str(channel))
+        self.channels = set(channels)
+        self.decimators = {channel: DECIMATORS[decimation](points_per_second) for channel in channels}
+
+    @property
+    def queued(self):
+        """The number of messages waiting to be sent."""
+        return len(self._messages)
+
+    def send(self, message):
+        """Queues a message, dropping the oldest one if the queue is full.
+        Never blocks.
+        """
+        messages = self._messages
+        if len(messages) >= self.MAX_QUEUED:
+            messages.popleft()
+            self.dropped += 1
+        messages.append(message)
+        self._ready.set()
+
+    def send_records(self, channel, records):
+        """Decimates and queues the new records of a channel."""
+        if channel not in self.channels:
+            return
+        records = self.decimators[channel].add(records)
+        if records:
+            self.send({"type": "data", "channel": channel, "records": records})
+
+    async def write_messages(self):
+        """Sends the queued messages until the connection closes."""
+        writer = self.writer
+        messages = self._messages
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while messages:
+                writer.write((json.dumps(messages.popleft()) + "\n").encode())
+                self.sent += 1
+                await writer.drain()
+
+
+class StreamServer:
+    """Streams live force, position and motor state to local clients and
+    accepts motion commands from them.
+
+    Attributes:
+        linear_actuator: The LinearActuator commanded by the clients, or None
+            to ignore motion commands.
+        host: The address the server listens on, localhost by default.
+        port: The port the server listens on. 0 selects a free port, which
+            is stored here once the server is started.
+        MAX_QUEUED: The message queue length of each client.
+        clients: A list of the connected StreamClient objects.
+    """
+
+    def __init__(self, force_buffer, position_buffer, linear_actuator=None, port=9109, host="127.0.0.1",
+                 MAX_QUEUED=256):
+        """Initializes StreamServer.
+
+        Args:
+            force_buffer: The SharedRingBuffer written by LoadCell.run().
+            position_buffer: The SharedRingBuffer written by RotaryEncoder.publish().
+            linear_actuator: The LinearActuator commanded by the clients.
+            port: The port to listen on.
+            host: The address to listen on.
+            MAX_QUEUED: The message queue length of each client.
+        """
+        self.readers = {"force": force_buffer.reader(), "position": position_buffer.reader()}
+        self.linear_actuator = linear_actuator
+        self.host = host
+        self.port = port
+        self.MAX_QUEUED = MAX_QUEUED
+        self.clients = []
+        self._state = None
+
+    async def serve(self):
+        """Accepts clients until the task is cancelled. Add it to a Runtime
+        with add_task(), and publish() with add_periodic().
+        """
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            # Closing the connections ends the client handlers
+            for client in self.clients:
+                client.writer.close()
+
+    def publish(self):
+        """Sends the records written since the last call and the motor state
+        to every client.
+        """
+        clients = self.clients
+        for channel, reader in self.readers.items():
+            records = reader.read()
+            if records and clients:
+                for client in clients:
+                    client.send_records(channel, records)
+        state = self.state()
+        if state and state != self._state:
+            self._state = state
+            message = dict(state, type="state", time=gpio.monotonic())
+            for client in clients:
+                client.send(message)
+
+    def state(self):
+        """Returns the motor state as a dictionary, or an empty dictionary
+        without a LinearActuator.
+        """
+        linear_actuator = self.linear_actuator
+        if linear_actuator is None:
+            return {}
+        motor = linear_actuator.MOTOR
+        return {
+            "enabled": motor.enabled,
+            "moving": motor.moving,
+            "direction": motor.direction.name,
+            "speed": linear_actuator.speed,
+        }
+
+    def report(self):
+        """Returns the message statistics of every client as a list of
+        dictionaries.
+        """
+        return [{"sent": client.sent, "dropped": client.dropped, "queued": client.queued}
+                for client in self.clients]
+
+    async def handle(self, reader, writer):
+        """Serves one client: sends its messages and runs its commands."""
+        client = StreamClient(writer, self.MAX_QUEUED)
+        self.clients.append(client)
+        if self._state is not None:
+            client.send(dict(self._state, type="state", time=gpio.monotonic()))
+        sender = asyncio.ensure_future(client.write_messages())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                client.send(self.execute(client, line))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.remove(client)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            writer.close()
+
+    def execute(self, client, line):
+        """Runs a command line received from a client.
+
+        Returns:
+            The reply message.
+        """
+        name = None
+        try:
+            command = json.loads(line)
+            name = command.get("command")
+            if name == "subscribe":
+                client.subscribe(command.get("decimation", "none"), command.get("points_per_second", 100),
+                                 command.get("channels", CHANNELS))
+            elif name in ("move_up", "move_down", "stop", "set_speed"):
+                linear_actuator = self.linear_actuator
+                if linear_actuator is None:
+                    raise ValueError("No linear actuator to command.")
+                if name == "set_speed":
+                    linear_actuator.set_speed(float(command["speed"]))
+                else:
+                    getattr(linear_actuator, name)(None)
+            else:
+                raise ValueError("Unknown command " + str(name))
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            return {"type": "reply", "command": name, "ok": False, "error": str(error)}
+        return {"type": "reply", "command": name, "ok": True}
@@ -0,0 +1,257 @@
+"""Module defining the supervision of the Runtime's worker processes.
+
+Each worker process started by a Runtime can be given:
+
+    Scheduling: the CPUs it may run on and its scheduling policy and
+        priority, applied in the child before it starts working. A setting
+        the system does not permit (e.g. a real-time policy without
+        CAP_SYS_NICE) or support is skipped with a warning, so the worker
+        still runs with the default scheduling.
+    Watchdog: a heartbeat, i.e. a function returning a counter the worker
+        advances while it is healthy, such as the head of the ring buffer it
+        publishes to. When the counter stops advancing for TIMEOUT, or the
+        process dies, the watchdog calls its on_stall function (e.g. to stop
+        the motor) and the Runtime restarts the worker, up to MAX_RESTARTS
+        times.
+
+WorkerStatistics reads the CPU time and the run queue wait of every worker
+from /proc (Linux), so it costs the worker nothing. The wait per timeslice
+is the mean scheduling latency: how long the worker was runnable before it
+got a CPU.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+from collections import namedtuple
+import os
+import time
+import warnings
+
+POLICIES = ("other", "batch", "idle", "fifo", "rr")
+REAL_TIME_POLICIES = ("fifo", "rr")
+
+Scheduling = namedtuple("Scheduling", ("cpus", "policy", "priority"), defaults=(None, None, 0))
+Scheduling.__doc__ = """The scheduling of a process.
+
+Attributes:
+    cpus: An iterable of the CPU numbers the process may run on, or None for
+        all of them.
+    policy: The scheduling policy, one of POLICIES, or None to keep the
+        default.
+    priority: An integer indicating the static priority for the real-time
+        policies "fifo" and "rr" (1 to 99), or the niceness for the others.
+"""
+
+
+def apply_scheduling(scheduling, pid=0):
+    """Applies a Scheduling to a process, skipping with a warning whatever
+    the system does not permit or support. A real-time policy is skipped as
+    well when the process was meant to be pinned to CPUs but could not be.
+
+    Args:
+        scheduling: The Scheduling to apply.
+        pid: The process to apply it to, 0 for the calling one.
+
+    Returns:
+        A dictionary of the CPUs and policy the process ended up with (None
+        where they cannot be queried).
+    """
+    pinned = True
+    if scheduling.cpus is not None:
+        pinned = False
+        if not hasattr(os, "sched_setaffinity"):
+            warnings.warn("CPU affinity is not supported on this system, ignoring it.")
+        else:
+            # Not intersected with the current affinity, which a child
+            # inherits from its parent, e.g. a main process pinned elsewhere
+            cpus = set(scheduling.cpus) & set(range(os.cpu_count() or 1))
+            if not cpus:
+                warnings.warn("None of the CPUs " + str(sorted(scheduling.cpus)) + " exists, keeping CPUs "
+                              + str(sorted(os.sched_getaffinity(pid))) + ".")
+            else:
+                try:
+                    os.sched_setaffinity(pid, cpus)
+                    pinned = True
+                except OSError as error:
+                    warnings.warn("Could not set the CPU affinity: " + str(error))
+
+    policy = scheduling.policy
+    if policy is not None:
+        if policy not in POLICIES:
+            raise ValueError("Unknown scheduling policy '" + str(policy) + "', expected one of "
+                             + ", ".join(POLICIES) + ".")
+        constant = getattr(os, "SCHED_" + policy.upper(), None)
+        if policy in REAL_TIME_POLICIES and not pinned:
+            # A busy real-time process sharing the main process's CPUs could
+            # starve it
+            warnings.warn("The process could not be pinned to its CPUs, ignoring the '" + policy
+                          + "' scheduling policy.")
+        elif constant is None or not hasattr(os, "sched_setscheduler"):
+            warnings.warn("The '" + policy + "' scheduling policy is not supported on this system, ignoring it.")
+        else:
+            priority = scheduling.priority if policy in REAL_TIME_POLICIES else 0
+            try:
+                os.sched_setscheduler(pid, constant, os.sched_param(priority))
+                if policy not in REAL_TIME_POLICIES and scheduling.priority:
+                    os.setpriority(os.PRIO_PROCESS, pid, scheduling.priority)
+            except OSError as error:
+                warnings.warn("Could not set the '" + policy + "' scheduling policy: " + str(error)
+                              + ", keeping the default policy.")
+    return scheduling_of(pid)
+
+
+def scheduling_of(pid=0):
+    """Returns a dictionary of the CPUs and policy of a process, None where
+    they cannot be queried.
+    """
+    try:
+        cpus = sorted(os.sched_getaffinity(pid))
+    except (AttributeError, OSError):
+        cpus = None
+    try:
+        constant = os.sched_getscheduler(pid)
+        policy = next((name for name in POLICIES if getattr(os, "SCHED_" + name.upper(), None) == constant),
+                      str(constant))
+    except (AttributeError, OSError):
+        policy = None
+    return {"cpus": cpus, "policy": policy}
+
+
+class Watchdog:
+    """Detects a stalled worker from its heartbeat.
+
+    Attributes:
+        heartbeat: A function returning a counter the worker advances while
+            it is healthy, e.g. lambda: ring_buffer.head.
+        TIMEOUT: A float indicating how long the counter may stay unchanged
+            [s].
+        on_stall: An optional function called with the worker's name when it
+            stalls or dies, before it is restarted, e.g. to stop the motor.
+        MAX_RESTARTS: An integer indicating how many times the worker is
+            restarted before it is left stopped.
+        stalls: An integer counting the stalls detected.
+        max_interval: A float holding the longest time the counter stayed
+            unchanged [s].
+    """
+
+    def __init__(self, heartbeat, TIMEOUT=1.0, on_stall=None, MAX_RESTARTS=3):
+        """Initializes Watchdog."""
+        self.heartbeat = heartbeat
+        self.TIMEOUT = TIMEOUT
+        self.on_stall = on_stall
+        self.MAX_RESTARTS = MAX_RESTARTS
+        self.stalls = 0
+        self.max_interval = 0.0
+        self.reset(time.monotonic())
+
+    def reset(self, now):
+        """Restarts the timeout, e.g. when the worker is (re)started."""
+        self._count = self.heartbeat()
+        self._beat_time = now
+
+    def check(self, now):
+        """Returns True if the heartbeat has not advanced for TIMEOUT."""
+        count = self.heartbeat()
+        if count != self._count:
+            self._count = count
+            self._beat_time = now
+            return False
+        interval = now - self._beat_time
+        if interval > self.max_interval:
+            self.max_interval = interval
+        return interval > self.TIMEOUT
+
+
+class WorkerStatistics:
+    """Keeps statistics on a worker process, read from /proc on Linux.
+
+    Attributes:
+        pid: The process id of the current worker process, or None.
+        restarts: An integer counting the restarts of the worker.
+        cpu_time: A float holding the CPU time used by the current process
+            [s], or None if it cannot be read.
+        cpu_usage: A float holding the fraction of a CPU used since the
+            previous update(), or None.
+        scheduling_latency: A float holding the mean time the process waited
+            for a CPU when it became runnable, since the previous update()
+            [s], or None.
+        max_scheduling_latency: A float holding the largest
+            scheduling_latency [s], or None.
+    """
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def __init__(self):
+        """Initializes WorkerStatistics with no process."""
+        self.restarts = 0
+        self.max_scheduling_latency = None
+        self.start(None)
+
+    def start(self, pid):
+        """Starts following a (re)started process."""
+        self.pid = pid
+        self.cpu_time = None
+        self.cpu_usage = None
+        self.scheduling_latency = None
+        self._previous = None   # (time, cpu time, schedstat) of the previous update()
+
+    def update(self, now=None):
+        """Reads the process's counters and updates the statistics."""
+        if self.pid is None:
+            return
+        now = time.monotonic() if now is None else now
+        cpu_time = _read_cpu_time(self.pid)
+        schedstat = _read_schedstat(self.pid)
+        self.cpu_time = cpu_time
+        previous = self._previous
+        self._previous = (now, cpu_time, schedstat)
+        if previous is None or now <= previous[0]:
+            return
+        if cpu_time is None or previous[1] is None:
+            self.cpu_usage = None
+        else:
+            self.cpu_usage = (cpu_time - previous[1]) / (now - previous[0])
+        if schedstat is not None and previous[2] is not None:
+            timeslices = schedstat[1] - previous[2][1]
+            if timeslices > 0:
+                self.scheduling_latency = (schedstat[0] - previous[2][0]) / timeslices
+                if self.max_scheduling_latency is None or self.scheduling_latency > self.max_scheduling_latency:
+                    self.max_scheduling_latency = self.scheduling_latency
+
+    def report(self):
+        """Returns the statistics and the process's scheduling as a
+        dictionary.
+        """
+        report = {
+            "pid": self.pid,
+            "restarts": self.restarts,
+            "cpu_time": self.cpu_time,
+            "cpu_usage": self.cpu_usage,
+            "scheduling_latency": self.scheduling_latency,
+            "max_scheduling_latency": self.max_scheduling_latency,
+        }
+        if self.pid is not None:
+            report.update(scheduling_of(self.pid))
+        return report
+
+
+def _read_cpu_time(pid):
+    """Returns the user plus system CPU time of a process [s], or None."""
+    try:
+        with open("/proc/" + str(pid) + "/stat") as file:
+            # The command name may contain spaces, so split after it
+            fields = file.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / WorkerStatistics.CLOCK_TICKS
+
+
+def _read_schedstat(pid):
+    """Returns the (run queue wait time [s], timeslices) of a process's main
+    thread, or None.
+    """
+    try:
+        with open("/proc/" + str(pid) + "/schedstat") as file:
+            _, wait_time, timeslices = file.read().split()[:3]
+    except (OSError, ValueError):
+        return None
+    return int(wait_time) / 1e9, int(timeslices)
@@ -0,0 +1,35 @@
+"""Shared fixtures of the tests, which run on the simulated GPIO backend.
+
+Uses Google Python Style Guide: https://google.github.io/styleguide/pyguide.html
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIRECTORY)
+os.environ.setdefault("PMT_GPIO_BACKEND", "sim")
+
+import gpio  # noqa: E402
+from simulator import SimulatedGPIO  # noqa: E402
+
+
+@pytest.fixture
+def sim():
+    """A fresh SimulatedGPIO selected as the GPIO backend."""
+    backend = SimulatedGPIO()
+    gpio.set_backend(backend)
+    yield backend
+    gpio.set_backend(None)
+
+
+@pytest.fixture
+def cli():
+    """The command line module, __main__.py."""
+    spec = importlib.util.spec_from_file_location("pmt_cli", os.path.join(PACKAGE_DIRECTORY, "__main__.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,63 @@
+"""Tests of the material property analysis on a synthetic tensile test."""
+
+import numpy as np
+import pytest
+
+from analysis import ArraySource, Specimen, analyze, analyze_recording
+from recorder import Recorder
+
+E = 200000.0    # [MPa]
+
+
+def stress_of(strain):
+    """Elastic up to 300 MPa, hardening to 400 MPa at 8% strain, then
+    breaking by 9%.
+    """
+    yield_strain = 300 / E
+    return np.where(strain < yield_strain, E * strain,
+                    np.where(strain < 0.08, 300 + 100 * (strain - yield_strain) / (0.08 - yield_strain),
+                             np.maximum(400 - 400 * (strain - 0.08) / 0.01, 0)))
+
+
+def tensile_test(samples=100000):
+    specimen = Specimen.rectangular(5, 2, GAUGE_LENGTH=50)
+    strain = np.linspace(0, 0.095, samples)
+    return specimen, stress_of(strain) * specimen.AREA, strain * specimen.GAUGE_LENGTH
+
+
+def test_properties_of_a_known_curve():
+    specimen, force, displacement = tensile_test()
+    results = analyze(ArraySource(force, displacement), specimen)
+    assert results.elastic_modulus == pytest.approx(E, rel=1e-3)
+    assert results.ultimate_strength == pytest.approx(400, rel=1e-3)
+    assert results.ultimate_strain == pytest.approx(0.08, rel=1e-3)
+    # The 0.2% offset line crosses the hardening segment at about 302.6 MPa
+    assert results.yield_strength == pytest.approx(302.6, abs=0.5)
+    assert results.elongation_at_break == pytest.approx(0.085, rel=1e-3)
+    strain = np.linspace(0, 0.085, 200001)
+    stress = stress_of(strain)
+    assert results.toughness == pytest.approx(np.sum((stress[1:] + stress[:-1]) * np.diff(strain)) / 2, rel=1e-3)
+
+
+def test_chunked_analysis_matches_the_whole_array():
+    specimen, force, displacement = tensile_test()
+    whole = analyze(ArraySource(force, displacement), specimen)
+    chunked = analyze(ArraySource(force, displacement), specimen, chunk_size=997)
+    for name, value in whole._asdict().items():
+        assert getattr(chunked, name) == pytest.approx(value), name
+
+
+def test_recorded_test_is_analyzed_from_the_file(tmp_path):
+    specimen, force, displacement = tensile_test(20000)
+    path = str(tmp_path / "test.pmt")
+    with Recorder(path, BLOCK_RECORDS=512) as recorder:
+        for i, (f, d) in enumerate(zip(force.tolist(), displacement.tolist())):
+            recorder.write(i * 0.001, 0, f, 0, d)
+    results = analyze_recording(path, specimen, chunk_size=4096)
+    assert results.samples == 20000
+    assert results.ultimate_strength == pytest.approx(400, rel=1e-3)
+
+
+def test_a_test_without_load_is_rejected():
+    with pytest.raises(ValueError):
+        analyze(ArraySource(np.zeros(10), np.arange(10.0)), Specimen(10, 50))
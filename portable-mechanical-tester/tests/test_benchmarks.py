@@ -0,0 +1,46 @@
+"""Smoke tests of the benchmark suite and of its regression check."""
+
+import math
+
+import pytest
+
+import benchmarks
+
+
+def test_regressions_are_found_in_the_worse_direction_only():
+    baseline = {"hx711.samples_per_s": 80.0, "filter.time": 1.0, "limit_switch.late_trips": 0.0}
+    results = {"hx711.samples_per_s": 50.0, "filter.time": 1.2, "limit_switch.late_trips": 0.0, "new.time": 9.0}
+    assert benchmarks.find_regressions(results, baseline) == [("hx711.samples_per_s", 80.0, 50.0)]
+    results = {"hx711.samples_per_s": 200.0, "filter.time": 1.5}
+    assert benchmarks.find_regressions(results, baseline) == [("filter.time", 1.0, 1.5)]
+
+
+def test_multi_channel_throughput_is_higher_is_better(sim):
+    results = benchmarks.benchmark_multi_channel_hx711(channels=(1, 2), samples=5)
+    metric = "channel_samples_2_channels_per_s"
+    assert metric in results
+    baseline = {metric: 100.0}
+    assert benchmarks.find_regressions({metric: 200.0}, baseline) == []
+    assert benchmarks.find_regressions({metric: 50.0}, baseline) == [(metric, 100.0, 50.0)]
+
+
+def test_results_are_appended_to_the_history(tmp_path):
+    path = str(tmp_path / "results.json")
+    assert benchmarks.load_history(path) == []
+    benchmarks.save_results({"filter.time": 1.0}, "first", path)
+    benchmarks.save_results({"filter.time": 0.5}, "second", path)
+    history = benchmarks.load_history(path)
+    assert [entry["label"] for entry in history] == ["first", "second"]
+    assert history[-1]["results"] == {"filter.time": 0.5}
+
+
+@pytest.mark.parametrize("benchmark, arguments", [
+    (benchmarks.benchmark_encoder_decoder, {"edges": 2000}),
+    (benchmarks.benchmark_filter, {"window_sizes": (20,), "readings": 500}),
+    (benchmarks.benchmark_step_generator, {"steps": 200}),
+    (benchmarks.benchmark_metrics_overhead, {"events": 2000}),
+])
+def test_benchmarks_run_on_the_simulator(sim, benchmark, arguments):
+    results = benchmark(**arguments)
+    assert results
+    assert all(isinstance(value, (int, float)) and math.isfinite(value) for value in results.values())
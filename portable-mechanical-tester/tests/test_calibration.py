@@ -0,0 +1,43 @@
+"""Tests of the calibration profiles and their use by the amplifier."""
+
+import numpy as np
+import pytest
+
+from calibration import CalibrationProfile, CalibrationStore
+from load_cell_amplifier import LoadCellAmplifier
+from simulator import SimulatedHX711
+
+
+def test_linearization_interpolates_and_extends_the_outer_segments():
+    profile = CalibrationProfile("load_cell", points=[(100, 10), (0, 0), (200, 30)])
+    assert profile.linearize(50) == pytest.approx(5)
+    assert profile.linearize(150) == pytest.approx(20)
+    assert profile.linearize(300) == pytest.approx(50)
+    assert profile.linearize(-100) == pytest.approx(-10)
+    readings = np.array([50, 150, 300, -100])
+    np.testing.assert_allclose(profile.linearize_array(readings), [profile.linearize(r) for r in readings])
+
+
+def test_profiles_are_stored_by_name(tmp_path):
+    store = CalibrationStore(str(tmp_path / "calibration" / "profiles.json"))
+    assert store.load("load_cell") is None
+    store.save(CalibrationProfile("load_cell", OFFSET=-1000, REFERENCE_UNIT=21, GAIN=64, points=[(0, 0), (1, 2)]))
+    store.save(CalibrationProfile("second", OFFSET=5))
+    profile = CalibrationStore(store.path).load("load_cell")
+    assert (profile.OFFSET, profile.REFERENCE_UNIT, profile.GAIN) == (-1000, 21, 64)
+    assert profile.points == [(0, 0), (1, 2)]
+    assert store.names() == ["load_cell", "second"]
+
+
+def test_amplifier_starts_from_a_profile_and_checks_its_drift(sim):
+    signal = [-1000]
+    SimulatedHX711(sim, 5, 6, value=lambda t: signal[0])
+    profile = CalibrationProfile("load_cell", OFFSET=-1100, REFERENCE_UNIT=2, GAIN=128, MAX_DRIFT=500)
+    amplifier = LoadCellAmplifier(5, 6, calibration=profile, quick_tare=True)
+    assert amplifier.OFFSET == -1000
+    # A load applied during a quick tare is not mistaken for the zero
+    signal[0] = 5000
+    sim.advance(0.5)
+    assert amplifier.quick_tare() == 6000
+    assert amplifier.OFFSET == -1000
+    assert amplifier.get_weight() == pytest.approx(3000)
@@ -0,0 +1,64 @@
+"""Tests of the triggers and of the triggered capture of load cell readings."""
+
+import pytest
+
+from capture import ForceDropTrigger, LimitSwitchTrigger, SlopeChangeTrigger, TriggeredCapture
+from filters import SpikeRejectionFilter
+from gpio import GPIO
+from load_cell import LoadCell
+from load_cell_amplifier import LoadCellAmplifier
+from recorder import Recording
+from simulator import SimulatedHX711, SimulatedSwitch
+
+
+def test_force_drop_trigger_fires_below_the_peak():
+    trigger = ForceDropTrigger(DROP_FRACTION=0.3, MIN_PEAK=1.0)
+    assert trigger.check(0, 0.5) is None
+    assert trigger.check(1, 0.3) is None      # Peak below MIN_PEAK
+    assert trigger.check(2, 10.0) is None
+    assert trigger.check(3, 7.5) is None
+    assert "10.000" in trigger.check(4, 6.5)
+    trigger.reset()
+    assert trigger.check(5, 6.5) is None
+
+
+def test_slope_change_trigger_fires_on_a_knee():
+    trigger = SlopeChangeTrigger(CHANGE=40, WINDOW=4)
+    fired = [trigger.check(i * 0.1, 10.0 * i if i <= 10 else 100.0) for i in range(20)]
+    first = next(i for i, description in enumerate(fired) if description is not None)
+    assert first == 12     # The slope over readings 8 to 12 is half the slope before
+
+
+def test_limit_switch_trigger_fires_on_the_active_level(sim):
+    switch = SimulatedSwitch(sim, 17)
+    GPIO.setup(17, GPIO.IN)
+    trigger = LimitSwitchTrigger([17])
+    assert trigger.check(0, 0) is None
+    switch.press()
+    assert "pin 17" in trigger.check(0, 0)
+    assert trigger.check(0, 0) is None
+
+
+def test_capture_writes_the_readings_around_the_trigger(sim, tmp_path):
+    SimulatedHX711(sim, 5, 6, value=0, PIN_RATE=13)
+    amplifier = LoadCellAmplifier(5, 6, PIN_RATE=13)
+    amplifier.set_offset(1000)
+    amplifier.set_reference_unit(10)
+    load_cell = LoadCell(amplifier, filter=SpikeRejectionFilter(1, 0))
+    capture = TriggeredCapture(load_cell, [ForceDropTrigger(0.5)], str(tmp_path), PRE_SAMPLES=20,
+                               POST_SAMPLES=10)
+    forces = [float(i) for i in range(50)] + [10.0] * 15
+    for i, force in enumerate(forces):
+        assert capture.add(i * 0.1, round(1000 + 10 * force)) == pytest.approx(force)
+        if i == 50:
+            assert amplifier.RATE == 80
+    capture.wait()
+    assert amplifier.RATE == 10
+    assert len(capture.captures) == 1
+
+    with Recording(capture.captures[0]) as recording:
+        assert recording.metadata["pre_samples"] == 20
+        assert recording.metadata["trigger_time"] == pytest.approx(5.0)
+        times = recording.column("time").tolist()
+        assert times == pytest.approx([i * 0.1 for i in range(31, 61)])
+        assert recording.column("force").tolist() == pytest.approx(forces[31:61])
@@ -0,0 +1,133 @@
+"""Tests of the PI controller and of the closed-loop controller's update."""
+
+import pytest
+
+from controller import ClosedLoopController, ControlMode, PIController
+
+
+class FakeMotor:
+    def __init__(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+
+class FakeLinearActuator:
+    """Moves the carriage at exactly the commanded velocity."""
+    MAX_SPEED = 500
+
+    def __init__(self):
+        self.MOTOR = FakeMotor()
+        self.velocity = 0.0
+
+    def set_velocity(self, velocity):
+        self.MOTOR.enabled = True
+        self.velocity = velocity
+
+
+class Plant:
+    """A carriage pulling a specimen of stiffness STIFFNESS [force/mm]."""
+
+    def __init__(self, STIFFNESS=10.0):
+        self.STIFFNESS = STIFFNESS
+        self.linear_actuator = FakeLinearActuator()
+        self.position = 0.0
+        self.sensors = True
+
+    def make_controller(self, **limits):
+        return ClosedLoopController(self.linear_actuator, lambda: self.position if self.sensors else None,
+                                    lambda: self.STIFFNESS * self.position, **limits)
+
+    def run(self, controller, periods, dt=0.01):
+        for _ in range(periods):
+            self.now = getattr(self, "now", 0.0) + dt
+            controller.update(self.now, dt)
+            if self.linear_actuator.MOTOR.enabled:
+                self.position += self.linear_actuator.velocity * dt
+
+
+def test_proportional_and_integral_terms():
+    controller = PIController(KP=2.0, KI=0.5, OUTPUT_LIMIT=100)
+    assert controller.update(1.0, 0.1) == pytest.approx(2.0 + 0.5 * 0.1)
+    assert controller.update(1.0, 0.1, feedforward=3.0) == pytest.approx(3.0 + 2.0 + 0.5 * 0.2)
+
+
+def test_integral_removes_a_steady_state_error():
+    # First order plant driven by the controller output
+    controller = PIController(KP=1.0, KI=5.0, OUTPUT_LIMIT=100)
+    measurement = 0.0
+    for _ in range(2000):
+        output = controller.update(10.0 - measurement, 0.01)
+        measurement += (output - 0.5 * measurement) * 0.01
+    assert measurement == pytest.approx(10.0, abs=1e-3)
+
+
+def test_output_is_clamped_without_winding_up():
+    controller = PIController(KP=1.0, KI=1.0, OUTPUT_LIMIT=5.0)
+    for _ in range(100):
+        assert controller.update(100.0, 0.1) == 5.0
+    assert controller.integral == pytest.approx(0.0)
+    # Not having wound up, the output leaves saturation as soon as the error
+    # changes sign
+    assert controller.update(-1.0, 0.1) < 0
+
+
+def test_crosshead_rate_is_tracked():
+    plant = Plant()
+    controller = plant.make_controller()
+    controller.set_crosshead_rate(2.0)
+    plant.run(controller, 500)
+    assert controller.velocity == pytest.approx(2.0, rel=1e-3)
+    assert plant.position == pytest.approx(2.0 * 4.99, abs=0.05)
+    assert controller.fault is None
+
+
+def test_force_limit_stops_the_motor_and_only_backing_off_may_run():
+    plant = Plant()
+    controller = plant.make_controller(FORCE_LIMIT=50)
+    controller.set_crosshead_rate(5.0)
+    plant.run(controller, 200)
+    assert controller.fault.startswith("Force limit exceeded")
+    assert controller.mode == ControlMode.IDLE
+    assert not plant.linear_actuator.MOTOR.enabled
+    tripped_at = plant.position
+    assert tripped_at * plant.STIFFNESS > 50
+
+    # Loading further faults again without moving
+    controller.set_crosshead_rate(1.0)
+    plant.run(controller, 5)
+    assert controller.fault is not None
+    assert plant.position == tripped_at
+
+    # Unloading runs and leaves the limit behind
+    controller.set_crosshead_rate(-2.0)
+    plant.run(controller, 100)
+    assert controller.fault is None
+    assert controller.mode == ControlMode.CROSSHEAD_RATE
+    assert plant.position * plant.STIFFNESS < 50
+
+
+def test_travel_limit_allows_a_force_hold_backing_off():
+    plant = Plant()
+    controller = plant.make_controller(TRAVEL_LIMITS=(0, 3))
+    plant.position = 3.5
+    plant.run(controller, 1)
+    assert controller.fault.startswith("Travel limit exceeded")
+    controller.hold_force(20)   # At 2 mm
+    plant.run(controller, 3000)
+    assert controller.fault is None
+    assert plant.position == pytest.approx(2.0, abs=0.01)
+
+
+def test_missing_sensor_data_stops_the_motor():
+    plant = Plant()
+    controller = plant.make_controller()
+    plant.sensors = False
+    plant.run(controller, 3)
+    assert controller.fault is None     # Idle: nothing to stop
+    controller.set_crosshead_rate(1.0)
+    plant.run(controller, 1)
+    assert controller.fault == "Sensor data missing."
+    assert not plant.linear_actuator.MOTOR.enabled
+    assert controller.mode == ControlMode.IDLE
@@ -0,0 +1,85 @@
+"""Tests of the cyclic test summaries and the rainflow counter."""
+
+import math
+
+import pytest
+
+from cyclic import SUMMARY_FIELDS, CycleSummarizer, RainflowCounter, ReversalDetector
+
+
+class ListWriter:
+    """Collects the records written to it, like a Recorder."""
+
+    def __init__(self):
+        self.records = []
+
+    def write(self, *values):
+        self.records.append(values)
+
+
+def test_reversals_below_the_hysteresis_are_ignored():
+    detector = ReversalDetector(HYSTERESIS=1.0)
+    values = [0, 0.5, 2, 1.5, 3, 1.9, 1.5, 2.2, -1]
+    reversals = [reversal for reversal in map(detector.add, values) if reversal is not None]
+    assert reversals == [0, 3]
+    assert detector.rising is False
+
+
+def test_rainflow_counts_the_astm_example():
+    # ASTM E1049 example reversals
+    counter = RainflowCounter(BIN_WIDTH=1)
+    for reversal in (-2, 1, -3, 5, -1, 3, -4, 4, -2):
+        counter.add(reversal)
+    assert counter.cycles == 1
+    assert counter.histogram == {(4, 1): 1}
+    assert counter.residue == [-2, 1, -3, 5, -4, 4, -2]
+    assert counter.half_cycles()[3] == (9, 0.5)
+
+
+def sine_records(cycles, samples_per_cycle=100, stiffness=10.0, amplitude=1.0):
+    for i in range(cycles * samples_per_cycle + 1):
+        t = i / samples_per_cycle
+        displacement = -amplitude * math.cos(2 * math.pi * t)
+        yield t, stiffness * displacement, displacement
+
+
+def test_summaries_of_a_linear_specimen():
+    summaries = ListWriter()
+    captures = ListWriter()
+    summarizer = CycleSummarizer(HYSTERESIS=0.1, summaries=summaries, captures=captures, CAPTURE_INTERVAL=2)
+    summarizer.add(sine_records(5))
+    # The first valley starts the first cycle, the last one is still open
+    assert summarizer.cycles == 4
+    summary = dict(zip(SUMMARY_FIELDS, summaries.records[0]))
+    assert summary["stiffness"] == pytest.approx(10.0)
+    assert summary["stiffness_ratio"] == pytest.approx(1.0)
+    assert summary["peak_displacement"] == pytest.approx(1.0)
+    # A linear specimen dissipates no energy
+    assert summary["area"] == pytest.approx(0.0, abs=1e-9)
+    # Times are those of the samples confirming each valley, in order
+    times = [record[0] for record in summaries.records]
+    assert times == sorted(times) and len(set(times)) == 4
+    assert [record[-1] for record in summaries.records] == [False, True, False, True]
+    assert {record[1] for record in captures.records} == {2, 4}
+
+
+def test_hysteresis_loop_area():
+    # Force leading displacement by a quarter cycle encloses an ellipse of
+    # area pi * force amplitude * displacement amplitude
+    summarizer = CycleSummarizer(HYSTERESIS=0.1, FORCE_HYSTERESIS=0.1)
+    records = []
+    for i in range(3001):
+        t = i / 1000
+        displacement = -math.cos(2 * math.pi * t)
+        force = 2 * math.sin(2 * math.pi * t)
+        records.append((t, force, displacement))
+    summarizer.add(records)
+    assert summarizer.last_summary["area"] == pytest.approx(2 * math.pi, rel=1e-3)
+
+
+def test_empty_cycle_is_not_summarized():
+    summaries = ListWriter()
+    summarizer = CycleSummarizer(summaries=summaries)
+    summarizer._CycleSummarizer__end_cycle(1.0)
+    assert summarizer.cycles == 0
+    assert summaries.records == []
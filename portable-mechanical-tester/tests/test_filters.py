@@ -0,0 +1,65 @@
+"""Tests of the streaming load cell filters."""
+
+import random
+
+import numpy as np
+import pytest
+
+from filters import MedianFilter, MovingAverageFilter, SlidingWindow, SpikeRejectionFilter, TrimmedMeanFilter
+
+
+def original_measure(history, spikes):
+    """The spike rejection of the original LoadCell.getMeasure()."""
+    mean = sum(history) / len(history)
+    deltas = sorted(abs(value - mean) for value in history)
+    max_permitted_delta = deltas[-1] if len(deltas) < spikes else deltas[-spikes]
+    kept = [value for value in history if abs(value - mean) <= max_permitted_delta]
+    return sum(kept) / len(kept)
+
+
+def readings(count=300, seed=1):
+    generator = random.Random(seed)
+    values = [1000 + generator.gauss(0, 5) for _ in range(count)]
+    for i in range(0, count, 37):
+        values[i] += 500    # Spikes
+    return values
+
+
+def test_sliding_window_keeps_the_newest_values_sorted():
+    window = SlidingWindow(3)
+    for value in (5, 1, 4, 2):
+        window.append(value)
+    assert list(window) == [1, 4, 2]
+    assert window.sorted == [1, 2, 4]
+    assert window.sum == 7
+
+
+@pytest.mark.parametrize("spikes", [0, 1, 4, 30])
+def test_spike_rejection_matches_the_original_filter(spikes):
+    values = readings()
+    spike_filter = SpikeRejectionFilter(20, spikes)
+    for i, value in enumerate(values):
+        expected = original_measure(values[max(0, i - 19):i + 1], spikes)
+        assert spike_filter.update(value) == pytest.approx(expected)
+
+
+def test_spikes_are_rejected():
+    spike_filter = SpikeRejectionFilter(20, 4)
+    for value in [1000.0] * 19 + [1500.0]:
+        result = spike_filter.update(value)
+    assert result == pytest.approx(1000.0)
+
+
+@pytest.mark.parametrize("make_filter", [
+    lambda: SpikeRejectionFilter(20, 4),
+    lambda: SpikeRejectionFilter(20, 0),
+    lambda: MedianFilter(20),
+    lambda: MedianFilter(7),
+    lambda: TrimmedMeanFilter(20, 2),
+    lambda: MovingAverageFilter(20),
+])
+def test_batch_mode_matches_the_streaming_mode(make_filter):
+    values = readings()
+    streaming_filter = make_filter()
+    expected = [streaming_filter.update(value) for value in values]
+    np.testing.assert_allclose(make_filter().filter_array(values), expected)
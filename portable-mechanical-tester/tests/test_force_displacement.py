@@ -0,0 +1,53 @@
+"""Tests of the alignment of the force and encoder streams."""
+
+import pytest
+
+from force_displacement import ForceDisplacementAligner
+
+
+def make_aligner(**constants):
+    # 1 mm per 1000 counts
+    return ForceDisplacementAligner(SCREW_LEAD=1, COUNTS_PER_REVOLUTION=1000, **constants)
+
+
+def test_displacement_is_interpolated_at_the_force_time():
+    aligner = make_aligner()
+    aligner.add_position(0.0, 0)
+    aligner.add_force(0.25, 10.0)
+    assert aligner.pop_aligned() == []   # Waits for an encoder sample after the force
+    aligner.add_position(0.5, 1000)
+    (t, force, displacement), = aligner.pop_aligned()
+    assert (t, force) == (0.25, 10.0)
+    assert displacement == pytest.approx(0.5)
+
+
+def test_positions_are_bounded_without_forces():
+    aligner = make_aligner(MAX_POSITIONS=100)
+    for i in range(10000):
+        aligner.add_position(i * 0.001, i)
+        aligner.pop_aligned()
+    assert len(aligner._positions) == 100
+    aligner.add_force(9.9995, 1.0)
+    aligner.add_position(10.0, 10000)
+    (_, _, displacement), = aligner.pop_aligned()
+    assert displacement == pytest.approx(9.9995)
+
+
+def test_forces_without_positions_are_bounded():
+    aligner = make_aligner(MAX_PENDING=10)
+    for i in range(100):
+        aligner.add_force(i * 0.1, 1.0)
+        aligner.pop_aligned()
+    assert len(aligner._forces) == 10
+    assert aligner.dropped_samples == 90
+
+
+def test_stale_encoder_holds_the_last_position():
+    aligner = make_aligner(MAX_PENDING=2)
+    aligner.add_position(0.0, 500)
+    aligner.add_position(0.1, 500)
+    for i in range(3):
+        aligner.add_force(1.0 + i, 1.0)
+    aligned = aligner.pop_aligned()
+    assert len(aligned) == 1
+    assert aligner.held_samples == 1
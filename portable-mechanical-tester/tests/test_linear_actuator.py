@@ -0,0 +1,42 @@
+"""Tests of the linear actuator's velocity commands on the simulated motor."""
+
+import time
+
+from linear_actuator import LinearActuator
+from motor import Motor
+from simulator import SimulatedAMT102
+
+
+def wait_for(condition, timeout=10.0):
+    # The motor thread advances the virtual clock, so wait in real time
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.001)
+
+
+def test_reversal_stops_the_motor_before_switching_direction(sim):
+    encoder = SimulatedAMT102(sim, 9, 11, 10, PIN_PUL=21, PIN_DIR=20)
+    motor = Motor(20, 21)
+    linear_actuator = LinearActuator(motor)
+    moving_at_direction_changes = []
+    sim.watch(20, lambda level: moving_at_direction_changes.append(motor.moving))
+
+    linear_actuator.set_velocity(5)
+    wait_for(lambda: encoder.count > 400)
+    linear_actuator.set_velocity(-5)
+    assert linear_actuator.pending_direction == Motor.Direction.CCW
+    assert motor.direction == Motor.Direction.CW
+    assert linear_actuator.speed == 0
+    count_at_reversal = encoder.count
+
+    def reversed_():
+        linear_actuator.set_velocity(-5)
+        return encoder.count < count_at_reversal
+    wait_for(reversed_)
+    linear_actuator.set_velocity(0)
+    wait_for(lambda: not motor.moving)
+
+    assert linear_actuator.pending_direction is None
+    assert motor.direction == Motor.Direction.CCW
+    assert True not in moving_at_direction_changes
@@ -0,0 +1,75 @@
+"""Tests of the HX711 acquisition on the simulated amplifiers."""
+
+import pytest
+
+from load_cell import LoadCell, MultiChannelLoadCell
+from load_cell_amplifier import LoadCellAmplifier, MultiChannelLoadCellAmplifier
+from simulator import SimulatedHX711
+
+
+def test_read_samples_reads_consecutive_conversions(sim):
+    device = SimulatedHX711(sim, 5, 6, value=lambda t: round(1000 * t), RATE=80)
+    amplifier = LoadCellAmplifier(5, 6, RATE=80)
+    amplifier.set_offset(0)
+    amplifier.set_reference_unit(1)
+    dropped = amplifier.statistics.dropped_conversions
+    raw = amplifier.read_samples(16)
+    values = amplifier.convert(raw)
+    # One conversion every 1 / 80 s, none of them dropped
+    steps = values[1:] - values[:-1]
+    assert steps.tolist() == pytest.approx([12.5] * 15, abs=1)
+    assert amplifier.statistics.dropped_conversions == dropped
+    assert device.overwritten_conversions == 0
+
+
+def test_negative_conversions_are_converted(sim):
+    SimulatedHX711(sim, 5, 6, value=-5000)
+    amplifier = LoadCellAmplifier(5, 6)
+    amplifier.set_offset(1000)
+    amplifier.set_reference_unit(2)
+    assert amplifier.convert(amplifier.read_samples(2)).tolist() == [-3000, -3000]
+
+
+def test_late_reads_are_counted_as_dropped_conversions(sim):
+    SimulatedHX711(sim, 5, 6, value=0)
+    amplifier = LoadCellAmplifier(5, 6)
+    dropped = amplifier.statistics.dropped_conversions
+    amplifier.read()
+    sim.advance(0.35)
+    amplifier.read()
+    assert amplifier.statistics.dropped_conversions == dropped + 3
+
+
+def test_load_cell_filters_calibrated_readings(sim):
+    signal = [0]
+    SimulatedHX711(sim, 5, 6, value=lambda t: signal[0])
+    load_cell = LoadCell(LoadCellAmplifier(5, 6))
+    signal[0] = 2100
+    sim.advance(0.5)
+    assert load_cell.getWeight() == pytest.approx(100)
+
+
+def test_channels_sharing_a_clock_are_read_together(sim):
+    devices = [SimulatedHX711(sim, pin, 6, value=value) for pin, value in ((5, 1000), (13, -2000), (16, 30000))]
+    amplifier = MultiChannelLoadCellAmplifier((5, 13, 16), 6)
+    assert [channel.OFFSET for channel in amplifier.channels] == [1000, -2000, 30000]
+    assert amplifier.read() == [1000, -2000, 30000]
+    assert [device.samples_read for device in devices] == [devices[0].samples_read] * 3
+    # Reading each channel in turn reads the amplifiers once per round
+    samples_read = devices[0].samples_read
+    assert [amplifier.read_channel(index) for index in range(3)] == [1000, -2000, 30000]
+    assert devices[0].samples_read == samples_read
+    amplifier.read_channel(0)
+    assert devices[0].samples_read == samples_read + 1
+
+
+def test_multi_channel_load_cell_measures_every_channel(sim):
+    signals = [0, 0]
+    SimulatedHX711(sim, 5, 6, value=lambda t: signals[0])
+    SimulatedHX711(sim, 13, 6, value=lambda t: signals[1])
+    load_cell = MultiChannelLoadCell(MultiChannelLoadCellAmplifier((5, 13), 6), samples=5)
+    signals[:] = [210, -420]
+    sim.advance(0.5)
+    for _ in range(5):
+        measures = load_cell.getMeasures()
+    assert measures == pytest.approx([10, -20])
@@ -0,0 +1,138 @@
+"""Tests of the command line: the run subcommand's wiring on the simulated
+hardware, the other subcommands and the lazy imports.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from calibration import CalibrationProfile, CalibrationStore
+from conftest import PACKAGE_DIRECTORY
+from recorder import Recorder
+
+from simulator import SimulatedAMT102, SimulatedHX711, SimulatedSwitch
+
+
+def simulate_tester(sim, cli, tmp_path, monkeypatch):
+    monkeypatch.setenv("PMT_CALIBRATION", str(tmp_path / "calibration.json"))
+    SimulatedHX711(sim, *cli.LOAD_CELL_AMPLIFIER_PINS, value=lambda t: 100000)
+    encoder = SimulatedAMT102(sim, *cli.ROTARY_ENCODER_PINS)
+    for pin in (cli.BOTTOM_LIMIT_SWITCH_PIN, cli.TOP_LIMIT_SWITCH_PIN, 27, 17, 2, 7, 3):
+        SimulatedSwitch(sim, pin)
+    return encoder
+
+
+def release_buffers(tester):
+    for name in ("force_buffer", "position_buffer", "force_displacement_buffer"):
+        tester[name].close()
+        tester[name].unlink()
+
+
+def test_displacement_follows_the_encoder(sim, cli, tmp_path, monkeypatch):
+    encoder = simulate_tester(sim, cli, tmp_path, monkeypatch)
+    arguments = argparse.Namespace(protocol=None, force_limit=None, travel_limits=None, startup_target=None)
+    tester = cli.build_tester(arguments, cli.StartupTimer())
+    runtime = tester["runtime"]
+    tester["stream_server"].port = 0
+    force_buffer = tester["force_buffer"]
+    force_displacement_buffer = tester["force_displacement_buffer"]
+    displacements = []
+
+    async def move_carriage():
+        # The forked load cell process has a virtual clock of its own, so
+        # keep this one ahead of its readings for them to be aligned
+        for _ in range(200):
+            await asyncio.sleep(0.02)
+            if force_buffer.head:
+                sim.advance(max(0.0, force_buffer.latest()["time"] - sim.monotonic()) + 0.01)
+            encoder.rotate(100)
+            if force_displacement_buffer.head:
+                displacements.append(force_displacement_buffer.latest()["displacement"])
+                if displacements[-1] != displacements[0]:
+                    break
+        runtime.stop()
+
+    runtime.add_task("move_carriage", move_carriage)
+    try:
+        runtime.run()
+    finally:
+        tester["motor"].disable()
+        release_buffers(tester)
+    assert tester["rotary_encoder"].position > 0
+    assert len(displacements) > 1
+    assert displacements[-1] > displacements[0]
+
+
+def test_protocol_controller_reads_only_recent_records_within_the_limits(sim, cli, tmp_path, monkeypatch):
+    simulate_tester(sim, cli, tmp_path, monkeypatch)
+    path = tmp_path / "protocol.json"
+    path.write_text(json.dumps({"stages": [{"type": "ramp", "rate": 1, "until": "displacement >= 5"}]}))
+    arguments = argparse.Namespace(protocol=str(path), force_limit=100, travel_limits=[-1, 10],
+                                   startup_target=None)
+    tester = cli.build_tester(arguments, cli.StartupTimer())
+    try:
+        controller = tester["protocol_runner"].controller
+        assert controller.FORCE_LIMIT == 100
+        assert controller.TRAVEL_LIMITS == (-1, 10)
+        tester["force_displacement_buffer"].write(sim.monotonic(), 12.5, 0.25)
+        assert (controller.force(), controller.position()) == (12.5, 0.25)
+        # A stalled load cell process leaves only stale records
+        sim.advance(1.0)
+        assert (controller.force(), controller.position()) == (None, None)
+    finally:
+        tester["motor"].disable()
+        release_buffers(tester)
+
+
+def test_analyze_passes_its_arguments_to_the_analysis(cli, tmp_path, capsys):
+    path = str(tmp_path / "test.pmt")
+    strain = np.linspace(0, 0.02, 2000)
+    stress = np.minimum(200000 * strain, 300) * (strain < 0.015)
+    with Recorder(path) as recorder:
+        for i, (force, displacement) in enumerate(zip(10 * stress, 50 * strain)):
+            recorder.write(i * 0.01, 0, float(force), 0, float(displacement))
+    assert cli.main(["analyze", path, "--area", "10", "--gauge-length", "50", "--jobs", "1"]) == 0
+    properties = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert properties["recording"] == path
+    assert properties["ultimate_strength"] == pytest.approx(300)
+
+
+def test_unknown_arguments_are_rejected(cli):
+    with pytest.raises(SystemExit) as error:
+        cli.main(["tare", "--area", "10"])
+    assert error.value.code == 2
+
+
+def test_tare_updates_the_stored_offset(sim, cli, tmp_path, capsys):
+    path = str(tmp_path / "calibration.json")
+    SimulatedHX711(sim, *cli.LOAD_CELL_AMPLIFIER_PINS, value=lambda t: 1234)
+    assert cli.main(["tare", "--calibration", path, "--times", "3"]) == 1
+    assert "run the calibrate subcommand first" in capsys.readouterr().out
+
+    CalibrationStore(path).save(CalibrationProfile("load_cell", OFFSET=1000, REFERENCE_UNIT=2))
+    assert cli.main(["tare", "--calibration", path, "--times", "3"]) == 0
+    profile = CalibrationStore(path).load("load_cell")
+    assert profile.OFFSET == pytest.approx(1234)
+    assert profile.REFERENCE_UNIT == 2
+
+
+def test_analyze_imports_no_device_module():
+    # The same check as a user's "python portable-mechanical-tester analyze"
+    code = ("import runpy, sys\n"
+            "sys.argv = ['portable-mechanical-tester', 'analyze', '--help']\n"
+            "try:\n"
+            "    runpy.run_path(" + repr(PACKAGE_DIRECTORY) + ", run_name='__main__')\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(sorted(set(sys.modules) & {'gpio', 'motor', 'load_cell_amplifier', 'rotary_encoder', "
+            "'runtime', 'streaming'}))\n")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            env=dict(os.environ, PYTHONPATH=PACKAGE_DIRECTORY)).stdout
+    assert "Computes the material properties" in output
+    assert output.splitlines()[-1] == "[]"
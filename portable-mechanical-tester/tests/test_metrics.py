@@ -0,0 +1,59 @@
+"""Tests of the metrics instrumentation and exporters."""
+
+import json
+import random
+
+import pytest
+
+from metrics import Histogram, MetricsRegistry, to_prometheus
+
+
+def test_histogram_percentiles_are_within_one_percent():
+    histogram = Histogram("latency")
+    generator = random.Random(0)
+    values = sorted(generator.lognormvariate(-9, 1) for _ in range(10000))
+    for value in values:
+        histogram.record(value)
+    for percentile in (50, 90, 99):
+        expected = values[int(len(values) * percentile / 100) - 1]
+        assert histogram.percentile(percentile) == pytest.approx(expected, rel=0.01)
+    assert histogram.max == values[-1]
+    assert histogram.min == values[0]
+
+
+def test_registry_reuses_metrics_by_name_and_type():
+    registry = MetricsRegistry()
+    assert registry.counter("reads") is registry.counter("reads")
+    with pytest.raises(ValueError):
+        registry.histogram("reads")
+
+
+def test_snapshot_is_exported_as_prometheus_text():
+    class Device:
+        dropped_conversions = 3
+
+    registry = MetricsRegistry("load_cell")
+    registry.counter("reads").inc(5)
+    registry.gauge("dropped", Device(), "dropped_conversions")
+    registry.histogram("read_seconds").record(0.001)
+    snapshot = json.loads(json.dumps(registry.snapshot()))
+    lines = to_prometheus([snapshot]).splitlines()
+    assert 'pmt_reads_total{process="load_cell"} 5' in lines
+    assert 'pmt_dropped{process="load_cell"} 3' in lines
+    assert 'pmt_read_seconds_count{process="load_cell"} 1' in lines
+    assert any(line.startswith('pmt_read_seconds{process="load_cell",quantile="0.99"} 0.00') for line in lines)
+
+
+def test_histogram_resolution_follows_sub_buckets():
+    class CoarseHistogram(Histogram):
+        SUB_BUCKETS = 16
+
+    histogram = CoarseHistogram("latency")
+    generator = random.Random(0)
+    values = sorted(generator.lognormvariate(-9, 1) for _ in range(10000))
+    for value in values:
+        histogram.record(value)
+    for percentile in (50, 90, 99):
+        expected = values[int(len(values) * percentile / 100) - 1]
+        assert histogram.percentile(percentile) == pytest.approx(expected, rel=1 / 16)
+    assert histogram.percentile(100) <= values[-1] * (1 + 1 / 16)
@@ -0,0 +1,85 @@
+"""Tests of the carriage position tracking and planned moves on the simulated
+motor and encoder.
+"""
+
+import time
+
+import pytest
+
+from linear_actuator import LinearActuator
+from motion_planner import MotionPlanner, move_schedule
+from motor import Motor
+from rotary_encoder import RotaryEncoder
+from simulator import SimulatedAMT102
+
+
+def wait_for(condition, timeout=10.0):
+    # The motor thread advances the virtual clock, so wait in real time
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.001)
+
+
+def make_planner(sim, coupled=True, **kwargs):
+    coupling = {"PIN_PUL": 21, "PIN_DIR": 20} if coupled else {}
+    device = SimulatedAMT102(sim, 9, 11, 10, **coupling)
+    motor = Motor(20, 21)
+    planner = MotionPlanner(LinearActuator(motor, speed=5), RotaryEncoder(9, 11, 10), **kwargs)
+    return device, motor, planner
+
+
+def test_move_by_emits_the_exact_steps_and_the_encoder_agrees(sim):
+    _, motor, planner = make_planner(sim)
+    assert planner.move_by(2.0)
+    wait_for(lambda: not motor.moving)
+    assert planner.position == pytest.approx(2.0)
+    assert planner.encoder_position == pytest.approx(2.0, abs=0.01)
+    assert planner.fault is None
+
+    assert planner.move_to(0.5)
+    wait_for(lambda: not motor.moving)
+    assert planner.position == pytest.approx(0.5)
+    assert planner.max_position_error < planner.MAX_POSITION_ERROR
+
+
+def test_targets_outside_the_travel_limits_are_refused_once_homed(sim):
+    _, motor, planner = make_planner(sim, TRAVEL_LIMITS=(0, 10))
+    planner.set_position(1)
+    assert planner.move_by(-2)      # Not homed: the envelope is not known yet
+    wait_for(lambda: not motor.moving)
+    planner.homed = True
+    assert not planner.move_to(11)
+    assert not planner.move_by(-0.5)
+    assert planner.position == pytest.approx(-1)
+
+
+def test_lost_steps_stop_a_planned_move(sim):
+    _, motor, planner = make_planner(sim, coupled=False, CHECK_STEPS=16)
+    assert planner.move_by(5.0)
+    wait_for(lambda: not motor.moving)
+    assert planner.fault is not None
+    assert not motor.enabled
+    # Stopped at the first check past MAX_POSITION_ERROR
+    assert 0 < planner.position <= 2 * planner.CHECK_STEPS / 40
+    assert not planner.move_by(1.0)
+
+    planner.reset()
+    assert planner.fault is None
+    assert planner.position == pytest.approx(0, abs=0.025)
+
+
+def test_check_latches_a_fault_when_the_carriage_slips(sim):
+    device, motor, planner = make_planner(sim)
+    device.rotate(round(0.2 * planner._counts_per_mm))
+    assert not planner.check()
+    assert planner.max_position_error == pytest.approx(0.2, abs=0.01)
+    assert "Lost steps" in planner.fault
+
+
+def test_move_schedules_are_cached():
+    move_schedule.cache_clear()
+    first = move_schedule(400, 1000, 5000, 100, "trapezoidal")
+    assert move_schedule(400, 1000, 5000, 100, "trapezoidal") is first
+    assert len(first) == 399
+    assert move_schedule.cache_info().hits == 1
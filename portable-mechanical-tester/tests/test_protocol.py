@@ -0,0 +1,168 @@
+"""Tests of the protocol compilation and of the ProtocolRunner."""
+
+import json
+
+import pytest
+
+from controller import ControlMode
+from linear_actuator import LinearActuator
+from motor import Motor
+import protocol
+from protocol import ProtocolRunner, compile_protocol, parse_condition
+
+TENSILE_TEST = {
+    "name": "Tensile test",
+    "gauge_length": 50,
+    "stages": [
+        {"name": "preload", "type": "ramp", "rate": 0.5, "until": "force >= 10"},
+        {"name": "pull", "type": "ramp", "strain_rate": 0.001,
+         "until": ["force <= 50% peak", "displacement >= 40"]},
+        {"name": "hold", "type": "hold", "force": 5, "duration": 30},
+        {"name": "back off", "type": "move", "distance": -2, "speed": 5},
+        {"name": "unload", "type": "move", "to": 0},
+    ],
+}
+
+
+@pytest.fixture
+def linear_actuator(sim):
+    return LinearActuator(Motor(20, 21), speed=5)
+
+
+def test_protocol_compiles_to_setpoints_conditions_and_schedules(linear_actuator):
+    plan = compile_protocol(TENSILE_TEST, linear_actuator)
+    assert plan.name == "Tensile test"
+    assert plan.gauge_length == 50.0
+    preload, pull, hold, back_off, unload = plan.stages
+    assert (preload.mode, preload.setpoint) == (ControlMode.CROSSHEAD_RATE, 0.5)
+    assert (pull.mode, pull.setpoint) == (ControlMode.STRAIN_RATE, 0.001)
+    assert [condition.text for condition in pull.conditions] == ["force <= 50% peak", "displacement >= 40"]
+    assert pull.conditions[0].of_peak
+    assert (hold.mode, hold.setpoint) == (ControlMode.FORCE_HOLD, 5.0)
+    assert hold.conditions[0].quantity == "time" and hold.conditions[0].threshold == 30.0
+    # 2 mm at 40 steps/mm, scheduled once at compile time
+    assert back_off.move.direction == Motor.Direction.CCW
+    assert len(back_off.move.intervals) + 1 == 80
+    assert unload.move.target == 0.0 and unload.move.intervals is None
+    assert unload.move.speed == linear_actuator.speed
+
+
+@pytest.mark.parametrize("text, quantity, threshold, of_peak", [
+    ("force >= 10", "force", 10.0, False),
+    (" displacement<-1.5e1 ", "displacement", -15.0, False),
+    ("time > .5", "time", 0.5, False),
+    ("force <= 50 % peak", "force", 50.0, True),
+])
+def test_conditions_are_parsed(text, quantity, threshold, of_peak):
+    condition = parse_condition(text)
+    assert (condition.quantity, condition.threshold, condition.of_peak) == (quantity, threshold, of_peak)
+
+
+@pytest.mark.parametrize("text", ["force = 10", "strain >= 1", "force >= ten", "time >= 50% peak"])
+def test_malformed_conditions_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse_condition(text)
+
+
+@pytest.mark.parametrize("stages, location", [
+    ([], "stages"),
+    ([{"type": "jump"}], "stages[0].type"),
+    ([{"type": "ramp", "rate": 1, "until": "force >= 1", "speed": 2}], "stages[0].speed"),
+    ([{"type": "ramp", "rate": 1}], "stages[0]: a ramp stage needs"),
+    ([{"type": "ramp", "rate": 1, "strain_rate": 0.1, "until": "time > 1"}], "stages[0]: expected either"),
+    ([{"type": "hold", "duration": 1}, {"type": "ramp", "strain_rate": 0.1, "until": "time > 1"}],
+     "stages[1].strain_rate: 'gauge_length' is required"),
+    ([{"type": "ramp", "rate": 600, "until": "time > 1"}], "exceeds"),
+    ([{"type": "hold", "force": "5", "duration": 1}], "stages[0].force: expected a number"),
+    ([{"type": "hold", "duration": 0}], "stages[0].duration: expected a positive number"),
+    ([{"type": "hold", "until": ["force >= 1", "force ~ 2"]}], "stages[0].until[1]"),
+    ([{"type": "move", "distance": 1, "to": 2}], "stages[0]: expected either 'distance' or 'to'"),
+])
+def test_invalid_protocols_are_located(linear_actuator, stages, location):
+    with pytest.raises(ValueError) as error:
+        compile_protocol({"stages": stages}, linear_actuator)
+    assert location in str(error.value)
+
+
+def test_main_validates_protocol_files(tmp_path, capsys):
+    valid = tmp_path / "tensile.json"
+    valid.write_text(json.dumps(TENSILE_TEST))
+    invalid = tmp_path / "invalid.json"
+    invalid.write_text(json.dumps({"stages": [{"type": "ramp"}]}))
+    assert protocol.main([str(valid)]) == 0
+    output = capsys.readouterr().out
+    assert "Protocol 'Tensile test', gauge length 50.0 mm" in output
+    assert "(80 steps scheduled)" in output
+    assert protocol.main([str(valid), str(invalid)]) == 1
+    assert "ERROR: " + str(invalid) + ": stages[0]" in capsys.readouterr().out
+
+
+class FakeController:
+    """Records the setpoints and serves the force and displacement."""
+
+    def __init__(self, linear_actuator):
+        self.linear_actuator = linear_actuator
+        self.fault = None
+        self.setpoints = []
+        self.force_value = 0.0
+        self.position_value = 0.0
+
+    def force(self):
+        return self.force_value
+
+    def position(self):
+        return self.position_value
+
+    def start(self):
+        pass
+
+    def idle(self):
+        self.setpoints.append((ControlMode.IDLE, None))
+
+    def set_crosshead_rate(self, rate):
+        self.setpoints.append((ControlMode.CROSSHEAD_RATE, rate))
+
+    def set_strain_rate(self, rate):
+        self.setpoints.append((ControlMode.STRAIN_RATE, rate))
+
+    def hold_force(self, force):
+        self.setpoints.append((ControlMode.FORCE_HOLD, force))
+
+
+def test_runner_moves_through_the_stages_on_their_conditions(sim, linear_actuator):
+    stages = TENSILE_TEST["stages"][:3]
+    plan = compile_protocol(dict(TENSILE_TEST, stages=stages), linear_actuator)
+    controller = FakeController(linear_actuator)
+    runner = ProtocolRunner(plan, controller)
+    runner.start()
+    assert runner.stage.name == "preload"
+    for force in (2, 5, 10):
+        controller.force_value = force
+        runner.update()
+    assert runner.stage.name == "pull"
+    for force in (20, 100, 60, 49):
+        controller.force_value = force
+        runner.update()
+    assert runner.stage.name == "hold"
+    sim.advance(29)
+    runner.update()
+    assert runner.running
+    sim.advance(2)
+    runner.update()
+    assert not runner.running
+    assert [transition.reason for transition in runner.transitions] == [
+        "Start", "force >= 10", "force <= 50% peak", "time >= 30.0"]
+    assert [mode for mode, _ in controller.setpoints] == [
+        ControlMode.CROSSHEAD_RATE, ControlMode.STRAIN_RATE, ControlMode.FORCE_HOLD, ControlMode.IDLE]
+
+
+def test_controller_fault_aborts_the_protocol(sim, linear_actuator):
+    plan = compile_protocol(TENSILE_TEST, linear_actuator)
+    controller = FakeController(linear_actuator)
+    runner = ProtocolRunner(plan, controller)
+    runner.start()
+    controller.fault = "Force limit exceeded"
+    runner.update()
+    assert not runner.running
+    assert runner.fault == "Force limit exceeded"
+    assert runner.report()["transitions"][-1]["reason"] == "Fault: Force limit exceeded"
@@ -0,0 +1,53 @@
+"""Tests of the recording file format."""
+
+import csv
+
+import pytest
+
+from recorder import Recorder, Recording, export_csv
+
+
+def write_recording(path, records=3000, **options):
+    calibration = {"OFFSET": 100.0, "REFERENCE_UNIT": 2.0, "GAIN": 128, "SCREW_LEAD": 5}
+    with Recorder(str(path), calibration=calibration, **options) as recorder:
+        for i in range(records):
+            t = i * 0.001
+            recorder.write(t, 100 + 2 * i, float(i), 4 * i, i * 5 / 8192)
+
+
+def test_records_round_trip(tmp_path):
+    path = tmp_path / "test.pmt"
+    write_recording(path, BLOCK_RECORDS=256, INDEX_INTERVAL=4)
+    with Recording(str(path)) as recording:
+        assert len(recording) == 3000
+        assert recording.calibration["REFERENCE_UNIT"] == 2.0
+        assert recording.column("raw").tolist() == [100 + 2 * i for i in range(3000)]
+        between = recording.between(1.0, 1.5)
+        assert between["position"][0] == 4000
+        assert len(between["time"]) == 500
+
+
+def test_close_releases_the_memory_map(tmp_path):
+    path = tmp_path / "test.pmt"
+    write_recording(path, records=10)
+    recording = Recording(str(path))
+    recording.close()
+    assert recording._map is None
+    assert recording._file.closed
+
+
+def test_empty_file_is_not_a_recording(tmp_path):
+    path = tmp_path / "empty.pmt"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        Recording(str(path))
+
+
+def test_export_csv(tmp_path):
+    path = tmp_path / "test.pmt"
+    write_recording(path, records=10)
+    export_csv(str(path), str(tmp_path / "test.csv"))
+    with open(tmp_path / "test.csv", newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == list(Recorder.RECORD_FIELDS)
+    assert len(rows) == 11
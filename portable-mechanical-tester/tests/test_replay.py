@@ -0,0 +1,82 @@
+"""Tests of replaying recordings through the load cell and encoder code."""
+
+import csv
+
+import pytest
+
+from recorder import Recorder
+import replay
+
+
+def write_recording(path, records=500):
+    calibration = {"OFFSET": 100.0, "REFERENCE_UNIT": 2.0, "GAIN": 128, "SCREW_LEAD": 5}
+    with Recorder(str(path), calibration=calibration) as recorder:
+        for i in range(records):
+            # Every 10th reading is a spike
+            raw = 100 + 2 * i + (10000 if i % 10 == 5 else 0)
+            recorder.write(i * 0.001, raw, float(i), 4 * i, i * 5 / 8192)
+
+
+def read_rows(path):
+    with open(path, newline="") as file:
+        return list(csv.DictReader(file))
+
+
+def test_replay_reproduces_the_recorded_positions(tmp_path):
+    path = tmp_path / "test.pmt"
+    write_recording(path)
+    output = tmp_path / "replay.csv"
+    summary = replay.replay(str(path), str(output), samples=4, spikes=1)
+    assert summary["records"] == 500
+    assert summary["invalid_transitions"] == 0
+    rows = read_rows(output)
+    assert [int(row["position"]) for row in rows] == [4 * i for i in range(500)]
+    assert float(rows[-1]["displacement"]) == pytest.approx(4 * 499 / 8192 * 5)
+    # Replays are deterministic
+    second_output = tmp_path / "second.csv"
+    replay.replay(str(path), str(second_output), samples=4, spikes=1)
+    assert second_output.read_text() == output.read_text()
+
+
+def test_replay_many_in_worker_processes_matches_serial_replays(tmp_path):
+    paths = []
+    for name in ("first", "second"):
+        paths.append(str(tmp_path / (name + ".pmt")))
+        write_recording(paths[-1], records=200)
+    serial = replay.replay_many(paths, str(tmp_path / "serial"), jobs=1, samples=4, spikes=1)
+    parallel = replay.replay_many(paths, str(tmp_path / "parallel"), jobs=2, samples=4, spikes=1)
+    assert parallel == serial
+    assert [summary["recording"] for summary in parallel] == paths
+    for name in ("first", "second"):
+        assert ((tmp_path / "parallel" / (name + ".csv")).read_text()
+                == (tmp_path / "serial" / (name + ".csv")).read_text())
+
+
+def test_replay_many_refuses_outputs_with_the_same_name(tmp_path):
+    paths = []
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        paths.append(str(tmp_path / directory / "test.pmt"))
+        write_recording(paths[-1], records=10)
+    with pytest.raises(ValueError):
+        replay.replay_many(paths, str(tmp_path / "output"), jobs=1)
+
+
+@pytest.mark.parametrize("filter", sorted(replay.FILTERS))
+def test_every_filter_choice_replays(tmp_path, capsys, filter):
+    path = tmp_path / "test.pmt"
+    write_recording(path, records=100)
+    assert replay.main([str(path), "--output", str(tmp_path), "--filter", filter, "--samples", "5",
+                        "--spikes", "2", "--jobs", "1"]) == 0
+    assert "100 records" in capsys.readouterr().out
+    forces = [float(row["force"]) for row in read_rows(tmp_path / "test.csv")]
+    assert len(forces) == 100
+    if filter != "average":
+        # The robust filters reject the spike of 5000 force units
+        assert max(forces) < 150
+
+
+def test_unknown_filter_is_rejected(tmp_path):
+    with pytest.raises(SystemExit) as error:
+        replay.main([str(tmp_path / "test.pmt"), "--filter", "kalman"])
+    assert error.value.code == 2
@@ -0,0 +1,122 @@
+"""Tests of the rotary encoder decoding on the simulated AMT102 and of the
+velocity estimation.
+"""
+
+import pytest
+
+from rotary_encoder import RotaryEncoder, VelocityEstimator
+from shared_ring_buffer import SharedRingBuffer
+from simulator import SimulatedAMT102
+
+
+def make_encoder(sim):
+    device = SimulatedAMT102(sim, 9, 11, 10)
+    return device, RotaryEncoder(9, 11, 10)
+
+
+def test_transitions_count_each_edge_in_both_directions(sim):
+    device, encoder = make_encoder(sim)
+    device.rotate(10)
+    assert encoder.position == 10
+    device.rotate(-25)
+    assert encoder.position == -15
+    assert encoder.invalid_transitions == 0
+
+
+def test_transition_table_is_antisymmetric_and_rejects_double_changes():
+    transitions = RotaryEncoder.TRANSITIONS
+    for previous in range(4):
+        for state in range(4):
+            change = transitions[(previous << 2) | state]
+            assert change == -transitions[(state << 2) | previous]
+            if previous ^ state == 0b11:
+                assert change == 0
+
+
+def test_invalid_transition_is_counted_not_decoded(sim):
+    _, encoder = make_encoder(sim)
+    encoder.update(0, 0)
+    encoder.update(1, 1)
+    assert encoder.position == 0
+    assert encoder.invalid_transitions == 1
+
+
+def test_index_pulse_detects_lost_counts(sim):
+    device, encoder = make_encoder(sim)
+    device.rotate(device.counts_per_revolution)
+    encoder.position -= 3   # Edges missed between two index pulses
+    device.rotate(device.counts_per_revolution)
+    assert encoder.lost_counts == 3
+
+
+def test_publish_writes_the_current_position(sim):
+    device, encoder = make_encoder(sim)
+    buffer = SharedRingBuffer(RotaryEncoder.RECORD_FIELDS, RotaryEncoder.RECORD_FORMAT)
+    try:
+        device.rotate(40)
+        encoder.publish(buffer)
+        first = buffer.latest()
+        sim.advance(0.01)
+        device.rotate(-10)
+        encoder.publish(buffer)
+        second = buffer.latest()
+    finally:
+        buffer.close()
+        buffer.unlink()
+    assert first["position"] == 40
+    assert second["position"] == 30
+    assert second["time"] > first["time"]
+
+
+def simulate(estimator, position_of, duration, update_period=0.001, edge_period=1e-5):
+    """Feeds the estimator the last edge before each update of an encoder
+    whose position is position_of(t), rounded down to whole counts.
+    """
+    edge = None
+    t = 0.0
+    updates = int(round(duration / update_period))
+    for i in range(1, updates + 1):
+        t = i * update_period
+        # Search the last count change before t
+        position = int(position_of(t))
+        if edge is None or position != edge[1]:
+            edge_time = t
+            while edge_time > 0 and int(position_of(edge_time - edge_period)) == position:
+                edge_time -= edge_period
+            edge = (edge_time, position)
+        estimator.update(t, edge)
+    return t
+
+
+def test_constant_velocity_is_measured_exactly_at_any_speed():
+    for velocity in (10000.0, 500.0, 40.0):
+        estimator = VelocityEstimator(TIME_CONSTANT=0)
+        simulate(estimator, lambda t: velocity * t, 0.5)
+        assert estimator.raw_velocity == pytest.approx(velocity, rel=0.01)
+
+
+def test_velocity_decays_to_zero_when_the_edges_stop():
+    estimator = VelocityEstimator(TIME_CONSTANT=0, MAX_EDGE_INTERVAL=0.5)
+    simulate(estimator, lambda t: 1000 * min(t, 0.2), 0.25)
+    # Bounded by one count over the time since the last edge
+    assert 0 < estimator.raw_velocity <= 1 / 0.049
+    simulate(estimator, lambda t: 200, 0.8)
+    assert estimator.velocity == 0
+
+
+def test_acceleration_is_the_derivative_of_the_velocity():
+    estimator = VelocityEstimator(SCALE=0.5, TIME_CONSTANT=0.01)
+    simulate(estimator, lambda t: 10000 * t * t / 2, 0.5)
+    assert estimator.velocity == pytest.approx(0.5 * 5000, rel=0.02)
+    assert estimator.acceleration == pytest.approx(0.5 * 10000, rel=0.05)
+
+
+def test_encoder_edges_feed_the_estimator(sim):
+    device, encoder = make_encoder(sim)
+    estimator = VelocityEstimator(TIME_CONSTANT=0)
+    for _ in range(100):
+        for _ in range(4):
+            sim.advance(0.00025)
+            device.rotate(1)
+        estimator.update(sim.monotonic(), encoder.last_edge)
+    assert estimator.velocity == pytest.approx(4000, rel=0.01)
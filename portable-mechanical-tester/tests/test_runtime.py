@@ -0,0 +1,133 @@
+"""Tests of the Runtime's event loop, tasks and processes."""
+
+import asyncio
+import threading
+import time
+
+from runtime import Runtime, initialize
+from shared_ring_buffer import SharedRingBuffer
+
+
+class Counter:
+    """A process target counting into a ring buffer until stopped."""
+
+    def __init__(self):
+        self.enabled = True
+
+    def run(self, buffer):
+        count = 0
+        while self.enabled:
+            count += 1
+            buffer.write(time.monotonic(), count)
+            time.sleep(0.001)
+
+    def stop(self):
+        self.enabled = False
+
+
+def stop_after(runtime, seconds):
+    async def stop():
+        await asyncio.sleep(seconds)
+        runtime.stop()
+    runtime.add_task("stop_after", stop)
+
+
+def test_events_are_handled_one_at_a_time_in_order():
+    runtime = Runtime()
+    handled = []
+
+    async def slow_handler(value):
+        await asyncio.sleep(0.001)
+        handled.append(("slow", value))
+
+    def failing_handler(value):
+        raise RuntimeError("Handler failure")
+
+    runtime.on("press", slow_handler)
+    runtime.on("press", failing_handler)
+    runtime.on("press", lambda value: handled.append(("fast", value)))
+
+    async def post_from_threads():
+        await asyncio.sleep(0.01)
+        for value in range(3):
+            thread = threading.Thread(target=runtime.callback("press"), args=(value,))
+            thread.start()
+            thread.join()
+        await asyncio.sleep(0.05)
+        runtime.stop()
+
+    runtime.add_task("post", post_from_threads)
+    runtime.run()
+    assert handled == [(name, value) for value in range(3) for name in ("slow", "fast")]
+    assert runtime.statistics["event:press"].runs == 3
+    assert runtime.statistics["event:press"].errors == 3
+
+
+def test_periodic_task_runs_on_its_period():
+    runtime = Runtime()
+    calls = []
+    runtime.add_periodic("tick", lambda: calls.append(time.monotonic()), 0.01)
+    stop_after(runtime, 0.2)
+    runtime.run()
+    assert 15 <= len(calls) <= 21
+    assert runtime.statistics["tick"].runs == len(calls)
+
+
+def test_failing_task_is_reported_and_the_others_keep_running():
+    runtime = Runtime()
+    calls = []
+
+    async def fail():
+        raise ValueError("Task failure")
+
+    runtime.add_task("fail", fail)
+    runtime.add_periodic("tick", lambda: calls.append(None), 0.01)
+    stop_after(runtime, 0.05)
+    runtime.run()
+    assert runtime.statistics["fail"].errors == 1
+    assert len(calls) > 1
+
+
+def test_processes_are_stopped_with_the_runtime():
+    buffer = SharedRingBuffer(("time", "count"), "dq")
+    try:
+        runtime = Runtime(PROCESS_JOIN_TIMEOUT=2)
+        runtime.add_process("counter", Counter().run, buffer)
+        stop_after(runtime, 0.5)
+        runtime.run()
+        process = runtime.processes["counter"]
+        assert not process.is_alive()
+        assert process.exitcode == 0
+        assert buffer.head > 0
+    finally:
+        buffer.close()
+        buffer.unlink()
+
+
+def test_devices_are_initialized_concurrently():
+    def slow_device():
+        time.sleep(0.2)
+        return object()
+
+    devices, startup_times = initialize({"a": slow_device, "b": slow_device, "c": slow_device})
+    assert set(devices) == {"a", "b", "c"}
+    assert startup_times["total"] < 0.5
+
+
+def test_serial_devices_are_initialized_alone_on_the_calling_thread():
+    finished = []
+
+    def slow_device():
+        time.sleep(0.1)
+        finished.append(time.perf_counter())
+        return object()
+
+    def bit_banging_device():
+        assert threading.current_thread() is threading.main_thread()
+        assert not any(thread.name.startswith("ThreadPoolExecutor") for thread in threading.enumerate())
+        return time.perf_counter()
+
+    devices, startup_times = initialize({"a": slow_device, "b": slow_device}, serial={"hx711": bit_banging_device})
+    assert set(devices) == {"a", "b", "hx711"}
+    assert devices["hx711"] > max(finished)
+    assert set(startup_times) == {"a", "b", "hx711", "total"}
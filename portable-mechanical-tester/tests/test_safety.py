@@ -0,0 +1,49 @@
+"""Tests of the limit switch interlock on the simulated hardware."""
+
+from motor import Motor
+from safety import SafetyInterlock
+from simulator import SimulatedSwitch
+
+
+def make_interlock(sim):
+    switches = {pin: SimulatedSwitch(sim, pin) for pin in (19, 26)}
+    motor = Motor(20, 21)
+    interlock = SafetyInterlock(motor, {19: Motor.Direction.CCW, 26: Motor.Direction.CW})
+    return motor, interlock, switches
+
+
+def test_limit_switch_halts_the_pulses_within_the_latency(sim):
+    motor, interlock, switches = make_interlock(sim)
+    motor.set_direction(Motor.Direction.CW)
+    switches[26].press_at(sim.monotonic() + 0.05)
+    steps = motor.step_generator.run_schedule([0.001] * 1000, lambda: True)
+    assert 49 <= steps <= 52
+    assert interlock.tripped
+    assert not motor.enabled
+    trip, = interlock.trips
+    assert trip.pin == 26
+    assert trip.latency <= interlock.MAX_LATENCY
+    assert interlock.late_trips == 0
+
+
+def test_motor_can_move_away_from_a_pressed_switch(sim):
+    motor, interlock, switches = make_interlock(sim)
+    switches[19].press()
+    assert not interlock.tripped     # The motor is turning CW, away from it
+    motor.set_direction(Motor.Direction.CCW)
+    assert motor.step_generator.run_schedule([0.001] * 10, lambda: True) == 0
+    assert interlock.fault == "Limit switch on pin 19 reached."
+    assert interlock.late_trips == 0
+    interlock.reset()
+    motor.set_direction(Motor.Direction.CW)
+    assert motor.step_generator.run_schedule([0.001] * 10, lambda: True) == 11
+    assert not interlock.tripped
+
+
+def test_switch_edge_trips_the_interlock_directly(sim):
+    motor, interlock, switches = make_interlock(sim)
+    motor.set_direction(Motor.Direction.CW)
+    switches[26].press(bounces=3)
+    assert interlock.tripped
+    assert len(interlock.trips) == 1
+    assert interlock.trips[0].latency == 0
@@ -0,0 +1,71 @@
+"""Tests of the shared memory ring buffer."""
+
+import multiprocessing
+
+import pytest
+
+from shared_ring_buffer import SharedRingBuffer
+
+
+@pytest.fixture
+def ring_buffer():
+    ring_buffer = SharedRingBuffer(("time", "force"), "dd", CAPACITY=8)
+    yield ring_buffer
+    ring_buffer.close()
+    ring_buffer.unlink()
+
+
+def test_reader_reads_in_order_and_counts_overruns(ring_buffer):
+    reader = ring_buffer.reader()
+    for i in range(5):
+        ring_buffer.write(i, 2.0 * i)
+    assert reader.read() == [(i, 2.0 * i) for i in range(5)]
+    for i in range(5, 20):
+        ring_buffer.write(i, 2.0 * i)
+    records = reader.read()
+    assert [record[0] for record in records] == list(range(12, 20))
+    assert reader.overruns == 7
+    assert ring_buffer.latest() == {"time": 19, "force": 38.0}
+
+
+def test_attached_buffer_shares_the_records_and_layout(ring_buffer):
+    ring_buffer.write(1.0, 2.0)
+    attached = SharedRingBuffer.attach(ring_buffer.name)
+    try:
+        assert attached.FIELDS == ("time", "force")
+        assert attached.FORMAT == "dd"
+        assert attached.latest() == {"time": 1.0, "force": 2.0}
+    finally:
+        attached.close()
+
+
+def _write_records(ring_buffer, count):
+    for i in range(count):
+        ring_buffer.write(i, -i)
+    ring_buffer.close()
+
+
+def test_records_written_by_another_process(ring_buffer):
+    process = multiprocessing.Process(target=_write_records, args=(ring_buffer, 5))
+    process.start()
+    process.join(10)
+    assert ring_buffer.head == 5
+    assert ring_buffer.latest() == {"time": 4.0, "force": -4.0}
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="Needs fork")
+def test_restarted_writer_process_carries_on_the_sequence(ring_buffer):
+    reader = ring_buffer.reader()
+    for count in (3, 2):
+        process = multiprocessing.get_context("fork").Process(target=_write_records, args=(ring_buffer, count))
+        process.start()
+        process.join(10)
+    assert ring_buffer.head == 5
+    assert reader.read() == [(0.0, 0.0), (1.0, -1.0), (2.0, -2.0), (0.0, 0.0), (1.0, -1.0)]
+
+
+def test_header_strings_that_do_not_fit_are_rejected():
+    with pytest.raises(ValueError):
+        SharedRingBuffer(tuple("field" + str(i) for i in range(40)), "d" * 40)
+    with pytest.raises(ValueError):
+        SharedRingBuffer(("time", "a" * 160), "dd")
@@ -0,0 +1,76 @@
+"""Tests of the GPIO backend selection and the simulated hardware."""
+
+import pytest
+
+import gpio
+from load_cell_amplifier import LoadCellAmplifier
+from simulator import SimulatedGPIO, SimulatedHX711, SimulatedSwitch
+
+
+def test_backend_is_chosen_from_the_environment(monkeypatch):
+    gpio.set_backend(None)
+    try:
+        monkeypatch.setenv(gpio.BACKEND_ENVIRONMENT_VARIABLE, "sim")
+        backend = gpio.get_backend()
+        assert isinstance(backend, SimulatedGPIO)
+        assert backend.getmode() == SimulatedGPIO.BCM
+        gpio.set_backend(None)
+        monkeypatch.setenv(gpio.BACKEND_ENVIRONMENT_VARIABLE, "pcb")
+        with pytest.raises(ValueError):
+            gpio.get_backend()
+    finally:
+        gpio.set_backend(None)
+
+
+def test_missing_rpi_gpio_is_not_replaced_by_the_simulator(monkeypatch):
+    def load_rpi_backend():
+        raise RuntimeError("No access to /dev/mem")
+    gpio.set_backend(None)
+    try:
+        monkeypatch.delenv(gpio.BACKEND_ENVIRONMENT_VARIABLE)
+        monkeypatch.setattr(gpio, "_load_rpi_backend", load_rpi_backend)
+        with pytest.raises(RuntimeError, match=gpio.BACKEND_ENVIRONMENT_VARIABLE + "=sim"):
+            gpio.get_backend()
+    finally:
+        gpio.set_backend(None)
+
+
+def test_clock_is_virtual(sim):
+    sim.sleep(3600)
+    assert gpio.monotonic() == pytest.approx(3600)
+
+
+def test_hx711_conversions_are_read_bit_by_bit(sim):
+    device = SimulatedHX711(sim, 5, 6, value=-1000)
+    amplifier = LoadCellAmplifier(5, 6)
+    assert amplifier.OFFSET == -1000
+    samples_read = device.samples_read
+    t_initial = sim.monotonic()
+    assert amplifier.read() == -1000
+    assert amplifier.read() == -1000
+    assert device.samples_read == samples_read + 2
+    assert device.overwritten_conversions == 0
+    # Each read waits for the next conversion, 0.1 s apart
+    assert sim.monotonic() - t_initial == pytest.approx(0.2, abs=0.01)
+
+
+def test_hx711_gain_scales_the_conversions(sim):
+    SimulatedHX711(sim, 5, 6, value=1280)
+    amplifier = LoadCellAmplifier(5, 6, GAIN=64)
+    amplifier.set_offset(0)
+    # The conversion after a gain change still uses the previous gain
+    amplifier.read()
+    assert amplifier.read() == 640
+
+
+def test_switch_bounces_are_filtered_by_the_bounce_time(sim):
+    switch = SimulatedSwitch(sim, 17)
+    sim.setup(17, sim.IN)
+    presses = []
+    sim.add_event_detect(17, sim.RISING, callback=presses.append, bouncetime=5)
+    switch.press(bounces=3)
+    assert presses == [17]
+    switch.release()
+    sim.advance(0.01)
+    switch.press()
+    assert presses == [17, 17]
@@ -0,0 +1,63 @@
+"""Tests of the step schedules and of the step pulses on the simulated GPIO."""
+
+import pytest
+
+from step_generator import Profile, StepGenerator, plan_move, ramp_intervals
+
+
+@pytest.mark.parametrize("profile", list(Profile))
+def test_ramp_accelerates_from_the_start_to_the_max_rate(profile):
+    ramp = ramp_intervals(200, 5000, 20000, profile)
+    assert all(later <= earlier for earlier, later in zip(ramp, ramp[1:]))
+    assert 1 / ramp[-1] == pytest.approx(5000, rel=0.05)
+    # The ramp takes (max_rate - start_rate) / acceleration, 1.5 times as
+    # long for the S-curve at the same peak acceleration
+    duration = 0.24 if profile == Profile.TRAPEZOIDAL else 0.36
+    assert sum(ramp) == pytest.approx(duration, rel=0.02)
+
+
+def test_trapezoidal_ramp_has_a_constant_acceleration():
+    ramp = ramp_intervals(0, 2000, 10000)
+    rates = [1 / interval for interval in ramp]
+    times = [sum(ramp[:i + 1]) for i in range(len(ramp))]
+    middle = len(ramp) // 2
+    acceleration = (rates[-1] - rates[middle]) / (times[-1] - times[middle])
+    assert acceleration == pytest.approx(10000, rel=0.02)
+
+
+def test_move_plans_are_symmetric_and_exact():
+    for steps in (1, 2, 3, 50, 5000):
+        intervals = plan_move(steps, 2000, 10000)
+        assert len(intervals) == max(steps - 1, 0)
+        assert intervals == intervals[::-1]
+    long_move = plan_move(5000, 2000, 10000)
+    assert min(long_move) == pytest.approx(1 / 2000)
+
+
+def test_run_schedule_emits_steps_at_their_deadlines(sim):
+    sim.setup(21, sim.OUT)
+    pulses = []
+    sim.watch(21, lambda level: level and pulses.append(sim.monotonic()))
+    generator = StepGenerator(21)
+    intervals = plan_move(200, 2000, 10000)
+    t_initial = sim.monotonic()
+    assert generator.run_schedule(intervals, lambda: True) == 200
+    assert len(pulses) == 200
+    assert generator.position == 200
+    assert generator.statistics.missed_deadlines == 0
+    assert pulses[-1] - t_initial == pytest.approx(sum(intervals), abs=1e-4)
+
+
+def test_run_follows_the_target_rate_down_to_a_stop(sim):
+    sim.setup(21, sim.OUT)
+    generator = StepGenerator(21, ACCELERATION=10000, START_RATE=100, MAX_RATE=2000)
+    target = [1000]
+
+    def running():
+        if generator.statistics.steps >= 500:
+            target[0] = 0   # Decelerate, which ends the run
+        return True
+    generator.run(lambda: target[0], running)
+    assert generator.statistics.achieved_rate == pytest.approx(1000, rel=0.2)
+    # The deceleration from 1000 steps/s takes about 50 steps
+    assert 500 <= generator.position <= 560
@@ -0,0 +1,106 @@
+"""Tests of the live data stream: decimation, backpressure and the TCP
+server.
+"""
+
+import asyncio
+import json
+import math
+
+import pytest
+
+from shared_ring_buffer import SharedRingBuffer
+from streaming import LTTBDecimator, MinMaxDecimator, StreamClient, StreamServer, lttb
+
+
+def sine(duration, rate=1000):
+    return [(i / rate, math.sin(2 * math.pi * i / rate)) for i in range(int(duration * rate))]
+
+
+def test_minmax_keeps_the_peaks_of_every_bucket():
+    records = sine(1.0)
+    records[333] = (records[333][0], 5.0)     # A spike
+    decimator = MinMaxDecimator(20)
+    output = decimator.add(records) + decimator.flush()
+    assert len(output) <= 20 + 2
+    assert (records[333][0], 5.0) in output
+    assert min(value for _, value in output) == pytest.approx(-1, abs=1e-3)
+    assert [t for t, _ in output] == sorted(t for t, _ in output)
+
+
+def test_lttb_keeps_the_ends_and_the_count():
+    records = sine(1.0)
+    selected = lttb(records, 50)
+    assert len(selected) == 50
+    assert selected[0] == records[0] and selected[-1] == records[-1]
+    assert max(value for _, value in selected) == pytest.approx(1, abs=0.02)
+    assert lttb(records[:10], 50) == records[:10]
+
+
+def test_lttb_decimator_reduces_consecutive_windows_to_the_rate():
+    decimator = LTTBDecimator(100, WINDOW=0.5)
+    records = sine(2.0)
+    output = []
+    for i in range(0, len(records), 100):
+        output.extend(decimator.add(records[i:i + 100]))
+    output.extend(decimator.flush())
+    assert len(output) == pytest.approx(200, rel=0.05)
+    assert [t for t, _ in output] == sorted(set(t for t, _ in output))
+
+
+def test_slow_client_drops_its_oldest_messages():
+    client = StreamClient(writer=None, MAX_QUEUED=3)
+    for i in range(5):
+        client.send({"i": i})
+    assert client.queued == 3
+    assert client.dropped == 2
+    assert [message["i"] for message in client._messages] == [2, 3, 4]
+
+
+def test_subscribe_rejects_unknown_settings():
+    client = StreamClient(writer=None)
+    with pytest.raises(ValueError):
+        client.subscribe(decimation="average")
+    with pytest.raises(ValueError):
+        client.subscribe(channels=["temperature"])
+    with pytest.raises(ValueError):
+        client.subscribe(points_per_second=0)
+
+
+def test_server_streams_subscribed_channels():
+    force_buffer = SharedRingBuffer(("time", "force"), "dd", CAPACITY=4096)
+    position_buffer = SharedRingBuffer(("time", "position", "angular_velocity"), "ddd", CAPACITY=64)
+    server = StreamServer(force_buffer, position_buffer, port=0)
+
+    async def session():
+        serving = asyncio.ensure_future(server.serve())
+        while server.port == 0:
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        writer.write((json.dumps({"command": "subscribe", "decimation": "minmax", "points_per_second": 10,
+                                  "channels": ["force"]}) + "\n").encode())
+        reply = json.loads(await reader.readline())
+        writer.write(b'{"command": "move_up"}\n')
+        refused = json.loads(await reader.readline())
+        for t, force in sine(1.0):
+            force_buffer.write(t, force)
+        position_buffer.write(0.0, 1, 0.0)
+        server.publish()
+        data = json.loads(await asyncio.wait_for(reader.readline(), 5))
+        report = server.report()
+        writer.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        return reply, refused, data, report
+
+    try:
+        reply, refused, data, report = asyncio.run(session())
+    finally:
+        for ring_buffer in (force_buffer, position_buffer):
+            ring_buffer.close()
+            ring_buffer.unlink()
+    assert reply == {"type": "reply", "command": "subscribe", "ok": True}
+    assert refused["ok"] is False
+    assert data["channel"] == "force"
+    assert 2 <= len(data["records"]) <= 12
+    assert max(value for _, value in data["records"]) == pytest.approx(1, abs=1e-3)
+    assert report[0]["dropped"] == 0
@@ -0,0 +1,98 @@
+"""Tests of the worker process scheduling and supervision."""
+
+import asyncio
+import os
+import time
+import warnings
+
+import pytest
+
+from runtime import Runtime
+from shared_ring_buffer import SharedRingBuffer
+from supervisor import Scheduling, Watchdog, WorkerStatistics, apply_scheduling, scheduling_of
+
+
+class StallingWorker:
+    """A process target that sends a few heartbeats, then hangs until
+    stopped.
+    """
+
+    def __init__(self):
+        self.enabled = True
+
+    def run(self, buffer):
+        for count in range(5):
+            buffer.write(time.monotonic(), count)
+        while self.enabled:
+            time.sleep(0.001)
+
+    def stop(self):
+        self.enabled = False
+
+
+def test_watchdog_fires_once_the_heartbeat_stops():
+    beats = [0]
+    watchdog = Watchdog(lambda: beats[0], TIMEOUT=1.0)
+    watchdog.reset(0.0)
+    assert not watchdog.check(0.9)
+    beats[0] += 1
+    assert not watchdog.check(1.5)
+    assert not watchdog.check(2.5)
+    assert watchdog.check(2.6)
+    assert watchdog.max_interval == pytest.approx(1.1)
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        apply_scheduling(Scheduling(policy="realtime"))
+
+
+def test_real_time_policy_is_skipped_when_the_process_cannot_be_pinned():
+    before = scheduling_of()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        after = apply_scheduling(Scheduling(cpus=[10 ** 6], policy="fifo", priority=50))
+    messages = [str(warning.message) for warning in caught]
+    assert any("None of the CPUs" in message for message in messages)
+    assert any("ignoring the 'fifo' scheduling policy" in message for message in messages)
+    assert after == before
+
+
+@pytest.mark.skipif(not hasattr(os, "sched_getaffinity"), reason="CPU affinity is Linux only")
+def test_worker_statistics_read_the_process_counters():
+    statistics = WorkerStatistics()
+    statistics.start(os.getpid())
+    statistics.update(time.monotonic())
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        pass
+    statistics.update(time.monotonic())
+    report = statistics.report()
+    assert report["pid"] == os.getpid()
+    assert report["cpu_time"] > 0
+    assert report["cpu_usage"] is not None
+    assert report["cpus"] == sorted(os.sched_getaffinity(0))
+
+
+def test_stalled_process_is_restarted_up_to_max_restarts():
+    buffer = SharedRingBuffer(("time", "count"), "dq")
+    stalled = []
+    try:
+        runtime = Runtime(PROCESS_JOIN_TIMEOUT=2, SUPERVISION_PERIOD=0.02)
+        watchdog = Watchdog(lambda: buffer.head, TIMEOUT=0.2, on_stall=stalled.append, MAX_RESTARTS=1)
+        runtime.add_process("worker", StallingWorker().run, buffer, scheduling=Scheduling(policy="other"),
+                            watchdog=watchdog)
+
+        async def stop():
+            await asyncio.sleep(2.0)
+            runtime.stop()
+        runtime.add_task("stop", stop)
+        runtime.run()
+        assert stalled == ["worker", "worker"]
+        assert watchdog.stalls == 2
+        assert runtime.worker_statistics["worker"].restarts == 1
+        assert buffer.head == 10      # Both runs sent their heartbeats
+        assert not runtime.processes["worker"].is_alive()
+    finally:
+        buffer.close()
+        buffer.unlink()